@@ -5,6 +5,7 @@
 #include "heartRate.h"
 #include <TinyGPS++.h>
 #include <LSM6DS3.h>
+#include <ArduinoBLE.h>
 
 #define SD_CS_PIN    6
 #define RED_PIN      0
@@ -22,7 +23,44 @@ unsigned long lastPrint = 0;
 bool logging = false;
 bool waitingForRelease = false;
 
-const char* filename = "data.csv";
+// --- SD logs (see older_builds/*/utils/sd_transfer.py) ---
+// One pair of files per boot, numbered from BOOT.TXT, so nothing is lost by
+// a reset before the host has pulled them. HRnnnn.BIN holds fixed records,
+// little-endian:
+//   sample  uint8 1, uint32 millis, uint8 bpm (0 none), int32 lat, int32 lon
+//           (1e-7 degrees, INT32_MIN without a fix)          14 bytes
+//   anchor  uint8 2, uint32 millis, uint32 GPS UTC unix time   9 bytes
+// against ~31 bytes for the same row as CSV text.
+#define REC_SAMPLE     1
+#define REC_ANCHOR     2
+#define NO_FIX         ((int32_t)0x80000000)
+#define ANCHOR_EVERY_MS 600000UL
+
+uint16_t bootNumber = 0;
+char filename[13];      // HRnnnn.BIN
+char imuFilename[13];   // IMnnnn.BIN
+unsigned long lastAnchor = 0;
+bool anchored = false;
+
+// --- Motion stream (see older_builds/*/utils/motion.py) ---
+// 50 Hz accelerometer samples in milli-g, sent 25 at a time as one packet:
+// uint8 version, uint8 rate, uint16 count, uint32 millis of the first sample,
+// then count x int16 (x, y, z), little-endian. The same packets are appended
+// to IMnnnn.BIN while logging. A 158-byte notification needs the central to
+// negotiate an MTU of at least 161 (desktop BLE stacks do).
+#define IMU_RATE_HZ        50
+#define IMU_PACKET_SAMPLES 25
+#define IMU_HEADER_BYTES   8
+#define IMU_PACKET_BYTES   (IMU_HEADER_BYTES + IMU_PACKET_SAMPLES * 6)
+
+uint8_t imuPacket[IMU_PACKET_BYTES];
+uint8_t imuCount = 0;
+unsigned long nextImuSample = 0;
+
+BLEService hrService("180D");
+BLECharacteristic hrChar("2A37", BLERead | BLENotify, 2);
+BLEService motionService("7e1a0001-5f3c-4b8e-9d6a-2c1f0e9b7a51");
+BLECharacteristic motionChar("7e1a0002-5f3c-4b8e-9d6a-2c1f0e9b7a51", BLERead | BLENotify, IMU_PACKET_BYTES);
 
 void setColor(bool r, bool g, bool b) {
   digitalWrite(RED_PIN, r ? HIGH : LOW);
@@ -50,21 +88,25 @@ void setup() {
   Serial.println(" ✅ SD card ready.");
   delay(500);
 
-  if (SD.exists(filename)) {
-    SD.remove(filename);
-    delay(100);
+  // Logs from earlier boots stay until the host has them (DELETE below)
+  File bootFile = SD.open("BOOT.TXT");
+  if (bootFile) {
+    bootNumber = bootFile.parseInt();
+    bootFile.close();
+    SD.remove("BOOT.TXT");
   }
-
-  File file = SD.open(filename, FILE_WRITE);
-  if (file) {
-    file.println("BPM,Latitude,Longitude");
-    file.close();
-    Serial.println("🧹 CSV file created and cleared.");
-  } else {
-    Serial.println("❌ Couldn't prepare CSV.");
+  bootNumber = bootNumber % 9999 + 1;
+  bootFile = SD.open("BOOT.TXT", FILE_WRITE);
+  if (!bootFile) {
+    Serial.println("❌ Couldn't write BOOT.TXT.");
     setColor(1, 0, 0);
     while (1);
   }
+  bootFile.println(bootNumber);
+  bootFile.close();
+  snprintf(filename, sizeof(filename), "HR%04u.BIN", bootNumber);
+  snprintf(imuFilename, sizeof(imuFilename), "IM%04u.BIN", bootNumber);
+  Serial.print("🗂️ Boot "); Serial.print(bootNumber); Serial.print(", logging to "); Serial.println(filename);
 
   // --- HR sensor ---
   if (!sensor.begin(Wire, I2C_SPEED_STANDARD)) {
@@ -96,10 +138,326 @@ void setup() {
   imu.writeRegister(LSM6DS3_ACC_GYRO_WAKE_UP_THS, 0x80);
   imu.writeRegister(LSM6DS3_ACC_GYRO_MD1_CFG, 0x40);
 
+  // --- BLE: standard HR service plus the motion stream ---
+  if (!BLE.begin()) {
+    Serial.println("❌ BLE init failed!");
+    setColor(1, 0, 0);
+    while (1);
+  }
+  BLE.setLocalName("SummerWearable");
+  BLE.setAdvertisedService(hrService);
+  hrService.addCharacteristic(hrChar);
+  motionService.addCharacteristic(motionChar);
+  BLE.addService(hrService);
+  BLE.addService(motionService);
+  BLE.advertise();
+  Serial.println("📡 BLE advertising.");
+
+  nextImuSample = millis();
   Serial.println("👆 Tap to start logging.");
 }
 
+void putLE16(uint8_t* p, int16_t v) {
+  p[0] = v & 0xFF;
+  p[1] = (v >> 8) & 0xFF;
+}
+
+void putLE32(uint8_t* p, uint32_t v) {
+  p[0] = v & 0xFF;
+  p[1] = (v >> 8) & 0xFF;
+  p[2] = (v >> 16) & 0xFF;
+  p[3] = (v >> 24) & 0xFF;
+}
+
+uint32_t getLE32(const uint8_t* p) {
+  return p[0] | (p[1] << 8) | ((uint32_t)p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+void appendRecord(const uint8_t* rec, size_t len) {
+  File file = SD.open(filename, FILE_WRITE);
+  if (file) {
+    file.write(rec, len);
+    file.close();
+  } else if (!transferActive()) {
+    Serial.println("❌ Failed to write to SD.");
+  }
+}
+
+// Seconds since 1970 for the GPS's UTC date and time
+uint32_t gpsUnixTime() {
+  int y = gps.date.year();
+  unsigned m = gps.date.month();
+  unsigned d = gps.date.day();
+  y -= m <= 2;
+  long era = (y >= 0 ? y : y - 399) / 400;
+  unsigned yoe = (unsigned)(y - era * 400);
+  unsigned doy = (153 * (m + (m > 2 ? -3 : 9)) + 2) / 5 + d - 1;
+  unsigned doe = yoe * 365 + yoe / 4 - yoe / 100 + doy;
+  long days = era * 146097L + (long)doe - 719468L;
+  return (uint32_t)(days * 86400L + gps.time.hour() * 3600L + gps.time.minute() * 60L + gps.time.second());
+}
+
+void logSample(unsigned long now) {
+  // A GPS time anchor lets the host date files from earlier boots
+  if (gps.date.isValid() && gps.time.isValid() && gps.date.year() >= 2020 &&
+      (!anchored || now - lastAnchor >= ANCHOR_EVERY_MS)) {
+    uint8_t anchor[9];
+    anchor[0] = REC_ANCHOR;
+    putLE32(anchor + 1, now - gps.time.age());
+    putLE32(anchor + 5, gpsUnixTime());
+    appendRecord(anchor, sizeof(anchor));
+    anchored = true;
+    lastAnchor = now;
+  }
+
+  uint8_t rec[14];
+  rec[0] = REC_SAMPLE;
+  putLE32(rec + 1, now);
+  rec[5] = (bpm > 20 && bpm < 220) ? (uint8_t)(bpm + 0.5) : 0;
+  bool fix = gps.location.isValid();
+  putLE32(rec + 6, fix ? (uint32_t)(int32_t)lround(gps.location.lat() * 1e7) : (uint32_t)NO_FIX);
+  putLE32(rec + 10, fix ? (uint32_t)(int32_t)lround(gps.location.lng() * 1e7) : (uint32_t)NO_FIX);
+  appendRecord(rec, sizeof(rec));
+}
+
+// --- Bulk transfer over USB serial ---
+// Frames: A5 5A, uint8 type, uint16 seq, uint16 length, payload, uint32
+// CRC-32 (zlib's) of type through payload. The host asks, the board answers
+// with the same seq:
+//   HELLO                          -> INFO version, boot, millis, files
+//   READ name[12], offset, length  -> DATA offset, bytes
+//   DELETE name[12], size, crc32   -> ACK once size and CRC match, else NAK
+// Files are only ever deleted on the host's DELETE, after it has all of it.
+#define FRAME_HELLO   0x01
+#define FRAME_READ    0x02
+#define FRAME_DELETE  0x03
+#define FRAME_INFO    0x81
+#define FRAME_DATA    0x82
+#define FRAME_ACK     0x83
+#define FRAME_NAK     0x84
+#define NAK_NO_FILE   1
+#define NAK_SIZE      2
+#define NAK_CRC       3
+#define NAK_BAD       4
+#define PROTOCOL_VERSION 1
+#define MAX_CHUNK     1020
+#define MAX_FILES     60
+#define QUIET_MS      2000
+
+uint8_t rxBuf[64];
+uint8_t rxLen = 0;
+uint8_t txBuf[1024];
+unsigned long lastFrame = 0;
+bool transferSeen = false;
+
+// While the host is talking to us, keep debug text off the wire
+bool transferActive() {
+  return transferSeen && millis() - lastFrame < QUIET_MS;
+}
+
+uint32_t crc32Update(uint32_t crc, const uint8_t* data, size_t len) {
+  crc = ~crc;
+  while (len--) {
+    crc ^= *data++;
+    for (int k = 0; k < 8; k++) {
+      crc = (crc >> 1) ^ (0xEDB88320UL & (0 - (crc & 1)));
+    }
+  }
+  return ~crc;
+}
+
+void sendFrame(uint8_t type, uint16_t seq, const uint8_t* payload, uint16_t len) {
+  uint8_t head[7] = {0xA5, 0x5A, type, (uint8_t)(seq & 0xFF), (uint8_t)(seq >> 8),
+                     (uint8_t)(len & 0xFF), (uint8_t)(len >> 8)};
+  uint32_t crc = crc32Update(0, head + 2, 5);
+  crc = crc32Update(crc, payload, len);
+  uint8_t tail[4];
+  putLE32(tail, crc);
+  Serial.write(head, sizeof(head));
+  if (len) Serial.write(payload, len);
+  Serial.write(tail, sizeof(tail));
+}
+
+void sendNak(uint16_t seq, uint8_t reason) {
+  sendFrame(FRAME_NAK, seq, &reason, 1);
+}
+
+// The 12-byte, zero-padded name field as a string; only our own logs
+bool requestName(const uint8_t* field, char* name) {
+  memcpy(name, field, 12);
+  name[12] = 0;
+  return (name[0] == 'H' && name[1] == 'R') || (name[0] == 'I' && name[1] == 'M');
+}
+
+void handleHello(uint16_t seq) {
+  uint8_t* p = txBuf;
+  p[0] = PROTOCOL_VERSION;
+  p[1] = bootNumber & 0xFF;
+  p[2] = bootNumber >> 8;
+  putLE32(p + 3, millis());
+  uint8_t count = 0;
+  p += 8;
+  File root = SD.open("/");
+  while (count < MAX_FILES) {
+    File entry = root.openNextFile();
+    if (!entry) break;
+    const char* name = entry.name();
+    bool ours = !entry.isDirectory() && strlen(name) <= 12 &&
+                ((name[0] == 'H' && name[1] == 'R') || (name[0] == 'I' && name[1] == 'M'));
+    if (ours) {
+      memset(p, 0, 12);
+      memcpy(p, name, strlen(name));
+      putLE32(p + 12, entry.size());
+      p += 16;
+      count++;
+    }
+    entry.close();
+  }
+  root.close();
+  txBuf[7] = count;
+  sendFrame(FRAME_INFO, seq, txBuf, p - txBuf);
+}
+
+void handleRead(uint16_t seq, const uint8_t* payload) {
+  char name[13];
+  uint32_t offset = getLE32(payload + 12);
+  uint16_t length = payload[16] | (payload[17] << 8);
+  if (!requestName(payload, name) || length > MAX_CHUNK) {
+    sendNak(seq, NAK_BAD);
+    return;
+  }
+  File file = SD.open(name, FILE_READ);
+  if (!file) {
+    sendNak(seq, NAK_NO_FILE);
+    return;
+  }
+  if (offset + length > file.size() || !file.seek(offset)) {
+    file.close();
+    sendNak(seq, NAK_BAD);
+    return;
+  }
+  putLE32(txBuf, offset);
+  int got = file.read(txBuf + 4, length);
+  file.close();
+  if (got != length) {
+    sendNak(seq, NAK_BAD);
+    return;
+  }
+  sendFrame(FRAME_DATA, seq, txBuf, length + 4);
+}
+
+void handleDelete(uint16_t seq, const uint8_t* payload) {
+  char name[13];
+  if (!requestName(payload, name)) {
+    sendNak(seq, NAK_BAD);
+    return;
+  }
+  File file = SD.open(name, FILE_READ);
+  if (!file) {
+    sendNak(seq, NAK_NO_FILE);
+    return;
+  }
+  // Still being written since the host listed it: keep it for next time
+  if (file.size() != getLE32(payload + 12)) {
+    file.close();
+    sendNak(seq, NAK_SIZE);
+    return;
+  }
+  uint32_t crc = 0;
+  int got;
+  while ((got = file.read(txBuf, sizeof(txBuf))) > 0) {
+    crc = crc32Update(crc, txBuf, got);
+  }
+  file.close();
+  if (crc != getLE32(payload + 16)) {
+    sendNak(seq, NAK_CRC);
+    return;
+  }
+  SD.remove(name);
+  sendFrame(FRAME_ACK, seq, NULL, 0);
+}
+
+void handleFrame(uint8_t type, uint16_t seq, const uint8_t* payload, uint16_t len) {
+  lastFrame = millis();
+  transferSeen = true;
+  if (type == FRAME_HELLO) {
+    handleHello(seq);
+  } else if (type == FRAME_READ && len == 18) {
+    handleRead(seq, payload);
+  } else if (type == FRAME_DELETE && len == 20) {
+    handleDelete(seq, payload);
+  } else {
+    sendNak(seq, NAK_BAD);
+  }
+}
+
+void serviceTransfer() {
+  while (Serial.available()) {
+    uint8_t b = Serial.read();
+    // Hunt for A5 5A, then collect header + payload + CRC
+    if ((rxLen == 0 && b != 0xA5) || (rxLen == 1 && b != 0x5A)) {
+      rxLen = (b == 0xA5) ? 1 : 0;
+      continue;
+    }
+    rxBuf[rxLen++] = b;
+    if (rxLen < 7) continue;
+    uint16_t len = rxBuf[5] | (rxBuf[6] << 8);
+    if (len > sizeof(rxBuf) - 11) {
+      rxLen = 0;
+      continue;
+    }
+    if (rxLen < 11 + len) continue;
+    uint32_t crc = crc32Update(0, rxBuf + 2, 5 + len);
+    if (crc == getLE32(rxBuf + 7 + len)) {
+      handleFrame(rxBuf[2], rxBuf[3] | (rxBuf[4] << 8), rxBuf + 7, len);
+    }
+    rxLen = 0;
+  }
+}
+
+void sampleImu() {
+  unsigned long now = millis();
+  if ((long)(now - nextImuSample) < 0) return;
+  nextImuSample += 1000 / IMU_RATE_HZ;
+  if ((long)(now - nextImuSample) > 1000) {
+    nextImuSample = now;  // fell far behind (SD transfer); don't burst to catch up
+  }
+
+  if (imuCount == 0) {
+    imuPacket[0] = 1;  // version
+    imuPacket[1] = IMU_RATE_HZ;
+    imuPacket[2] = IMU_PACKET_SAMPLES;
+    imuPacket[3] = 0;
+    imuPacket[4] = now & 0xFF;
+    imuPacket[5] = (now >> 8) & 0xFF;
+    imuPacket[6] = (now >> 16) & 0xFF;
+    imuPacket[7] = (now >> 24) & 0xFF;
+  }
+  uint8_t* p = imuPacket + IMU_HEADER_BYTES + imuCount * 6;
+  putLE16(p, (int16_t)(imu.readFloatAccelX() * 1000));
+  putLE16(p + 2, (int16_t)(imu.readFloatAccelY() * 1000));
+  putLE16(p + 4, (int16_t)(imu.readFloatAccelZ() * 1000));
+
+  if (++imuCount == IMU_PACKET_SAMPLES) {
+    imuCount = 0;
+    if (BLE.connected()) {
+      motionChar.writeValue(imuPacket, IMU_PACKET_BYTES);
+    }
+    if (logging) {
+      File file = SD.open(imuFilename, FILE_WRITE);
+      if (file) {
+        file.write(imuPacket, IMU_PACKET_BYTES);
+        file.close();
+      }
+    }
+  }
+}
+
 void loop() {
+  BLE.poll();
+  sampleImu();
+  serviceTransfer();
+
   // --- Update GPS ---
   while (Serial1.available()) {
     gps.encode(Serial1.read());
@@ -122,11 +480,11 @@ void loop() {
       waitingForRelease = true;
 
       if (logging) {
-        Serial.println("▶️ Logging started.");
+        if (!transferActive()) Serial.println("▶️ Logging started.");
         setColor(1, 1, 0);  // 🟠 orange
       } else {
-        Serial.println("⏹ Logging stopped.");
-        printAndDeleteFile();
+        // Kept on the SD card until the host pulls it (utils/sd_transfer.py)
+        if (!transferActive()) Serial.println("⏹ Logging stopped.");
         setColor(0, 1, 0);  // 🟢 done
       }
     }
@@ -142,41 +500,22 @@ void loop() {
     String latStr = gps.location.isValid() ? String(gps.location.lat(), 6) : "null";
     String lonStr = gps.location.isValid() ? String(gps.location.lng(), 6) : "null";
 
-    Serial.print("📊 ");
-    Serial.print("BPM: "); Serial.print(hrStr);
-    Serial.print(" | Lat: "); Serial.print(latStr);
-    Serial.print(" Lon: "); Serial.println(lonStr);
-
-    if (logging) {
-      File file = SD.open(filename, FILE_WRITE);
-      if (file) {
-        file.print(hrStr); file.print(",");
-        file.print(latStr); file.print(",");
-        file.println(lonStr);
-        file.close();
-      } else {
-        Serial.println("❌ Failed to write to SD.");
-      }
+    if (!transferActive()) {
+      Serial.print("📊 ");
+      Serial.print("BPM: "); Serial.print(hrStr);
+      Serial.print(" | Lat: "); Serial.print(latStr);
+      Serial.print(" Lon: "); Serial.print(lonStr);
+      Serial.print(" | ms: "); Serial.println(lastPrint);
     }
-  }
-}
 
-void printAndDeleteFile() {
-  Serial.println("📂 Printing CSV contents:");
-  File file = SD.open("data.csv");
-  if (file) {
-    while (file.available()) {
-      Serial.write(file.read());
+    if (BLE.connected()) {
+      // Heart Rate Measurement: flags (uint8 BPM, no contact bit), BPM
+      uint8_t hrMeasurement[2] = {0, (uint8_t)((bpm > 20 && bpm < 220) ? bpm : 0)};
+      hrChar.writeValue(hrMeasurement, 2);
     }
-    file.close();
-  } else {
-    Serial.println("❌ Couldn’t read CSV.");
-  }
 
-  Serial.println("\n🗑 Deleting CSV file...");
-  if (SD.remove("data.csv")) {
-    Serial.println("✅ File deleted.");
-  } else {
-    Serial.println("❌ Failed to delete.");
+    if (logging) {
+      logSample(lastPrint);
+    }
   }
-}
\ No newline at end of file
+}
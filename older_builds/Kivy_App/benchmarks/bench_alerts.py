@@ -0,0 +1,137 @@
+# benchmarks/bench_alerts.py
+#
+# Alert engine benchmarks (utils/hr_alerts.py). Run from the app directory:
+#
+#   python -m benchmarks.bench_alerts --devices 50 --rate 4 --out benchmarks/results/alerts.json
+#
+#   alerts_process   per-sample cost with every device interleaved on a
+#                    virtual clock, and how many times over it could keep up
+#                    with devices x rate on one core (headroom)
+#   alerts_fanout    the same engine behind real HRMonitors on simulated
+#                    straps streaming in real time
+#   alerts_latency   how long after a condition is met its alert fires, in
+#                    sample periods (1 = on the first sample), and how many
+#                    times above_zone fires for a reading flapping across
+#                    the top of the zones (1: hysteresis holds the rest back)
+
+import argparse
+import os
+import sys
+
+from benchmarks import harness
+from ble import simulator
+from ble.hr_monitor import HRMonitor
+from utils import instrumentation
+from utils.hr_alerts import AlertEngine, PersonalZones, DROP_BPM
+
+
+def bench_process(args):
+    devices = simulator.make_devices(args.devices, rate_hz=args.rate, seed=7, dropout_prob=0.02)
+    period = 1.0 / args.rate
+    per_device = max(1, args.samples // args.devices)
+    # Decode up front so only the engine is timed
+    from ble.hr_monitor import decode_hr_measurement
+    samples = []
+    for i in range(per_device):
+        for device in devices:
+            hr, contact, _ = decode_hr_measurement(device.next_payload())
+            samples.append((device.address, hr, contact, i * period))
+
+    engine = AlertEngine(PersonalZones(max_hr=170, resting_hr=55))
+    result = harness.run_stage("alerts_process",
+                               lambda s: engine.process(s[0], s[1], s[2], t=s[3]),
+                               samples, memory=not args.no_memory,
+                               setup=lambda: engine._devices.clear())
+    needed = args.devices * args.rate
+    result["required_per_s"] = needed
+    result["headroom"] = round(result["throughput_per_s"] / needed, 1)
+    print(f"[BENCH] {'':<18} needs {needed:.0f}/s -> {result['headroom']}x headroom on one core",
+          file=sys.stderr)
+    return result
+
+
+def bench_fanout(args):
+    engine = AlertEngine()
+
+    def make_monitor(on_hr):
+        monitor = HRMonitor()
+
+        def handle(bpm):
+            engine.process(monitor.address, bpm, monitor.latest_contact)
+            on_hr(bpm)
+
+        monitor.on_hr_callback = handle
+        return monitor
+
+    devices = simulator.make_devices(args.devices, rate_hz=args.rate, seed=8)
+    simulator.install(args.devices, rate_hz=args.rate, seed=8)
+    with harness.quiet():
+        return harness.run_fanout("alerts_fanout", make_monitor, devices, args.seconds)
+
+
+def bench_latency(args):
+    # Scripted conditions on one device; how many samples after onset each fires
+    period = 1.0 / args.rate
+    zones = PersonalZones(max_hr=170, resting_hr=55)
+    scripts = {
+        "above_zone": [90] * 8 + [zones.max_hr + 10] * 10,
+        "sudden_drop": [150] * 8 + [150 - DROP_BPM - 5] * 4,
+        "contact_lost": [80] * 8 + [0] * 6,
+    }
+    delays = {}
+    for kind, bpms in scripts.items():
+        engine = AlertEngine(zones)
+        onset = next(i for i, b in enumerate(bpms) if b != bpms[0])
+        for i, bpm in enumerate(bpms):
+            if any(a.kind == kind for a in engine.process("dev", bpm, t=i * period)):
+                delays[kind] = i - onset + 1
+                break
+    engine = AlertEngine(zones)
+    engine.process("dev", 80, t=0.0)
+    t = 0.0
+    while not engine.tick(t):
+        t += period
+    delays["no_data"] = round(t / period - 10 / period + 1, 1)
+    engine = AlertEngine(zones)
+    top = zones.limits[-1]
+    flapping = [top + 5 if i % 2 else top - 5 for i in range(40)]
+    flaps = sum(a.kind == "above_zone" for i, bpm in enumerate(flapping)
+                for a in engine.process("dev", bpm, t=i * period))
+    print(f"[BENCH] {'alerts_latency':<18} samples to fire: {delays}, flapping above_zone fired {flaps}x",
+          file=sys.stderr)
+    return {"stage": "alerts_latency", "samples_to_fire": delays, "flapping_fired": flaps}
+
+
+STAGES = {
+    "alerts_process": bench_process,
+    "alerts_fanout": bench_fanout,
+    "alerts_latency": bench_latency,
+}
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="HR alert engine benchmarks"))
+    parser.set_defaults(devices=50, rate=4.0, samples=200000)
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    results = []
+    for name, stage in STAGES.items():
+        if args.only and name not in args.only:
+            continue
+        results.append(stage(args))
+
+    report = harness.build_report("alerts", results, {k: v for k, v in vars(args).items()
+                                                      if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
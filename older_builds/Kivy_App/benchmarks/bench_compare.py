@@ -0,0 +1,145 @@
+# benchmarks/bench_compare.py
+#
+# Session comparison benchmarks (utils/session_compare.py). Run from the app
+# directory:
+#
+#   python -m benchmarks.bench_compare --out benchmarks/results/compare.json
+#
+#   nearest_<N>       k nearest of N sessions' feature vectors (--sessions),
+#                     what the workout log waits on to pick the comparisons
+#   refresh_noop      bringing --days of vectors up to date when no log has
+#                     changed, which every query does first
+#   dtw_<n>           banded DTW of two n-step series, against the textbook
+#                     full-matrix loop (speedup)
+#   compare_<align>   a whole /sessions/compare answer for a --hours session
+#                     against its 3 most similar, per alignment
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import numpy as np
+
+from benchmarks import harness
+from benchmarks.bench_session_export import FIRST_DAY, make_data
+from utils import instrumentation, session_compare
+from utils.geo_index import TRACK_DIR, TrackIndex
+from utils.hr_store import HRStore
+from utils.sessions import SessionIndex
+
+WORKOUTS = ("Run", "Walk", "Cycle")
+
+
+def naive_dtw(a, b):
+    # Unbanded DTW the way it's usually written, for the speedup figure
+    n, m = len(a), len(b)
+    cost = [[float("inf")] * (m + 1) for _ in range(n + 1)]
+    cost[0][0] = 0.0
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            cost[i][j] = abs(a[i - 1] - b[j - 1]) + min(cost[i - 1][j - 1], cost[i - 1][j], cost[i][j - 1])
+    return cost[n][m]
+
+
+def synthetic_index(data_dir, count, rng):
+    # A FeatureIndex holding `count` made-up vectors, a few sessions a day
+    index = session_compare.FeatureIndex(SessionIndex(HRStore(data_dir)), path=os.path.join(data_dir, "f.json"))
+    start = FIRST_DAY.timestamp()
+    days = index._index["days"]
+    for n in range(count):
+        t = start + n * 8 * 3600
+        row = [float(t), WORKOUTS[n % len(WORKOUTS)], rng.normal(0, 1, len(session_compare.WEIGHTS)).tolist()]
+        days.setdefault(str(n // 3), {"version": None, "rows": []})["rows"].append(row)
+    return index, [start + n * 8 * 3600 for n in range(count)]
+
+
+def bench_nearest(args, data_dir, rng):
+    results = []
+    for count in args.sessions:
+        index, starts = synthetic_index(data_dir, count, rng)
+        index.nearest(starts[-1])  # builds the standardized matrix once
+        queries = rng.choice(starts[count // 2:], size=args.queries).tolist()
+        results.append(harness.run_stage(f"nearest_{count}", lambda t: index.nearest(t, 3), queries,
+                                         warmup=10, memory=not args.no_memory))
+    return results
+
+
+def bench_dtw(args, rng):
+    results = []
+    for length in args.dtw_lengths:
+        a = 140 + np.cumsum(rng.normal(0, 1, length))
+        b = 140 + np.cumsum(rng.normal(0, 1, int(length * 1.1)))
+        result = harness.run_stage(f"dtw_{length}", lambda _: session_compare.dtw_path(a, b), [None] * args.repeat,
+                                   warmup=1, memory=not args.no_memory)
+        start = time.perf_counter()
+        naive_dtw(a.tolist(), b.tolist())
+        naive_s = time.perf_counter() - start
+        result["naive_ms"] = round(naive_s * 1000, 1)
+        result["speedup_vs_naive"] = round(naive_s / (result["p50_us"] / 1e6), 1)
+        print(f"[BENCH] {'':<18} naive {naive_s * 1000:.0f} ms ({result['speedup_vs_naive']}x)", file=sys.stderr)
+        results.append(result)
+    return results
+
+
+def bench_compare(args, data_dir):
+    make_data(data_dir, args.days, args.hours, args.hours)
+    store = HRStore(data_dir)
+    index = session_compare.FeatureIndex(SessionIndex(store), TrackIndex(os.path.join(data_dir, TRACK_DIR)))
+    start = time.perf_counter()
+    index.refresh()
+    build_s = time.perf_counter() - start
+    print(f"[BENCH] {'':<18} features for {args.days} days built in {build_s:.1f} s", file=sys.stderr)
+
+    results = [harness.run_stage("refresh_noop", lambda _: index.refresh(), [None] * args.repeat,
+                                 warmup=1, memory=not args.no_memory)]
+    last = index.sessions.sessions((FIRST_DAY + timedelta(days=args.days - 1)).date())[-1]
+    for align in session_compare.ALIGNMENTS:
+        result = harness.run_stage(f"compare_{align}",
+                                   lambda _: session_compare.compare(index, last["start"], 3, align),
+                                   [None] * args.repeat, warmup=1, memory=not args.no_memory)
+        results.append(result)
+    return results
+
+
+def bench(args):
+    data_dir = tempfile.mkdtemp()
+    rng = np.random.default_rng(5)
+    try:
+        with harness.quiet():
+            return bench_nearest(args, data_dir, rng) + bench_dtw(args, rng) + bench_compare(args, data_dir)
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="Session comparison benchmarks"))
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--queries", type=int, default=500, help="per nearest_<N> stage")
+    parser.add_argument("--dtw-lengths", type=int, nargs="+", default=[240, 960],
+                        help="steps; 240 is an hour at DTW_STEP_S")
+    parser.add_argument("--days", type=int, default=30, help="of history for refresh and compare")
+    parser.add_argument("--hours", type=float, default=1.0, help="per session")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    results = [r for r in bench(args) if not args.only or r["stage"] in args.only]
+
+    report = harness.build_report("compare", results, {k: v for k, v in vars(args).items()
+                                                       if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# benchmarks/bench_energy.py
+#
+# Energy expenditure and session summary benchmarks (utils/energy.py,
+# utils/sessions.py). Run from the app directory:
+#
+#   python -m benchmarks.bench_energy --out benchmarks/results/energy.json
+#
+#   energy_meter      EnergyMeter.add per live sample
+#   energy_history    session_energy over a recorded day at 1 Hz, against
+#                     the same day fed through EnergyMeter (speedup)
+#   sessions_cold     SessionIndex.sessions for a day with nothing cached
+#   sessions_cached   the same call once the summary is in the index, which
+#                     is all the workout log pays
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks import harness
+from ble import simulator
+from utils import instrumentation
+from utils.energy import EnergyMeter, UserProfile, session_energy
+from utils.hr_store import HRStore
+from utils.sessions import SessionIndex
+
+DAY = datetime(2025, 7, 20)
+
+
+def make_day(count, seed=3):
+    device = simulator.SimulatedHRDevice("SIM:EN:ER:GY", rate_hz=1.0, seed=seed)
+    samples = list(device.samples(count, start=DAY.replace(hour=6), gap_every=3600, gap_seconds=1200))
+    return (np.array([t.timestamp() for t, _ in samples]), np.array([b for _, b in samples], dtype=np.uint16))
+
+
+def bench_meter(args):
+    ts, bpms = make_day(args.samples)
+    items = list(zip(ts.tolist(), bpms.tolist()))
+    meter = EnergyMeter(UserProfile())
+    return harness.run_stage("energy_meter", lambda s: meter.add(s[0], s[1]), items,
+                             memory=not args.no_memory, setup=meter.reset)
+
+
+def bench_history(args):
+    ts, bpms = make_day(86400 // 2)
+    profile = UserProfile()
+    items = [None] * args.repeat
+    result = harness.run_stage("energy_history", lambda _: session_energy(ts, bpms, profile), items,
+                               warmup=1, memory=not args.no_memory)
+
+    meter = EnergyMeter(profile)
+    start = time.perf_counter()
+    for t, bpm in zip(ts.tolist(), bpms.tolist()):
+        meter.add(t, bpm)
+    loop_s = time.perf_counter() - start
+    _, summary = session_energy(ts, bpms, profile)
+    result["samples"] = len(ts)
+    result["speedup_vs_meter"] = round(loop_s / (result["total_s"] / len(items)), 1)
+    result["agrees"] = abs(summary["kcal"] - meter.kcal) < 0.1
+    print(f"[BENCH] {'':<18} {len(ts):,} samples: {result['speedup_vs_meter']}x the per-sample "
+          f"meter, same total: {result['agrees']}", file=sys.stderr)
+    return result
+
+
+def bench_sessions(args):
+    data_dir = tempfile.mkdtemp()
+    try:
+        simulator.write_hr_log(os.path.join(data_dir, f"hr_log_{DAY.date().isoformat()}.csv"),
+                               simulator.SimulatedHRDevice("SIM:SE:SS", rate_hz=1.0, seed=4), 86400 // 2,
+                               start=DAY.replace(hour=6), gap_every=3600, gap_seconds=1200)
+        store = HRStore(data_dir)
+        store.read_day(DAY.date())  # parsing is the store's cost, not the index's
+
+        def cold(_):
+            index = SessionIndex(store, UserProfile(), path=os.path.join(data_dir, "cold.json"))
+            index._index["days"].clear()
+            return index.sessions(DAY.date())
+
+        results = [harness.run_stage("sessions_cold", cold, [None] * args.repeat, warmup=1,
+                                     memory=not args.no_memory)]
+        index = SessionIndex(store, UserProfile())
+        index.sessions(DAY.date())
+        results.append(harness.run_stage("sessions_cached", lambda _: index.sessions(DAY.date()),
+                                         [None] * 1000, memory=not args.no_memory))
+        return results
+    finally:
+        shutil.rmtree(data_dir)
+
+
+STAGES = {
+    "energy_meter": bench_meter,
+    "energy_history": bench_history,
+    "sessions": bench_sessions,
+}
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="Energy and session summary benchmarks"))
+    parser.add_argument("--repeat", type=int, default=20, help="runs of the whole-day stages")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    results = []
+    for name, stage in STAGES.items():
+        if args.only and name not in args.only:
+            continue
+        result = stage(args)
+        results.extend(result if isinstance(result, list) else [result])
+
+    report = harness.build_report("energy", results, {k: v for k, v in vars(args).items()
+                                                      if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
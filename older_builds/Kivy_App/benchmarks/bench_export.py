@@ -0,0 +1,174 @@
+# benchmarks/bench_export.py
+#
+# Parquet export benchmarks (utils/hr_export.py) over --days of synthetic
+# history: two workouts a day at 1 Hz with their activity epochs. Run from
+# the app directory:
+#
+#   python -m benchmarks.bench_export --out benchmarks/results/export.json
+#
+#   export_full         every day converted, with --workers processes
+#   export_incremental  one day appended to and a new day added, then
+#                       exported again; only those two are converted
+#   query_week          a week of hr (t, bpm) from the dataset, against
+#                       globbing the same week's CSVs into pandas (speedup)
+#   query_workouts      a year of hr during Run sessions, against parsing
+#                       every CSV; row groups read of the total
+#
+# Each run prints the size of the dataset next to the CSVs it came from.
+
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import harness
+from utils import hr_export, instrumentation
+from utils.motion import activity_log_path
+
+FIRST_DAY = datetime(2024, 7, 1)
+WORKOUTS = ((7, "run"), (18, "walk"))  # start hour, activity
+
+
+def write_day(data_dir, day, minutes, rng, workouts=WORKOUTS):
+    # HR samples and 5 s activity epochs for the day's workouts
+    hr_lines = []
+    activity_lines = []
+    for hour, activity in workouts:
+        start = day.replace(hour=hour).timestamp()
+        ts = start + np.arange(minutes * 60)
+        base = 150 if activity == "run" else 105
+        bpms = np.clip(base + np.cumsum(rng.normal(0, 0.8, len(ts))), 60, 195).astype(int)
+        hr_lines += [f"{datetime.fromtimestamp(t).isoformat()},{b}\n" for t, b in zip(ts.tolist(), bpms.tolist())]
+        steps = 14 if activity == "run" else 9
+        for t in ts[4::5].tolist():
+            activity_lines.append(f"{datetime.fromtimestamp(t).isoformat()},{steps},{rng.uniform(80, 400):.1f},"
+                                  f"{rng.uniform(1000, 4000):.1f},{activity}\n")
+    with open(os.path.join(data_dir, f"hr_log_{day.date().isoformat()}.csv"), "a") as f:
+        f.writelines(hr_lines)
+    with open(activity_log_path(data_dir, day.date()), "a") as f:
+        f.writelines(activity_lines)
+    return len(hr_lines)
+
+
+def make_history(data_dir, days, minutes, seed=11):
+    rng = np.random.default_rng(seed)
+    return sum(write_day(data_dir, FIRST_DAY + timedelta(days=i), minutes, rng) for i in range(days))
+
+
+def read_csvs(paths):
+    # What analysis scripts did before the export
+    frames = [pd.read_csv(p, names=["t", "bpm"]) for p in paths]
+    frame = pd.concat(frames, ignore_index=True)
+    frame["t"] = pd.to_datetime(frame["t"], format="ISO8601")
+    return frame
+
+
+def dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def bench_export(args, data_dir, root):
+    start = time.perf_counter()
+    totals = hr_export.export(data_dir, root, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    csv_bytes = sum(os.path.getsize(p) for p in glob.glob(os.path.join(data_dir, "*.csv")))
+    parquet_bytes = dir_bytes(root)
+    full = harness.summarize("export_full", [int(elapsed * 1e9)], elapsed, days=args.days, rows=totals,
+                             csv_bytes=csv_bytes, parquet_bytes=parquet_bytes)
+    print(f"[BENCH] {'export_full':<20} {args.days} days in {elapsed:.1f} s; "
+          f"{csv_bytes / 2 ** 20:.1f} MiB of CSV -> {parquet_bytes / 2 ** 20:.1f} MiB of Parquet", file=sys.stderr)
+
+    last = FIRST_DAY + timedelta(days=args.days - 1)
+    rng = np.random.default_rng(99)
+    write_day(data_dir, last, args.minutes, rng, workouts=((21, "run"),))
+    write_day(data_dir, last + timedelta(days=1), args.minutes, rng)
+    start = time.perf_counter()
+    totals = hr_export.export(data_dir, root, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    incremental = harness.summarize("export_incremental", [int(elapsed * 1e9)], elapsed, rows=totals,
+                                    share_of_full=round(elapsed / full["total_s"], 3))
+    print(f"[BENCH] {'export_incremental':<20} 2 changed days in {elapsed:.2f} s "
+          f"({totals['hr']:,} hr rows rewritten)", file=sys.stderr)
+    return [full, incremental]
+
+
+def bench_queries(args, data_dir, root):
+    results = []
+    week_start = FIRST_DAY + timedelta(days=args.days // 2)
+    week_end = week_start + timedelta(days=7)
+    week_paths = [os.path.join(data_dir, f"hr_log_{(week_start + timedelta(days=i)).date().isoformat()}.csv")
+                  for i in range(7)]
+    all_paths = sorted(glob.glob(os.path.join(data_dir, "hr_log_*.csv")))
+    cases = (
+        ("query_week", dict(start=week_start, end=week_end), week_paths),
+        ("query_workouts", dict(workouts=["Run"]), all_paths),
+    )
+    for stage, kwargs, paths in cases:
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            t0 = time.perf_counter_ns()
+            table = hr_export.query("hr", ["t", "bpm"], root=root, **kwargs)
+            latencies.append(time.perf_counter_ns() - t0)
+        total_s = time.perf_counter() - start
+
+        csv_start = time.perf_counter()
+        frame = read_csvs(paths)
+        csv_s = time.perf_counter() - csv_start
+        info = hr_export.plan("hr", root=root, **kwargs)
+        result = harness.summarize(stage, latencies, total_s, rows=table.num_rows, csv_rows=len(frame),
+                                   row_groups=info["row_groups"], row_groups_total=info["row_groups_total"],
+                                   csv_ms=round(csv_s * 1000, 1),
+                                   speedup_vs_csv=round(csv_s / (total_s / args.repeat), 1))
+        print(f"[BENCH] {stage:<20} {table.num_rows:,} rows in {result['p50_us'] / 1000:.1f} ms from "
+              f"{info['row_groups']} of {info['row_groups_total']} row groups; CSV {csv_s * 1000:.0f} ms "
+              f"({result['speedup_vs_csv']}x)", file=sys.stderr)
+        results.append(result)
+    return results
+
+
+def bench(args):
+    directory = tempfile.mkdtemp()
+    data_dir = os.path.join(directory, "data")
+    root = os.path.join(data_dir, hr_export.EXPORT_DIR)
+    os.makedirs(data_dir)
+    try:
+        samples = make_history(data_dir, args.days, args.minutes)
+        print(f"[BENCH] {'':<20} {samples:,} samples over {args.days} days", file=sys.stderr)
+        return bench_export(args, data_dir, root) + bench_queries(args, data_dir, root)
+    finally:
+        shutil.rmtree(directory)
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="Parquet export benchmarks"))
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--minutes", type=int, default=60, help="per workout, two a day")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each query")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    results = [r for r in bench(args) if not args.only or r["stage"] in args.only]
+
+    report = harness.build_report("export", results, {k: v for k, v in vars(args).items()
+                                                      if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+# benchmarks/bench_geo.py
+#
+# GPS track index benchmarks (utils/geo_index.py) over synthetic years of
+# workouts: 1 Hz tracks around a few cities, most of them repeats of a set of
+# favourite routes with GPS noise, the rest one-offs. Run from the app
+# directory:
+#
+#   python -m benchmarks.bench_geo --tracks 1100 --out benchmarks/results/geo.json
+#
+#   geo_add        simplify, cover with cells and append one track
+#   geo_load       open an index of --tracks tracks from disk
+#   geo_near       tracks passing within 300 m of a point
+#   geo_nearest    5 nearest start points
+#   geo_similar    5 most similar routes to a stored track, and how many of
+#                  them are repeats of the same favourite route (precision)
+
+import argparse
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import harness
+from utils import instrumentation
+from utils.geo_index import TrackIndex, EARTH_RADIUS_M
+
+CITIES = [(47.3769, 8.5417), (46.2044, 6.1432), (51.5072, -0.1276), (40.7128, -74.0060)]
+FIRST_DAY = 1.64e9  # early 2022
+
+
+def _walk(rng, lat, lon, seconds, speed=3.0):
+    # A 1 Hz route wandering away from (lat, lon)
+    heading = np.cumsum(rng.normal(0, 0.05, seconds)) + rng.uniform(0, 2 * math.pi)
+    step = speed / EARTH_RADIUS_M * 180 / math.pi
+    lats = lat + np.cumsum(np.cos(heading)) * step
+    lons = lon + np.cumsum(np.sin(heading)) * step / math.cos(math.radians(lat))
+    return lats, lons
+
+
+def make_tracks(count, routes=40, repeat_share=0.7, seed=1):
+    rng = np.random.default_rng(seed)
+    favourites = []
+    for i in range(routes):
+        lat, lon = CITIES[i % len(CITIES)]
+        start = (lat + rng.normal(0, 0.03), lon + rng.normal(0, 0.03))
+        favourites.append(_walk(rng, *start, int(rng.integers(1800, 5400))))
+
+    tracks = []
+    for i in range(count):
+        t0 = FIRST_DAY + i * 86400 * 3 * 365 / count
+        if rng.random() < repeat_share:
+            route = int(rng.integers(routes))
+            lats, lons = favourites[route]
+            noise = 5.0 / EARTH_RADIUS_M * 180 / math.pi  # ~5 m of GPS noise
+            lats = lats + rng.normal(0, noise, len(lats))
+            lons = lons + rng.normal(0, noise, len(lons))
+        else:
+            route = None
+            lat, lon = CITIES[i % len(CITIES)]
+            lats, lons = _walk(rng, lat + rng.normal(0, 0.05), lon + rng.normal(0, 0.05),
+                               int(rng.integers(1200, 5400)))
+        ts = t0 + np.arange(len(lats), dtype=np.float64)
+        tracks.append((f"track-{i:05d}", route, ts, lats, lons))
+    return tracks
+
+
+def bench(args):
+    tracks = make_tracks(args.tracks, seed=args.seed)
+    raw_points = sum(len(t[2]) for t in tracks)
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        index_dir = [None]
+
+        def fresh():
+            index_dir[0] = tempfile.mkdtemp(dir=directory)
+            fresh.index = TrackIndex(index_dir[0])
+
+        result = harness.run_stage("geo_add", lambda t: fresh.index.add(t[0], t[2], t[3], t[4]), tracks,
+                                   warmup=0, memory=not args.no_memory, setup=fresh)
+        on_disk = sum(os.path.getsize(os.path.join(index_dir[0], f)) for f in os.listdir(index_dir[0]))
+        kept = sum(m["count"] for m in fresh.index.tracks.values())
+        result.update(raw_points=raw_points, kept_points=kept, index_kib=round(on_disk / 1024, 1))
+        print(f"[BENCH] {'':<18} {raw_points:,} fixes -> {kept:,} kept, index {on_disk / 1024:,.0f} KiB on disk",
+              file=sys.stderr)
+        results.append(result)
+
+        start = time.perf_counter()
+        index = TrackIndex(index_dir[0])
+        load_s = time.perf_counter() - start
+        results.append(harness.summarize("geo_load", [int(load_s * 1e9)], load_s, tracks=len(index)))
+        print(f"[BENCH] {'geo_load':<18} {len(index):,} tracks in {load_s * 1000:.1f} ms", file=sys.stderr)
+
+        rng = np.random.default_rng(args.seed + 1)
+        points = []
+        for _ in range(args.queries):
+            lat, lon = CITIES[int(rng.integers(len(CITIES)))]
+            points.append((lat + rng.normal(0, 0.03), lon + rng.normal(0, 0.03)))
+        near = harness.run_stage("geo_near", lambda p: index.passing_through(p[0], p[1], 300.0), points,
+                                 memory=not args.no_memory)
+        near["mean_hits"] = round(sum(len(index.passing_through(p[0], p[1], 300.0)) for p in points)
+                                  / len(points), 1)
+        results.append(near)
+        results.append(harness.run_stage("geo_nearest", lambda p: index.nearest_starts(p[0], p[1]), points,
+                                         memory=not args.no_memory))
+
+        repeats = [t for t in tracks if t[1] is not None][:args.queries]
+        route_of = {t[0]: t[1] for t in tracks}
+        similar = harness.run_stage("geo_similar", lambda t: index.similar_routes(t[0]), repeats,
+                                    memory=not args.no_memory)
+        found = same = 0
+        for t in repeats:
+            for r in index.similar_routes(t[0]):
+                found += 1
+                same += route_of[r["id"]] == t[1]
+        similar["precision"] = round(same / found, 3) if found else 0.0
+        print(f"[BENCH] {'':<18} {same}/{found} similar routes are repeats of the same route", file=sys.stderr)
+        results.append(similar)
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="GPS track index benchmarks"))
+    parser.add_argument("--tracks", type=int, default=1100, help="about three years of daily workouts")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    results = [r for r in bench(args) if not args.only or r["stage"] in args.only]
+
+    report = harness.build_report("geo", results, {k: v for k, v in vars(args).items()
+                                                   if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+# benchmarks/bench_graph.py
+#
+# Frame times for a scrolling HR graph holding 10k to 1M points, comparing
+# ui/hr_graph.HRGraph with the kivy_garden Graph + LinePlot it replaced.
+# Every frame appends a point and scrolls the window one sample, the way the
+# live graph moves; the whole series is in view, the way a day looks on the
+# metrics screen. Needs a window. Run from the Kivy_App directory:
+#
+#   python -m benchmarks.bench_graph --points 10000 100000 1000000 --out benchmarks/results/graph.json
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+from benchmarks import harness
+
+APP_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+JANK_MS = 33.3  # anything slower than 30 fps is a visible stutter
+MODES = ("hrgraph", "garden")
+
+
+def synthetic_hr(n, step=1.0):
+    # A day-like trace at one sample a second, as (xs, ys) lists
+    import math
+    import random
+    rng = random.Random(11)
+    xs, ys = [], []
+    bpm = 70.0
+    for i in range(n):
+        bpm += rng.gauss(0, 1.5) + (75 - bpm) * 0.02
+        xs.append(i * step)
+        ys.append(round(bpm + 20 * math.sin(i / 600)))
+    return xs, ys
+
+
+def run_mode(args):
+    from kivy.config import Config
+    Config.set("graphics", "maxfps", "0")
+    Config.set("graphics", "vsync", "0")
+    from kivy.app import App
+    from kivy.clock import Clock
+
+    xs, ys = synthetic_hr(args.points)
+    frames, updates = [], []
+    span = xs[-1] - xs[0]
+
+    if args.mode == "hrgraph":
+        from ui.hr_graph import HRGraph
+        graph = HRGraph(xmin=0, xmax=span, ymin=30, ymax=200, x_ticks_major=span / 6, y_ticks_major=20,
+                        x_grid=True, y_grid=True, y_grid_label=True)
+        series = graph.add_series(color=(1, 0, 0, 1), max_gap=5)
+        series.set_data(xs, ys)
+
+        def step(i):
+            series.append(xs[-1] + i, ys[i % len(ys)])
+            series.trim_before(i)
+            graph.x_offset = i
+    else:
+        from kivy_garden.graph import Graph, LinePlot
+        graph = Graph(xmin=0, xmax=span, ymin=30, ymax=200, x_ticks_major=span / 6, y_ticks_major=20,
+                      x_grid=True, y_grid=True, y_grid_label=True)
+        plot = LinePlot(line_width=1.5, color=[1, 0, 0, 1])
+        graph.add_plot(plot)
+        points = list(zip(xs, ys))
+        plot.points = points
+
+        def step(i):
+            # The old live graph: append, drop what scrolled off, shift, reassign
+            points.append((xs[-1] + i, ys[i % len(ys)]))
+            del points[0]
+            plot.points = [(x - i, y) for x, y in points]
+
+    class GraphBenchApp(App):
+        def build(self):
+            return graph
+
+        def on_start(self):
+            self.i = 0
+            self.started = time.perf_counter()
+            self.last_frame = time.perf_counter_ns()
+            Clock.schedule_interval(self.on_frame, 0)
+
+        def on_frame(self, dt):
+            now = time.perf_counter_ns()
+            frames.append(now - self.last_frame)
+            self.last_frame = now
+            self.i += 1
+            if time.perf_counter() - self.started > args.seconds:
+                self.stop()
+                return False
+            step(self.i)
+            updates.append(time.perf_counter_ns() - now)
+
+    start = time.perf_counter()
+    GraphBenchApp().run()
+    total_s = time.perf_counter() - start
+
+    frames = frames[1:]  # the first includes window setup
+    update_ms = sorted(updates)[len(updates) // 2] / 1e6 if updates else 0.0
+    janky = sum(1 for f in frames if f / 1e6 > JANK_MS)
+    return harness.summarize(f"{args.mode}_{args.points}", frames, total_s,
+                             mode=args.mode, points=args.points, janky_frames=janky,
+                             update_p50_ms=round(update_ms, 3))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kivy HR graph frame-time benchmark")
+    parser.add_argument("--points", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--seconds", type=float, default=5.0, help="how long to scroll each graph")
+    parser.add_argument("--mode", choices=MODES + ("both",), default="both")
+    parser.add_argument("--out", default="-", help="JSON output path ('-' for stdout)")
+    parser.add_argument("--baseline", help="previous JSON result to compare against")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+
+    if args.mode == "both" or len(args.points) > 1:
+        # Kivy only runs one App per process, so each graph gets its own
+        results = []
+        for mode in (MODES if args.mode == "both" else (args.mode,)):
+            for points in args.points:
+                with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+                    part = tmp.name
+                cmd = [sys.executable, "-m", "benchmarks.bench_graph", "--mode", mode,
+                       "--points", str(points), "--seconds", str(args.seconds), "--out", part]
+                subprocess.run(cmd, cwd=APP_DIR, check=True)
+                with open(part) as f:
+                    results.extend(json.load(f)["results"])
+                os.remove(part)
+    else:
+        args.points = args.points[0]
+        results = [run_mode(args)]
+
+    for result in results:
+        print(f"[BENCH] {result['stage']:<18} frames {result['calls']:>5}  "
+              f"p50 {result['p50_us'] / 1000:>7.1f}ms  p99 {result['p99_us'] / 1000:>7.1f}ms  "
+              f"update {result['update_p50_ms']:>7.2f}ms  janky {result['janky_frames']}", file=sys.stderr)
+
+    params = {k: v for k, v in vars(args).items() if k not in ("out", "baseline")}
+    report = harness.build_report("kivy", results, params)
+    harness.write_report(report, out)
+    if args.baseline:
+        return 1 if harness.compare_reports(args.baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
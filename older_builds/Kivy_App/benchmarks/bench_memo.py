@@ -0,0 +1,105 @@
+# benchmarks/bench_memo.py
+#
+# Derived-result cache benchmarks (utils/memo.py), on the HR service's day
+# metrics: what the Metrics screen's Refresh and the Streamlit metrics page
+# ask for. Run from the app directory:
+#
+#   python -m benchmarks.bench_memo --out benchmarks/results/memo.json
+#
+#   metrics_uncached   /metrics for a --hours day at 1 Hz with HR_MEMO=0,
+#                      as every Refresh was before
+#   metrics_memory     the same request when nothing has changed
+#   metrics_disk       the same from the disk tier alone, as after a restart
+#   metrics_appended   a batch appended before each request, so every one is
+#                      a miss; the price of the key (a stat per file) on top
+#                      of the computation
+#
+# Each stage reports the cache's hit rate.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date, datetime
+
+import numpy as np
+
+from benchmarks import harness
+from utils import instrumentation
+from utils.hr_service import HRService
+from utils.hr_store import HRStore
+from utils.memo import ResultCache
+
+DAY = date(2025, 6, 2)
+
+
+def make_day(data_dir, hours, seed=3):
+    rng = np.random.default_rng(seed)
+    start = datetime(DAY.year, DAY.month, DAY.day, 6).timestamp()
+    ts = start + np.arange(int(hours * 3600))
+    bpms = np.clip(90 + np.cumsum(rng.normal(0, 0.8, len(ts))), 45, 195).astype(int)
+    with open(os.path.join(data_dir, f"hr_log_{DAY.isoformat()}.csv"), "w") as f:
+        f.writelines(f"{datetime.fromtimestamp(t).isoformat()},{b}\n" for t, b in zip(ts.tolist(), bpms.tolist()))
+    return ts[-1]
+
+
+def bench(args):
+    data_dir = tempfile.mkdtemp()
+    try:
+        last = make_day(data_dir, args.hours)
+        service = HRService(HRStore(data_dir), port=0)
+        query = {"day": DAY.isoformat(), "max_points": "2000"}
+        calls = [None] * args.repeat
+        results = []
+
+        def stage(name, cache, fn=None):
+            service.metrics_cache = cache
+            result = harness.run_stage(name, fn or (lambda _: service._metrics(query)), calls, warmup=1,
+                                       memory=not args.no_memory)
+            result.update(cache.stats())
+            print(f"[BENCH] {'':<18} hit rate {result['hit_rate']}", file=sys.stderr)
+            results.append(result)
+
+        disk_dir = os.path.join(data_dir, "cache")
+        stage("metrics_uncached", ResultCache("metrics", enabled=False))
+        stage("metrics_memory", ResultCache("metrics", disk_dir))
+        # Nothing fits in memory, so every lookup reads the pickle back
+        stage("metrics_disk", ResultCache("metrics", disk_dir, memory_bytes=0))
+
+        appended = [last]
+
+        def append_then_query(_):
+            appended[0] += 1
+            service.store.append_batch([(appended[0], 100)])
+            service._metrics(query)
+
+        stage("metrics_appended", ResultCache("metrics", os.path.join(data_dir, "appended")), append_then_query)
+        return results
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="Derived-result cache benchmarks"))
+    parser.add_argument("--hours", type=float, default=16.0, help="of 1 Hz samples in the day")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    results = [r for r in bench(args) if not args.only or r["stage"] in args.only]
+
+    report = harness.build_report("memo", results, {k: v for k, v in vars(args).items()
+                                                    if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
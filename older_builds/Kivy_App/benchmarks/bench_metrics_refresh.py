@@ -0,0 +1,130 @@
+# benchmarks/bench_metrics_refresh.py
+#
+# Frame times while the metrics screen refreshes a large day log, comparing
+# the old inline path (parse + aggregate on the main thread) with the
+# analytics worker. Needs a window. Run from the Kivy_App directory:
+#
+#   python -m benchmarks.bench_metrics_refresh --samples 200000 --out benchmarks/results/refresh.json
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+from benchmarks import harness
+from ble import simulator
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+JANK_MS = 33.3  # anything slower than 30 fps is a visible stutter
+
+
+def run_mode(args):
+    from kivy.app import App
+    from kivy.clock import Clock
+    from kivy.uix.screenmanager import ScreenManager
+    from screens.metrics_screen import MetricsScreen
+    from utils.analytics_worker import shutdown_worker
+    from utils.hr_analytics import analyze_log
+
+    log_path = f"data/hr_log_{date.today().isoformat()}.csv"
+    frames = []
+
+    class RefreshBenchApp(App):
+        def build(self):
+            self.screen = MetricsScreen(name="metrics")
+            sm = ScreenManager()
+            sm.add_widget(self.screen)
+            return sm
+
+        def on_start(self):
+            self.refreshes = 0
+            self.last_frame = time.perf_counter_ns()
+            Clock.schedule_interval(self.on_frame, 0)
+            Clock.schedule_interval(self.refresh, args.interval)
+
+        def on_frame(self, dt):
+            now = time.perf_counter_ns()
+            frames.append(now - self.last_frame)
+            self.last_frame = now
+
+        def refresh(self, dt):
+            if self.refreshes >= args.refreshes:
+                # Let the last worker result land before stopping
+                Clock.schedule_once(lambda dt: self.stop(), args.interval)
+                return False
+            self.refreshes += 1
+            for _ in range(args.burst):
+                if args.mode == "sync":
+                    self.screen.apply_metrics(analyze_log(log_path))
+                else:
+                    self.screen.update_metrics()
+
+        def on_stop(self):
+            shutdown_worker()
+
+    start = time.perf_counter()
+    RefreshBenchApp().run()
+    total_s = time.perf_counter() - start
+
+    janky = sum(1 for f in frames if f / 1e6 > JANK_MS)
+    return harness.summarize(f"frame_time_{args.mode}", frames, total_s,
+                             janky_frames=janky, refreshes=args.refreshes, burst=args.burst)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kivy metrics refresh frame-time benchmark")
+    parser.add_argument("--samples", type=int, default=100000, help="samples in the day log")
+    parser.add_argument("--refreshes", type=int, default=10)
+    parser.add_argument("--burst", type=int, default=3, help="Refresh presses per round, to exercise cancellation")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between refresh rounds")
+    parser.add_argument("--mode", choices=["sync", "worker", "both"], default="both")
+    parser.add_argument("--out", default="-", help="JSON output path ('-' for stdout)")
+    parser.add_argument("--baseline", help="previous JSON result to compare against")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+
+    if args.mode == "both":
+        # Kivy only runs one App per process, so each mode gets its own
+        results = []
+        for mode in ("sync", "worker"):
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+                part = tmp.name
+            cmd = [sys.executable, "-m", "benchmarks.bench_metrics_refresh", "--mode", mode,
+                   "--samples", str(args.samples), "--refreshes", str(args.refreshes),
+                   "--burst", str(args.burst), "--interval", str(args.interval), "--out", part]
+            subprocess.run(cmd, cwd=APP_DIR, check=True)
+            with open(part) as f:
+                results.extend(json.load(f)["results"])
+            os.remove(part)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.makedirs(os.path.join(workdir, "data"))
+            os.chdir(workdir)
+            device = simulator.SimulatedHRDevice("SIM:BENCH", seed=3)
+            simulator.write_hr_log(f"data/hr_log_{date.today().isoformat()}.csv", device,
+                                   args.samples, gap_every=900)
+            results = [run_mode(args)]
+            os.chdir(APP_DIR)
+
+    for result in results:
+        print(f"[BENCH] {result['stage']:<18} p50 {result['p50_us'] / 1000:>7.1f}ms  "
+              f"p99 {result['p99_us'] / 1000:>7.1f}ms  max {result['max_us'] / 1000:>7.1f}ms  "
+              f"janky {result['janky_frames']}", file=sys.stderr)
+
+    params = {k: v for k, v in vars(args).items() if k not in ("out", "baseline")}
+    report = harness.build_report("kivy", results, params)
+    harness.write_report(report, out)
+    if args.baseline:
+        return 1 if harness.compare_reports(args.baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+# benchmarks/bench_pipeline.py
+#
+# Ingestion and rendering hot-path benchmarks for the Kivy app, driven by the
+# synthetic strap in ble/simulator.py. Run from the Kivy_App directory:
+#
+#   python -m benchmarks.bench_pipeline --out benchmarks/results/latest.json
+#   python -m benchmarks.bench_pipeline --baseline benchmarks/results/latest.json
+
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date, datetime
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+from benchmarks import harness
+from ble import simulator
+from ble.hr_monitor import HRMonitor
+from utils import instrumentation
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def bench_hr_handler(args):
+    device = simulator.SimulatedHRDevice("SIM:BENCH", rate_hz=args.rate, seed=1)
+    payloads = device.payloads(args.samples)
+    with harness.quiet():
+        monitor = HRMonitor(on_hr_callback=lambda bpm: None)
+        return harness.run_stage("hr_handler", lambda data: monitor._hr_handler(None, data),
+                                 payloads, memory=not args.no_memory)
+
+
+def bench_log_flush(args):
+    from utils.hr_store import HRStore
+
+    store = HRStore()
+    device = simulator.SimulatedHRDevice("SIM:BENCH", rate_hz=args.rate, seed=2)
+    samples = [(t.timestamp(), bpm) for t, bpm in device.samples(args.samples)]
+    batches = [samples[i:i + 10] for i in range(0, len(samples), 10)]
+    return harness.run_stage("log_flush", store.append_batch, batches, memory=not args.no_memory)
+
+
+def bench_dispatch(args):
+    from utils.ui_dispatcher import CoalescingDispatcher
+
+    # Per-packet cost of push + rate-limited flush, and how many UI updates survive
+    dispatcher = CoalescingDispatcher(max_updates_per_s=10)
+    dispatcher.subscribe_latest(lambda bpm: None)
+    dispatcher.subscribe_batch(lambda batch: None)
+    bpms = [bpm for _, bpm in simulator.SimulatedHRDevice("SIM:BENCH", seed=5).samples(args.samples)]
+
+    def push(bpm):
+        dispatcher.push(bpm)
+        dispatcher.flush()
+
+    result = harness.run_stage("dispatch", push, bpms, memory=not args.no_memory)
+    result.update(dispatcher.stats())
+    return result
+
+
+def bench_update_metrics(args):
+    from screens.metrics_screen import MetricsScreen
+    from utils.hr_analytics import analyze_log
+
+    device = simulator.SimulatedHRDevice("SIM:BENCH", seed=3)
+    log_path = f"data/hr_log_{date.today().isoformat()}.csv"
+    simulator.write_hr_log(log_path, device, args.samples, gap_every=900)
+
+    with harness.quiet():
+        screen = MetricsScreen(name="metrics")
+    # The screen hands this work to the analytics worker; run both halves
+    # inline here so the number stays the total cost of one refresh
+    calls = list(range(max(5, args.samples // 2000)))
+    return harness.run_stage("update_metrics", lambda _: screen.apply_metrics(analyze_log(log_path)),
+                             calls, warmup=1, memory=not args.no_memory)
+
+
+def bench_update_graph(args):
+    from ui.live_hr_graph import LiveHRGraph
+
+    graph = LiveHRGraph()
+    # A full window of points at the simulated rate, stamped the way add_point does
+    now = datetime.now().timestamp()
+    count = int(graph.window_seconds * args.rate)
+    device = simulator.SimulatedHRDevice("SIM:BENCH", rate_hz=args.rate, seed=4)
+
+    def fill():
+        graph.hr_data = [(now - (count - i) / args.rate, bpm)
+                         for i, (_, bpm) in enumerate(device.samples(count))]
+
+    calls = list(range(max(20, args.samples // 100)))
+    return harness.run_stage("update_graph", lambda _: graph.update_graph(0), calls,
+                             memory=not args.no_memory, setup=fill)
+
+
+def bench_save_sleep_graph(args):
+    from utils.graph_utils import save_sleep_graph
+
+    calls = list(range(max(5, args.samples // 1000)))
+    return harness.run_stage("save_sleep_graph", lambda _: save_sleep_graph(cached=False), calls,
+                             warmup=1, memory=not args.no_memory)
+
+
+def bench_ble_fanout(args):
+    devices = simulator.make_devices(args.devices, rate_hz=args.rate)
+    HRMonitor.client_class = simulator.FakeBleakClient
+    with harness.quiet():
+        return harness.run_fanout("ble_fanout", lambda cb: HRMonitor(on_hr_callback=cb),
+                                  devices, args.seconds)
+
+
+STAGES = {
+    "hr_handler": bench_hr_handler,
+    "dispatch": bench_dispatch,
+    "log_flush": bench_log_flush,
+    "update_metrics": bench_update_metrics,
+    "update_graph": bench_update_graph,
+    "save_sleep_graph": bench_save_sleep_graph,
+    "ble_fanout": bench_ble_fanout,
+}
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="Kivy ingestion benchmarks"))
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    # Stages write data/ and assets/ relative to the working directory, so run
+    # them in a scratch copy of the app layout rather than the real one
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "data"))
+        os.makedirs(os.path.join(workdir, "assets"))
+        os.chdir(workdir)
+
+        results = []
+        for name, stage in STAGES.items():
+            if args.only and name not in args.only:
+                continue
+            results.append(stage(args))
+        os.chdir(APP_DIR)
+
+    report = harness.build_report("kivy", results, {k: v for k, v in vars(args).items()
+                                                    if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
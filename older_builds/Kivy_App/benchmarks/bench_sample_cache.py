@@ -0,0 +1,147 @@
+# benchmarks/bench_sample_cache.py
+#
+# Session sample cache benchmarks (utils/sample_cache.py) over --days of
+# synthetic history, two --minutes workouts a day at 1 Hz, fetched from an
+# HR service on a fresh store as the workout log does. Run from the app
+# directory:
+#
+#   python -m benchmarks.bench_sample_cache --out benchmarks/results/sample_cache.json
+#
+#   load_miss            one session's samples loaded into an empty cache
+#                        (the day already parsed by the service)
+#   peek_hit             the same session once it's held
+#   scroll_cold          expanding every session in turn, newest first,
+#                        with nothing prefetched: each expand waits on a load
+#   scroll_prefetch      the same, with prefetch() called for the entries
+#                        around each one and --dwell-ms spent looking at it
+#                        before the next; most expands are hits
+#
+# The scroll stages run under --budget-mb, so a long history also shows the
+# cache staying inside its budget. Each run prints bytes per sample held,
+# against the (datetime, int) tuples the log used to keep.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks import harness
+from benchmarks.bench_export import FIRST_DAY, make_history
+from utils import instrumentation
+from utils.hr_client import HRClient
+from utils.hr_service import HRService
+from utils.hr_store import HRStore
+from utils.sample_cache import SampleCache, SessionSamples
+from utils.sessions import SessionIndex
+
+
+def tuple_bytes(ts, bpms):
+    # What a list of (datetime, bpm) tuples of the same samples costs
+    tracemalloc.start()
+    samples = [(datetime.fromtimestamp(t), int(b)) for t, b in zip(ts, bpms)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del samples
+    return size
+
+
+def bench_single(args, store, fetch, sessions):
+    session = sessions[0]
+    results = [harness.run_stage("load_miss", lambda _: SampleCache(fetch).get(session),
+                                 [None] * args.repeat, warmup=1, memory=not args.no_memory)]
+    cache = SampleCache(fetch)
+    cache.get(session)
+    results.append(harness.run_stage("peek_hit", lambda _: cache.peek(session), [None] * 1000,
+                                     memory=not args.no_memory))
+
+    ts, bpms = store.read_range(session["start"], session["end"] + 1)
+    held = SessionSamples(session["start"], ts, bpms)
+    per_sample = held.nbytes / len(held)
+    tuples = tuple_bytes(ts, bpms) / len(held)
+    results[-1].update(bytes_per_sample=round(per_sample, 1), tuple_bytes_per_sample=round(tuples, 1))
+    print(f"[BENCH] {'':<18} {per_sample:.1f} bytes/sample held, {tuples:.0f} as (datetime, int) tuples",
+          file=sys.stderr)
+    return results
+
+
+def scroll(args, data_dir, sessions, prefetch):
+    # Expands each session in turn against a service that hasn't parsed
+    # anything yet; returns the wait per expand
+    service = HRService(HRStore(data_dir), port=0).start_in_thread()
+    client = HRClient(service.url)
+    cache = SampleCache(client.range, budget_bytes=int(args.budget_mb * (1 << 20)))
+    waits = []
+    peak = 0
+    start = time.perf_counter()
+    for i, session in enumerate(sessions):
+        if prefetch:
+            around = sessions[max(0, i - 3):i + 4]
+            cache.prefetch(around)
+            time.sleep(args.dwell_ms / 1000)
+        t0 = time.perf_counter_ns()
+        cache.get(session)
+        waits.append(time.perf_counter_ns() - t0)
+        peak = max(peak, cache.stats()["bytes"])
+    total_s = time.perf_counter() - start
+    client.close()
+    service.stop()
+    stage = "scroll_prefetch" if prefetch else "scroll_cold"
+    stats = cache.stats()
+    hit_rate = round(stats["hits"] / len(sessions), 3)
+    result = harness.summarize(stage, waits, total_s, sessions=len(sessions), hit_rate=hit_rate,
+                               peak_bytes=peak, mean_wait_us=round(sum(waits) / len(waits) / 1000, 1), **stats)
+    print(f"[BENCH] {stage:<18} {len(sessions)} expands: mean wait {result['mean_wait_us'] / 1000:.2f} ms, "
+          f"hit rate {hit_rate}, peak {peak / 2 ** 20:.1f} of {args.budget_mb:g} MiB, "
+          f"{stats['evicted']} evicted", file=sys.stderr)
+    return result
+
+
+def bench(args):
+    data_dir = tempfile.mkdtemp()
+    try:
+        make_history(data_dir, args.days, args.minutes)
+        store = HRStore(data_dir)
+        last = (FIRST_DAY + timedelta(days=args.days - 1)).date()
+        sessions = SessionIndex(store).recent(args.days, today=last)
+        service = HRService(store, port=0).start_in_thread()
+        client = HRClient(service.url)
+        try:
+            results = bench_single(args, store, client.range, sessions)
+        finally:
+            client.close()
+            service.stop()
+        return results + [scroll(args, data_dir, sessions, False), scroll(args, data_dir, sessions, True)]
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="Session sample cache benchmarks"))
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--minutes", type=int, default=45, help="per workout, two a day")
+    parser.add_argument("--budget-mb", type=float, default=1.0, help="for the scroll stages")
+    parser.add_argument("--dwell-ms", type=float, default=30.0, help="spent on each entry while scrolling")
+    parser.add_argument("--repeat", type=int, default=20, help="runs of load_miss")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    results = [r for r in bench(args) if not args.only or r["stage"] in args.only]
+
+    report = harness.build_report("sample_cache", results, {k: v for k, v in vars(args).items()
+                                                            if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+# benchmarks/bench_session_export.py
+#
+# Session file export benchmarks (utils/session_export.py). Run from the app
+# directory:
+#
+#   python -m benchmarks.bench_session_export --out benchmarks/results/session_export.json
+#
+#   export_gpx / _tcx / _fit   one --hours session at 1 Hz with a GPS track,
+#                              written to memory; peak memory is the writer's
+#   export_fit_long            the same as FIT for a session --long-hours
+#                              long: streaming keeps the peak where it was
+#   export_bulk_1              every session of --days days (two a day, all
+#                              three formats) with one worker process
+#   export_bulk_<N>            the same with --workers processes, in
+#                              sessions per second
+#   iter_hr_archived           a day whose morning session was archived
+#                              before the evening one and a few late,
+#                              out-of-order samples landed in its CSV;
+#                              "matches" checks the export sees the same
+#                              samples in the same order as HRStore.read_day
+
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from benchmarks import harness
+from utils import instrumentation, session_export
+from utils.geo_index import TRACK_DIR, TrackIndex
+from utils.hr_store import HRStore
+from utils.sessions import SessionIndex
+
+FIRST_DAY = datetime(2025, 6, 2)
+
+
+def write_session(data_dir, tracks, start, seconds, rng):
+    # A run at 1 Hz with a GPS fix every second
+    ts = start.timestamp() + np.arange(seconds)
+    bpms = np.clip(140 + np.cumsum(rng.normal(0, 0.8, seconds)), 60, 195).astype(int)
+    with open(os.path.join(data_dir, f"hr_log_{start.date().isoformat()}.csv"), "a") as f:
+        f.writelines(f"{datetime.fromtimestamp(t).isoformat()},{b}\n" for t, b in zip(ts.tolist(), bpms.tolist()))
+    heading = np.cumsum(rng.normal(0, 0.05, seconds))
+    lats = 47.37 + np.cumsum(np.cos(heading)) * 2.5e-5
+    lons = 8.54 + np.cumsum(np.sin(heading)) * 3.7e-5
+    tracks.add(start.isoformat(timespec="seconds"), ts, lats, lons)
+
+
+def make_data(data_dir, days, hours, long_hours, seed=21):
+    rng = np.random.default_rng(seed)
+    tracks = TrackIndex(os.path.join(data_dir, TRACK_DIR))
+    for i in range(days):
+        day = FIRST_DAY + timedelta(days=i)
+        write_session(data_dir, tracks, day.replace(hour=7), int(hours * 3600), rng)
+        write_session(data_dir, tracks, day.replace(hour=18), int(hours * 3600), rng)
+    long_day = FIRST_DAY + timedelta(days=days)
+    write_session(data_dir, tracks, long_day.replace(hour=6), int(long_hours * 3600), rng)
+    return long_day.date()
+
+
+def bench_single(args, data_dir, long_day):
+    store = HRStore(data_dir)
+    tracks = TrackIndex(os.path.join(data_dir, TRACK_DIR))
+    index = SessionIndex(store)
+    session = index.sessions(FIRST_DAY.date())[0]
+    long_session = index.sessions(long_day)[0]
+    results = []
+    cases = [(f"export_{fmt}", fmt, session) for fmt in session_export.FORMATS]
+    cases.append(("export_fit_long", "fit", long_session))
+    for stage, fmt, chosen in cases:
+        sizes = []
+
+        def export(_):
+            f = io.BytesIO()
+            session_export.write_session(store, tracks, chosen, fmt, f)
+            sizes.append(f.tell())
+
+        result = harness.run_stage(stage, export, [None] * args.repeat, warmup=1, memory=not args.no_memory)
+        result["samples"] = chosen["samples"]
+        result["bytes"] = sizes[-1]
+        results.append(result)
+    return results
+
+
+def bench_bulk(args, data_dir):
+    results = []
+    last = (FIRST_DAY + timedelta(days=args.days - 1)).date()
+    SessionIndex(HRStore(data_dir)).recent(args.days + 1, today=last)  # summaries are the index's cost
+    for workers in sorted({1, args.workers}):
+        out_dir = tempfile.mkdtemp(dir=data_dir)
+        with harness.quiet():
+            report = session_export.export_range(data_dir, out_dir, FIRST_DAY.date(), last, workers=workers)
+        stage = f"export_bulk_{workers}"
+        result = harness.summarize(stage, [int(report["seconds"] * 1e9)], report["seconds"], workers=workers,
+                                   **report)
+        print(f"[BENCH] {stage:<18} {report['sessions']} sessions, {report['files']} files, "
+              f"{report['bytes'] / 2 ** 20:.1f} MiB in {report['seconds']:.1f} s: "
+              f"{report['sessions_per_s']} sessions/s", file=sys.stderr)
+        results.append(result)
+    return results
+
+
+def bench_archived(args, seed=22):
+    data_dir = tempfile.mkdtemp()
+    try:
+        rng = np.random.default_rng(seed)
+        store = HRStore(data_dir)
+        tracks = TrackIndex(os.path.join(data_dir, TRACK_DIR))
+        day = FIRST_DAY.date()
+        seconds = int(args.hours * 3600)
+        write_session(data_dir, tracks, FIRST_DAY.replace(hour=7), seconds, rng)
+        store.compact_day(day)
+        write_session(data_dir, tracks, FIRST_DAY.replace(hour=18), seconds, rng)
+        late = FIRST_DAY.replace(hour=7).timestamp() + rng.uniform(0, seconds, 20).round(3)
+        store.append_batch((t, 100) for t in late.tolist())
+
+        start = datetime.combine(day, datetime.min.time()).timestamp()
+        t0 = time.perf_counter_ns()
+        chunks = list(session_export.iter_hr(store, start, start + 86399.999))
+        elapsed_ns = time.perf_counter_ns() - t0
+        ts, bpms = (np.concatenate(a) for a in zip(*chunks))
+        want_ts, want_bpms = store.read_day(day)
+        matches = bool(np.array_equal(ts, want_ts) and np.array_equal(bpms, want_bpms))
+        print(f"[BENCH] {'iter_hr_archived':<18} {len(ts)} samples ({len(late)} late) in "
+              f"{elapsed_ns / 1e6:.1f} ms, matches read_day: {matches}", file=sys.stderr)
+        return [harness.summarize("iter_hr_archived", [elapsed_ns], elapsed_ns / 1e9, samples=len(ts),
+                                  matches=matches)]
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def bench(args):
+    data_dir = tempfile.mkdtemp()
+    try:
+        long_day = make_data(data_dir, args.days, args.hours, args.long_hours)
+        return bench_single(args, data_dir, long_day) + bench_bulk(args, data_dir) + bench_archived(args)
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="Session file export benchmarks"))
+    parser.add_argument("--days", type=int, default=30, help="of history for the bulk export")
+    parser.add_argument("--hours", type=float, default=1.0, help="per session")
+    parser.add_argument("--long-hours", type=float, default=8.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each single-session stage")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    results = [r for r in bench(args) if not args.only or r["stage"] in args.only]
+
+    report = harness.build_report("session_export", results, {k: v for k, v in vars(args).items()
+                                                              if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
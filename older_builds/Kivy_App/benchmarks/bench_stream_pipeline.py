@@ -0,0 +1,176 @@
+# benchmarks/bench_stream_pipeline.py
+#
+# Live stream pipeline benchmarks (utils/stream_pipeline.py), fed batches of
+# --batch samples from the synthetic strap in ble/simulator.py. Run from the
+# app directory:
+#
+#   python -m benchmarks.bench_stream_pipeline --out benchmarks/results/stream_pipeline.json
+#
+#   fanout_<N>       one push to --sinks inline sinks that only read the
+#                    batch; the same SampleBatch reaches every one, so the
+#                    peak memory stays at one batch whatever N is
+#   fanout_copy_<N>  the same with each sink handed its own list of pairs,
+#                    what a copy per consumer would cost
+#   thread_sinks     pushes to --sinks thread sinks that each wait
+#                    --io-ms per batch (disk, network); the push returns
+#                    without waiting on any of them
+#   block / drop     a sink --slow-ms per batch behind a --queue queue, fed
+#                    faster than it drains: "block" holds the pusher back
+#                    (push p99 grows, nothing lost), "drop" keeps pushes
+#                    fast and counts the samples it sheds
+#   filter_inline    a CPU-heavy filter (--filter-window rolling median)
+#   filter_process   the same filter in a process pool of --workers; the
+#                    pushing thread stays free while it runs
+#
+# Stage latencies (push to end of stage, queue wait included) come from
+# Pipeline.stats() and are reported with each result.
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from benchmarks import harness
+from ble import simulator
+from utils import instrumentation
+from utils.stream_pipeline import Pipeline, SampleBatch
+
+
+def make_batches(args, count):
+    device = simulator.SimulatedHRDevice("SIM:BENCH", seed=7)
+    samples = [(t.timestamp(), bpm) for t, bpm in device.samples(count * args.batch)]
+    return [SampleBatch.from_pairs(samples[i:i + args.batch]) for i in range(0, len(samples), args.batch)]
+
+
+def read_sink(batch):
+    # Touches every sample without copying them
+    np.frombuffer(batch.bpm, dtype=np.uint16).max()
+
+
+def median_filter(batch):
+    # Rolling median of bpm; module-level so a process pool can run it
+    window = int(os.environ.get("BENCH_FILTER_WINDOW", 31))
+    bpm = np.frombuffer(batch.bpm, dtype=np.uint16).astype(np.float64)
+    padded = np.pad(bpm, window // 2, mode="edge")
+    smooth = np.median(np.lib.stride_tricks.sliding_window_view(padded, window), axis=1)
+    return SampleBatch(batch.ts, memoryview(smooth.round().astype(np.uint16)))
+
+
+def finish(result, pipeline, total_s=None):
+    pipeline.stop()
+    stats = pipeline.stats()
+    result["stages"] = stats
+    if total_s:
+        result["drained_s"] = round(total_s, 4)
+    return result
+
+
+def bench_fanout(args, batches):
+    results = []
+    pipeline = Pipeline("bench")
+    for i in range(args.sinks):
+        pipeline.add(f"sink{i}", read_sink)
+    results.append(finish(harness.run_stage(f"fanout_{args.sinks}", pipeline.push, batches,
+                                            memory=not args.no_memory), pipeline))
+
+    def copy_push(batch):
+        for _ in range(args.sinks):
+            read_sink(SampleBatch.from_pairs(list(batch)))
+
+    results.append(harness.run_stage(f"fanout_copy_{args.sinks}", copy_push, batches, memory=not args.no_memory))
+    return results
+
+
+def bench_threads(args, batches):
+    def io_sink(batch):
+        time.sleep(args.io_ms / 1000)
+
+    pipeline = Pipeline("bench")
+    for i in range(args.sinks):
+        pipeline.add(f"io{i}", io_sink, executor="thread", queue_size=len(batches))
+    result = harness.run_stage("thread_sinks", pipeline.push, batches, warmup=0, memory=False)
+    start = time.perf_counter()
+    pipeline.join()
+    return [finish(result, pipeline, time.perf_counter() - start)]
+
+
+def bench_backpressure(args, batches):
+    results = []
+    for on_full in ("block", "drop"):
+        def slow_sink(batch):
+            time.sleep(args.slow_ms / 1000)
+
+        pipeline = Pipeline("bench")
+        pipeline.add("slow", slow_sink, executor="thread", queue_size=args.queue, on_full=on_full)
+        # Twice as fast as the sink drains
+        interval = args.slow_ms / 2000
+
+        def paced_push(batch):
+            pipeline.push(batch)
+            time.sleep(interval)
+
+        result = harness.run_stage(on_full, paced_push, batches, warmup=0, memory=False)
+        finish(result, pipeline)
+        stage = result["stages"]["slow"]
+        print(f"[BENCH] {'':<18} {stage['samples']} samples through, {stage['dropped']} dropped, "
+              f"mean latency {stage['mean_us'] / 1000:.0f} ms", file=sys.stderr)
+        results.append(result)
+    return results
+
+
+def bench_filter(args, batches):
+    results = []
+    for executor in ("inline", "process"):
+        pipeline = Pipeline("bench")
+        smooth = pipeline.add("smooth", median_filter, executor=executor, workers=args.workers,
+                              queue_size=args.queue)
+        pipeline.add("sink", read_sink, after=smooth)
+        if executor == "process":
+            pipeline.push(batches[0])
+            pipeline.join()    # the pool's start-up isn't per batch
+        result = harness.run_stage(f"filter_{executor}", pipeline.push, batches, warmup=0, memory=False)
+        start = time.perf_counter()
+        pipeline.join()
+        results.append(finish(result, pipeline, time.perf_counter() - start))
+    return results
+
+
+def bench(args):
+    batches = make_batches(args, args.batches)
+    few = batches[:args.batches // 10]
+    return (bench_fanout(args, batches) + bench_threads(args, few) + bench_backpressure(args, few)
+            + bench_filter(args, few))
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="Live stream pipeline benchmarks"))
+    parser.add_argument("--batch", type=int, default=256, help="samples per pushed batch")
+    parser.add_argument("--batches", type=int, default=2000)
+    parser.add_argument("--sinks", type=int, default=8)
+    parser.add_argument("--io-ms", type=float, default=2.0, help="per batch in each thread sink")
+    parser.add_argument("--slow-ms", type=float, default=5.0, help="per batch in the backpressure sink")
+    parser.add_argument("--queue", type=int, default=8, help="batches queued or in flight")
+    parser.add_argument("--filter-window", type=int, default=31)
+    parser.add_argument("--workers", type=int, default=2, help="processes for filter_process")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+    os.environ["BENCH_FILTER_WINDOW"] = str(args.filter_window)
+
+    results = [r for r in bench(args) if not args.only or r["stage"] in args.only]
+
+    report = harness.build_report("stream_pipeline", results, {k: v for k, v in vars(args).items()
+                                                               if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
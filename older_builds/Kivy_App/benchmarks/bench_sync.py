@@ -0,0 +1,213 @@
+# benchmarks/bench_sync.py
+#
+# Upload queue benchmarks (utils/cloud_sync.py) against a local stand-in for
+# the sync endpoint, over --days of synthetic history (two --minutes
+# workouts a day at 1 Hz). Run from the app directory:
+#
+#   python -m benchmarks.bench_sync --out benchmarks/results/sync.json
+#
+#   notify          what the live path pays per BLE batch
+#   drain           the whole backlog uploaded to a healthy endpoint; per
+#                   batch latency, samples/s, and bytes a sample on the wire
+#   drain_flaky     the same with --fail-rate of requests answered 503 (half
+#                   of them after the endpoint had applied the batch, as if
+#                   the response was lost) and --latency-ms on each
+#   restart         a drain stopped after --rounds rounds, then resumed by a
+#                   new queue on the same state file, as after an app restart
+#
+# The stand-in keeps every batch by Idempotency-Key and checks the result:
+# each drain must leave it holding every stored sample exactly once
+# ("complete"), and "resent_acked" counts batches sent again after being
+# acknowledged, which must stay 0.
+
+import argparse
+import gzip
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks import harness
+from benchmarks.bench_export import make_history
+from utils import cloud_sync, instrumentation
+from utils.hr_archive import decode_samples
+from utils.hr_store import HRStore
+
+BACKOFF_S = (0.01, 0.1)   # the stand-in recovers at once; don't wait minutes on it
+
+
+class Endpoint(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fail_rate=0.0, latency_ms=0.0, seed=5):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.fail_rate = fail_rate
+        self.latency_s = latency_ms / 1000
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.batches = {}        # Idempotency-Key -> (day, offset, replace, ts, bpms)
+        self.sessions = {}       # day -> sessions
+        self.acked = set()
+        self.resent_acked = 0
+        self.failed = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def samples(self):
+        # day -> timestamps, applying batches in arrival order as the real
+        # one would
+        days = {}
+        for day, offset, replace, ts, _ in self.batches.values():
+            held = days.setdefault(day, {})
+            if replace:
+                held.clear()
+            for i, t in enumerate(ts):
+                held[offset + i] = t
+        return {day: [held[i] for i in sorted(held)] for day, held in days.items()}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        key = self.headers["Idempotency-Key"]
+        if server.latency_s:
+            time.sleep(server.latency_s)
+        with server.lock:
+            roll = server.rng.random()
+            if roll < server.fail_rate / 2:
+                server.failed += 1
+                return self._reply(503)
+            if key in server.acked:
+                server.resent_acked += 1
+            if key not in server.batches:
+                day = self.headers["X-HR-Day"]
+                if self.path.endswith("/sessions"):
+                    server.sessions[day] = json.loads(gzip.decompress(body))["sessions"]
+                    server.batches[key] = (day, 0, False, [], [])
+                else:
+                    ts, bpms = decode_samples(body)
+                    server.batches[key] = (day, int(self.headers["X-HR-Offset"]),
+                                           self.headers.get("X-HR-Replace") == "1", list(ts), list(bpms))
+            if roll < server.fail_rate:
+                # Applied, but the client never hears so
+                server.failed += 1
+                return self._reply(503)
+            server.acked.add(key)
+        self._reply(200)
+
+    def _reply(self, status):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def check(endpoint, store):
+    # Timestamps travel to the millisecond, as in the archive
+    held = {day: [round(t * 1000) for t in ts] for day, ts in endpoint.samples().items()}
+    complete = all(held.get(day.isoformat()) == [round(t * 1000) for t in store.read_day(day)[0]]
+                   for day in store.days())
+    return {"complete": complete, "resent_acked": endpoint.resent_acked, "failed_requests": endpoint.failed,
+            "session_days": len(endpoint.sessions)}
+
+
+def drain(args, data_dir, stage, fail_rate=0.0, latency_ms=0.0):
+    endpoint = Endpoint(fail_rate, latency_ms)
+    threading.Thread(target=endpoint.serve_forever, daemon=True).start()
+    state = os.path.join(data_dir, f"sync_{stage}.json")
+    store = HRStore(data_dir)
+    sync = cloud_sync.SyncQueue(store, endpoint.url, path=state, batch_samples=args.batch, backoff_s=BACKOFF_S)
+    latencies = []
+    send = sync._send
+
+    def timed(entry):
+        t0 = time.perf_counter_ns()
+        try:
+            return send(entry)
+        finally:
+            latencies.append(time.perf_counter_ns() - t0)
+
+    sync._send = timed
+    start = time.perf_counter()
+    if stage == "restart":
+        for _ in range(args.rounds):
+            sync.run_once()
+        sync.uploader.close()
+        sync = cloud_sync.SyncQueue(store, endpoint.url, path=state, batch_samples=args.batch,
+                                    backoff_s=BACKOFF_S)
+        sync._send = timed
+    rounds = sync.drain()
+    total_s = time.perf_counter() - start
+    sync.uploader.close()
+    endpoint.shutdown()
+    endpoint.server_close()
+
+    samples = sum(len(b[3]) for b in endpoint.batches.values())
+    stats = sync.stats()
+    result = harness.summarize(stage, latencies, total_s, rounds=rounds, samples=samples,
+                               samples_per_s=round(samples / total_s), retries=stats["retries"],
+                               bytes_per_sample=round(stats["bytes"] / max(1, stats["samples"]), 3),
+                               **check(endpoint, store))
+    print(f"[BENCH] {stage:<18} {samples} samples in {total_s:.2f} s ({result['samples_per_s']}/s, "
+          f"{result['bytes_per_sample']} B/sample) over {rounds} rounds, {stats['retries']} retries; "
+          f"complete={result['complete']} resent_acked={result['resent_acked']}", file=sys.stderr)
+    return result
+
+
+def bench_notify(args, data_dir):
+    sync = cloud_sync.SyncQueue(HRStore(data_dir), "http://127.0.0.1:9/v1", path=os.path.join(data_dir, "n.json"))
+    batch = [(time.time(), 70)] * 10
+    return harness.run_stage("notify", sync.notify, [batch] * 100000, memory=not args.no_memory)
+
+
+def bench(args):
+    data_dir = tempfile.mkdtemp()
+    try:
+        make_history(data_dir, args.days, args.minutes)
+        return [bench_notify(args, data_dir),
+                drain(args, data_dir, "drain"),
+                drain(args, data_dir, "drain_flaky", args.fail_rate, args.latency_ms),
+                drain(args, data_dir, "restart")]
+    finally:
+        shutil.rmtree(data_dir)
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="Upload queue benchmarks"))
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--minutes", type=int, default=45, help="per workout, two a day")
+    parser.add_argument("--batch", type=int, default=cloud_sync.BATCH_SAMPLES, help="samples per upload")
+    parser.add_argument("--fail-rate", type=float, default=0.2, help="of requests in drain_flaky")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="per request in drain_flaky")
+    parser.add_argument("--rounds", type=int, default=1, help="before the restart")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    results = [r for r in bench(args) if not args.only or r["stage"] in args.only]
+
+    report = harness.build_report("sync", results, {k: v for k, v in vars(args).items()
+                                                    if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
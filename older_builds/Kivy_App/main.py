@@ -1,6 +1,7 @@
 # main.py
 
 import asyncio
+import os
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.core.window import Window
@@ -10,13 +11,28 @@ from screens.dashboard_screen import DashboardScreen
 from screens.settings_screen import SettingsScreen
 from screens.workout_log_screen import WorkoutLogScreen
 from ui.nav_bar import NavigationBar
+from ui.profiler import profiler
 from utils.graph_utils import save_sleep_graph
 from screens.metrics_screen import MetricsScreen
+from utils import instrumentation
+from utils.analytics_worker import shutdown_worker
+from utils.hr_client import get_client, get_embedded_service
 
 
 
 
 Window.size = (375, 667)
+instrumentation.configure_logging()
+
+# HR_SIMULATOR_HZ=4 python main.py runs against a synthetic strap instead of BLE
+if os.environ.get("HR_SIMULATOR_HZ"):
+    from ble import simulator
+    simulator.install(rate_hz=float(os.environ["HR_SIMULATOR_HZ"]), motion=True)
+
+# HR_REPLAY=2025-07-20@10 python main.py plays a recorded day back as the strap, at 10x
+if os.environ.get("HR_REPLAY"):
+    from ble import replay
+    replay.install(*replay.parse_replay_spec(os.environ["HR_REPLAY"]))
 
 class WearableApp(App):
     async def async_run(self, **kwargs):
@@ -24,11 +40,14 @@ class WearableApp(App):
 
     def build(self):
         save_sleep_graph()
+        # Starts the embedded HR service unless HR_SERVICE_URL points elsewhere
+        get_client()
         self.sm = ScreenManager(transition=SlideTransition(duration=0.3))
-        self.sm.add_widget(DashboardScreen(name='dashboard'))
-        self.sm.add_widget(SettingsScreen(name='settings'))
-        self.sm.add_widget(WorkoutLogScreen(name='log'))
-        self.sm.add_widget(MetricsScreen(name='metrics'))
+        # build_screen times each screen's construction and on_pre_enter
+        self.sm.add_widget(profiler.build_screen(DashboardScreen, name='dashboard'))
+        self.sm.add_widget(profiler.build_screen(SettingsScreen, name='settings'))
+        self.sm.add_widget(profiler.build_screen(WorkoutLogScreen, name='log'))
+        self.sm.add_widget(profiler.build_screen(MetricsScreen, name='metrics'))
 
 
         self.screen_order = ['dashboard', 'log', 'metrics', 'settings']
@@ -42,6 +61,19 @@ class WearableApp(App):
         Window.bind(on_touch_up=self._on_touch_up)
         Window.bind(on_key_down=self._on_key_down)
         self._touch_start_x = 0
+        # HR_PROFILE=1 starts with the profiler HUD on
+        profiler.attach(self.sm)
+
+    def on_stop(self):
+        # Whatever the dashboard has queued for storage lands before the
+        # service goes
+        dashboard = self.sm.get_screen('dashboard').dashboard
+        dashboard.dispatcher.flush(force=True)
+        dashboard.pipeline.stop()
+        shutdown_worker()
+        service = get_embedded_service()
+        if service:
+            service.stop()
 
     def _on_key_down(self, window, key, scancode, codepoint, modifier):
         if key == 276:  # Left arrow
@@ -52,6 +84,10 @@ class WearableApp(App):
             current_idx = self.screen_order.index(self.sm.current)
             if current_idx < len(self.screen_order) - 1:
                 self.go_to_screen(self.screen_order[current_idx + 1])
+        elif key == 293:  # F12
+            profiler.toggle()
+        elif key == 292:  # F11
+            profiler.capture()
 
     def _on_touch_down(self, window, touch):
         self._touch_start_x = touch.x
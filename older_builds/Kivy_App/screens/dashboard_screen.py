@@ -1,4 +1,5 @@
 import asyncio
+import logging
 from kivy.uix.screenmanager import Screen
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.image import Image
@@ -10,14 +11,23 @@ from kivy.uix.widget import Widget
 from kivy.uix.anchorlayout import AnchorLayout
 from kivy.clock import Clock
 from kivy.uix.button import Button
-from datetime import datetime
 
 from ui.live_hr_graph import LiveHRGraph
 from ble.hr_monitor import HRMonitor
+from utils.hr_alerts import AlertEngine
+from utils.hr_client import ingest_batch
+from utils.energy import EnergyMeter
+from utils.motion import MotionTracker
+from utils.stream_pipeline import Pipeline
+from utils.ui_dispatcher import CoalescingDispatcher
 
+log = logging.getLogger("wearable.dashboard")
 
 
 class ConnectionStatus(BoxLayout):
+    COLORS = {"connected": (0, 1, 0, 1), "connecting": (1, 1, 0, 1), "disconnected": (1, 0, 0, 1)}
+    LABELS = {"connected": "Connected", "connecting": "Connecting..."}
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.orientation = 'horizontal'
@@ -28,7 +38,7 @@ class ConnectionStatus(BoxLayout):
 
         self.circle = Widget(size_hint=(None, None), size=(22, 22))
         with self.circle.canvas:
-            Color(1, 0, 0, 1)
+            self.circle_color = Color(*self.COLORS["disconnected"])
             self.circle_shape = Ellipse(pos=self.circle.pos, size=self.circle.size)
         self.circle.bind(pos=self.update_shape, size=self.update_shape)
 
@@ -51,22 +61,9 @@ class ConnectionStatus(BoxLayout):
         self.circle_shape.size = self.circle.size
 
     def set_status(self, status):
-        self.circle.canvas.clear()
-        if status == "connected":
-            self.status_label.text = "Connected"
-            with self.circle.canvas:
-                Color(0, 1, 0, 1)
-                self.circle_shape = Ellipse(pos=self.circle.pos, size=self.circle.size)
-        elif status == "connecting":
-            self.status_label.text = "Connecting..."
-            with self.circle.canvas:
-                Color(1, 1, 0, 1)
-                self.circle_shape = Ellipse(pos=self.circle.pos, size=self.circle.size)
-        else:
-            self.status_label.text = "Not Connected"
-            with self.circle.canvas:
-                Color(1, 0, 0, 1)
-                self.circle_shape = Ellipse(pos=self.circle.pos, size=self.circle.size)
+        # Recolours the one Ellipse instead of rebuilding the canvas
+        self.status_label.text = self.LABELS.get(status, "Not Connected")
+        self.circle_color.rgba = self.COLORS.get(status, self.COLORS["disconnected"])
 
 
 class DailyDashboard(BoxLayout):
@@ -90,6 +87,15 @@ class DailyDashboard(BoxLayout):
         )
         self.add_widget(self.device_label)
 
+        self.alert_label = Label(
+            text="",
+            font_size=20,
+            size_hint=(1, None),
+            height=30,
+            color=(1, 0.3, 0.3, 1)
+        )
+        self.add_widget(self.alert_label)
+
         wearable_container = BoxLayout(size_hint=(1, None), height=300, orientation="vertical")
 
         wearable_image = Image(source="assets/wearable.png", size_hint=(None, None), size=(240, 240))
@@ -125,6 +131,9 @@ class DailyDashboard(BoxLayout):
         self.content.add_widget(Label(text="Sleep History", size_hint_y=None, height=30, color=(1, 1, 1, 1)))
         self.content.add_widget(Image(source="assets/sleep_graph.png", size_hint_y=None, height=200))
 
+        self.activity_label = Label(text="Activity: -", size_hint_y=None, height=30, color=(1, 1, 1, 1))
+        self.content.add_widget(self.activity_label)
+
         self.content.add_widget(Label(text="Live Heart Rate", size_hint_y=None, height=30, color=(1, 1, 1, 1)))
         self.hr_graph = LiveHRGraph()
         self.hr_graph.size_hint_y = None
@@ -134,7 +143,32 @@ class DailyDashboard(BoxLayout):
         scroll.add_widget(self.content)
         self.add_widget(scroll)
 
-        self.hr_monitor = HRMonitor(on_hr_callback=self._handle_hr)
+        # Checked per sample in _handle_hr; tick() catches devices gone quiet
+        self.alerts = AlertEngine()
+        self.alerts.subscribe(self._on_alert)
+        Clock.schedule_interval(lambda dt: self.alerts.tick(), 1)
+
+        # Accelerometer packets are folded into 5 s epochs on the BLE thread;
+        # the label only reads the running totals
+        self.motion = MotionTracker(data_dir="data")
+        # Calories for this session so far, one sample at a time
+        self.energy = EnergyMeter()
+        Clock.schedule_interval(self._refresh_activity, 1)
+
+        # BLE samples are coalesced and flushed on the frame clock at most 10
+        # times a second, then fanned out through the pipeline: the graph
+        # inline on the UI thread, disk and network work on their own threads
+        self.dispatcher = CoalescingDispatcher(max_updates_per_s=10)
+        self.dispatcher.subscribe_latest(self.hr_graph.set_current)
+        self.pipeline = Pipeline("dashboard").attach(self.dispatcher)
+        self.pipeline.add("graph", self.hr_graph.add_points)
+        # Persisted and published to /live subscribers by the HR service
+        self.pipeline.add("store", ingest_batch, executor="thread")
+        self.pipeline.add("energy", self._add_energy, executor="thread")
+        Clock.schedule_interval(self.dispatcher.flush, 0)
+
+        self.hr_monitor = HRMonitor(on_hr_callback=self._handle_hr,
+                                    on_motion_callback=self.motion.ingest_packet)
         HRMonitor.register_device_update_callback(self.update_device_label)
         self.update_device_label()
 
@@ -143,8 +177,7 @@ class DailyDashboard(BoxLayout):
         self.bg_rect.size = self.size
 
     def update_device_label(self, *args):
-        selected = HRMonitor._selected_address
-        name = HRMonitor._selected_name
+        selected, name = HRMonitor.selected_device()
         if selected and name:
             display = f"Selected Device ({name}: {selected[:4]})"
         elif selected:
@@ -158,6 +191,8 @@ class DailyDashboard(BoxLayout):
 
     def start_connection(self, instance):
         self.connection.set_status("connecting")
+        # Calories count from the start of this session, not of the app
+        self.energy.reset()
         loop = asyncio.get_event_loop()
         loop.create_task(self.connect_hr_monitor())
 
@@ -166,25 +201,37 @@ class DailyDashboard(BoxLayout):
         if connected:
             self.connection.set_status("connected")
         else:
+            log.warning("❗ Could not connect to %s", self.hr_monitor.address or "any device")
             self.connection.set_status("disconnected")
 
 
     def _handle_hr(self, bpm):
-        self.hr_graph.add_point(bpm)
-        self.log_heart_rate(bpm)
-
-    def log_heart_rate(self, bpm):
-        from datetime import datetime
-        timestamp = datetime.now()
-        date_str = timestamp.date().isoformat()  # e.g., 2025-07-20
-        log_path = f"data/hr_log_{date_str}.csv"
-
-        try:
-            with open(log_path, "a") as f:
-                f.write(f"{timestamp.isoformat()},{bpm}\n")
-        except Exception as e:
-            print(f"[ERROR] Could not log HR: {e}")
-
+        # Called per BLE notification; everything else happens in batches on
+        # flush. Alerts stay per sample: they need the packet's contact flag
+        self.dispatcher.push(bpm)
+        self.alerts.process(self.hr_monitor.address or "strap", bpm, self.hr_monitor.latest_contact,
+                            active=self.motion.is_active())
+
+    def _add_energy(self, batch):
+        activity = self.motion.activity
+        for t, bpm in batch:
+            self.energy.add(t, bpm, activity=activity)
+
+    def _refresh_activity(self, dt):
+        if self.motion.activity or self.energy.kcal:
+            self.activity_label.text = (f"Activity: {self.motion.activity or '-'}  ·  "
+                                        f"{self.motion.steps_today:,} steps  ·  {self.energy.kcal:.0f} kcal")
+
+    def _on_alert(self, alert):
+        Clock.schedule_once(lambda dt: self._show_alert(alert.message))
+
+    def _show_alert(self, message):
+        self.alert_label.text = f"⚠ {message}"
+        Clock.unschedule(self._clear_alert)
+        Clock.schedule_once(self._clear_alert, 15)
+
+    def _clear_alert(self, *args):
+        self.alert_label.text = ""
 
 
 
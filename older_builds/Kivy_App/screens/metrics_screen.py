@@ -4,9 +4,17 @@ from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.anchorlayout import AnchorLayout
 from kivy.graphics import Color, Rectangle
-from kivy.garden.graph import Graph, LinePlot
-from datetime import datetime, date
-import os
+from datetime import date
+
+from ui.hr_graph import HRGraph
+from utils import instrumentation
+from utils.analytics_worker import get_worker
+from utils.hr_analytics import MAX_GAP, HIGH_BPM_THRESHOLD
+from utils.hr_client import get_client, fetch_day_metrics, fetch_mean_max
+from utils.mean_max import ALL_TIME, HEADLINE_S, describe_best, headline
+
+METRICS_REFRESH_US = instrumentation.histogram("ui.metrics_refresh_us")
+GRAPH_MAX_POINTS = 2000  # the graph can't show more than this at 375px anyway
 
 class MetricsScreen(Screen):
     def __init__(self, **kwargs):
@@ -16,10 +24,9 @@ class MetricsScreen(Screen):
         self._add_background(self.layout)
 
         # Graph Setup (Top)
-        self.hr_graph = Graph(
+        self.hr_graph = HRGraph(
             xlabel='Time',
             ylabel='HR',
-            x_ticks_minor=5,
             x_ticks_major=10,
             y_ticks_major=10,
             y_grid_label=True,
@@ -35,6 +42,7 @@ class MetricsScreen(Screen):
             height=300
         )
 
+        self.hr_series = self.hr_graph.add_series(color=(1, 0.3, 0.3, 1), width=1.5)
         self.layout.add_widget(self.hr_graph)
 
         # Info Labels
@@ -44,6 +52,13 @@ class MetricsScreen(Screen):
             self.metric_labels.append(lbl)
             self.layout.add_widget(lbl)
 
+        # All-time best sustained efforts (utils/mean_max.py)
+        self.best_labels = []
+        for _ in HEADLINE_S:
+            lbl = Label(color=(1, 0.85, 0.5, 1), size_hint_y=None, height=25)
+            self.best_labels.append(lbl)
+            self.layout.add_widget(lbl)
+
         # Refresh Button
         self.refresh_button_container = AnchorLayout(anchor_x='center', anchor_y='bottom', size_hint=(1, None), height=60)
         self.refresh_button = Button(text="Refresh", size_hint=(None, None), size=(160, 40))
@@ -66,72 +81,51 @@ class MetricsScreen(Screen):
         self.bg.size = instance.size
 
     def update_metrics(self):
-        log_path = f"data/hr_log_{date.today().isoformat()}.csv"
-        if not os.path.exists(log_path):
-            print("No heart rate log found.")
-            return
+        # The HR service does the parsing and aggregation; the worker only
+        # waits on the query. A newer Refresh cancels or discards any request
+        # still in flight
+        self.refresh_button.text = "Refreshing..."
+        started = instrumentation.stopwatch()
+        get_worker().submit(
+            "metrics", fetch_day_metrics, get_client().base_url, date.today(),
+            MAX_GAP, HIGH_BPM_THRESHOLD, GRAPH_MAX_POINTS,
+            on_result=lambda result: self.apply_metrics(result, started),
+            on_error=lambda error: self._finish_refresh()
+        )
+        get_worker().submit("mean_max", fetch_mean_max, get_client().base_url, ALL_TIME,
+                            on_result=self.apply_bests)
+
+    def apply_bests(self, envelope):
+        for label, best in zip(self.best_labels, headline(envelope)):
+            label.text = describe_best(*best)
+
+    def _finish_refresh(self):
+        self.refresh_button.text = "Refresh"
 
-        bpm_values = []
-        with open(log_path, "r") as f:
-            for line in f:
-                try:
-                    timestamp_str, bpm_str = line.strip().split(",")
-                    bpm = int(bpm_str)
-                    timestamp = datetime.fromisoformat(timestamp_str)
-                    bpm_values.append((timestamp, bpm))
-                except:
-                    continue
-
-        if not bpm_values:
-            print("No valid heart rate data.")
+    def apply_metrics(self, result, started=0):
+        # Main thread only: redraws the series and labels for a finished analysis
+        self._finish_refresh()
+        if result is None:
             return
 
-        for p in self.hr_graph.plots[:]:
-            self.hr_graph.remove_plot(p)
-
-        # Split into segments with no large time gaps
-        segments = []
-        current_segment = []
-        last_time = None
-        max_gap = 30  # seconds
-
-        for i, (t, bpm) in enumerate(bpm_values):
-            if last_time is not None and (t - last_time).total_seconds() > max_gap:
-                if current_segment:
-                    segments.append(current_segment)
-                    current_segment = []
-            seconds_since_start = (t - bpm_values[0][0]).total_seconds()
-            current_segment.append((seconds_since_start, bpm))
-
-            last_time = t
-
-        if current_segment:
-            segments.append(current_segment)
-
-        # Add new plots
-        for segment in segments:
-            plot = LinePlot(line_width=1.5, color=(1, 0.3, 0.3, 1))
-            plot.points = segment
-            self.hr_graph.add_plot(plot)
-
-        raw_bpms = [b for _, b in bpm_values]
-        avg_bpm = sum(raw_bpms) / len(raw_bpms)
-        max_bpm = max(raw_bpms)
-        resting_bpm = min(raw_bpms)
-        high_bpm_threshold = 130
-        high_bpm_count = sum(1 for b in raw_bpms if b > high_bpm_threshold)
-
-        self.hr_graph.xmax = max(segment[-1][0] for segment in segments if segment)
-        self.hr_graph.ymax = max(100, max(raw_bpms) + 10)
-        self.hr_graph.ymin = min(40, min(raw_bpms) - 10)
+        t0 = instrumentation.stopwatch()
+        # One series for the whole day; gaps between segments are line breaks
+        self.hr_series.set_segments(result["segments"])
+
+        self.hr_graph.xmax = result["xmax"]
+        self.hr_graph.ymax = max(100, result["max_bpm"] + 10)
+        self.hr_graph.ymin = min(40, result["resting_bpm"] - 10)
 
         # Update visible metric labels
         metric_texts = [
-            f"Total readings: {len(raw_bpms)}",
-            f"Average HR: {avg_bpm:.1f} BPM",
-            f"Max HR: {max_bpm} BPM",
-            f"Resting HR (min): {resting_bpm} BPM",
-            f"Training Load (HR > {high_bpm_threshold}): {high_bpm_count} points"
+            f"Total readings: {result['total']}",
+            f"Average HR: {result['avg_bpm']:.1f} BPM",
+            f"Max HR: {result['max_bpm']} BPM",
+            f"Resting HR (min): {result['resting_bpm']} BPM",
+            f"Training Load (HR > {result['high_bpm_threshold']}): {result['high_bpm_count']} points"
         ]
         for label, text in zip(self.metric_labels, metric_texts):
             label.text = text
+
+        instrumentation.UI_UPDATE_US.record_since(t0)
+        METRICS_REFRESH_US.record_since(started)
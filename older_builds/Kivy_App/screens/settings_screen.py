@@ -11,6 +11,8 @@ from kivy.clock import Clock
 from bleak import BleakScanner
 
 from ble.hr_monitor import HRMonitor
+from ui.profiler import profiler, CAPTURE_SECONDS
+from utils import instrumentation
 
 
 class SettingsTab(BoxLayout):
@@ -31,6 +33,7 @@ class SettingsTab(BoxLayout):
         self.add_widget(self.create_toggle_section("SETTINGS 1", self.create_placeholder_section("SETTINGS 1")))
         self.add_widget(self.create_toggle_section("Device Selector", self.create_device_scan_section()))
         self.add_widget(self.create_toggle_section("SETTINGS 3", self.create_placeholder_section("SETTINGS 3")))
+        self.add_widget(self.create_toggle_section("Diagnostics", self.create_diagnostics_section()))
 
     def _update_bg(self, *args):
         self.bg.pos = self.pos
@@ -138,6 +141,71 @@ class SettingsTab(BoxLayout):
         container.on_expand = on_expand
         return container
 
+    def create_diagnostics_section(self):
+        container = BoxLayout(orientation='vertical', spacing=5, padding=[10, 0, 10, 0], size_hint_y=None)
+        container.bind(minimum_height=container.setter('height'))
+
+        controls = BoxLayout(orientation='horizontal', spacing=10, size_hint_y=None, height=40)
+        enable_btn = Button()
+        refresh_btn = Button(text="Refresh")
+        export_btn = Button(text="Export")
+        controls.add_widget(enable_btn)
+        controls.add_widget(refresh_btn)
+        controls.add_widget(export_btn)
+        container.add_widget(controls)
+
+        profile_controls = BoxLayout(orientation='horizontal', spacing=10, size_hint_y=None, height=40)
+        hud_btn = Button()
+        capture_btn = Button(text=f"Profile {CAPTURE_SECONDS:g}s")
+        profile_controls.add_widget(hud_btn)
+        profile_controls.add_widget(capture_btn)
+        container.add_widget(profile_controls)
+
+        status = Label(text="", color=(1, 1, 1, 1), size_hint_y=None, height=25, font_size='12sp')
+        container.add_widget(status)
+
+        metrics_box = BoxLayout(orientation='vertical', spacing=2, size_hint_y=None)
+        metrics_box.bind(minimum_height=metrics_box.setter('height'))
+        container.add_widget(metrics_box)
+
+        def refresh(*args):
+            enable_btn.text = "Disable" if instrumentation.enabled else "Enable"
+            hud_btn.text = "Hide HUD" if profiler.enabled else "Show HUD"
+            metrics_box.clear_widgets()
+            for line in instrumentation.snapshot_lines():
+                row = Label(text=line, color=(1, 1, 1, 1), size_hint_y=None, height=22,
+                            font_size='12sp', halign='left', valign='middle')
+                row.bind(size=row.setter('text_size'))
+                metrics_box.add_widget(row)
+
+        def toggle_enabled(*args):
+            instrumentation.set_enabled(not instrumentation.enabled)
+            status.text = "Instrumentation on" if instrumentation.enabled else "Instrumentation off"
+            refresh()
+
+        def export(*args):
+            path = instrumentation.export_snapshot()
+            status.text = f"Snapshot saved to {path}"
+
+        def toggle_hud(*args):
+            profiler.toggle()
+            refresh()
+
+        def capture(*args):
+            def done(path):
+                status.text = f"Profile saved to {path}"
+            if profiler.capture(on_done=done):
+                status.text = "Profiling..."
+
+        enable_btn.bind(on_release=toggle_enabled)
+        hud_btn.bind(on_release=toggle_hud)
+        capture_btn.bind(on_release=capture)
+        refresh_btn.bind(on_release=refresh)
+        export_btn.bind(on_release=export)
+
+        container.on_expand = refresh
+        return container
+
 class SettingsScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
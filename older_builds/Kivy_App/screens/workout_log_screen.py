@@ -1,10 +1,142 @@
 # screens/workout_log_screen.py
+import os
+
+from kivy.clock import Clock
 from kivy.uix.screenmanager import Screen
 from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
 from kivy.uix.scrollview import ScrollView
 from kivy.uix.label import Label
 from kivy.graphics import Color, Rectangle
 
+from ui.hr_graph import HRGraph
+from utils.analytics_worker import get_worker
+from utils.hr_analytics import MAX_GAP
+from utils.hr_client import get_client, fetch_compare, fetch_export, fetch_sessions
+from utils.sample_cache import SampleCache
+from utils.session_compare import describe_match
+from utils.session_export import FORMATS, filename
+from utils.sessions import describe
+
+RECENT_DAYS = 7
+EXPORT_DIR = os.path.join("data", "exports")
+SIMILAR_SESSIONS = 3
+ALIGN_BUTTONS = (("Time", "time"), ("Distance", "distance"), ("Shape", "dtw"))
+MATCH_COLORS = ((0.4, 0.7, 1, 1), (0.6, 0.9, 0.5, 1), (0.9, 0.8, 0.4, 1))
+PREFETCH_AROUND = 3   # sessions above and below the visible ones loaded in the background
+PREFETCH_DELAY_S = 0.2
+
+_sample_cache = None
+
+
+def get_sample_cache():
+    global _sample_cache
+    if _sample_cache is None:
+        _sample_cache = SampleCache(lambda start, end: get_client().range(start, end))
+    return _sample_cache
+
+
+def load_session_samples(session):
+    # Analytics worker task: a session's samples, from the cache if held
+    return get_sample_cache().get(session)
+
+
+class SessionGraph(HRGraph):
+    # The session's own heart rate, from the sample cache; usually already
+    # prefetched by the time the entry is expanded
+    def __init__(self, session, **kwargs):
+        super().__init__(xlabel='min', ylabel='HR', x_ticks_major=10, y_ticks_major=20, y_grid_label=True,
+                         x_grid_label=True, y_grid=True, xmin=0, xmax=max(1, session["duration_s"] / 60),
+                         ymin=40, ymax=200, size_hint_y=None, height=160, **kwargs)
+        self.session = session
+        self.loaded = False
+        self.hr = self.add_series(color=(1, 0.3, 0.3, 1), width=1.5, max_gap=MAX_GAP / 60)
+
+    def load(self):
+        self.loaded = True
+        series = get_sample_cache().peek(self.session)
+        if series is not None:
+            self.apply(series)
+            return
+        get_worker().submit(f"samples:{self.session['start']}", load_session_samples, self.session,
+                            on_result=self.apply)
+
+    def apply(self, series):
+        if not len(series):
+            return
+        self.hr.set_data(series.minutes(), series.bpm)
+        self.ymin = int(series.bpm.min()) - 10
+        self.ymax = int(series.bpm.max()) + 10
+
+
+class SessionComparison(BoxLayout):
+    # This session's heart rate against its most similar earlier sessions,
+    # lined up by time, distance or shape (utils/session_compare.py)
+    def __init__(self, session, **kwargs):
+        super().__init__(orientation='vertical', size_hint_y=None, spacing=5, **kwargs)
+        self.bind(minimum_height=self.setter('height'))
+        self.session = session
+        self.loaded = False
+
+        buttons = BoxLayout(orientation='horizontal', size_hint_y=None, height=35, spacing=10)
+        for text, align in ALIGN_BUTTONS:
+            button = Button(text=text)
+            button.bind(on_release=lambda instance, align=align: self.load(align))
+            buttons.add_widget(button)
+        self.add_widget(buttons)
+
+        self.graph = HRGraph(xlabel='min', ylabel='HR', x_ticks_major=10, y_ticks_major=20, y_grid_label=True,
+                             x_grid_label=True, y_grid=True, xmin=0, xmax=60, ymin=40, ymax=200,
+                             size_hint_y=None, height=160)
+        self.matches = [self.graph.add_series(color=color, width=1.2) for color in MATCH_COLORS]
+        self.ref = self.graph.add_series(color=(1, 0.3, 0.3, 1), width=1.8)
+        self.add_widget(self.graph)
+        self.status = Label(text="", size_hint_y=None, height=25)
+        self.add_widget(self.status)
+        self.rows = [Label(text="", size_hint_y=None, height=25, color=color) for color in MATCH_COLORS]
+        for row in self.rows:
+            self.add_widget(row)
+
+    def load(self, align="time"):
+        self.loaded = True
+        self.status.text = "Finding similar sessions..."
+        get_worker().submit(f"compare:{self.session['start']}", fetch_compare, get_client().base_url,
+                            self.session["start"], SIMILAR_SESSIONS, align,
+                            on_result=self.apply, on_error=self._show_error)
+
+    def _show_error(self, error):
+        self.status.text = str(error).split(": ", 1)[-1]
+
+    def apply(self, result):
+        by_distance = result["unit"] == "m"
+        scale = 1000.0 if by_distance else 60.0
+        xs = [x / scale for x in result["x"]]
+        nan = float("nan")
+
+        def values(bpms):
+            return [nan if v is None else v for v in bpms]
+
+        self.ref.set_data(xs, values(result["bpm"]))
+        known = [v for v in result["bpm"] if v is not None]
+        for series, row, n in zip(self.matches, self.rows, range(len(self.matches))):
+            if n < len(result["similar"]):
+                entry = result["similar"][n]
+                series.set_data(xs, values(entry["bpm"]))
+                known += [v for v in entry["bpm"] if v is not None]
+                when, bpm, pace = describe_match(entry)
+                row.text = f"{when}:  {bpm}" + (f",  {pace}" if pace else "")
+            else:
+                series.clear()
+                row.text = ""
+        self.graph.xlabel = 'km' if by_distance else 'min'
+        self.graph.xmax = max(xs[-1], 1) if xs else 1
+        self.graph.x_ticks_major = 1 if by_distance else 10
+        if known:
+            self.graph.ymin = min(known) - 10
+            self.graph.ymax = max(known) + 10
+        self.status.text = "" if result["similar"] else "No earlier sessions like this one yet"
+
+
 class WorkoutLogTab(BoxLayout):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -13,12 +145,54 @@ class WorkoutLogTab(BoxLayout):
         self.padding = 10
         self.size_hint_y = None
         self.bind(minimum_height=self.setter('height'))
+        self._shown = None
+        self.entries = []   # (session, section), newest first
 
-        self.add_widget(self.create_log_entry("Bike", "45 min", "137 bpm", "7:00 AM"))
-        self.add_widget(self.create_log_entry("Row", "30 min", "145 bpm", "6:45 PM"))
-        self.add_widget(self.create_log_entry("Lift", "60 min", "120 bpm", "1:00 PM"))
+        self.empty_label = Label(text="Loading sessions...", size_hint_y=None, height=40)
+        self.add_widget(self.empty_label)
 
-    def create_log_entry(self, workout, duration, hr, time):
+    def refresh(self):
+        # Summaries, calories included, are cached by the HR service; this
+        # only fetches them
+        get_worker().submit("sessions", fetch_sessions, get_client().base_url, RECENT_DAYS,
+                            on_result=self.apply_sessions, on_error=self._show_error)
+
+    def _show_error(self, error):
+        if self._shown is None:
+            self.empty_label.text = "Couldn't load sessions"
+
+    def apply_sessions(self, sessions):
+        key = [(s["start"], s["end"]) for s in sessions]
+        if key == self._shown:
+            return
+        self._shown = key
+        self.clear_widgets()
+        self.entries = []
+        if not sessions:
+            self.empty_label.text = "No sessions in the last week"
+            self.add_widget(self.empty_label)
+        for session in sessions:
+            section = self.create_log_entry(*describe(session), session)
+            self.entries.append((session, section))
+            self.add_widget(section)
+
+    def prefetch_visible(self, scroll):
+        # Loads the samples of the entries on screen, then of those just
+        # above and below them, so expanding one rarely waits
+        _, bottom = scroll.to_window(scroll.x, scroll.y)
+        _, top = scroll.to_window(scroll.x, scroll.top)
+        visible = [i for i, (_, section) in enumerate(self.entries)
+                   if section.to_window(section.x, section.top)[1] >= bottom
+                   and section.to_window(section.x, section.y)[1] <= top]
+        if not visible:
+            return
+        first, last = visible[0], visible[-1]
+        order = list(visible)
+        for step in range(1, PREFETCH_AROUND + 1):
+            order += [i for i in (last + step, first - step) if 0 <= i < len(self.entries)]
+        get_sample_cache().prefetch([self.entries[i][0] for i in order])
+
+    def create_log_entry(self, workout, duration, hr, time, session):
         section = BoxLayout(orientation='vertical', size_hint_y=None, spacing=5)
         section.bind(minimum_height=section.setter('height'))
 
@@ -53,9 +227,16 @@ class WorkoutLogTab(BoxLayout):
 
         details = BoxLayout(orientation='vertical', padding=[10, 0, 10, 0], spacing=5, size_hint_y=None)
         details.bind(minimum_height=details.setter('height'))
-        details.add_widget(Label(text="Pace: 2:05/500m", size_hint_y=None, height=25))
-        details.add_widget(Label(text="Calories: 350 kcal", size_hint_y=None, height=25))
-        details.add_widget(Label(text="[Graph Placeholder]", size_hint_y=None, height=100))
+        details.add_widget(Label(text=f"Max HR: {session['max_bpm']} bpm", size_hint_y=None, height=25))
+        details.add_widget(Label(text=f"Calories: {session['kcal']:.0f} kcal ({session['active_kcal']:.0f} active)",
+                                 size_hint_y=None, height=25))
+        if session["steps"]:
+            details.add_widget(Label(text=f"Steps: {session['steps']:,}", size_hint_y=None, height=25))
+        details.add_widget(self.create_export_row(session))
+        graph = SessionGraph(session)
+        details.add_widget(graph)
+        comparison = SessionComparison(session)
+        details.add_widget(comparison)
 
         content_shown = [False]
 
@@ -66,17 +247,49 @@ class WorkoutLogTab(BoxLayout):
             else:
                 section.add_widget(details)
                 arrow_label.text = "🔽"
+                if not graph.loaded:
+                    graph.load()
+                if not comparison.loaded:
+                    comparison.load()
             content_shown[0] = not content_shown[0]
 
         toggle_row.bind(on_touch_down=lambda instance, touch: toggle() if toggle_row.collide_point(*touch.pos) else None)
 
         return section
 
+    def create_export_row(self, session):
+        row = BoxLayout(orientation='horizontal', size_hint_y=None, height=40, spacing=10)
+        status = Label(text="", size_hint_x=0.4)
+        for fmt in FORMATS:
+            button = Button(text=fmt.upper(), size_hint_x=0.2)
+            button.bind(on_release=lambda instance, fmt=fmt: self.export(session, fmt, status))
+            row.add_widget(button)
+        row.add_widget(status)
+        return row
+
+    def export(self, session, fmt, status):
+        # The service writes the file; it lands in data/exports/
+        status.text = "Exporting..."
+        path = os.path.join(EXPORT_DIR, filename(session, fmt))
+        get_worker().submit(f"export:{session['start']}", fetch_export, get_client().base_url,
+                            session["start"], fmt, path,
+                            on_result=lambda saved: setattr(status, 'text', f"Saved {os.path.basename(saved)}"),
+                            on_error=lambda error: setattr(status, 'text', "Export failed"))
+
 class WorkoutLogScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         layout = BoxLayout(orientation='vertical')
-        scroll = ScrollView()
-        scroll.add_widget(WorkoutLogTab())
-        layout.add_widget(scroll)
+        self.scroll = ScrollView()
+        self.log_tab = WorkoutLogTab()
+        self.scroll.add_widget(self.log_tab)
+        # Prefetch once scrolling settles, and once a new list is laid out
+        self._prefetch = Clock.create_trigger(lambda dt: self.log_tab.prefetch_visible(self.scroll),
+                                              PREFETCH_DELAY_S)
+        self.scroll.bind(scroll_y=lambda *args: self._prefetch())
+        self.log_tab.bind(height=lambda *args: self._prefetch())
+        layout.add_widget(self.scroll)
         self.add_widget(layout)
+
+    def on_pre_enter(self, *args):
+        self.log_tab.refresh()
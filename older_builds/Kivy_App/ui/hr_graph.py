@@ -0,0 +1,360 @@
+# ui/hr_graph.py
+#
+# Line graph for HR data that redraws in place. Each series keeps its points
+# in growable numpy arrays and owns one Mesh whose vertex and index buffers
+# are preallocated for the widget's width. Mesh reads numpy buffers without
+# copying them, so a redraw only rewrites numbers in those buffers:
+#
+#   1. the visible x range is found by bisection
+#   2. with more points than two per pixel column, they're reduced to the
+#      min and max of each column, so vertex count is O(width) whether the
+#      series holds 10k points or 1M
+#   3. each segment becomes a quad of the line's width, written straight
+#      into the vertex buffer
+#
+# A NaN y breaks the line; give it the x of the last point before the gap.
+# So does a step in x larger than the series' max_gap. Several series share
+# one set of axes, and x_offset shifts every series without touching its
+# data (a live graph keeps epoch seconds and sets x_offset to now):
+#
+#   graph = HRGraph(xmin=-60, xmax=0, ymin=30, ymax=250)
+#   hr = graph.add_series(color=(1, 0, 0, 1), max_gap=5)
+#   hr.extend(ts, bpms)
+#   graph.x_offset = now
+
+import math
+
+import numpy as np
+from kivy.clock import Clock
+from kivy.graphics import Color, Line, Mesh, PopMatrix, PushMatrix, Rotate
+from kivy.graphics.scissor_instructions import ScissorPop, ScissorPush
+from kivy.properties import BooleanProperty, ListProperty, NumericProperty, StringProperty
+from kivy.uix.label import Label
+from kivy.uix.widget import Widget
+
+from utils import instrumentation
+
+GRAPH_REDRAW_US = instrumentation.histogram("ui.graph_redraw_us")
+
+MAX_SEGMENTS = 65535 // 4   # Mesh indices are 16-bit; 4 vertices per segment
+LABEL_FONT = "11sp"
+TICK_LABEL_W = 36
+AXIS_LABEL_H = 18
+_QUAD = np.array([0, 1, 2, 2, 1, 3], dtype=np.uint16)
+
+
+class Series:
+    # One line on an HRGraph; create with HRGraph.add_series()
+    def __init__(self, graph, color, width, max_gap, capacity=1024):
+        self.graph = graph
+        self.width = width
+        self.max_gap = max_gap
+        self._x = np.empty(capacity)
+        self._y = np.empty(capacity)
+        self._start = self._end = 0
+        self._vertices = np.zeros(0, dtype=np.float32)
+        self._indices = np.zeros(0, dtype=np.uint16)
+        self.color = Color(*color)
+        self.mesh = Mesh(mode="triangles")
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def x(self):
+        return self._x[self._start:self._end]
+
+    @property
+    def y(self):
+        return self._y[self._start:self._end]
+
+    def set_data(self, xs, ys):
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        self._start = self._end = 0
+        self._reserve(len(xs))
+        self._x[:len(xs)] = xs
+        self._y[:len(ys)] = ys
+        self._end = len(xs)
+        self.graph.ask_redraw()
+
+    def set_segments(self, segments):
+        # Lists of (x, y) pairs, as hr_analytics.split_segments returns,
+        # drawn as one line with breaks between them
+        xs, ys = [], []
+        for segment in segments:
+            if not segment:
+                continue
+            if xs:
+                xs.append(xs[-1])
+                ys.append(math.nan)
+            for x, y in segment:
+                xs.append(x)
+                ys.append(y)
+        self.set_data(xs, ys)
+
+    def extend(self, xs, ys):
+        # Points must not be earlier than the last one already held
+        n = len(xs)
+        if not n:
+            return
+        self._reserve(len(self) + n)
+        self._x[self._end:self._end + n] = xs
+        self._y[self._end:self._end + n] = ys
+        self._end += n
+        self.graph.ask_redraw()
+
+    def append(self, x, y):
+        self._reserve(len(self) + 1)
+        self._x[self._end] = x
+        self._y[self._end] = y
+        self._end += 1
+        self.graph.ask_redraw()
+
+    def trim_before(self, x):
+        # Drops points older than x, keeping the one just before it so the
+        # line still runs in from the left edge
+        i = int(np.searchsorted(self.x, x)) - 1
+        if i > 0:
+            self._start += i
+            self.graph.ask_redraw()
+
+    def clear(self):
+        self._start = self._end = 0
+        self.graph.ask_redraw()
+
+    def _reserve(self, count):
+        # Room for `count` points from _start; slides the live points to the
+        # front first, and only grows when that isn't enough
+        if self._start + count <= len(self._x):
+            return
+        live = len(self)
+        if count > len(self._x):
+            size = max(count, 2 * len(self._x))
+            x, y = np.empty(size), np.empty(size)
+            x[:live] = self.x
+            y[:live] = self.y
+            self._x, self._y = x, y
+        else:
+            self._x[:live] = self.x
+            self._y[:live] = self.y
+        self._start, self._end = 0, live
+
+    def _reserve_segments(self, count):
+        if count * 16 <= len(self._vertices):
+            return
+        count = min(max(count, 2 * len(self._vertices) // 16, 256), MAX_SEGMENTS)
+        self._vertices = np.zeros(count * 16, dtype=np.float32)
+        self._indices = (np.arange(count, dtype=np.uint16)[:, None] * 4 + _QUAD).ravel()
+
+    def _render(self, x0, y0, width, height, columns):
+        graph = self.graph
+        lo_x = graph.xmin + graph.x_offset
+        hi_x = graph.xmax + graph.x_offset
+        x, y = self.x, self.y
+        # One point either side of the visible range so lines reach the edges
+        lo = max(int(np.searchsorted(x, lo_x, "left")) - 1, 0)
+        hi = min(int(np.searchsorted(x, hi_x, "right")) + 1, len(x))
+        x, y = x[lo:hi], y[lo:hi]
+        if len(x) < 2 or hi_x <= lo_x or graph.ymax <= graph.ymin:
+            self.mesh.indices = self._indices[:0]
+            return
+
+        sx = width / (hi_x - lo_x)
+        breaks = None
+        if len(x) > 2 * columns:
+            col = ((x - lo_x) * sx).astype(np.intp)
+            starts = np.flatnonzero(np.diff(col, prepend=col[0] - 1))
+            lows = np.fmin.reduceat(y, starts)
+            highs = np.fmax.reduceat(y, starts)
+            gap_after = np.add.reduceat(np.isnan(y), starts) > 0
+            if self.max_gap:
+                gap_after[:-1] |= x[starts[1:]] - x[starts[1:] - 1] > self.max_gap
+            x = np.repeat(x[starts], 2)
+            y = np.column_stack((lows, highs)).ravel()
+            breaks = np.zeros(len(x) - 1, dtype=bool)
+            breaks[1::2] = gap_after[:-1]
+        elif self.max_gap:
+            breaks = np.diff(x) > self.max_gap
+
+        finite = np.isfinite(y)
+        ok = finite[:-1] & finite[1:]
+        if breaks is not None:
+            ok &= ~breaks
+        seg = np.flatnonzero(ok)
+        count = len(seg)
+        self._reserve_segments(count)
+
+        px = x0 + (x - lo_x) * sx
+        py = y0 + (y - graph.ymin) * (height / (graph.ymax - graph.ymin))
+        ax, ay = px[seg], py[seg]
+        bx, by = px[seg + 1], py[seg + 1]
+        dx, dy = bx - ax, by - ay
+        length = np.hypot(dx, dy)
+        length[length == 0] = 1.0
+        half = self.width / 2.0
+        nx = -dy / length * half
+        ny = dx / length * half
+
+        quads = self._vertices[:count * 16].reshape(count, 4, 4)
+        quads[:, 0, 0] = ax + nx
+        quads[:, 0, 1] = ay + ny
+        quads[:, 1, 0] = ax - nx
+        quads[:, 1, 1] = ay - ny
+        quads[:, 2, 0] = bx + nx
+        quads[:, 2, 1] = by + ny
+        quads[:, 3, 0] = bx - nx
+        quads[:, 3, 1] = by - ny
+        self.mesh.vertices = self._vertices[:count * 16]
+        self.mesh.indices = self._indices[:count * 6]
+
+
+class HRGraph(Widget):
+    xmin = NumericProperty(0)
+    xmax = NumericProperty(100)
+    ymin = NumericProperty(0)
+    ymax = NumericProperty(100)
+    x_offset = NumericProperty(0)
+    x_ticks_major = NumericProperty(0)
+    y_ticks_major = NumericProperty(0)
+    x_grid_label = BooleanProperty(False)
+    y_grid_label = BooleanProperty(False)
+    x_grid = BooleanProperty(False)
+    y_grid = BooleanProperty(False)
+    xlabel = StringProperty("")
+    ylabel = StringProperty("")
+    padding = NumericProperty(5)
+    draw_border = BooleanProperty(True)
+    border_color = ListProperty([1, 1, 1, 0.95])
+    grid_color = ListProperty([0.25, 0.25, 0.25, 1])
+
+    def __init__(self, **kwargs):
+        self.series = []
+        self.ask_redraw = Clock.create_trigger(self._redraw)
+        self._ask_layout = Clock.create_trigger(self._layout)
+        super().__init__(**kwargs)
+        self._plot = (0, 0, 0, 0)
+        self._tick_labels = []
+
+        with self.canvas:
+            self._grid_color = Color(*self.grid_color)
+            self._grid = Mesh(mode="lines")
+            self._border_color = Color(*self.border_color)
+            self._border = Line(rectangle=(0, 0, 0, 0), width=1)
+            self._scissor = ScissorPush(x=0, y=0, width=0, height=0)
+        # Series instructions go between these two
+        self._scissor_pop = ScissorPop()
+        self.canvas.add(self._scissor_pop)
+
+        self._xlabel = Label(font_size=LABEL_FONT, size_hint=(None, None))
+        self._ylabel = Label(font_size=LABEL_FONT, size_hint=(None, None))
+        with self._ylabel.canvas.before:
+            PushMatrix()
+            self._ylabel_rotate = Rotate(angle=90)
+        with self._ylabel.canvas.after:
+            PopMatrix()
+        self.add_widget(self._xlabel)
+        self.add_widget(self._ylabel)
+
+        self.bind(pos=self._ask_layout, size=self._ask_layout, xmin=self._ask_layout,
+                  xmax=self._ask_layout, ymin=self._ask_layout, ymax=self._ask_layout,
+                  x_ticks_major=self._ask_layout, y_ticks_major=self._ask_layout,
+                  x_grid_label=self._ask_layout, y_grid_label=self._ask_layout,
+                  x_grid=self._ask_layout, y_grid=self._ask_layout, padding=self._ask_layout,
+                  xlabel=self._ask_layout, ylabel=self._ask_layout, draw_border=self._ask_layout,
+                  x_offset=self.ask_redraw)
+        self.bind(border_color=lambda _, c: setattr(self._border_color, "rgba", c),
+                  grid_color=lambda _, c: setattr(self._grid_color, "rgba", c))
+        self._ask_layout()
+
+    def add_series(self, color=(1, 0, 0, 1), width=1.5, max_gap=None):
+        series = Series(self, color, width, max_gap)
+        i = self.canvas.indexof(self._scissor_pop)
+        self.canvas.insert(i, series.color)
+        self.canvas.insert(i + 1, series.mesh)
+        self.series.append(series)
+        return series
+
+    def remove_series(self, series):
+        self.canvas.remove(series.color)
+        self.canvas.remove(series.mesh)
+        self.series.remove(series)
+
+    def _ticks(self, lo, hi, step):
+        if step <= 0 or hi <= lo:
+            return []
+        first = math.ceil(lo / step)
+        return [i * step for i in range(first, int(math.floor(hi / step)) + 1)]
+
+    def _layout(self, *args):
+        # Axes, grid and labels; only runs when size, range or options change
+        pad = self.padding
+        left = pad + (AXIS_LABEL_H if self.ylabel else 0) + (TICK_LABEL_W if self.y_grid_label else 0)
+        bottom = pad + (AXIS_LABEL_H if self.xlabel else 0) + (AXIS_LABEL_H if self.x_grid_label else 0)
+        x0, y0 = self.x + left, self.y + bottom
+        width = max(0, self.width - left - pad)
+        height = max(0, self.height - bottom - pad)
+        self._plot = (x0, y0, width, height)
+
+        self._border.rectangle = (x0, y0, width, height) if self.draw_border else (0, 0, 0, 0)
+        wx, wy = self.to_window(x0, y0)
+        self._scissor.x, self._scissor.y = int(wx), int(wy)
+        self._scissor.width, self._scissor.height = int(width) + 1, int(height) + 1
+
+        xticks = self._ticks(self.xmin, self.xmax, self.x_ticks_major)
+        yticks = self._ticks(self.ymin, self.ymax, self.y_ticks_major)
+        sx = width / (self.xmax - self.xmin) if self.xmax > self.xmin else 0
+        sy = height / (self.ymax - self.ymin) if self.ymax > self.ymin else 0
+        grid = []
+        if self.x_grid:
+            for v in xticks:
+                gx = x0 + (v - self.xmin) * sx
+                grid += [gx, y0, 0, 0, gx, y0 + height, 0, 0]
+        if self.y_grid:
+            for v in yticks:
+                gy = y0 + (v - self.ymin) * sy
+                grid += [x0, gy, 0, 0, x0 + width, gy, 0, 0]
+        self._grid.vertices = grid
+        self._grid.indices = list(range(len(grid) // 4))
+
+        placed = []
+        if self.x_grid_label:
+            placed += [(f"{v:g}", (x0 + (v - self.xmin) * sx - TICK_LABEL_W / 2, y0 - AXIS_LABEL_H),
+                        "center") for v in xticks]
+        if self.y_grid_label:
+            placed += [(f"{v:g}", (x0 - TICK_LABEL_W - 2, y0 + (v - self.ymin) * sy - AXIS_LABEL_H / 2),
+                        "right") for v in yticks]
+        self._place_tick_labels(placed)
+
+        self._xlabel.text = self.xlabel
+        self._xlabel.size = (width, AXIS_LABEL_H)
+        self._xlabel.pos = (x0, self.y + pad)
+        self._ylabel.text = self.ylabel
+        self._ylabel.size = (height, AXIS_LABEL_H)
+        self._ylabel.center = (self.x + pad + AXIS_LABEL_H / 2, y0 + height / 2)
+        self._ylabel_rotate.origin = self._ylabel.center
+        self.ask_redraw()
+
+    def _place_tick_labels(self, placed):
+        # Labels are pooled; only a change in tick count adds or removes widgets
+        while len(self._tick_labels) < len(placed):
+            label = Label(font_size=LABEL_FONT, size_hint=(None, None), size=(TICK_LABEL_W, AXIS_LABEL_H))
+            label.bind(size=label.setter("text_size"))
+            self._tick_labels.append(label)
+            self.add_widget(label)
+        while len(self._tick_labels) > len(placed):
+            self.remove_widget(self._tick_labels.pop())
+        for label, (text, pos, halign) in zip(self._tick_labels, placed):
+            label.text = text
+            label.halign = halign
+            label.pos = pos
+
+    def _redraw(self, *args):
+        t0 = instrumentation.stopwatch()
+        x0, y0, width, height = self._plot
+        if width < 2 or height < 2:
+            return
+        columns = min(int(width), MAX_SEGMENTS // 2 - 4)
+        for series in self.series:
+            series._render(x0, y0, width, height, columns)
+        GRAPH_REDRAW_US.record_since(t0)
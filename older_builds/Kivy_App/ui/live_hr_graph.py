@@ -4,10 +4,14 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
 from kivy.clock import Clock
-from kivy_garden.graph import Graph, LinePlot
 from datetime import datetime
 import asyncio
 from ble.hr_monitor import HRMonitor
+from ui.hr_graph import HRGraph
+from utils import instrumentation
+from utils.timebase import timebase
+
+GAP_S = 5  # break the line where the strap went quiet for longer than this
 
 class LiveHRGraph(BoxLayout):
     def __init__(self, **kwargs):
@@ -15,9 +19,9 @@ class LiveHRGraph(BoxLayout):
         self.orientation = 'vertical'
         self.padding = 10
         self.window_seconds = 60
-        self.hr_data = []
+        self._label_second = None
 
-        axis_label = Label(
+        self.axis_label = Label(
             size_hint_y=None,
             height=20,
             font_size='12sp',
@@ -25,12 +29,12 @@ class LiveHRGraph(BoxLayout):
             halign='center',
             valign='middle'
         )
-        axis_label.bind(size=axis_label.setter('text_size'))
-        self.add_widget(axis_label)
+        self.axis_label.bind(size=self.axis_label.setter('text_size'))
+        self.add_widget(self.axis_label)
 
-        self.graph = Graph(
+        self.graph = HRGraph(
             xlabel='Time (s)',
-            ylabel='30     BPM     230',
+            ylabel='BPM',
             x_ticks_major=10,
             y_ticks_major=20,
             y_grid_label=True,
@@ -48,8 +52,7 @@ class LiveHRGraph(BoxLayout):
             border_color=[0.6, 0.6, 0.6, 1]
         )
 
-        self.plot = LinePlot(line_width=1.5, color=[1, 0, 0, 1])
-        self.graph.add_plot(self.plot)
+        self.series = self.graph.add_series(color=[1, 0, 0, 1], width=1.5, max_gap=GAP_S)
         self.add_widget(self.graph)
 
         Clock.schedule_interval(self.update_graph, 1)
@@ -57,13 +60,34 @@ class LiveHRGraph(BoxLayout):
     def add_point(self, bpm):
         if bpm <= 0:
             return
-        now = datetime.now().timestamp()
-        self.hr_data.append((now, bpm))
+        now = timebase.wall_now()
+        self.series.append(now, bpm)
+        self.graph.x_offset = now
+
+    def add_points(self, batch):
+        # (timestamp, bpm) pairs from the dispatcher; the graph redraws once
+        # per frame however many batches arrive
+        points = [(t, bpm) for t, bpm in batch if bpm > 0]
+        if points:
+            ts, bpms = zip(*points)
+            self.series.extend(ts, bpms)
+            self.graph.x_offset = timebase.wall_now()
+
+    def set_current(self, bpm):
+        self.axis_label.text = f"{bpm} BPM" if bpm > 0 else "-- BPM"
 
     def update_graph(self, dt):
-        now_timestamp = datetime.now().timestamp()
-        cutoff = now_timestamp - self.window_seconds
-        self.hr_data = [(t, bpm) for (t, bpm) in self.hr_data if t >= cutoff]
-        shifted_points = [(t - now_timestamp, bpm) for (t, bpm) in self.hr_data]
-        self.plot.points = shifted_points
-        self.graph.xlabel = f"Time (s) — now: {datetime.now().strftime('%H:%M:%S')}"
+        t0 = instrumentation.stopwatch()
+        # Same anchor the dispatcher converted the points with, so the x axis
+        # doesn't jump when the wall clock does. Points stay in epoch seconds;
+        # x_offset scrolls them
+        now_timestamp = timebase.wall_now()
+        self.series.trim_before(now_timestamp - self.window_seconds)
+        self.graph.x_offset = now_timestamp
+        # A new xlabel re-renders the axis title texture; only when the
+        # displayed second changes
+        second = int(now_timestamp)
+        if second != self._label_second:
+            self._label_second = second
+            self.graph.xlabel = f"Time (s) — now: {datetime.fromtimestamp(second).strftime('%H:%M:%S')}"
+        instrumentation.UI_UPDATE_US.record_since(t0)
@@ -0,0 +1,254 @@
+# ui/profiler.py
+#
+# Built-in profiling mode for WearableApp. Screen build and on_pre_enter
+# times are always recorded (one perf_counter pair each); everything else
+# only runs while the profiler is enabled, so it costs nothing otherwise:
+#
+#   HUD        frame times (fps, p50/p99/max over the last FRAME_WINDOW
+#              frames), jank frames per screen, build and on_pre_enter
+#              times, and widget / canvas instruction counts for the
+#              current screen, refreshed twice a second
+#   capture()  cProfile of the UI thread for N seconds, dumped to
+#              data/profiles/ as .prof (for snakeviz / pstats) plus a .txt
+#              of the top functions and the per-screen table
+#
+# Enable with HR_PROFILE=1, F12 or the Settings diagnostics section; F11
+# captures HR_PROFILE_SECONDS (default 10) of cProfile.
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+from collections import deque
+from datetime import datetime
+
+from kivy.clock import Clock
+from kivy.core.window import Window
+from kivy.graphics import Color, Rectangle
+from kivy.uix.label import Label
+
+log = logging.getLogger("wearable.profiler")
+
+FRAME_WINDOW = 300       # frames kept for the HUD percentiles (~5 s at 60 fps)
+JANK_MS = 33.3           # slower than 30 fps
+HUD_INTERVAL = 0.5
+CAPTURE_SECONDS = float(os.environ.get("HR_PROFILE_SECONDS", 10))
+PROFILE_DIR = os.path.join("data", "profiles")
+TOP_FUNCTIONS = 40
+
+
+def count_tree(widget):
+    # (widgets, canvas instructions) in widget and everything under it
+    widgets = instructions = 0
+    stack = [widget]
+    while stack:
+        w = stack.pop()
+        widgets += 1
+        canvas = w.canvas
+        if canvas is not None:
+            instructions += _count_instructions(canvas)
+            # before/after are created on first access, so only count them
+            # if something has already asked for them
+            if getattr(canvas, "has_before", False):
+                instructions += _count_instructions(canvas.before)
+            if getattr(canvas, "has_after", False):
+                instructions += _count_instructions(canvas.after)
+        stack.extend(w.children)
+    return widgets, instructions
+
+
+def _count_instructions(group):
+    count = 0
+    stack = list(group.children)
+    while stack:
+        instruction = stack.pop()
+        count += 1
+        children = getattr(instruction, "children", None)
+        if children:
+            stack.extend(children)
+    return count
+
+
+class ScreenStats:
+    __slots__ = ("build_ms", "pre_enter_ms", "jank", "widgets", "instructions")
+
+    def __init__(self):
+        self.build_ms = None
+        self.pre_enter_ms = None
+        self.jank = 0
+        self.widgets = self.instructions = 0
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.screens = {}
+        self.frames = deque(maxlen=FRAME_WINDOW)
+        self.manager = None
+        self._last_frame = None
+        self._frame_event = None
+        self._hud_event = None
+        self._hud = None
+        self._capture = None
+
+    def _stats(self, name):
+        stats = self.screens.get(name)
+        if stats is None:
+            stats = self.screens[name] = ScreenStats()
+        return stats
+
+    # Screens -------------------------------------------------------------
+
+    def build_screen(self, screen_class, **kwargs):
+        # Constructs a screen, timing its __init__, and times its
+        # on_pre_enter from then on
+        t0 = time.perf_counter_ns()
+        screen = screen_class(**kwargs)
+        self._stats(screen.name).build_ms = (time.perf_counter_ns() - t0) / 1e6
+
+        handler = screen.on_pre_enter
+
+        def timed_pre_enter(*args):
+            t0 = time.perf_counter_ns()
+            result = handler(*args)
+            self._stats(screen.name).pre_enter_ms = (time.perf_counter_ns() - t0) / 1e6
+            return result
+
+        # EventDispatcher.dispatch looks the default handler up by name, so
+        # the instance attribute takes its place
+        screen.on_pre_enter = timed_pre_enter
+        return screen
+
+    def attach(self, manager):
+        self.manager = manager
+        if os.environ.get("HR_PROFILE", "") not in ("", "0"):
+            self.enable()
+
+    def _current(self):
+        return self.manager.current if self.manager else ""
+
+    # HUD -----------------------------------------------------------------
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self.frames.clear()
+        self._last_frame = time.perf_counter_ns()
+        self._frame_event = Clock.schedule_interval(self._on_frame, 0)
+        self._hud_event = Clock.schedule_interval(self._refresh_hud, HUD_INTERVAL)
+        if self._hud is None:
+            self._hud = self._make_hud()
+        Window.add_widget(self._hud)
+        log.info("⏱️ Profiler on")
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._frame_event.cancel()
+        self._hud_event.cancel()
+        Window.remove_widget(self._hud)
+        log.info("⏱️ Profiler off")
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def _on_frame(self, dt):
+        now = time.perf_counter_ns()
+        frame_ms = (now - self._last_frame) / 1e6
+        self._last_frame = now
+        self.frames.append(frame_ms)
+        if frame_ms > JANK_MS:
+            self._stats(self._current()).jank += 1
+
+    def _make_hud(self):
+        hud = Label(size_hint=(None, None), font_size="11sp", halign="left", valign="top",
+                    color=(0.6, 1, 0.6, 1), padding=(6, 4))
+        with hud.canvas.before:
+            Color(0, 0, 0, 0.7)
+            hud.bg = Rectangle()
+
+        def fit(*args):
+            hud.size = hud.texture_size
+            hud.pos = (0, Window.height - hud.height)
+            hud.bg.pos, hud.bg.size = hud.pos, hud.size
+
+        hud.bind(texture_size=fit)
+        Window.bind(height=fit)
+        return hud
+
+    def frame_summary(self):
+        frames = sorted(self.frames)
+        if not frames:
+            return {"fps": 0.0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        return {
+            "fps": round(1000 * len(frames) / sum(frames), 1),
+            "p50_ms": frames[len(frames) // 2],
+            "p99_ms": frames[min(len(frames) - 1, int(len(frames) * 0.99))],
+            "max_ms": frames[-1],
+        }
+
+    def _refresh_hud(self, dt):
+        name = self._current()
+        stats = self._stats(name)
+        if self.manager and self.manager.has_screen(name):
+            stats.widgets, stats.instructions = count_tree(self.manager.get_screen(name))
+        self._hud.text = "\n".join(self.lines())
+
+    def lines(self):
+        f = self.frame_summary()
+        lines = [f"{f['fps']:.0f} fps  p50 {f['p50_ms']:.1f}  p99 {f['p99_ms']:.1f}  max {f['max_ms']:.1f} ms"]
+        current = self._current()
+        for name, s in self.screens.items():
+            build = f"{s.build_ms:.1f}" if s.build_ms is not None else "-"
+            pre_enter = f"{s.pre_enter_ms:.1f}" if s.pre_enter_ms is not None else "-"
+            mark = ">" if name == current else " "
+            lines.append(f"{mark} {name:<9} build {build:>6}  enter {pre_enter:>5}  jank {s.jank}")
+            if name == current and s.widgets:
+                lines.append(f"    {s.widgets} widgets, {s.instructions} canvas instructions")
+        if self._capture:
+            lines.append("* cProfile capturing")
+        return lines
+
+    # cProfile ------------------------------------------------------------
+
+    def capture(self, seconds=CAPTURE_SECONDS, on_done=None):
+        # Profiles the UI thread for `seconds`; on_done(path) gets the .prof
+        # path. Returns False if a capture is already running.
+        if self._capture:
+            return False
+        profile = cProfile.Profile()
+        self._capture = profile
+        profile.enable()
+        log.info("⏱️ Capturing cProfile for %ss", seconds)
+
+        def finish(dt):
+            profile.disable()
+            self._capture = None
+            path = self.dump(profile)
+            if on_done:
+                on_done(path)
+
+        Clock.schedule_once(finish, seconds)
+        return True
+
+    def dump(self, profile):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f"kivy_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        profile.dump_stats(base + ".prof")
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        with open(base + ".txt", "w") as f:
+            f.write("\n".join(self.lines()) + "\n\n")
+            f.write(out.getvalue())
+        log.info("💾 Profile saved to %s.prof", base)
+        return base + ".prof"
+
+
+profiler = Profiler()
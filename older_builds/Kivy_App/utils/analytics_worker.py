@@ -0,0 +1,95 @@
+# utils/analytics_worker.py
+#
+# Runs slow analytics (file I/O, parsing, aggregation) off the Kivy main
+# thread. Results are handed back through Clock.schedule_once so callbacks
+# can touch widgets safely. Each submit() supersedes the previous one for the
+# same key: pending work is cancelled and late results are dropped, so
+# hammering Refresh only ever applies the newest request.
+
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from kivy.clock import Clock
+
+log = logging.getLogger("wearable.analytics")
+
+
+class AnalyticsWorker:
+    def __init__(self, use_processes=None, max_workers=2):
+        if use_processes is None:
+            use_processes = os.environ.get("HR_ANALYTICS_PROCESSES", "") not in ("", "0")
+        # Processes sidestep the GIL for very large logs, threads start faster
+        executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.executor = executor_cls(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._generation = {}
+        self._pending = {}
+
+    def submit(self, key, fn, *args, on_result=None, on_error=None):
+        with self._lock:
+            generation = self._generation.get(key, 0) + 1
+            self._generation[key] = generation
+            previous = self._pending.pop(key, None)
+            future = self.executor.submit(fn, *args)
+            self._pending[key] = future
+        # cancel() runs done-callbacks synchronously, so it must happen outside the lock
+        if previous is not None:
+            previous.cancel()
+
+        def done(fut):
+            # Runs on the worker (or pool management) thread
+            with self._lock:
+                if self._generation.get(key) != generation:
+                    return
+                self._pending.pop(key, None)
+            if fut.cancelled():
+                return
+            error = fut.exception()
+            if error is not None:
+                log.error("Analytics task %s failed: %s", key, error)
+                if on_error:
+                    Clock.schedule_once(lambda dt: on_error(error))
+                return
+            if on_result:
+                result = fut.result()
+                Clock.schedule_once(lambda dt: self._deliver(key, generation, on_result, result))
+
+        future.add_done_callback(done)
+        return future
+
+    def _deliver(self, key, generation, on_result, result):
+        # A newer request may have been submitted while this one was queued on the Clock
+        if self._generation.get(key) == generation:
+            on_result(result)
+
+    def is_busy(self, key):
+        with self._lock:
+            return key in self._pending
+
+    def shutdown(self):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._generation.clear()
+        for future in pending:
+            future.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_worker = None
+
+
+def get_worker():
+    global _worker
+    if _worker is None:
+        _worker = AnalyticsWorker()
+    return _worker
+
+
+def shutdown_worker():
+    global _worker
+    if _worker is not None:
+        _worker.shutdown()
+        _worker = None
@@ -0,0 +1,154 @@
+# utils/energy.py
+#
+# Energy expenditure from heart rate, with movement as a fallback.
+#
+#   HR >= KEYTEL_MIN_BPM   Keytel et al. (2005), from HR, sex, age and weight
+#   below that             GPS speed (ACSM walking/running equations) when
+#                          known, else the accelerometer's activity class as
+#                          METs (utils/motion.py), else resting
+#
+# GPS tracks only arrive afterwards, imported from the SD card
+# (utils/geo_index.py), so speed is an input for recorded sessions; a live
+# EnergyMeter goes by heart rate and activity alone.
+#
+# Keytel is only fitted for exercising heart rates; at rest it undershoots
+# and can go negative, so every estimate is floored at resting (1 MET,
+# about 1 kcal per kg per hour). "Active" calories are what's above that.
+#
+# EnergyMeter accumulates a live session sample by sample; session_energy()
+# does the same for a recorded session in one pass over numpy arrays, and
+# agrees with the meter to rounding. Gaps longer than MAX_GAP add nothing.
+# The dashboards feed the meter from a pipeline thread and reset it from the
+# UI, so add() and reset() hold its lock.
+#
+# The profile comes from HR_SEX (m/f), HR_AGE and HR_WEIGHT_KG.
+
+import os
+import threading
+
+import numpy as np
+
+from utils.hr_analytics import MAX_GAP
+from utils.motion import ACTIVITIES
+
+KJ_PER_KCAL = 4.184
+KEYTEL_MIN_BPM = 90
+# kJ/min = a + b*HR + c*weight + d*age
+KEYTEL = {
+    "m": (-55.0969, 0.6309, 0.1988, 0.2017),
+    "f": (-20.4022, 0.4472, -0.1263, 0.074),
+}
+ACTIVITY_METS = {"still": 1.0, "light": 2.0, "walk": 3.5, "run": 8.0, "active": 5.0}
+RUN_SPEED = 134 / 60.0  # m/s; ACSM's walking equation holds up to about 8 km/h
+
+
+class UserProfile:
+    def __init__(self, sex="m", age=30, weight_kg=75.0):
+        if sex not in KEYTEL:
+            raise ValueError(f"sex must be one of {', '.join(KEYTEL)}")
+        self.sex = sex
+        self.age = age
+        self.weight_kg = weight_kg
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get("HR_SEX", "m").lower()[:1], int(os.environ.get("HR_AGE", 30)),
+                   float(os.environ.get("HR_WEIGHT_KG", 75)))
+
+    def key(self):
+        # Changes whenever an estimate would (utils/sessions.py cache key)
+        return f"{self.sex}/{self.age}/{self.weight_kg:g}"
+
+    @property
+    def rest_kcal_min(self):
+        return self.weight_kg / 60.0
+
+
+def kcal_per_min(profile, bpm, speed=None, activity=None):
+    # One sample; speed in m/s, activity a name from utils.motion.ACTIVITIES
+    rest = profile.rest_kcal_min
+    if bpm >= KEYTEL_MIN_BPM:
+        a, b, c, d = KEYTEL[profile.sex]
+        rate = (a + b * bpm + c * profile.weight_kg + d * profile.age) / KJ_PER_KCAL
+    elif speed is not None:
+        rate = float(_acsm_kcal_min(profile, speed))
+    elif activity is not None:
+        rate = ACTIVITY_METS[activity] * rest
+    else:
+        rate = rest
+    return max(rate, rest)
+
+
+def _acsm_kcal_min(profile, speed):
+    # VO2 (ml/kg/min) = 3.5 + k * m/min, k 0.1 walking / 0.2 running;
+    # about 5 kcal per litre of O2. Works for scalars and arrays.
+    m_min = np.asarray(speed) * 60.0
+    vo2 = 3.5 + np.where(speed < RUN_SPEED, 0.1, 0.2) * m_min
+    return vo2 * profile.weight_kg / 1000.0 * 5.0
+
+
+def kcal_per_min_many(profile, bpms, speeds=None, activities=None):
+    # Vectorized kcal_per_min. speeds: m/s with NaN where unknown;
+    # activities: indices into ACTIVITIES with -1 where unknown.
+    bpms = np.asarray(bpms, dtype=np.float64)
+    rest = profile.rest_kcal_min
+    rate = np.full(len(bpms), rest)
+    if activities is not None:
+        activities = np.asarray(activities)
+        mets = np.array([ACTIVITY_METS[name] for name in ACTIVITIES] + [1.0])
+        rate = mets[activities] * rest  # -1 picks the trailing resting MET
+    if speeds is not None:
+        speeds = np.asarray(speeds, dtype=np.float64)
+        known = ~np.isnan(speeds)
+        rate[known] = _acsm_kcal_min(profile, speeds[known])
+    a, b, c, d = KEYTEL[profile.sex]
+    keytel = (a + b * bpms + c * profile.weight_kg + d * profile.age) / KJ_PER_KCAL
+    rate = np.where(bpms >= KEYTEL_MIN_BPM, keytel, rate)
+    return np.maximum(rate, rest)
+
+
+def session_energy(ts, bpms, profile, speeds=None, activities=None, max_gap=MAX_GAP):
+    # (per-sample kcal, summary) for a recorded session. Each sample's rate
+    # holds until the next one, as in EnergyMeter.
+    ts = np.asarray(ts, dtype=np.float64)
+    rate = kcal_per_min_many(profile, bpms, speeds, activities)
+    dt = np.diff(ts, append=ts[-1]) if len(ts) else ts
+    dt[(dt < 0) | (dt > max_gap)] = 0.0
+    kcal = rate * dt / 60.0
+    total = float(kcal.sum())
+    rest = profile.rest_kcal_min * float(dt.sum()) / 60.0
+    return kcal, {"kcal": round(total, 1), "active_kcal": round(total - rest, 1)}
+
+
+class EnergyMeter:
+    def __init__(self, profile=None, max_gap=MAX_GAP):
+        self.profile = profile or UserProfile.from_env()
+        self.max_gap = max_gap
+        self.kcal = 0.0
+        self.rest_kcal = 0.0
+        self.rate = 0.0  # kcal/min of the latest sample
+        self._last_t = None
+        self._lock = threading.Lock()
+
+    def add(self, t, bpm, activity=None):
+        # Credits the previous sample's rate up to t, then takes this one's
+        rate = kcal_per_min(self.profile, bpm, activity=activity)
+        with self._lock:
+            if self._last_t is not None:
+                dt = t - self._last_t
+                if 0 <= dt <= self.max_gap:
+                    self.kcal += self.rate * dt / 60.0
+                    self.rest_kcal += self.profile.rest_kcal_min * dt / 60.0
+            self._last_t = t
+            self.rate = rate
+            return self.kcal
+
+    @property
+    def active_kcal(self):
+        with self._lock:
+            return self.kcal - self.rest_kcal
+
+    def reset(self):
+        with self._lock:
+            self.kcal = self.rest_kcal = self.rate = 0.0
+            self._last_t = None
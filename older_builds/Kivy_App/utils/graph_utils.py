@@ -1,7 +1,19 @@
-from matplotlib import pyplot as plt
+import io
+import os
+
+from utils.memo import CACHE_DIR, ResultCache
+
+SLEEP_GRAPH_PATH = 'assets/sleep_graph.png'
+SLEEP_DATA = [6.5, 7.2, 5.8, 8.0, 6.9, 7.5, 7.0]
+
+# Rendered PNGs by their data; on disk too, so a restart skips matplotlib
+graph_cache = ResultCache("graphs", os.path.join("data", CACHE_DIR, "graphs"))
+
+
+def render_sleep_graph(sleep_data):
+    # Imported here: with a cached graph the app never loads matplotlib
+    from matplotlib import pyplot as plt
 
-def save_sleep_graph():
-    sleep_data = [6.5, 7.2, 5.8, 8.0, 6.9, 7.5, 7.0]
     nights = list(range(1, len(sleep_data) + 1))
     plt.figure(figsize=(4, 2))
     plt.plot(nights, sleep_data, color='deepskyblue', marker='o')
@@ -10,5 +22,24 @@ def save_sleep_graph():
     plt.ylabel('Hours')
     plt.grid(True)
     plt.tight_layout()
-    plt.savefig('assets/sleep_graph.png')
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png')
     plt.close()
+    return buf.getvalue()
+
+
+def save_sleep_graph(path=SLEEP_GRAPH_PATH, cached=True):
+    sleep_data = SLEEP_DATA
+    if cached:
+        png = graph_cache.get(("sleep_graph", tuple(sleep_data)), lambda: render_sleep_graph(sleep_data))
+    else:
+        png = render_sleep_graph(sleep_data)
+    # Rewriting an unchanged image would only make the Image widget reload it
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == png:
+                return
+    except FileNotFoundError:
+        pass
+    with open(path, 'wb') as f:
+        f.write(png)
@@ -0,0 +1,230 @@
+# utils/hr_alerts.py
+#
+# Streaming alert rules for live HR, evaluated per sample in O(1) (the
+# sudden-drop window is a monotonic deque, amortised O(1)). State is kept
+# per device, so one engine can watch any number of straps.
+#
+#   above_zone       BPM above the top of the personal zones (Karvonen,
+#                    from HR_MAX_BPM / HR_RESTING_BPM)
+#   high_at_rest     resting + HIGH_AT_REST_DELTA sustained for
+#                    HIGH_AT_REST_S while the wearer is not active
+#   sudden_drop      BPM fell by DROP_BPM or more within DROP_WINDOW_S
+#   contact_lost     strap reports no skin contact (or BPM 0)
+#   no_data          nothing from a device for NO_DATA_S (checked by tick())
+#
+# Every rule fires on the first sample that meets its condition, so
+# latency is at most one sample period. Flapping is held back by
+# hysteresis instead: a rule that fired stays quiet until `clear`
+# consecutive good samples, and never re-fires within COOLDOWN_S.
+# Times are monotonic seconds (utils.timebase.now_ns() / 1e9).
+
+import logging
+import os
+import threading
+from collections import deque
+
+from utils import instrumentation
+from utils.timebase import now_ns
+
+log = logging.getLogger("wearable.alerts")
+
+HIGH_AT_REST_DELTA = 40
+HIGH_AT_REST_S = 120
+DROP_BPM = 30
+DROP_WINDOW_S = 10
+NO_DATA_S = 10
+COOLDOWN_S = 60
+
+PROCESS_US = instrumentation.histogram("alerts.process_us")
+FIRED = instrumentation.counter("alerts.fired")
+
+
+class PersonalZones:
+    # Five heart-rate reserve (Karvonen) zones: 50-60-70-80-90-100 %
+    BOUNDS = (0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+    def __init__(self, max_hr=190, resting_hr=60):
+        self.max_hr = max_hr
+        self.resting_hr = resting_hr
+        reserve = max_hr - resting_hr
+        self.limits = [resting_hr + f * reserve for f in self.BOUNDS]
+
+    @classmethod
+    def from_env(cls):
+        return cls(int(os.environ.get("HR_MAX_BPM", 190)), int(os.environ.get("HR_RESTING_BPM", 60)))
+
+    def zone(self, bpm):
+        # 0 below zone 1, 1..5 inside the zones, 6 above the max
+        for i, limit in enumerate(self.limits):
+            if bpm < limit:
+                return i
+        return len(self.limits)
+
+
+class Alert:
+    __slots__ = ("device", "kind", "t", "bpm", "message")
+
+    def __init__(self, device, kind, t, bpm, message):
+        self.device = device
+        self.kind = kind
+        self.t = t
+        self.bpm = bpm
+        self.message = message
+
+    def __repr__(self):
+        return f"Alert({self.device!r}, {self.kind!r}, t={self.t:.2f}, bpm={self.bpm})"
+
+
+class _Debounce:
+    __slots__ = ("clear", "good", "active", "last_fired")
+
+    def __init__(self, clear):
+        self.clear = clear
+        self.good = 0
+        self.active = False
+        self.last_fired = None
+
+    def update(self, condition, t):
+        # True exactly when the alert should fire
+        if condition:
+            self.good = 0
+            if not self.active and (self.last_fired is None or t - self.last_fired >= COOLDOWN_S):
+                self.active = True
+                self.last_fired = t
+                return True
+        else:
+            self.good += 1
+            if self.active and self.good >= self.clear:
+                self.active = False
+        return False
+
+
+class _DeviceState:
+    __slots__ = ("last_t", "high_since", "window", "rules", "silent")
+
+    def __init__(self):
+        self.last_t = None
+        self.high_since = None
+        self.window = deque()  # (t, bpm) with decreasing bpm: the window max is window[0]
+        self.silent = False
+        self.rules = {
+            "above_zone": _Debounce(clear=5),
+            "high_at_rest": _Debounce(clear=5),
+            "sudden_drop": _Debounce(clear=1),
+            "contact_lost": _Debounce(clear=2),
+        }
+
+
+class AlertEngine:
+    def __init__(self, zones=None):
+        self.zones = zones or PersonalZones.from_env()
+        self._devices = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._ticker = None
+        self._ticker_stop = threading.Event()
+
+    def subscribe(self, cb):
+        if cb not in self._subscribers:
+            self._subscribers.append(cb)
+
+    def _fire(self, alerts):
+        for alert in alerts:
+            FIRED.inc()
+            log.warning("🚨 %s: %s", alert.device, alert.message)
+            for cb in self._subscribers:
+                cb(alert)
+
+    def process(self, device, bpm, contact=None, t=None, active=False):
+        # One sample from one device; returns the alerts it fired (usually none)
+        t0 = instrumentation.stopwatch()
+        if t is None:
+            t = now_ns() / 1e9
+        with self._lock:
+            state = self._devices.get(device)
+            if state is None:
+                state = self._devices[device] = _DeviceState()
+            state.last_t = t
+            state.silent = False
+            fired = self._evaluate(device, state, bpm, contact, t, active)
+        if fired:
+            self._fire(fired)
+        PROCESS_US.record_since(t0)
+        return fired
+
+    def _evaluate(self, device, state, bpm, contact, t, active):
+        fired = []
+        rules = state.rules
+        no_contact = contact is False or bpm <= 0
+        if rules["contact_lost"].update(no_contact, t):
+            fired.append(Alert(device, "contact_lost", t, bpm, "Strap lost skin contact"))
+        if no_contact:
+            # Nothing below is meaningful without a reading
+            state.high_since = None
+            state.window.clear()
+            return fired
+
+        top = self.zones.limits[-1]
+        if rules["above_zone"].update(bpm > top, t):
+            fired.append(Alert(device, "above_zone", t, bpm, f"{bpm} BPM is above your max zone ({top:.0f})"))
+
+        high = not active and bpm >= self.zones.resting_hr + HIGH_AT_REST_DELTA
+        if high:
+            if state.high_since is None:
+                state.high_since = t
+        else:
+            state.high_since = None
+        sustained = high and t - state.high_since >= HIGH_AT_REST_S
+        if rules["high_at_rest"].update(sustained, t):
+            fired.append(Alert(device, "high_at_rest", t, bpm,
+                               f"{bpm} BPM at rest for {HIGH_AT_REST_S // 60} min"))
+
+        # Sliding-window max: drop expired heads, pop smaller tails, append
+        window = state.window
+        while window and t - window[0][0] > DROP_WINDOW_S:
+            window.popleft()
+        peak = window[0][1] if window else bpm
+        while window and window[-1][1] <= bpm:
+            window.pop()
+        window.append((t, bpm))
+        if rules["sudden_drop"].update(peak - bpm >= DROP_BPM, t):
+            fired.append(Alert(device, "sudden_drop", t, bpm,
+                               f"HR dropped {peak - bpm} BPM in under {DROP_WINDOW_S}s"))
+        return fired
+
+    def tick(self, t=None):
+        # Fires no_data for devices that have gone quiet; call about once a
+        # second (Kivy Clock, or start_ticker())
+        if t is None:
+            t = now_ns() / 1e9
+        fired = []
+        with self._lock:
+            for device, state in self._devices.items():
+                if not state.silent and state.last_t is not None and t - state.last_t >= NO_DATA_S:
+                    state.silent = True
+                    fired.append(Alert(device, "no_data", t, 0, f"No data for {NO_DATA_S}s"))
+        if fired:
+            self._fire(fired)
+        return fired
+
+    def forget(self, device):
+        with self._lock:
+            self._devices.pop(device, None)
+
+    def start_ticker(self, interval=1.0):
+        if self._ticker and self._ticker.is_alive():
+            return
+        self._ticker_stop.clear()
+
+        def run():
+            while not self._ticker_stop.wait(interval):
+                self.tick()
+
+        self._ticker = threading.Thread(target=run, name="hr-alerts", daemon=True)
+        self._ticker.start()
+
+    def stop_ticker(self):
+        self._ticker_stop.set()
+        if self._ticker:
+            self._ticker.join(timeout=1.0)
+            self._ticker = None
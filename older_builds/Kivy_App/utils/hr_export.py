@@ -0,0 +1,410 @@
+# utils/hr_export.py
+#
+# Parquet export of the HR store and what's derived from it, for analysis
+# outside the apps: no more globbing data/hr_log_*.csv and re-parsing ISO
+# timestamps in pandas. One hive-partitioned dataset per table:
+#
+#   data/export/<table>/date=YYYY-MM-DD/device=<name>/part-0.parquet
+#
+#   hr        t (timestamp, UTC), bpm
+#   activity  t, enmo_mg, counts, steps, activity    5 s epochs (utils/motion.py)
+#   sessions  start, end, duration_s, samples, avg_bpm, max_bpm, kcal,
+#             active_kcal, steps, workout              (utils/sessions.py)
+#   gps       track_id, start, point, lat, lon         simplified tracks
+#                                                      (utils/geo_index.py)
+#
+# Rows are sorted by time and written in row groups of ROW_GROUP_ROWS, each
+# with min/max statistics. query() prunes on the partition values first
+# (date, device), then drops row groups whose statistics can't match the
+# time range, and reads only the columns asked for. A workout filter turns
+# into the matching sessions' time ranges. plan() reports what a query would
+# read.
+#
+# export() is incremental: data/export/_manifest.json records the version
+# (size, mtime) of every source it converted, and only new or changed days
+# are redone, in parallel processes. The store doesn't record which strap a
+# sample came from, so each data directory exports under one --device name.
+#
+#   python -m utils.hr_export export --device polar-h10
+#   python -m utils.hr_export query hr --start 2025-07-01 --end 2025-08-01 --workout Run
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from utils import instrumentation
+from utils.energy import UserProfile
+from utils.geo_index import TRACK_DIR, TrackIndex
+from utils.hr_store import HRStore, _version
+from utils.motion import ACTIVITIES, activity_log_path, read_activity_log
+from utils.sessions import find_sessions, load_epochs, summarize_session
+
+log = logging.getLogger("wearable.export")
+
+EXPORT_DIR = "export"
+MANIFEST = "_manifest.json"
+DEFAULT_DEVICE = os.environ.get("HR_DEVICE", "wearable")
+ROW_GROUP_ROWS = 3600  # an hour of 1 Hz samples
+COMPRESSION = "zstd"
+
+TIMESTAMP = pa.timestamp("ms", tz="UTC")
+SCHEMAS = {
+    "hr": pa.schema([("t", TIMESTAMP), ("bpm", pa.uint16())]),
+    "activity": pa.schema([("t", TIMESTAMP), ("enmo_mg", pa.float32()), ("counts", pa.float32()),
+                           ("steps", pa.uint16()), ("activity", pa.dictionary(pa.int8(), pa.string()))]),
+    "sessions": pa.schema([("start", TIMESTAMP), ("end", TIMESTAMP), ("duration_s", pa.float64()),
+                           ("samples", pa.int32()), ("avg_bpm", pa.float32()), ("max_bpm", pa.uint16()),
+                           ("kcal", pa.float32()), ("active_kcal", pa.float32()), ("steps", pa.int32()),
+                           ("workout", pa.string())]),
+    "gps": pa.schema([("track_id", pa.string()), ("start", TIMESTAMP), ("point", pa.int32()),
+                      ("lat", pa.float32()), ("lon", pa.float32())]),
+}
+TIME_COLUMN = {"hr": "t", "activity": "t", "sessions": "start", "gps": "start"}
+DAY_TABLES = ("hr", "activity", "sessions")
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string()), ("device", pa.string())]), flavor="hive")
+
+EXPORT_DAY_US = instrumentation.histogram("export.day_us")
+
+
+def _timestamps(seconds):
+    return pa.array(np.round(np.asarray(seconds, dtype=np.float64) * 1000).astype(np.int64), type=TIMESTAMP)
+
+
+def _timestamp(when):
+    # A datetime (naive means local time) as a scalar to compare columns with
+    return pa.scalar(round(when.timestamp() * 1000), type=TIMESTAMP)
+
+
+def partition_path(root, table, day, device):
+    return os.path.join(root, table, f"date={day.isoformat()}", f"device={device}")
+
+
+def _write(table, root, name, day, device):
+    # Replaces the day's file for this device atomically; an empty table
+    # removes it
+    directory = partition_path(root, name, day, device)
+    if not table.num_rows:
+        shutil.rmtree(directory, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(directory))  # the date, once no device has data for it
+        except OSError:
+            pass
+        return 0
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, ".part-0.parquet.tmp")
+    pq.write_table(table, tmp, row_group_size=ROW_GROUP_ROWS, compression=COMPRESSION, write_statistics=True)
+    os.replace(tmp, os.path.join(directory, "part-0.parquet"))
+    return table.num_rows
+
+
+# ---------- per-day conversion (runs in worker processes) ----------
+
+def _hr_table(ts, bpms):
+    return pa.table([_timestamps(ts), pa.array(bpms, type=pa.uint16())], schema=SCHEMAS["hr"])
+
+
+def _activity_table(rows):
+    if not rows:
+        return SCHEMAS["activity"].empty_table()
+    t, enmo, counts, steps, activity = zip(*rows)
+    names = pa.DictionaryArray.from_arrays(pa.array(activity, type=pa.int8()), pa.array(ACTIVITIES))
+    return pa.table([_timestamps(t), pa.array(enmo, type=pa.float32()), pa.array(counts, type=pa.float32()),
+                     pa.array(steps, type=pa.uint16()), names], schema=SCHEMAS["activity"])
+
+
+def _sessions_table(summaries):
+    # steps is None without a motion log
+    columns = {name: [s[name] for s in summaries] for name in SCHEMAS["sessions"].names}
+    arrays = [_timestamps(columns["start"]), _timestamps(columns["end"])]
+    arrays += [pa.array(columns[f.name], type=f.type) for f in list(SCHEMAS["sessions"])[2:]]
+    return pa.table(arrays, schema=SCHEMAS["sessions"])
+
+
+def export_day(data_dir, root, device, day_iso, tables):
+    # Converts one day's sources; returns {table: rows written}
+    t0 = instrumentation.stopwatch()
+    day = date.fromisoformat(day_iso)
+    store = HRStore(data_dir)
+    ts, bpms = store.read_day(day)
+    ts = np.frombuffer(ts, dtype=np.float64) if len(ts) else np.empty(0)
+    bpms = np.frombuffer(bpms, dtype=np.uint16) if len(bpms) else np.empty(0, np.uint16)
+    order = np.argsort(ts, kind="stable")
+    ts, bpms = ts[order], bpms[order]
+
+    written = {}
+    if "hr" in tables:
+        written["hr"] = _write(_hr_table(ts, bpms), root, "hr", day, device)
+    if "activity" in tables:
+        rows = sorted(read_activity_log(activity_log_path(data_dir, day)))
+        written["activity"] = _write(_activity_table(rows), root, "activity", day, device)
+    if "sessions" in tables:
+        profile = UserProfile.from_env()
+        epochs = load_epochs(data_dir, day)
+        summaries = [summarize_session(ts[lo:hi], bpms[lo:hi], profile, epochs) for lo, hi in find_sessions(ts)]
+        written["sessions"] = _write(_sessions_table(summaries), root, "sessions", day, device)
+    EXPORT_DAY_US.record_since(t0)
+    return written
+
+
+# ---------- export ----------
+
+def _source_versions(store, day):
+    # What each table of a day is built from; the profile changes calories
+    hr = store.day_version(day)
+    activity = _version(activity_log_path(store.data_dir, day))
+    return {"hr": repr(hr), "activity": repr(activity),
+            "sessions": repr((hr, activity, UserProfile.from_env().key()))}
+
+
+def _load_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"devices": {}}
+
+
+def _save_manifest(root, manifest):
+    os.makedirs(root, exist_ok=True)
+    tmp = os.path.join(root, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(tmp, os.path.join(root, MANIFEST))
+
+
+def _activity_days(data_dir):
+    days = set()
+    for name in os.listdir(data_dir) if os.path.isdir(data_dir) else ():
+        if name.startswith("activity_log_") and name.endswith(".csv"):
+            try:
+                days.add(date.fromisoformat(name[len("activity_log_"):-len(".csv")]))
+            except ValueError:
+                continue
+    return days
+
+
+def _export_gps(data_dir, root, device, done):
+    # Tracks by the local date they started on; a day is rewritten when its
+    # set of tracks (or their geometry) changes
+    index = TrackIndex(os.path.join(data_dir, TRACK_DIR))
+    by_day = {}
+    for slot, track_id in enumerate(index._ids):
+        meta = index.tracks[track_id]
+        by_day.setdefault(datetime.fromtimestamp(meta["start"]).date().isoformat(), []).append(slot)
+    written = 0
+    for day_iso in sorted(set(by_day) | set(done)):
+        slots = by_day.get(day_iso, [])
+        version = repr(sorted((index._ids[s], index.tracks[index._ids[s]]["offset"]) for s in slots))
+        if done.get(day_iso) == version:
+            continue
+        ids, starts, points, lats, lons = [], [], [], [], []
+        for slot in sorted(slots, key=lambda s: index.tracks[index._ids[s]]["start"]):
+            meta = index.tracks[index._ids[slot]]
+            s_lats, s_lons = index._geometry[slot]
+            n = len(s_lats)
+            ids += [meta["id"]] * n
+            starts += [meta["start"]] * n
+            points.append(np.arange(n, dtype=np.int32))
+            lats.append(s_lats)
+            lons.append(s_lons)
+        table = pa.table([pa.array(ids, type=pa.string()), _timestamps(starts),
+                          pa.array(np.concatenate(points) if points else [], type=pa.int32()),
+                          pa.array(np.concatenate(lats) if lats else [], type=pa.float32()),
+                          pa.array(np.concatenate(lons) if lons else [], type=pa.float32())], schema=SCHEMAS["gps"])
+        written += _write(table, root, "gps", date.fromisoformat(day_iso), device)
+        if slots:
+            done[day_iso] = version
+        else:
+            done.pop(day_iso, None)
+    return written
+
+
+def export(data_dir="data", root=None, device=DEFAULT_DEVICE, workers=None, force=False):
+    # Brings the dataset up to date with data_dir; returns {table: rows written}
+    root = root or os.path.join(data_dir, EXPORT_DIR)
+    store = HRStore(data_dir)
+    manifest = _load_manifest(root)
+    done = manifest["devices"].setdefault(device, {"days": {}, "gps": {}})
+    if force:
+        done["days"].clear()
+        done["gps"].clear()
+
+    days = sorted(set(store.days()) | _activity_days(data_dir) | {date.fromisoformat(d) for d in done["days"]})
+    todo = {}
+    for day in days:
+        versions = _source_versions(store, day)
+        previous = done["days"].get(day.isoformat(), {})
+        changed = [t for t in DAY_TABLES if previous.get(t) != versions[t]]
+        if changed:
+            todo[day] = (versions, changed)
+
+    totals = dict.fromkeys(DAY_TABLES + ("gps",), 0)
+    if todo:
+        log.info("📦 Exporting %d day(s) for %s", len(todo), device)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {day: pool.submit(export_day, data_dir, root, device, day.isoformat(), changed)
+                       for day, (_, changed) in todo.items()}
+            for day, future in futures.items():
+                for table, rows in future.result().items():
+                    totals[table] += rows
+                versions, changed = todo[day]
+                entry = done["days"].setdefault(day.isoformat(), {})
+                entry.update({t: versions[t] for t in changed})
+                if versions["hr"] == versions["activity"] == "None":
+                    done["days"].pop(day.isoformat(), None)  # deleted; its partitions went with it
+    totals["gps"] = _export_gps(data_dir, root, device, done["gps"])
+    _save_manifest(root, manifest)
+    return totals
+
+
+# ---------- queries ----------
+
+def _expressions(table, start=None, end=None, devices=None, workouts=None):
+    # (partition filter, row filter): the first picks files by their
+    # date/device directories, the second row groups by their statistics
+    column = TIME_COLUMN[table]
+    files = ds.scalar(True)
+    rows = ds.scalar(True)
+    # Partitions are local dates
+    if start is not None:
+        files &= ds.field("date") >= start.astimezone().date().isoformat()
+        rows &= ds.field(column) >= _timestamp(start)
+    if end is not None:
+        files &= ds.field("date") <= end.astimezone().date().isoformat()
+        rows &= ds.field(column) < _timestamp(end)
+    if devices:
+        files &= ds.field("device").isin(list(devices))
+    if workouts and table == "sessions":
+        rows &= ds.field("workout").isin(list(workouts))
+    return files, rows
+
+
+def _workout_spans(root, start, end, devices, workouts):
+    # {(date, device): [(start, end), ...]} of the matching sessions
+    sessions = query("sessions", ["start", "end", "date", "device"], start, end, devices, workouts, root=root)
+    spans = {}
+    for row in zip(*(sessions[name] for name in ("date", "device", "start", "end"))):
+        spans.setdefault((row[0].as_py(), row[1].as_py()), []).append((row[2], row[3]))
+    return spans
+
+
+def _pieces(table, start, end, devices, workouts, root):
+    # (dataset, row groups to read, row filter, workout spans or None)
+    path = os.path.join(root, table)
+    if not os.path.isdir(path):
+        return None, [], None, None
+    dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING)
+    files, rows = _expressions(table, start, end, devices, workouts)
+    spans = None
+    if workouts and table != "sessions":
+        spans = _workout_spans(root, start, end, devices, workouts)
+        files &= ds.field("date").isin(sorted({day for day, _ in spans}))
+    pieces = []
+    for fragment in dataset.get_fragments(filter=files):
+        expr = rows
+        if spans is not None:
+            # Only this partition's sessions, so each row group is tested
+            # against a handful of spans rather than a year's worth
+            keys = ds.get_partition_keys(fragment.partition_expression)
+            during = ds.scalar(False)
+            for lo, hi in spans.get((keys["date"], keys["device"]), ()):
+                during |= (ds.field(TIME_COLUMN[table]) >= lo) & (ds.field(TIME_COLUMN[table]) <= hi)
+            expr = rows & during
+        pieces += fragment.split_by_row_group(expr)
+    return dataset, pieces, rows, spans
+
+
+def _during(rows, column, spans):
+    # Mask of the rows inside their own device's sessions
+    mask = np.zeros(rows.num_rows, dtype=bool)
+    devices = rows["device"].to_numpy()
+    t = rows[column].cast(pa.int64()).to_numpy()
+    by_device = {}
+    for (_, device), pairs in spans.items():
+        by_device.setdefault(device, []).extend((lo.value, hi.value) for lo, hi in pairs)
+    for device, pairs in by_device.items():
+        lo, hi = np.array(sorted(pairs), dtype=np.int64).T
+        mine = devices == device
+        idx = np.searchsorted(lo, t[mine], side="right") - 1
+        mask[mine] = (idx >= 0) & (t[mine] <= hi[np.maximum(idx, 0)])
+    return mask
+
+
+def plan(table, start=None, end=None, devices=None, workouts=None, root=None):
+    # How much of the dataset a query would read
+    root = root or os.path.join("data", EXPORT_DIR)
+    dataset, pieces, _, _ = _pieces(table, start, end, devices, workouts, root)
+    if dataset is None:
+        return {"files": 0, "row_groups": 0, "row_groups_total": 0}
+    total = sum(f.metadata.num_row_groups for f in dataset.get_fragments())
+    return {"files": len({p.path for p in pieces}), "row_groups": len(pieces), "row_groups_total": total}
+
+
+def query(table, columns=None, start=None, end=None, devices=None, workouts=None, root=None):
+    # A pyarrow Table of `columns` (default all, partition columns included)
+    # for rows in [start, end) from `devices`, optionally only during
+    # sessions of the given workout types ("Run", "Walk", ...)
+    root = root or os.path.join("data", EXPORT_DIR)
+    dataset, pieces, rows, spans = _pieces(table, start, end, devices, workouts, root)
+    if dataset is None or not pieces:
+        schema = SCHEMAS[table].append(pa.field("date", pa.string())).append(pa.field("device", pa.string()))
+        empty = schema.empty_table()
+        return empty.select(columns) if columns else empty
+    read = columns
+    if spans is not None and columns:
+        read = list(dict.fromkeys(columns + [TIME_COLUMN[table], "device"]))
+    result = ds.FileSystemDataset(pieces, dataset.schema, dataset.format).to_table(columns=read, filter=rows)
+    if spans is not None:
+        # Row groups were pruned on the spans; the rows within them here
+        result = result.filter(_during(result, TIME_COLUMN[table], spans))
+        if columns:
+            result = result.select(columns)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parquet export of the HR data for analysis")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--out", help="dataset root (default <data-dir>/export)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export", help="convert new or changed days")
+    p.add_argument("--device", default=DEFAULT_DEVICE)
+    p.add_argument("--workers", type=int)
+    p.add_argument("--force", action="store_true", help="convert every day again")
+    p = sub.add_parser("query", help="print matching rows")
+    p.add_argument("table", choices=list(SCHEMAS))
+    p.add_argument("--start", help="ISO time")
+    p.add_argument("--end", help="ISO time")
+    p.add_argument("--device", action="append")
+    p.add_argument("--workout", action="append")
+    p.add_argument("--columns", help="comma-separated")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    root = args.out or os.path.join(args.data_dir, EXPORT_DIR)
+
+    if args.command == "export":
+        start = time.perf_counter()
+        totals = export(args.data_dir, root, args.device, args.workers, args.force)
+        log.info("📦 %s in %.1f s", ", ".join(f"{n} {t}" for t, n in totals.items()), time.perf_counter() - start)
+        return
+    start = datetime.fromisoformat(args.start) if args.start else None
+    end = datetime.fromisoformat(args.end) if args.end else None
+    columns = args.columns.split(",") if args.columns else None
+    info = plan(args.table, start, end, args.device, args.workout, root)
+    result = query(args.table, columns, start, end, args.device, args.workout, root)
+    log.info("%d rows from %d of %d row groups", result.num_rows, info["row_groups"], info["row_groups_total"])
+    print(result.to_pandas().to_string(max_rows=40))
+
+
+if __name__ == "__main__":
+    main()
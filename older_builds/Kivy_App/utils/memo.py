@@ -0,0 +1,229 @@
+# utils/memo.py
+#
+# Memoized derived results: a day's metrics, rendered graphs. An entry is
+# keyed by everything it was derived from, so nothing ever has to be
+# invalidated by hand; a changed input is simply a different key:
+#
+#   key = ("metrics", day, store.day_version(day), max_gap, threshold)
+#   metrics = cache.get(key, lambda: compute_metrics(...))
+#
+# Inputs are identified by fingerprints rather than contents: the HR store's
+# day_version(), or file_fingerprint(path) (path, size and mtime) for any
+# other file. Parameters go in the key as they are.
+#
+# Two tiers, both least-recently-used and bounded by size (pickled bytes):
+#
+#   memory  the values themselves, up to memory_bytes; callers share them,
+#           so they must not be modified
+#   disk    optional, one pickle per entry under disk_dir, up to disk_bytes,
+#           so a restarted app or service starts warm; a hit touches the
+#           file's mtime, which is what eviction goes by
+#
+# A key being built is built once; other threads asking for it wait for
+# that build. stats() counts memory and disk hits, misses, evictions and
+# what each tier holds. HR_MEMO=0 rebuilds everything on every call.
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from utils import instrumentation
+
+log = logging.getLogger("wearable.memo")
+
+ENABLED = os.environ.get("HR_MEMO", "1") != "0"
+CACHE_DIR = "cache"   # under the data directory, one subdirectory per cache
+MEMORY_BYTES = 32 << 20
+DISK_BYTES = 128 << 20
+
+HITS = instrumentation.counter("memo.hits")
+MISSES = instrumentation.counter("memo.misses")
+BUILD_US = instrumentation.histogram("memo.build_us")
+
+
+def file_fingerprint(path):
+    # Changes whenever the file does; None for a missing file
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return path, None
+    return path, stat.st_size, stat.st_mtime_ns
+
+
+def _digest(key):
+    # Keys are tuples of strings, numbers, dates and tuples, whose repr is
+    # stable from run to run
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, name, disk_dir=None, memory_bytes=MEMORY_BYTES, disk_bytes=DISK_BYTES, enabled=None):
+        self.name = name
+        self.disk_dir = disk_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.enabled = ENABLED if enabled is None else enabled
+        self._memory = OrderedDict()   # digest -> (value, size)
+        self._memory_used = 0
+        self._disk_used = None         # scanned on first write
+        self._building = {}            # digest -> lock held while building it
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evicted_memory": 0, "evicted_disk": 0}
+
+    def get(self, key, build):
+        if not self.enabled:
+            return build()
+        digest = _digest(key)
+        found, value = self._lookup(digest)
+        if found:
+            return value
+        with self._lock:
+            key_lock = self._building.setdefault(digest, threading.Lock())
+        with key_lock:
+            # Another thread may have built it while we waited
+            found, value = self._lookup(digest)
+            if found:
+                return value
+            t0 = instrumentation.stopwatch()
+            value = build()
+            BUILD_US.record_since(t0)
+            MISSES.inc()
+            with self._lock:
+                self._stats["misses"] += 1
+                self._building.pop(digest, None)
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            self._remember(digest, value, len(blob))
+            if self.disk_dir:
+                self._write(digest, blob)
+            return value
+
+    def _lookup(self, digest):
+        with self._lock:
+            entry = self._memory.get(digest)
+            if entry is not None:
+                self._memory.move_to_end(digest)
+                self._stats["memory_hits"] += 1
+                HITS.inc()
+                return True, entry[0]
+        if not self.disk_dir:
+            return False, None
+        path = self._path(digest)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+            value = pickle.loads(blob)
+            os.utime(path)
+        except FileNotFoundError:
+            return False, None
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            log.warning("⚠️ Dropping unreadable %s cache entry: %s", self.name, e)
+            self._remove(path)
+            return False, None
+        with self._lock:
+            self._stats["disk_hits"] += 1
+        HITS.inc()
+        self._remember(digest, value, len(blob))
+        return True, value
+
+    def _remember(self, digest, value, size):
+        if size > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(digest, None)
+            if old is not None:
+                self._memory_used -= old[1]
+            self._memory[digest] = (value, size)
+            self._memory_used += size
+            while self._memory_used > self.memory_bytes:
+                _, (_, dropped) = self._memory.popitem(last=False)
+                self._memory_used -= dropped
+                self._stats["evicted_memory"] += 1
+
+    # ---------- disk tier ----------
+
+    def _path(self, digest):
+        return os.path.join(self.disk_dir, f"{digest}.pickle")
+
+    def _files(self):
+        try:
+            names = [n for n in os.listdir(self.disk_dir) if n.endswith(".pickle")]
+        except FileNotFoundError:
+            return []
+        files = []
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(self.disk_dir, name))
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, os.path.join(self.disk_dir, name)))
+        return files
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return 0
+        return size
+
+    def _write(self, digest, blob):
+        if len(blob) > self.disk_bytes:
+            return
+        path = self._path(digest)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            replaced = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning("⚠️ Could not write %s cache entry: %s", self.name, e)
+            return
+        with self._lock:
+            if self._disk_used is None:
+                self._disk_used = sum(size for _, size, _ in self._files())
+            else:
+                self._disk_used += len(blob) - replaced
+            over = self._disk_used > self.disk_bytes
+        if over:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        # Least recently used files first, down to three quarters of the
+        # limit so the next few writes don't each rescan the directory
+        files = sorted(self._files())
+        used = sum(size for _, size, _ in files)
+        evicted = 0
+        for _, _, path in files:
+            if used <= self.disk_bytes * 3 // 4:
+                break
+            used -= self._remove(path)
+            evicted += 1
+        with self._lock:
+            self._disk_used = used
+            self._stats["evicted_disk"] += evicted
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+        if self.disk_dir:
+            for _, _, path in self._files():
+                self._remove(path)
+            with self._lock:
+                self._disk_used = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_used
+            if self._disk_used is not None:
+                stats["disk_bytes"] = self._disk_used
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else None
+        return stats
@@ -0,0 +1,185 @@
+# utils/sessions.py
+#
+# Workout sessions: the stretches of a day's HR log with no break longer
+# than SESSION_GAP_S, lasting at least MIN_SESSION_S. Each gets a summary
+# (duration, average / max HR, calories from utils/energy.py, steps and the
+# dominant activity from the day's activity log) for the workout log.
+#
+# Summaries are kept in data/session_index.json and only recomputed when the
+# day's data or the user profile changes. Even then, sessions that had
+# already ended (a gap after them, or a past day) are kept as they are and
+# only the samples after them are looked at, so a live day costs one pass
+# over its newest session. Samples that land at or before the end of a kept
+# session (an SD import, a merge) send the whole day back through.
+
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from utils import instrumentation
+from utils.energy import UserProfile, session_energy
+from utils.motion import ACTIVITIES, EPOCH_S, activity_log_path, read_activity_log
+
+log = logging.getLogger("wearable.sessions")
+
+SESSION_GAP_S = 300
+MIN_SESSION_S = 300
+INDEX_FILE = "session_index.json"
+WORKOUT_NAMES = {"walk": "Walk", "run": "Run", "active": "Workout"}
+
+SUMMARIZE_US = instrumentation.histogram("sessions.summarize_us")
+
+
+def find_sessions(ts, gap=SESSION_GAP_S, min_s=MIN_SESSION_S):
+    # (lo, hi) index ranges of the sessions in time-ordered ts
+    ts = np.asarray(ts, dtype=np.float64)
+    if not len(ts):
+        return []
+    breaks = np.flatnonzero(np.diff(ts) > gap) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(ts)]))
+    return [(int(lo), int(hi)) for lo, hi in zip(starts, ends) if ts[hi - 1] - ts[lo] >= min_s]
+
+
+def summarize_session(ts, bpms, profile, epochs=None):
+    # ts/bpms: one session's samples; epochs: (t, activity, steps) arrays
+    # from the activity log, or None without a motion stream
+    activities = None
+    steps = None
+    workout = "Session"
+    if epochs is not None and len(epochs[0]):
+        epoch_t, epoch_activity, epoch_steps = epochs
+        # Each epoch is stamped with its last sample, so a sample belongs to
+        # the first epoch at or after it
+        idx = np.searchsorted(epoch_t, ts)
+        inside = idx < len(epoch_t)
+        inside[inside] = epoch_t[idx[inside]] - ts[inside] < EPOCH_S
+        activities = np.where(inside, epoch_activity[np.minimum(idx, len(epoch_t) - 1)], -1)
+        lo, hi = np.searchsorted(epoch_t, (ts[0], ts[-1] + EPOCH_S))
+        steps = int(epoch_steps[lo:hi].sum())
+        moving = np.bincount(epoch_activity[lo:hi], minlength=len(ACTIVITIES))
+        best = max(WORKOUT_NAMES, key=lambda name: moving[ACTIVITIES.index(name)])
+        if moving[ACTIVITIES.index(best)]:
+            workout = WORKOUT_NAMES[best]
+
+    _, energy = session_energy(ts, bpms, profile, activities=activities)
+    return {
+        "start": float(ts[0]),
+        "end": float(ts[-1]),
+        "duration_s": round(float(ts[-1] - ts[0]), 1),
+        "samples": len(ts),
+        "avg_bpm": round(float(bpms.mean()), 1),
+        "max_bpm": int(bpms.max()),
+        "kcal": energy["kcal"],
+        "active_kcal": energy["active_kcal"],
+        "steps": steps,
+        "workout": workout,
+    }
+
+
+def load_epochs(data_dir, day):
+    # (t, activity, steps) arrays from the day's activity log, or None
+    rows = read_activity_log(activity_log_path(data_dir, day))
+    if not rows:
+        return None
+    table = np.array([(r[0], r[4], r[3]) for r in rows])
+    return table[:, 0], table[:, 1].astype(np.intp), table[:, 2]
+
+
+def _file_version(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class SessionIndex:
+    def __init__(self, store, profile=None, path=None):
+        self.store = store
+        self.profile = profile or UserProfile.from_env()
+        self.path = path or os.path.join(store.data_dir, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._index = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {"profile": self.profile.key(), "days": {}}
+        if index.get("profile") != self.profile.key():
+            log.info("Profile changed; recomputing session summaries")
+            return {"profile": self.profile.key(), "days": {}}
+        return index
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def _version(self, day):
+        activity = _file_version(activity_log_path(self.store.data_dir, day))
+        return repr((self.store.day_version(day), activity))
+
+    def sessions(self, day):
+        # Summaries of the day's sessions, oldest first
+        key = day.isoformat()
+        version = self._version(day)
+        with self._lock:
+            cached = self._index["days"].get(key)
+            if cached and cached["version"] == version:
+                return cached["sessions"]
+
+            t0 = instrumentation.stopwatch()
+            ts, bpms = self.store.read_day(day)
+            ts = np.frombuffer(ts, dtype=np.float64) if len(ts) else np.empty(0)
+            bpms = np.frombuffer(bpms, dtype=np.uint16) if len(bpms) else np.empty(0, np.uint16)
+            # Sessions that had ended can't change; carry on after the last
+            # one, unless samples have since landed at or before its end (an
+            # SD import, a merge), which means starting the day over
+            kept = [s for s in cached["sessions"] if s["closed"]] if cached else []
+            resume = np.searchsorted(ts, kept[-1]["end"], side="right") if kept else 0
+            if kept and resume != cached.get("through"):
+                kept, resume = [], 0
+
+            epochs = load_epochs(self.store.data_dir, day)
+            last_t = ts[-1] if len(ts) else 0.0
+            past_day = day < date.today()
+            sessions = kept
+            for lo, hi in find_sessions(ts[resume:]):
+                summary = summarize_session(ts[resume + lo:resume + hi], bpms[resume + lo:resume + hi],
+                                            self.profile, epochs)
+                summary["closed"] = past_day or bool(summary["end"] + SESSION_GAP_S < last_t)
+                sessions.append(summary)
+            closed = [s for s in sessions if s["closed"]]
+            through = int(np.searchsorted(ts, closed[-1]["end"], side="right")) if closed else 0
+            self._index["days"][key] = {"version": version, "sessions": sessions, "through": through}
+            self._save()
+            SUMMARIZE_US.record_since(t0)
+            return sessions
+
+    def recent(self, days=7, today=None):
+        # Sessions from the last `days` days that have data, newest first
+        today = today or date.today()
+        first = today - timedelta(days=days - 1)
+        found = []
+        for day in reversed(self.store.days()):
+            if day < first:
+                break
+            if day <= today:
+                found.extend(reversed(self.sessions(day)))
+        return found
+
+
+def describe(session):
+    # ("Run", "45 min", "137 bpm", "7:00 AM") for the workout log rows
+    start = datetime.fromtimestamp(session["start"])
+    return (session["workout"], f"{round(session['duration_s'] / 60)} min",
+            f"{round(session['avg_bpm'])} bpm", start.strftime("%I:%M %p").lstrip("0"))
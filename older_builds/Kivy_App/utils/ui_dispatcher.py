@@ -0,0 +1,141 @@
+# utils/ui_dispatcher.py
+#
+# Coalesces high-rate HR samples between the BLE callback and anything that
+# touches the UI. push() is O(1) and safe to call from any thread; flush()
+# runs on the UI side (a Kivy Clock tick, or the ticker thread for Streamlit)
+# at most max_updates_per_s times a second, whatever the input rate:
+#
+#   - latest subscribers get only the newest value (text labels, metrics)
+#   - batch subscribers get every (timestamp, value) since the last flush
+#     (graphs, file logging)
+#
+# Samples are stamped with time.monotonic_ns() on push and converted to
+# epoch seconds once per batch on flush (utils/timebase.py), so batch
+# subscribers see wall-clock times that never run backwards.
+#
+# When consumers fall behind, the pending buffer is bounded (oldest samples
+# are dropped and counted) and the flush interval stretches to the cost of
+# the last flush, so slow consumers get bigger, rarer batches.
+
+import threading
+import time
+from collections import deque
+
+from utils import instrumentation
+from utils.timebase import timebase
+
+DISPATCH_FLUSH_US = instrumentation.histogram("ui.dispatch_flush_us")
+DISPATCH_BATCH = instrumentation.histogram("ui.dispatch_batch", unit="samples")
+DISPATCH_DROPPED = instrumentation.counter("ui.dispatch_dropped")
+
+
+class CoalescingDispatcher:
+    # A flush that took `cost` seconds pushes the next one out by cost * BACKOFF
+    BACKOFF = 2.0
+
+    def __init__(self, max_updates_per_s=10, max_pending=4096, clock=None):
+        # clock: utils.timebase.timebase, or a VirtualClock when replaying
+        self.clock = clock or timebase
+        self.min_interval = 1.0 / max_updates_per_s
+        self.max_pending = max_pending
+        self._pending = deque(maxlen=max_pending)
+        self._lock = threading.Lock()
+        self._latest = None
+        self._latest_subscribers = []
+        self._batch_subscribers = []
+        self._next_flush_at = 0.0
+        self._ticker = None
+        self._ticker_stop = threading.Event()
+
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    def subscribe_latest(self, cb):
+        if cb not in self._latest_subscribers:
+            self._latest_subscribers.append(cb)
+
+    def subscribe_batch(self, cb):
+        if cb not in self._batch_subscribers:
+            self._batch_subscribers.append(cb)
+
+    def push(self, value, mono_ns=None):
+        if mono_ns is None:
+            mono_ns = self.clock.now_ns()
+        with self._lock:
+            if len(self._pending) == self.max_pending:
+                # deque(maxlen) evicts the oldest sample on append
+                self.dropped += 1
+                DISPATCH_DROPPED.inc()
+            self._pending.append((mono_ns, value))
+            self._latest = value
+            self.received += 1
+
+    def latest(self):
+        return self._latest
+
+    def pending(self):
+        return len(self._pending)
+
+    def is_saturated(self):
+        # Producers can use this to shed optional work
+        return len(self._pending) >= self.max_pending // 2
+
+    def flush(self, *args, force=False):
+        # *args lets this be bound straight to Clock.schedule_interval
+        now = time.monotonic()
+        if not force and now < self._next_flush_at:
+            return False
+        with self._lock:
+            if not self._pending:
+                return False
+            stamps = [t for t, _ in self._pending]
+            values = [v for _, v in self._pending]
+            self._pending.clear()
+            latest = self._latest
+
+        started = time.perf_counter()
+        batch = list(zip(self.clock.to_wall_many(stamps), values))
+        for cb in self._latest_subscribers:
+            cb(latest)
+        for cb in self._batch_subscribers:
+            cb(batch)
+        cost = time.perf_counter() - started
+
+        self._next_flush_at = now + max(self.min_interval, cost * self.BACKOFF)
+        self.delivered += len(batch)
+        self.flushes += 1
+        DISPATCH_FLUSH_US.record(cost * 1e6)
+        DISPATCH_BATCH.record(len(batch))
+        return True
+
+    def start_ticker(self):
+        # For front ends without a frame clock (Streamlit): flush from a daemon thread
+        if self._ticker and self._ticker.is_alive():
+            return
+        self._ticker_stop.clear()
+
+        def run():
+            while not self._ticker_stop.is_set():
+                self.flush()
+                self._ticker_stop.wait(self.min_interval / 2)
+            self.flush(force=True)
+
+        self._ticker = threading.Thread(target=run, name="hr-dispatch", daemon=True)
+        self._ticker.start()
+
+    def stop_ticker(self):
+        self._ticker_stop.set()
+        if self._ticker:
+            self._ticker.join(timeout=1.0)
+            self._ticker = None
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "pending": self.pending(),
+        }
@@ -1,12 +1,31 @@
 # app.py
 
+import os
 import streamlit as st
 from screens import dashboard, metrics, workout_log, settings
-from utils.graph_utils import save_sleep_graph
+from utils import instrumentation
+from utils.hr_client import get_client
 
 st.set_page_config(layout="wide", page_title="Wearable Dashboard")
+instrumentation.configure_logging()
 
-save_sleep_graph()
+# Starts the embedded HR service once per server process unless HR_SERVICE_URL is set
+get_client()
+
+# HR_SIMULATOR_HZ=4 streamlit run app.py runs against a synthetic strap instead of BLE
+if os.environ.get("HR_SIMULATOR_HZ"):
+    from ble import simulator
+    from ble.hr_monitor import HRMonitor
+    if HRMonitor.client_class is not simulator.FakeBleakClient:
+        simulator.install(rate_hz=float(os.environ["HR_SIMULATOR_HZ"]), motion=True)
+
+# HR_REPLAY=2025-07-20@10 streamlit run app.py plays a recorded day back as the strap, at 10x
+if os.environ.get("HR_REPLAY"):
+    from ble import replay
+    from ble.hr_monitor import HRMonitor
+    address, _ = HRMonitor.selected_device()
+    if not address or not address.startswith("REPLAY:"):
+        replay.install(*replay.parse_replay_spec(os.environ["HR_REPLAY"]))
 
 page = st.sidebar.selectbox("📱 Navigation", [
     "📊 Dashboard",
@@ -15,11 +34,12 @@ page = st.sidebar.selectbox("📱 Navigation", [
     "⚙️ Settings"
 ])
 
-if page == "📊 Dashboard":
-    dashboard.render()
-elif page == "📈 Metrics":
-    metrics.render()
-elif page == "📝 Workout Log":
-    workout_log.render()
-elif page == "⚙️ Settings":
-    settings.render()
+with instrumentation.UI_UPDATE_US.time():
+    if page == "📊 Dashboard":
+        dashboard.render()
+    elif page == "📈 Metrics":
+        metrics.render()
+    elif page == "📝 Workout Log":
+        workout_log.render()
+    elif page == "⚙️ Settings":
+        settings.render()
@@ -0,0 +1,99 @@
+# benchmarks/bench_archive.py
+#
+# Archive tier benchmarks (utils/hr_archive.py): compression ratio of closed
+# days, and decode throughput against re-parsing the CSV. Run from the app
+# directory:
+#
+#   python -m benchmarks.bench_archive --samples 86400 --days 3 --out benchmarks/results/archive.json
+
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from benchmarks import harness
+from ble import simulator
+from utils import instrumentation
+from utils.hr_archive import ArchiveCompactor, decode_samples, encode_samples
+from utils.hr_store import HRStore, read_log_file
+
+
+def make_days(args, store):
+    # One CSV per day written the way the app logs, at 1 Hz with occasional gaps
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    days = []
+    for i in range(args.days, 0, -1):
+        start = today - timedelta(days=i)
+        device = simulator.SimulatedHRDevice("SIM:BENCH", rate_hz=1.0, seed=i)
+        simulator.write_hr_log(store.day_path(start.date()), device, min(args.samples, 86000),
+                               start=start, gap_every=3600)
+        days.append(start.date())
+    return days
+
+
+def bench_compression(args, store, days):
+    paths = [store.day_path(day) for day in days]
+    parsed = [read_log_file(path) for path in paths]
+    blobs = [encode_samples(ts, bpms) for ts, bpms in parsed]
+    csv_bytes = sum(os.path.getsize(path) for path in paths)
+    archive_bytes = sum(len(blob) for blob in blobs)
+    samples = sum(len(ts) for ts, _ in parsed)
+    reps = max(1, 12 // len(days))
+
+    results = [
+        harness.run_stage("csv_parse", read_log_file, paths * reps, warmup=1, memory=not args.no_memory),
+        harness.run_stage("archive_encode", lambda day: encode_samples(*day), parsed * reps,
+                          warmup=1, memory=not args.no_memory),
+        harness.run_stage("archive_decode", decode_samples, blobs * reps, warmup=1, memory=not args.no_memory),
+    ]
+    for result in results:
+        result["samples_per_s"] = round(result["throughput_per_s"] * samples / len(days), 1)
+    results[1].update(csv_bytes=csv_bytes, archive_bytes=archive_bytes,
+                      ratio=round(csv_bytes / archive_bytes, 1),
+                      bytes_per_sample=round(archive_bytes / samples, 3))
+    print(f"[BENCH] {'compression':<18} {csv_bytes / 1024:>10.1f}KiB -> {archive_bytes / 1024:.1f}KiB "
+          f"({results[1]['ratio']}x, {results[1]['bytes_per_sample']} B/sample)", file=sys.stderr)
+    return results
+
+
+def bench_compaction(args, store, days):
+    # The background job's own cost: archive every closed day, then read one back
+    compactor = ArchiveCompactor(store)
+    result = harness.run_stage("compaction", lambda _: compactor.run_once(), [None], warmup=0, memory=False)
+    fresh = HRStore(store.data_dir)
+    result["archived_days"] = len(store.archived_days())
+    result["read_back_samples"] = len(fresh.read_day(days[0])[0])
+    return [result]
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="HR archive benchmarks"))
+    parser.add_argument("--days", type=int, default=3, help="closed days to generate")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        store = HRStore(os.path.join(workdir, "data"))
+        os.makedirs(store.data_dir)
+        days = make_days(args, store)
+        results = []
+        if not args.only or "compression" in args.only:
+            results += bench_compression(args, store, days)
+        if not args.only or "compaction" in args.only:
+            results += bench_compaction(args, store, days)
+
+    report = harness.build_report("archive", results, {k: v for k, v in vars(args).items()
+                                                       if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
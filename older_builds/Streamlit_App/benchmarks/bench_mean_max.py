@@ -0,0 +1,141 @@
+# benchmarks/bench_mean_max.py
+#
+# Mean-maximal curve benchmarks (utils/mean_max.py). Run from the app
+# directory:
+#
+#   python -m benchmarks.bench_mean_max --out benchmarks/results/mean_max.json
+#
+#   curve_<H>h        one session's heart-rate and pace curve over every
+#                     duration, for sessions of each --hours at 1 Hz with GPS
+#   envelope_query    the all-time envelope over --years of sessions (two a
+#                     day), as the metrics screens ask for it
+#   envelope_add      one new session folded into that envelope
+#   envelope_rebuild  the envelope rebuilt from every stored curve, what
+#                     losing a record holder costs
+#   refresh_noop      checking --days of real history for changes when
+#                     there are none, which every query does first
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from datetime import timedelta
+
+import numpy as np
+
+from benchmarks import harness
+from benchmarks.bench_session_export import FIRST_DAY, make_data, write_session
+from utils import instrumentation, mean_max
+from utils.geo_index import TRACK_DIR, TrackIndex
+from utils.hr_store import HRStore
+from utils.sessions import SessionIndex
+
+
+def synthetic_curve(rng, durations):
+    # Falls off with duration like a real one
+    top = rng.uniform(150, 195)
+    speed = rng.uniform(2.0, 4.5)
+    bpm = [round(top - 12 * np.log10(w), 1) for w in durations]
+    distance = [round(speed * w * (1 - 0.02 * np.log10(w)), 1) for w in durations]
+    return {"bpm": bpm, "distance": distance}
+
+
+def bench_curves(args, data_dir):
+    tracks = TrackIndex(os.path.join(data_dir, TRACK_DIR))
+    rng = np.random.default_rng(4)
+    for i, hours in enumerate(args.hours):
+        write_session(data_dir, tracks, (FIRST_DAY + timedelta(days=1000 + 2 * i)).replace(hour=0),
+                      int(hours * 3600), rng)
+    store = HRStore(data_dir)
+    index = SessionIndex(store)
+    results = []
+    for i, hours in enumerate(args.hours):
+        session = max(index.sessions((FIRST_DAY + timedelta(days=1000 + 2 * i)).date()),
+                      key=lambda s: s["duration_s"])
+        store.read_range(session["start"], session["end"] + 1)   # parsing the day isn't the curve's cost
+        result = harness.run_stage(f"curve_{hours:g}h",
+                                   lambda _: mean_max.session_curve(store, tracks, session),
+                                   [None] * args.repeat, warmup=1, memory=not args.no_memory)
+        result["samples"] = session["samples"]
+        results.append(result)
+    return results
+
+
+def bench_envelope(args, data_dir):
+    index = mean_max.MeanMaxIndex(SessionIndex(HRStore(data_dir)), path=os.path.join(data_dir, "mm.json"))
+    rng = np.random.default_rng(8)
+    days = index._index["days"]
+    start = FIRST_DAY.timestamp()
+    count = 0
+    for day in range(int(args.years * 365)):
+        rows = []
+        for hour in (7, 18):
+            t = start + day * 86400 + hour * 3600
+            rows.append([t, "Run", synthetic_curve(rng, index.durations)])
+            for scope in (mean_max.ALL_TIME, mean_max.season(t)):
+                mean_max._raise(index._index["envelopes"].setdefault(scope, mean_max._empty_envelope(
+                    len(index.durations))), t, rows[-1][2])
+            count += 1
+        days[str(day)] = {"version": None, "rows": rows}
+    print(f"[BENCH] {'':<18} {count} sessions over {args.years:g} years", file=sys.stderr)
+
+    results = [harness.run_stage("envelope_query", lambda _: index.envelope(), [None] * 1000,
+                                 memory=not args.no_memory)]
+    envelope = index._index["envelopes"][mean_max.ALL_TIME]
+    new = [(start + count * 43200 + i, synthetic_curve(rng, index.durations)) for i in range(1000)]
+    results.append(harness.run_stage("envelope_add", lambda item: mean_max._raise(envelope, *item), new,
+                                     memory=not args.no_memory))
+    results.append(harness.run_stage("envelope_rebuild", lambda _: index._rebuild(mean_max.ALL_TIME),
+                                     [None] * args.repeat, warmup=1, memory=not args.no_memory))
+    for result in results:
+        result["sessions"] = count
+    return results
+
+
+def bench_refresh(args, data_dir):
+    make_data(data_dir, args.days, 0.25, 0.25)
+    index = mean_max.MeanMaxIndex(SessionIndex(HRStore(data_dir)), TrackIndex(os.path.join(data_dir, TRACK_DIR)))
+    index.refresh()
+    result = harness.run_stage("refresh_noop", lambda _: index.refresh(), [None] * args.repeat,
+                               warmup=1, memory=not args.no_memory)
+    result["days"] = args.days
+    return [result]
+
+
+def bench(args):
+    results = []
+    for stage in (bench_curves, bench_envelope, bench_refresh):
+        data_dir = tempfile.mkdtemp()
+        try:
+            results += stage(args, data_dir)
+        finally:
+            shutil.rmtree(data_dir)
+    return results
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="Mean-maximal curve benchmarks"))
+    parser.add_argument("--hours", type=float, nargs="+", default=[1.0, 8.0, 24.0], help="session lengths")
+    parser.add_argument("--years", type=float, default=5.0, help="of sessions in the envelope stages")
+    parser.add_argument("--days", type=int, default=90, help="of real history for refresh_noop")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    results = [r for r in bench(args) if not args.only or r["stage"] in args.only]
+
+    report = harness.build_report("mean_max", results, {k: v for k, v in vars(args).items()
+                                                        if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
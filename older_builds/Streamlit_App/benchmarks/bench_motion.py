@@ -0,0 +1,154 @@
+# benchmarks/bench_motion.py
+#
+# Accelerometer stream benchmarks (utils/motion.py). Run from the app
+# directory:
+#
+#   python -m benchmarks.bench_motion --devices 20 --out benchmarks/results/motion.json
+#
+#   motion_decode    packet -> (n, 3) int16 view, per 25-sample packet
+#   motion_ingest    decode + epoch features + classification with every
+#                    device's tracker interleaved, and how many times over
+#                    it could keep up with devices x 50 Hz on one core
+#   motion_day       a full day of 50 Hz packets through one tracker: wall
+#                    time, and peak / retained memory (bounded by the per-day
+#                    epoch array, not the 4.3M samples)
+#   motion_fanout    real HRMonitors on simulated wearables streaming heart
+#                    rate and motion in real time
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+from benchmarks import harness
+from ble import simulator
+from ble.hr_monitor import HRMonitor
+from utils import instrumentation
+from utils.motion import MotionTracker, decode_packet, PACKET_SAMPLES, RATE_HZ
+
+DAY_START = 1753000000.0
+PACKET_S = PACKET_SAMPLES / RATE_HZ
+
+
+def make_packets(count, seed=5):
+    imu = simulator.SimulatedIMU(RATE_HZ, seed=seed)
+    return [imu.next_payload() for _ in range(count)]
+
+
+def bench_decode(args):
+    packets = make_packets(min(args.samples, 5000))
+    return harness.run_stage("motion_decode", decode_packet, packets, memory=not args.no_memory)
+
+
+def bench_ingest(args):
+    per_device = max(1, args.samples // args.devices)
+    # Each device gets its own recording and tracker; packets are interleaved
+    # the way they'd arrive from several wearables at once
+    streams = [make_packets(per_device, seed=i) for i in range(args.devices)]
+    items = []
+    for i in range(per_device):
+        t = DAY_START + (i + 1) * PACKET_S
+        for d, stream in enumerate(streams):
+            items.append((d, stream[i], t))
+
+    trackers = []
+
+    def reset():
+        trackers[:] = [MotionTracker() for _ in range(args.devices)]
+
+    def ingest(item):
+        t0_ms, rate_hz, samples = decode_packet(item[1])
+        trackers[item[0]].ingest(t0_ms, samples, rate_hz, t=item[2])
+
+    reset()
+    result = harness.run_stage("motion_ingest", ingest, items, memory=not args.no_memory, setup=reset)
+    needed = args.devices * RATE_HZ / PACKET_SAMPLES
+    result["required_per_s"] = needed
+    result["headroom"] = round(result["throughput_per_s"] / needed, 1)
+    print(f"[BENCH] {'':<18} needs {needed:.0f} packets/s -> {result['headroom']}x headroom on one core",
+          file=sys.stderr)
+    return result
+
+
+def bench_day(args):
+    # Packets are generated as they're ingested, so only the tracker's own
+    # memory is measured
+    count = int(86400 / PACKET_S * args.day_fraction)
+    imu = simulator.SimulatedIMU(RATE_HZ, seed=9)
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracker = MotionTracker()
+    start = time.perf_counter()
+    for i in range(count):
+        t0_ms, rate_hz, samples = decode_packet(imu.next_payload())
+        tracker.ingest(t0_ms, samples, rate_hz, t=DAY_START + (i + 1) * PACKET_S)
+    total_s = time.perf_counter() - start
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    summary = tracker.summary()
+    result = harness.summarize("motion_day", [], total_s, peak - before, after - before,
+                               packets=count, samples=count * PACKET_SAMPLES, epochs=tracker.count,
+                               steps=summary["steps"], minutes=summary["minutes"])
+    print(f"[BENCH] {'motion_day':<18} {count * PACKET_SAMPLES:,} samples in {total_s:.1f}s  "
+          f"(includes simulation; tracemalloc on)  peak {result['mem_peak_kib']:.1f}KiB  "
+          f"retained {result['mem_retained_kib']:.1f}KiB  {summary['steps']:,} steps", file=sys.stderr)
+    return result
+
+
+def bench_fanout(args):
+    trackers = []
+
+    def make_monitor(on_hr):
+        tracker = MotionTracker()
+        trackers.append(tracker)
+        return HRMonitor(on_hr_callback=on_hr, on_motion_callback=tracker.ingest_packet)
+
+    devices = simulator.make_devices(args.devices, rate_hz=args.rate, seed=8, motion=True)
+    simulator.install(args.devices, rate_hz=args.rate, seed=8, motion=True)
+    with harness.quiet():
+        result = harness.run_fanout("motion_fanout", make_monitor, devices, args.seconds)
+    result["motion_samples"] = sum(t._sample_index + t._fill for t in trackers)
+    result["motion_expected"] = int(args.devices * RATE_HZ * args.seconds)
+    print(f"[BENCH] {'':<18} motion {result['motion_samples']:,} samples "
+          f"(expected ~{result['motion_expected']:,})", file=sys.stderr)
+    return result
+
+
+STAGES = {
+    "motion_decode": bench_decode,
+    "motion_ingest": bench_ingest,
+    "motion_day": bench_day,
+    "motion_fanout": bench_fanout,
+}
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="Accelerometer stream benchmarks"))
+    parser.add_argument("--day-fraction", type=float, default=1.0, help="how much of a day motion_day runs")
+    parser.set_defaults(devices=20, samples=40000)
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    results = []
+    for name, stage in STAGES.items():
+        if args.only and name not in args.only:
+            continue
+        results.append(stage(args))
+
+    report = harness.build_report("motion", results, {k: v for k, v in vars(args).items()
+                                                      if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
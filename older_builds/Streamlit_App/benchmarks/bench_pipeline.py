@@ -0,0 +1,130 @@
+# benchmarks/bench_pipeline.py
+#
+# Ingestion hot-path benchmarks for the Streamlit app, driven by the synthetic
+# strap in ble/simulator.py. Run from the Streamlit_App directory:
+#
+#   python -m benchmarks.bench_pipeline --out benchmarks/results/latest.json
+#   python -m benchmarks.bench_pipeline --baseline benchmarks/results/latest.json
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+from benchmarks import harness
+from ble import simulator
+from ble.hr_monitor import HRMonitor
+from utils import instrumentation
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def bench_hr_handler(args):
+    device = simulator.SimulatedHRDevice("SIM:BENCH", rate_hz=args.rate, seed=1)
+    payloads = device.payloads(args.samples)
+    with harness.quiet():
+        monitor = HRMonitor(on_hr_callback=lambda bpm: None)
+        return harness.run_stage("hr_handler", lambda data: monitor._hr_handler(None, data),
+                                 payloads, memory=not args.no_memory)
+
+
+def bench_log_heart_rate(args):
+    from screens.dashboard import hr_dispatcher, log_heart_rate
+
+    # Outside `streamlit run` every session_state access logs a bare-mode warning
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+
+    bpms = [bpm for _, bpm in simulator.SimulatedHRDevice("SIM:BENCH", seed=2).samples(args.samples)]
+    result = harness.run_stage("log_heart_rate", log_heart_rate, bpms, memory=not args.no_memory)
+    hr_dispatcher.flush(force=True)
+    return result
+
+
+def bench_log_flush(args):
+    from utils.hr_store import HRStore
+
+    store = HRStore()
+    device = simulator.SimulatedHRDevice("SIM:BENCH", rate_hz=args.rate, seed=2)
+    samples = [(t.timestamp(), bpm) for t, bpm in device.samples(args.samples)]
+    batches = [samples[i:i + 10] for i in range(0, len(samples), 10)]
+    return harness.run_stage("log_flush", store.append_batch, batches, memory=not args.no_memory)
+
+
+def bench_dispatch(args):
+    from utils.ui_dispatcher import CoalescingDispatcher
+
+    # Per-packet cost of push + rate-limited flush, and how many UI updates survive
+    dispatcher = CoalescingDispatcher(max_updates_per_s=10)
+    dispatcher.subscribe_latest(lambda bpm: None)
+    dispatcher.subscribe_batch(lambda batch: None)
+    bpms = [bpm for _, bpm in simulator.SimulatedHRDevice("SIM:BENCH", seed=5).samples(args.samples)]
+
+    def push(bpm):
+        dispatcher.push(bpm)
+        dispatcher.flush()
+
+    result = harness.run_stage("dispatch", push, bpms, memory=not args.no_memory)
+    result.update(dispatcher.stats())
+    return result
+
+
+def bench_save_sleep_graph(args):
+    from utils.graph_utils import save_sleep_graph
+
+    calls = list(range(max(5, args.samples // 1000)))
+    return harness.run_stage("save_sleep_graph", lambda _: save_sleep_graph(cached=False), calls,
+                             warmup=1, memory=not args.no_memory)
+
+
+def bench_ble_fanout(args):
+    devices = simulator.make_devices(args.devices, rate_hz=args.rate)
+    HRMonitor.client_class = simulator.FakeBleakClient
+    with harness.quiet():
+        return harness.run_fanout("ble_fanout", lambda cb: HRMonitor(on_hr_callback=cb),
+                                  devices, args.seconds)
+
+
+STAGES = {
+    "hr_handler": bench_hr_handler,
+    "log_heart_rate": bench_log_heart_rate,
+    "log_flush": bench_log_flush,
+    "dispatch": bench_dispatch,
+    "save_sleep_graph": bench_save_sleep_graph,
+    "ble_fanout": bench_ble_fanout,
+}
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="Streamlit ingestion benchmarks"))
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    # Stages write data/ and assets/ relative to the working directory, so run
+    # them in a scratch copy of the app layout rather than the real one
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "data"))
+        os.makedirs(os.path.join(workdir, "assets"))
+        os.chdir(workdir)
+
+        results = []
+        for name, stage in STAGES.items():
+            if args.only and name not in args.only:
+                continue
+            results.append(stage(args))
+        os.chdir(APP_DIR)
+
+    report = harness.build_report("streamlit", results, {k: v for k, v in vars(args).items()
+                                                         if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
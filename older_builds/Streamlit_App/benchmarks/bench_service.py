@@ -0,0 +1,184 @@
+# benchmarks/bench_service.py
+#
+# Load test for the HR data service (utils/hr_service.py) on localhost:
+#
+#   live_fanout  hundreds of concurrent WebSocket subscribers on /live while
+#                batches are published at the dispatcher's rate; latency is
+#                publish-to-receive per frame
+#   range_bin    concurrent pooled /range queries, binary payloads
+#   range_json   the same queries as JSON
+#
+# Run from the app directory:
+#
+#   python -m benchmarks.bench_service --subscribers 500 --out benchmarks/results/service.json
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from benchmarks import harness
+from ble import simulator
+from utils import instrumentation
+from utils.hr_client import HRClient, live_feed
+from utils.hr_service import HRService
+from utils.hr_store import HRStore
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def bench_live_fanout(args, service):
+    latencies = []
+    received = [0]
+    publish_hz = 10  # what CoalescingDispatcher delivers at most
+    batch_size = max(1, int(args.rate * args.devices / publish_hz))
+
+    async def subscriber(ready, stop):
+        feed = live_feed(service.host, service.port)
+        first = asyncio.ensure_future(feed.__anext__())
+        ready.release()
+        try:
+            batch = await first
+            while True:
+                received[0] += 1
+                latencies.append(int((time.time() - batch[-1][0]) * 1e9))
+                if stop.is_set():
+                    return
+                batch = await feed.__anext__()
+        except StopAsyncIteration:
+            pass
+        finally:
+            await feed.aclose()
+
+    def publisher(stop, counts):
+        device = simulator.SimulatedHRDevice("SIM:BENCH", seed=5)
+        samples = device.samples(10 ** 9)
+        deadline = time.perf_counter() + args.seconds
+        while time.perf_counter() < deadline:
+            # Stamped with the publish time so subscribers can measure latency
+            now = time.time()
+            batch = [(now, bpm) for _, bpm in itertools.islice(samples, batch_size)]
+            service.publish(batch)
+            counts[0] += 1
+            time.sleep(1.0 / publish_hz)
+        stop.set()
+
+    async def main():
+        ready = asyncio.Semaphore(0)
+        stop = asyncio.Event()
+        tasks = [asyncio.create_task(subscriber(ready, stop)) for _ in range(args.subscribers)]
+        for _ in tasks:
+            await ready.acquire()
+        while len(service._subscribers) < args.subscribers:
+            await asyncio.sleep(0.01)
+
+        counts = [0]
+        thread_stop = threading.Event()
+        start = time.perf_counter()
+        thread = threading.Thread(target=publisher, args=(thread_stop, counts))
+        thread.start()
+        while not thread_stop.is_set():
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        thread.join()
+        # One more frame wakes every subscriber so it can see the stop flag
+        stop.set()
+        service.publish([(time.time(), 60)])
+        await asyncio.wait(tasks, timeout=5)
+        return elapsed, counts[0]
+
+    elapsed, published = asyncio.run(main())
+    expected = published * args.subscribers
+    dropped = sum(sub.dropped for sub in service._subscribers)
+    result = harness.summarize("live_fanout", latencies, elapsed, subscribers=args.subscribers,
+                               batch_size=batch_size, expected_frames=expected, dropped=dropped)
+    print(f"[BENCH] {'live_fanout':<18} {result['throughput_per_s']:>12.1f}/s  "
+          f"({args.subscribers} subscribers, {published} batches)  "
+          f"p50 {result['p50_us']:>10.1f}us  p99 {result['p99_us']:>10.1f}us", file=sys.stderr)
+    return result
+
+
+def bench_range(args, service, stage, binary):
+    # Windows of 5 minutes to the whole day, downsampled for a chart
+    store_ts, _ = service.store.read_day(datetime.now().date())
+    first, last = store_ts[0], store_ts[-1]
+    rng = random.Random(6)
+    windows = []
+    for _ in range(max(50, args.samples // 100)):
+        span = rng.uniform(300, last - first)
+        start = rng.uniform(first, last - span)
+        windows.append((start, start + span))
+
+    client = HRClient(service.url, pool_size=args.clients)
+    latencies = []
+
+    def query(window):
+        t0 = time.perf_counter_ns()
+        client.range(window[0], window[1], max_points=500, binary=binary)
+        latencies.append(time.perf_counter_ns() - t0)
+
+    for window in windows[:5]:
+        query(window)
+    latencies.clear()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        list(pool.map(query, windows))
+    elapsed = time.perf_counter() - start
+    client.close()
+
+    result = harness.summarize(stage, latencies, elapsed, clients=args.clients,
+                               day_samples=len(store_ts))
+    print(f"[BENCH] {stage:<18} {result['throughput_per_s']:>12.1f}/s  "
+          f"p50 {result['p50_us']:>10.1f}us  p99 {result['p99_us']:>10.1f}us", file=sys.stderr)
+    return result
+
+
+STAGES = {
+    "live_fanout": bench_live_fanout,
+    "range_bin": lambda args, service: bench_range(args, service, "range_bin", True),
+    "range_json": lambda args, service: bench_range(args, service, "range_json", False),
+}
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="HR data service benchmarks"))
+    parser.add_argument("--subscribers", type=int, default=200, help="concurrent /live WebSocket clients")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent /range query threads")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # A day of samples for the range queries, written the way the app does
+        device = simulator.SimulatedHRDevice("SIM:BENCH", seed=4)
+        store = HRStore(os.path.join(workdir, "data"))
+        store.append_batch([(t.timestamp(), bpm) for t, bpm in device.samples(args.samples)])
+
+        service = HRService(store, port=0).start_in_thread()
+        results = []
+        for name, stage in STAGES.items():
+            if args.only and name not in args.only:
+                continue
+            results.append(stage(args, service))
+        service.stop()
+
+    report = harness.build_report("service", results, {k: v for k, v in vars(args).items()
+                                                       if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
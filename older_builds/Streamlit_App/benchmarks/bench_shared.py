@@ -0,0 +1,150 @@
+# benchmarks/bench_shared.py
+#
+# Per-rerun cost of the Streamlit pages with several viewers at once, with
+# and without the shared layer (utils/shared_cache.py). Each viewer is a
+# streamlit.testing AppTest session on app.py in this process, so they share
+# the server-wide caches the way browser tabs on one `streamlit run` do. Run
+# from the Streamlit_App directory:
+#
+#   python -m benchmarks.bench_shared --out benchmarks/results/shared.json
+#
+# For each page and each --viewers count, every viewer reruns once per
+# round for --rounds rounds. Before each round a live batch lands, as it
+# does several times a second while a strap is connected, so the day's
+# products go stale and are rebuilt: once per round with the shared layer,
+# once per viewer and round without.
+#
+#   <page>_x<N>_rerun    HR_SHARED_CACHE=0, everything built per rerun
+#   <page>_x<N>_shared   built once per change, shared by every viewer
+#
+# Reruns run one after another: the script thread of each session holds the
+# GIL for most of its rerun, so the server's total work is the same either way.
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from streamlit.testing.v1 import AppTest
+
+from benchmarks import harness
+from ble import simulator
+from utils import instrumentation, shared_cache
+from utils.hr_client import get_client, get_embedded_service
+
+APP = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, "app.py"))
+ASSETS = os.path.join(os.path.dirname(APP), "assets")
+PAGES = {"dashboard": "📊 Dashboard", "metrics": "📈 Metrics", "workout_log": "📝 Workout Log"}
+
+
+def make_data(hours):
+    # Today up to now, plus a week of morning workouts
+    os.makedirs("data", exist_ok=True)
+    os.symlink(ASSETS, "assets")
+    now = datetime.now()
+    device = simulator.SimulatedHRDevice("SIM:SH:AR:ED", rate_hz=1.0, seed=8)
+    start = max(datetime.combine(now.date(), datetime.min.time()), now - timedelta(hours=hours))
+    simulator.write_hr_log(f"data/hr_log_{now.date().isoformat()}.csv", device,
+                           int((now - start).total_seconds()), start=start, gap_every=3600, gap_seconds=900)
+    for back in range(1, 7):
+        day = now.date() - timedelta(days=back)
+        simulator.write_hr_log(f"data/hr_log_{day.isoformat()}.csv", device, 3600,
+                               start=datetime.combine(day, datetime.min.time()).replace(hour=7))
+
+
+def live_batch(seconds=1):
+    # What the dashboard's dispatcher hands on while a strap is connected
+    now = time.time()
+    batch = [(now - seconds + i, 120 + i % 7) for i in range(seconds)]
+    get_embedded_service().ingest(batch)
+    shared_cache.get_live_buffer().append_batch(batch)
+
+
+def open_viewers(count, page):
+    viewers = []
+    for _ in range(count):
+        at = AppTest.from_file(APP, default_timeout=60)
+        at.run()
+        at.sidebar.selectbox[0].set_value(PAGES[page]).run()
+        if at.exception:
+            raise RuntimeError(f"{page}: {at.exception[0].message}")
+        viewers.append(at)
+    return viewers
+
+
+def bench_page(page, count, shared, rounds):
+    cache = shared_cache.get_shared()
+    cache.enabled = shared
+    cache.clear()
+    viewers = open_viewers(count, page)
+    builds = shared_cache.BUILDS.count
+    latencies = []
+    round_s = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        live_batch()
+        round_start = time.perf_counter_ns()
+        for at in viewers:
+            t0 = time.perf_counter_ns()
+            at.run()
+            latencies.append(time.perf_counter_ns() - t0)
+        round_s.append((time.perf_counter_ns() - round_start) / 1e9)
+    total_s = time.perf_counter() - start
+    stage = f"{page}_x{count}_{'shared' if shared else 'rerun'}"
+    result = harness.summarize(stage, latencies, total_s, viewers=count,
+                               round_ms=round(sum(round_s) / len(round_s) * 1000, 1))
+    if instrumentation.enabled:
+        result["builds"] = shared_cache.BUILDS.count - builds
+    print(f"[BENCH] {stage:<26} p50 {result['p50_us'] / 1000:>7.1f} ms/rerun  "
+          f"p99 {result['p99_us'] / 1000:>7.1f} ms  all {count} viewers {result['round_ms']:>8.1f} ms",
+          file=sys.stderr)
+    return result
+
+
+def bench(args):
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        make_data(args.hours)
+        get_client()  # the embedded service, on the data above
+        results = []
+        for page in args.pages:
+            for count in args.viewers:
+                for shared in (False, True):
+                    results.append(bench_page(page, count, shared, args.rounds))
+        return results
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="Shared Streamlit computation benchmarks"))
+    parser.add_argument("--viewers", type=int, nargs="*", default=[1, 10, 50])
+    parser.add_argument("--pages", nargs="*", default=list(PAGES), choices=list(PAGES))
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--hours", type=float, default=8, help="of today's log so far")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+    os.environ.setdefault("HR_SERVICE_PORT", "0")
+
+    results = [r for r in bench(args) if not args.only or r["stage"] in args.only]
+
+    report = harness.build_report("shared", results, {k: v for k, v in vars(args).items()
+                                                      if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
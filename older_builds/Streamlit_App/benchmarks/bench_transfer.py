@@ -0,0 +1,208 @@
+# benchmarks/bench_transfer.py
+#
+# SD log transfer benchmarks (utils/sd_transfer.py) against the stand-in
+# wearable on a pseudo-terminal. Run from the app directory:
+#
+#   python -m benchmarks.bench_transfer --out benchmarks/results/transfer.json
+#
+#   transfer_uart    --uart-minutes of HR log paced at --baud, against the
+#                    time the old firmware's CSV text dump of the same rows
+#                    needs on the wire at that rate (speedup)
+#   transfer_pty     --hours of HR log plus --imu-minutes of motion as fast
+#                    as the pty goes, straight into an HR store
+#   transfer_lossy   the same with --loss of reply frames dropped or damaged;
+#                    every sample must still arrive exactly once, and
+#                    bytes sent over the file sizes
+#   transfer_resume  the link cut halfway through and the pull run again;
+#                    bytes re-sent over the file size
+#   transfer_overlap --uart-minutes of an earlier boot's log (GPS-anchored),
+#                    the first half already recorded live over BLE a fraction
+#                    of a second off; each beat must be stored once, the live
+#                    copy kept
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import harness
+from utils import instrumentation, sd_transfer
+from utils.hr_store import HRStore
+from utils.motion import PACKET_SAMPLES, RATE_HZ, encode_packet
+
+BOOT = 7
+
+
+def make_hr_log(seconds, seed=5, start_ms=60000):
+    # 1 Hz records with a fix and an occasional missed beat, as the firmware
+    # logs them; returns (binary file, the same rows as the old CSV)
+    rng = np.random.default_rng(seed)
+    bpms = np.clip(110 + np.cumsum(rng.normal(0, 1.0, seconds)), 60, 190).astype(int)
+    bpms[rng.random(seconds) < 0.02] = 0
+    lats = 47.3769 + np.cumsum(rng.normal(0, 2e-5, seconds))
+    lons = 8.5417 + np.cumsum(rng.normal(0, 2e-5, seconds))
+    blob = bytearray()
+    csv = ["BPM,Latitude,Longitude,Millis\n"]
+    for i in range(seconds):
+        millis = start_ms + i * 1000
+        blob += sd_transfer.encode_sample(millis, bpms[i], lats[i], lons[i])
+        bpm = f"{bpms[i] + rng.random():.1f}" if bpms[i] else "null"
+        csv.append(f"{bpm},{lats[i]:.6f},{lons[i]:.6f},{millis}\n")
+    return bytes(blob), "".join(csv).encode(), int((bpms > 0).sum())
+
+
+def make_imu_log(minutes, seed=6):
+    rng = np.random.default_rng(seed)
+    packets = []
+    for k in range(minutes * 60 * RATE_HZ // PACKET_SAMPLES):
+        samples = rng.normal(0, 80, (PACKET_SAMPLES, 3)).astype(np.int16) + np.array([0, 0, 1000], np.int16)
+        packets.append(encode_packet(60000 + k * 1000 * PACKET_SAMPLES // RATE_HZ, samples))
+    return b"".join(packets)
+
+
+def pull(files, data_dir, **device):
+    # One connection: returns (receiver, device, seconds)
+    wearable = sd_transfer.EmulatedWearable(files, boot=BOOT, **device)
+    port = sd_transfer.SerialPort(wearable.path)
+    receiver = sd_transfer.Receiver(port, data_dir=data_dir)
+    start = time.perf_counter()
+    try:
+        receiver.pull()
+    except sd_transfer.TransferError as e:
+        print(f"[BENCH] {'':<18} {e}", file=sys.stderr)
+    finally:
+        elapsed = time.perf_counter() - start
+        port.close()
+        wearable.close()
+    return receiver, wearable, elapsed
+
+
+def stored(data_dir):
+    store = HRStore(data_dir)
+    ts = np.concatenate([np.frombuffer(store.read_day(d)[0], dtype=np.float64) for d in store.days()] or [[]])
+    return len(ts), len(np.unique(ts))
+
+
+def bench_uart(args, directory):
+    blob, csv, _ = make_hr_log(args.uart_minutes * 60)
+    data_dir = tempfile.mkdtemp(dir=directory)
+    _, _, elapsed = pull({f"HR{BOOT:04d}.BIN": blob}, data_dir, baud=args.baud)
+    text_s = len(csv) * 10 / args.baud
+    result = harness.summarize("transfer_uart", [int(elapsed * 1e9)], elapsed, bytes=len(blob),
+                               csv_bytes=len(csv), text_s=round(text_s, 2),
+                               speedup_vs_text=round(text_s / elapsed, 2))
+    print(f"[BENCH] {'transfer_uart':<18} {len(blob):,} B in {elapsed:.2f} s at {args.baud} baud; "
+          f"CSV text {len(csv):,} B needs {text_s:.2f} s ({result['speedup_vs_text']}x)", file=sys.stderr)
+    return result
+
+
+def bench_pty(args, directory, stage, loss=0.0):
+    blob, _, beats = make_hr_log(args.hours * 3600)
+    imu = make_imu_log(args.imu_minutes)
+    files = {f"HR{BOOT:04d}.BIN": blob, f"IM{BOOT:04d}.BIN": imu}
+    data_dir = tempfile.mkdtemp(dir=directory)
+    _, wearable, elapsed = pull(files, data_dir, drop=loss, corrupt=loss)
+    total = len(blob) + len(imu)
+    rows, unique = stored(data_dir)
+    result = harness.summarize(stage, [int(elapsed * 1e9)], elapsed, bytes=total,
+                               mib_per_s=round(total / elapsed / 2 ** 20, 2),
+                               samples=rows, exactly_once=rows == unique == beats,
+                               deleted=not wearable.files,
+                               overhead_pct=round((wearable.sent / total - 1) * 100, 1))
+    print(f"[BENCH] {stage:<18} {total / 2 ** 20:.1f} MiB in {elapsed:.2f} s ({result['mib_per_s']} MiB/s), "
+          f"{rows:,} samples, exactly once: {result['exactly_once']}", file=sys.stderr)
+    return result
+
+
+def bench_resume(args, directory):
+    blob, _, beats = make_hr_log(args.hours * 3600)
+    files = {f"HR{BOOT:04d}.BIN": blob}
+    data_dir = tempfile.mkdtemp(dir=directory)
+    wearable = sd_transfer.EmulatedWearable(files, boot=BOOT)
+    wearable.cut_after = len(blob) // 2
+    port = sd_transfer.SerialPort(wearable.path)
+    try:
+        sd_transfer.Receiver(port, data_dir=data_dir).pull()
+    except sd_transfer.TransferError:
+        pass
+    port.close()
+    wearable.close()
+    first = wearable.sent
+
+    _, again, elapsed = pull(wearable.files, data_dir)
+    rows, unique = stored(data_dir)
+    overhead = (first + again.sent) / len(blob) - 1
+    result = harness.summarize("transfer_resume", [int(elapsed * 1e9)], elapsed, bytes=len(blob),
+                               overhead_pct=round(overhead * 100, 1), exactly_once=rows == unique == beats,
+                               deleted=not again.files)
+    print(f"[BENCH] {'transfer_resume':<18} {overhead * 100:.1f}% sent beyond the file size, "
+          f"exactly once: {result['exactly_once']}", file=sys.stderr)
+    return result
+
+
+def bench_overlap(args, directory):
+    blob, _, beats = make_hr_log(args.uart_minutes * 60)
+    unix_s = 1752998400
+    blob = sd_transfer.encode_anchor(60000, unix_s) + blob
+    offset = unix_s - 60.0
+    samples = [r for r in sd_transfer.RecordDecoder().feed(blob) if r[0] == "sample" and r[2]]
+    live = [(millis / 1000.0 + offset + 0.3, bpm) for _, millis, bpm, _, _ in samples[:len(samples) // 2]]
+    data_dir = tempfile.mkdtemp(dir=directory)
+    HRStore(data_dir).append_batch(live)
+
+    _, _, elapsed = pull({f"HR{BOOT - 1:04d}.BIN": blob}, data_dir)
+    rows, unique = stored(data_dir)
+    store = HRStore(data_dir)
+    kept = store.read_range(live[0][0], live[-1][0] + 0.001)[0]
+    live_kept = list(kept) == [t for t, _ in live]
+    result = harness.summarize("transfer_overlap", [int(elapsed * 1e9)], elapsed, samples=rows, live=len(live),
+                               exactly_once=rows == unique == beats and live_kept)
+    print(f"[BENCH] {'transfer_overlap':<18} {rows:,} samples from {beats:,} beats ({len(live):,} live), "
+          f"exactly once: {result['exactly_once']}", file=sys.stderr)
+    return result
+
+
+def bench(args):
+    directory = tempfile.mkdtemp()
+    try:
+        with harness.quiet():
+            results = [bench_uart(args, directory),
+                       bench_pty(args, directory, "transfer_pty"),
+                       bench_pty(args, directory, "transfer_lossy", loss=args.loss),
+                       bench_resume(args, directory),
+                       bench_overlap(args, directory)]
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def main(argv=None):
+    parser = harness.add_common_args(argparse.ArgumentParser(description="SD log transfer benchmarks"))
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--uart-minutes", type=int, default=30, help="log pulled at --baud")
+    parser.add_argument("--hours", type=int, default=8, help="HR log pulled over the bare pty")
+    parser.add_argument("--imu-minutes", type=int, default=30)
+    parser.add_argument("--loss", type=float, default=0.01, help="share of reply frames dropped, and damaged")
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out) if args.out != "-" else args.out
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    instrumentation.set_enabled(args.instrument)
+
+    results = [r for r in bench(args) if not args.only or r["stage"] in args.only]
+
+    report = harness.build_report("transfer", results, {k: v for k, v in vars(args).items()
+                                                        if k not in ("out", "baseline")})
+    if args.instrument:
+        report["instrumentation"] = instrumentation.snapshot()
+    harness.write_report(report, out)
+    if baseline:
+        return 1 if harness.compare_reports(baseline, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+# benchmarks/harness.py
+#
+# Shared timing/memory helpers for the benchmark scripts. Every stage reports
+# the same fields so result files from different runs can be diffed with
+# compare_reports().
+
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(stage, latencies_ns, total_s, mem_peak=0, mem_retained=0, **extra):
+    latencies_ns = sorted(latencies_ns)
+    calls = len(latencies_ns)
+    result = {
+        "stage": stage,
+        "calls": calls,
+        "total_s": round(total_s, 6),
+        "throughput_per_s": round(calls / total_s, 1) if total_s > 0 else 0.0,
+        "mean_us": round(sum(latencies_ns) / calls / 1000, 3) if calls else 0.0,
+        "p50_us": round(percentile(latencies_ns, 50) / 1000, 3),
+        "p99_us": round(percentile(latencies_ns, 99) / 1000, 3),
+        "max_us": round(latencies_ns[-1] / 1000, 3) if calls else 0.0,
+        "mem_peak_kib": round(mem_peak / 1024, 1),
+        "mem_retained_kib": round(mem_retained / 1024, 1),
+    }
+    result.update(extra)
+    return result
+
+
+@contextlib.contextmanager
+def quiet():
+    # The code under test still pays for formatting its prints, but the
+    # terminal isn't flooded with one line per packet
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def run_stage(stage, fn, items, warmup=20, memory=True, setup=None):
+    # Calls fn(item) once per item. Timing and memory are measured in separate
+    # passes because tracemalloc slows allocation-heavy code considerably.
+    if setup:
+        setup()
+    for item in items[:warmup]:
+        fn(item)
+
+    latencies = []
+    clock = time.perf_counter_ns
+    start = clock()
+    for item in items:
+        t0 = clock()
+        fn(item)
+        latencies.append(clock() - t0)
+    total_s = (clock() - start) / 1e9
+
+    mem_peak = mem_retained = 0
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        for item in items:
+            fn(item)
+        after, mem_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        mem_peak -= before
+        mem_retained = after - before
+
+    result = summarize(stage, latencies, total_s, mem_peak, mem_retained)
+    print(f"[BENCH] {stage:<18} {result['throughput_per_s']:>12.1f}/s  "
+          f"p50 {result['p50_us']:>10.1f}us  p99 {result['p99_us']:>10.1f}us  "
+          f"peak {result['mem_peak_kib']:>9.1f}KiB", file=sys.stderr)
+    return result
+
+
+def run_fanout(stage, make_monitor, devices, seconds):
+    # Connects one monitor per simulated device and measures delivered rate
+    # and notification-to-callback latency while all of them stream at once
+    latencies = []
+
+    async def main():
+        monitors = []
+        start = time.perf_counter()
+        for device in devices:
+            def on_hr(bpm, holder=monitors, idx=len(monitors)):
+                latencies.append(time.perf_counter_ns() - holder[idx].client.sent_at_ns)
+
+            monitor = make_monitor(on_hr)
+            monitor._selected_address = device.address
+            monitors.append(monitor)
+            await monitor.connect()
+
+        await asyncio.sleep(seconds)
+        elapsed = time.perf_counter() - start
+        for monitor in monitors:
+            await monitor.client.disconnect()
+        return elapsed
+
+    elapsed = asyncio.run(main())
+    expected = sum(d.rate_hz for d in devices)
+    result = summarize(stage, latencies, elapsed, devices=len(devices),
+                       expected_per_s=round(expected, 1))
+    print(f"[BENCH] {stage:<18} {result['throughput_per_s']:>12.1f}/s  "
+          f"(expected {expected:.1f}/s)  p99 {result['p99_us']:>10.1f}us", file=sys.stderr)
+    return result
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def build_report(app, results, params):
+    return {
+        "app": app,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+
+
+def write_report(report, path):
+    if not path or path == "-":
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[BENCH] 💾 Results written to {path}", file=sys.stderr)
+
+
+def compare_reports(baseline_path, report, tolerance=0.10):
+    # Prints p50/p99/throughput changes per stage; returns the regressed stages
+    with open(baseline_path) as f:
+        baseline = {r["stage"]: r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in report["results"]:
+        old = baseline.get(result["stage"])
+        if not old:
+            continue
+        changes = []
+        for key, higher_is_worse in (("p50_us", True), ("p99_us", True), ("throughput_per_s", False)):
+            if not old.get(key):
+                continue
+            delta = (result[key] - old[key]) / old[key]
+            worse = delta > tolerance if higher_is_worse else delta < -tolerance
+            changes.append(f"{key} {delta:+.1%}{' ⚠️' if worse else ''}")
+            if worse and result["stage"] not in regressions:
+                regressions.append(result["stage"])
+        print(f"[BENCH] {result['stage']:<18} " + "  ".join(changes), file=sys.stderr)
+    return regressions
+
+
+def add_common_args(parser):
+    parser.add_argument("--samples", type=int, default=20000, help="calls per stage")
+    parser.add_argument("--devices", type=int, default=20, help="simulated devices for the fan-out load test")
+    parser.add_argument("--rate", type=float, default=4.0, help="notifications per second per device")
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of the fan-out load test")
+    parser.add_argument("--only", nargs="*", help="run only these stages")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--instrument", action="store_true", help="enable utils.instrumentation while measuring")
+    parser.add_argument("--out", default="-", help="JSON output path ('-' for stdout)")
+    parser.add_argument("--baseline", help="previous JSON result to compare against")
+    return parser
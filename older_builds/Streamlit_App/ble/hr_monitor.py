@@ -1,41 +1,91 @@
 import asyncio
+import logging
 from bleak import BleakClient, BleakScanner
 
+from utils import instrumentation
+from utils.motion import MOTION_UUID
+from utils.timebase import DriftEstimator, now_ns
+
 HR_UUID = "00002a37-0000-1000-8000-00805f9b34fb"
 
+log = logging.getLogger("wearable.ble")
+
+RR_DRIFT_PPM = instrumentation.histogram("ble.rr_drift_ppm", unit="ppm")
+
+
+def decode_hr_measurement(data):
+    # Heart Rate Measurement (0x2A37): flags, uint8/uint16 BPM, optional energy
+    # expended, then any number of uint16 RR intervals in 1/1024 s units
+    flags = data[0]
+    if flags & 0x01:
+        hr = data[1] | (data[2] << 8)
+        offset = 3
+    else:
+        hr = data[1]
+        offset = 2
+    contact = bool(flags & 0x02) if flags & 0x04 else None
+    if flags & 0x08:
+        offset += 2
+    rr_intervals = []
+    if flags & 0x10:
+        rr_intervals = [(data[i] | (data[i + 1] << 8)) / 1024.0 for i in range(offset, len(data) - 1, 2)]
+    return hr, contact, rr_intervals
+
+
 class HRMonitor:
     _selected_address = None
     _selected_name = None
     _last_scan_results = []
     _device_update_callbacks = []
+    # Swapped for ble.simulator.FakeBleakClient in benchmarks and load tests
+    client_class = BleakClient
 
-    def __init__(self, on_hr_callback=None):
-        print("[INIT] HRMonitor created.")
+    def __init__(self, on_hr_callback=None, on_motion_callback=None):
+        log.info("HRMonitor created.")
         self.client = None
         self.latest_hr = 0
+        self.latest_contact = None
+        self.latest_rr = []
         self.on_hr_callback = on_hr_callback
+        # Raw accelerometer packets for utils.motion.MotionTracker.ingest_packet
+        self.on_motion_callback = on_motion_callback
+        # RR intervals are timed by the strap's own clock; their running sum
+        # against host time gives its drift
+        self.rr_clock = 0.0
+        self.rr_drift = DriftEstimator("rr")
         self._listener_task = None
 
     @classmethod
     async def scan_named_devices(cls, limit=5):
-        print("[BLE] 🔍 Scanning for named BLE devices...")
+        log.info("🔍 Scanning for named BLE devices...")
         try:
             devices = await BleakScanner.discover(timeout=5.0)
             named = [d for d in devices if d.name]
             cls._last_scan_results = named[:limit]
             return cls._last_scan_results
         except Exception as e:
-            print(f"[BLE] 🚨 Scan error: {e}")
+            log.error("🚨 Scan error: %s", e)
             return []
 
     @classmethod
     def set_device(cls, address, name=None):
-        print(f"[BLE] 📡 Device address set to: {address}")
+        log.info("📡 Device address set to: %s", address)
         cls._selected_address = address
         cls._selected_name = name
         for cb in cls._device_update_callbacks:
             cb()
 
+    @classmethod
+    def selected_device(cls):
+        # (address, name) of the device picked in Settings, or (None, None)
+        return cls._selected_address, cls._selected_name
+
+    @property
+    def address(self):
+        # The device this monitor connects to; the selected one unless a
+        # load test gave the instance its own
+        return self._selected_address
+
     @classmethod
     def register_device_update_callback(cls, cb):
         if cb not in cls._device_update_callbacks:
@@ -44,44 +94,67 @@ class HRMonitor:
     async def connect(self):
         address = self._selected_address
         if not address:
-            print("[BLE] ❗ No address set.")
+            log.warning("❗ No address set.")
             return False
 
         try:
-            self.client = BleakClient(address)
+            self.client = self.client_class(address)
             await self.client.connect()
 
             if self.client.is_connected:
                 await self.client.start_notify(HR_UUID, self._hr_handler)
-                print("[BLE] ✅ Connected and listening for HR notifications")
+                if self.on_motion_callback:
+                    await self._start_motion()
+                log.info("✅ Connected and listening for HR notifications")
                 self._listener_task = asyncio.create_task(self._stream_loop())
                 return True
         except Exception as e:
-            print(f"[BLE] ❗ Exception during connect: {e}")
+            log.error("❗ Exception during connect: %s", e)
             return False
 
-    def _hr_handler(self, sender, data):
-        print(f"[BLE] 🔄 Raw HR data: {list(data)}")
+    async def _start_motion(self):
+        # Only the wearable has the accelerometer characteristic; plain HR
+        # straps carry on without it
+        try:
+            await self.client.start_notify(MOTION_UUID, self._motion_handler)
+            log.info("🏃 Listening for motion notifications")
+        except Exception as e:
+            log.info("No motion stream on this device: %s", e)
 
-        # Parse flags
-        flags = data[0]
-        hr_format_uint16 = flags & 0b1
+    def _motion_handler(self, sender, data):
+        self.on_motion_callback(data)
 
-        if hr_format_uint16:
-            hr = int.from_bytes(data[1:3], byteorder='little')
-        else:
-            hr = data[1]
+    def _hr_handler(self, sender, data):
+        instrumentation.NOTIFICATIONS.inc()
+        t0 = instrumentation.stopwatch()
+        try:
+            hr, contact, rr_intervals = decode_hr_measurement(data)
+        except IndexError:
+            instrumentation.DECODE_ERRORS.inc()
+            log.warning("Malformed HR packet: %s", bytes(data).hex())
+            return
+        instrumentation.DECODE_US.record_since(t0)
 
         self.latest_hr = hr
-        print(f"[BLE] ❤️ Heart Rate: {hr} BPM")
+        self.latest_contact = contact
+        self.latest_rr = rr_intervals
+        if rr_intervals:
+            self.rr_clock += sum(rr_intervals)
+            self.rr_drift.add(now_ns(), self.rr_clock)
+            if self.rr_drift.ppm is not None:
+                RR_DRIFT_PPM.record(self.rr_drift.ppm)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("hr_sample bpm=%d contact=%s rr=%s raw=%s", hr, contact, rr_intervals, bytes(data).hex())
 
         if self.on_hr_callback:
+            t1 = instrumentation.stopwatch()
             self.on_hr_callback(hr)
+            instrumentation.CALLBACK_US.record_since(t1)
 
     async def _stream_loop(self):
-        print("[BLE] 🌀 Streaming HR data...")
+        log.info("🌀 Streaming HR data...")
         try:
             while self.client and self.client.is_connected:
                 await asyncio.sleep(1)
         except asyncio.CancelledError:
-            print("[BLE] ❌ Stream loop cancelled.")
+            log.info("❌ Stream loop cancelled.")
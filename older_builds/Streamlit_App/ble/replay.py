@@ -0,0 +1,206 @@
+# ble/replay.py
+#
+# Pushes recorded sessions (any day in the HR store, CSV or archived) back
+# through the live path: Heart Rate Measurement payloads into
+# HRMonitor._hr_handler, the on_hr callback into a CoalescingDispatcher, and
+# its batches into sinks (a scratch HRStore, analytics).
+#
+# Two ways to run it:
+#
+#   replay_session()   virtual clock. Samples keep their recorded times and
+#                      the dispatcher flushes on virtual-time boundaries, so
+#                      output is bit-for-bit the same on every run (compare
+#                      the returned checksum). speed=None runs as fast as
+#                      possible; speed=N also sleeps to pace at N x real time.
+#   ReplayDevice       a device for simulator.FakeBleakClient, so the apps
+#                      themselves see a recording as a live strap:
+#                      HR_REPLAY=2025-07-20@10 python main.py
+#
+# replay_days() fans whole days out over a process pool:
+#
+#   python -m ble.replay --all --max-gap 45 --threshold 140 --out-dir data/replay
+
+import argparse
+import hashlib
+import logging
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from ble.hr_monitor import HRMonitor
+from ble.simulator import FakeBleakClient, encode_hr_measurement, register_device
+from utils.hr_analytics import compute_metrics, MAX_GAP, HIGH_BPM_THRESHOLD
+from utils.hr_store import HRStore
+from utils.timebase import VirtualClock
+from utils.ui_dispatcher import CoalescingDispatcher
+
+log = logging.getLogger("wearable.replay")
+
+FLUSH_HZ = 10  # the dashboards' dispatcher rate
+_SAMPLE = struct.Struct("<dH")
+
+
+def encode_sample(bpm):
+    # Recordings only keep BPM; 0 was logged while the strap had no contact
+    return encode_hr_measurement(bpm, contact=bpm > 0)
+
+
+class ReplayDevice:
+    # Plays (ts, bpms) back at their recorded spacing divided by speed
+    def __init__(self, address, ts, bpms, speed=1.0, name=None):
+        self.address = address
+        self.name = name or f"Replay {address[-10:]}"
+        self.ts = ts
+        self.bpms = bpms
+        self.speed = speed
+        self.rate_hz = len(ts) / max(ts[-1] - ts[0], 1.0) * speed if ts else 1.0
+        self.sent = 0
+
+    def next_payload(self):
+        if self.sent >= len(self.ts):
+            return None
+        payload = encode_sample(self.bpms[self.sent])
+        self.sent += 1
+        return payload
+
+    def interval(self):
+        i = self.sent
+        if i == 0 or i >= len(self.ts):
+            return 0.0
+        return max(0.0, self.ts[i] - self.ts[i - 1]) / self.speed
+
+
+def install(day, speed=1.0, data_dir="data"):
+    # Points HRMonitor at a recording of `day` and preselects it
+    ts, bpms = HRStore(data_dir).read_day(day)
+    if not ts:
+        raise ValueError(f"No recording for {day.isoformat()}")
+    device = register_device(ReplayDevice(f"REPLAY:{day.isoformat()}", ts, bpms, speed))
+    HRMonitor.client_class = FakeBleakClient
+    HRMonitor.set_device(device.address, device.name)
+    log.info("⏯️ Replaying %s (%d samples) at %sx", day.isoformat(), len(ts), speed)
+    return device
+
+
+def parse_replay_spec(spec):
+    # "2025-07-20@10" -> (date(2025, 7, 20), 10.0)
+    day, _, speed = spec.partition("@")
+    return date.fromisoformat(day), float(speed or 1.0)
+
+
+def replay_session(ts, bpms, sinks=(), speed=None, flush_hz=FLUSH_HZ):
+    # Feeds one recording through HRMonitor and a CoalescingDispatcher on a
+    # virtual clock. sinks are batch subscribers. Returns a summary with a
+    # sha256 over every delivered (t, bpm), for checking determinism.
+    if not ts:
+        return {"samples": 0, "batches": 0, "checksum": hashlib.sha256().hexdigest()}
+    clock = VirtualClock(ts[0])
+    dispatcher = CoalescingDispatcher(max_updates_per_s=flush_hz, max_pending=1 << 20, clock=clock)
+    digest = hashlib.sha256()
+    counts = {"samples": 0, "batches": 0}
+
+    def record(batch):
+        counts["batches"] += 1
+        counts["samples"] += len(batch)
+        digest.update(b"".join(_SAMPLE.pack(t, bpm) for t, bpm in batch))
+
+    dispatcher.subscribe_batch(record)
+    for sink in sinks:
+        dispatcher.subscribe_batch(sink)
+    monitor = HRMonitor(on_hr_callback=lambda bpm: dispatcher.push(bpm))
+    handler = monitor._hr_handler
+    payloads = {}
+
+    period_ns = round(1e9 / flush_hz)
+    next_flush = period_ns
+    wall_start = time.perf_counter()
+    for t, bpm in zip(ts, bpms):
+        clock.set(t)
+        now = clock.now_ns()
+        # Everything pushed before this sample's time goes out first
+        while now >= next_flush:
+            dispatcher.flush(force=True)
+            next_flush += period_ns
+        if speed:
+            delay = (t - ts[0]) / speed - (time.perf_counter() - wall_start)
+            if delay > 0:
+                time.sleep(delay)
+        payload = payloads.get(bpm)
+        if payload is None:
+            payload = payloads[bpm] = encode_sample(bpm)
+        handler(None, payload)
+    dispatcher.flush(force=True)
+
+    counts["checksum"] = digest.hexdigest()
+    return counts
+
+
+def replay_day(day, data_dir="data", out_dir=None, max_gap=MAX_GAP,
+               threshold=HIGH_BPM_THRESHOLD, speed=None):
+    # Top-level so replay_days() can run it in a process pool. Replayed
+    # samples go to out_dir (a separate HRStore) when given, and metrics are
+    # recomputed from what came out of the pipeline.
+    ts, bpms = HRStore(data_dir).read_day(day)
+    collected_t, collected_bpm = [], []
+
+    def collect(batch):
+        for t, bpm in batch:
+            collected_t.append(t)
+            collected_bpm.append(bpm)
+
+    started = time.perf_counter()
+    summary = replay_session(ts, bpms, [collect], speed=speed)
+    if out_dir and collected_t:
+        # One append for the day instead of one file open per batch
+        HRStore(out_dir).append_batch(zip(collected_t, collected_bpm))
+    summary["day"] = day.isoformat()
+    summary["elapsed_s"] = round(time.perf_counter() - started, 3)
+    metrics = None
+    if collected_t:
+        metrics = compute_metrics(collected_t, collected_bpm, max_gap, threshold)
+        metrics["segment_count"] = len(metrics.pop("segments"))
+    summary["metrics"] = metrics
+    return summary
+
+
+def replay_days(days, data_dir="data", out_dir=None, processes=None, **kwargs):
+    # One day per task; results come back in the order of `days`
+    days = list(days)
+    if processes == 1 or len(days) <= 1:
+        return [replay_day(day, data_dir, out_dir, **kwargs) for day in days]
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as pool:
+        futures = [pool.submit(replay_day, day, data_dir, out_dir, **kwargs) for day in days]
+        return [f.result() for f in futures]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded HR sessions through the live pipeline")
+    parser.add_argument("--days", nargs="*", default=[], help="YYYY-MM-DD days to replay")
+    parser.add_argument("--all", action="store_true", help="replay every recorded day")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--out-dir", help="write replayed samples to this store")
+    parser.add_argument("--speed", type=float, help="pace at this multiple of real time (default: max speed)")
+    parser.add_argument("--max-gap", type=float, default=MAX_GAP)
+    parser.add_argument("--threshold", type=int, default=HIGH_BPM_THRESHOLD)
+    parser.add_argument("--processes", type=int, help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    days = HRStore(args.data_dir).days() if args.all else [date.fromisoformat(d) for d in args.days]
+    if not days:
+        parser.error("nothing to replay; pass --days or --all")
+    results = replay_days(days, args.data_dir, args.out_dir, args.processes,
+                          max_gap=args.max_gap, threshold=args.threshold, speed=args.speed)
+    for r in results:
+        m = r["metrics"] or {}
+        log.info("%s  %6d samples  %4d batches  %6.2fs  avg %5.1f  load %4s  %s",
+                 r["day"], r["samples"], r["batches"], r["elapsed_s"],
+                 m.get("avg_bpm", 0), m.get("high_bpm_count", "-"), r["checksum"][:12])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+# ble/simulator.py
+#
+# Synthetic heart-rate strap for load testing and benchmarking without hardware.
+# SimulatedHRDevice produces Heart Rate Measurement (0x2A37) payloads and
+# FakeBleakClient drives them through the same start_notify() callback that a
+# real BleakClient would, so HRMonitor can be pointed at any number of fake
+# devices via HRMonitor.client_class. A device created with motion=True also
+# serves the wearable's accelerometer stream (utils/motion.py) through a
+# SimulatedIMU.
+
+import asyncio
+import logging
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+from utils.motion import MOTION_UUID, encode_packet
+
+log = logging.getLogger("wearable.sim")
+
+# Heart Rate Measurement flag bits (Bluetooth GATT spec, characteristic 0x2A37)
+FLAG_HR_UINT16 = 0x01
+FLAG_CONTACT_DETECTED = 0x02
+FLAG_CONTACT_SUPPORTED = 0x04
+FLAG_ENERGY_EXPENDED = 0x08
+FLAG_RR_INTERVALS = 0x10
+
+
+def encode_hr_measurement(bpm, rr_intervals=(), contact=None, uint16=False, energy=None):
+    # rr_intervals are in seconds; on the wire they are uint16 in 1/1024 s units.
+    # contact=None means the strap does not support contact detection.
+    flags = 0
+    bpm = int(round(bpm))
+    if uint16 or bpm > 255:
+        flags |= FLAG_HR_UINT16
+    if contact is not None:
+        flags |= FLAG_CONTACT_SUPPORTED
+        if contact:
+            flags |= FLAG_CONTACT_DETECTED
+    if energy is not None:
+        flags |= FLAG_ENERGY_EXPENDED
+    if rr_intervals:
+        flags |= FLAG_RR_INTERVALS
+
+    payload = bytearray([flags])
+    if flags & FLAG_HR_UINT16:
+        payload += bpm.to_bytes(2, "little")
+    else:
+        payload.append(bpm)
+    if energy is not None:
+        payload += int(energy).to_bytes(2, "little")
+    for rr in rr_intervals:
+        payload += min(int(round(rr * 1024)), 0xFFFF).to_bytes(2, "little")
+    return payload
+
+
+class SimulatedIMU:
+    # Wrist accelerometer packets: still, walking, running and cycling (arm
+    # movement without steps), switching every minute or so
+    MODES = {
+        # mode: (frequency Hz, peak dynamic acceleration g, sharp heel strikes)
+        "still": (0.0, 0.0, False),
+        "walk": (1.8, 0.35, True),
+        "run": (2.7, 0.9, True),
+        "cycle": (1.4, 0.1, False),
+    }
+
+    def __init__(self, rate_hz=50, seed=None, packet_samples=25, mode=None):
+        self.rate_hz = rate_hz
+        self.packet_samples = packet_samples
+        self.fixed_mode = mode
+        self.mode = mode or "still"
+        self._rng = random.Random(seed)
+        self._phase = 0.0
+        self._millis = 0
+        self.sent = 0
+
+    def _switch_mode(self):
+        if self.fixed_mode is None and self._rng.random() < self.packet_samples / (60.0 * self.rate_hz):
+            self.mode = self._rng.choice(list(self.MODES))
+
+    def next_samples(self):
+        # (t0 millis, [(x, y, z) milli-g, ...]) for one packet
+        self._switch_mode()
+        freq, amp, strikes = self.MODES[self.mode]
+        dt = 1.0 / self.rate_hz
+        gauss = self._rng.gauss
+        samples = []
+        for _ in range(self.packet_samples):
+            self._phase += 2 * math.pi * freq * dt
+            # Steps are a sharp peak per heel strike along the forearm's y
+            # axis; pedalling is a smooth sway that never reaches the step
+            # threshold
+            wave = math.sin(self._phase)
+            dyn = amp * (max(0.0, wave) ** 3 if strikes else wave)
+            samples.append((int(gauss(0, 8)), int(1000 * (1.0 + dyn) + gauss(0, 12)), int(gauss(0, 8))))
+        t0 = self._millis
+        self._millis += int(self.packet_samples * 1000 / self.rate_hz)
+        return t0, samples
+
+    def next_payload(self):
+        t0, samples = self.next_samples()
+        self.sent += 1
+        return encode_packet(t0, samples, self.rate_hz)
+
+    def interval(self):
+        return self.packet_samples / self.rate_hz
+
+
+class SimulatedHRDevice:
+    def __init__(self, address, name=None, rate_hz=1.0, base_bpm=70, seed=None,
+                 uint16=False, rr=True, contact=True, dropout_prob=0.0, energy=False,
+                 motion=False, motion_hz=50):
+        self.address = address
+        self.name = name or f"SimHR {address[-5:]}"
+        self.rate_hz = rate_hz
+        self.base_bpm = base_bpm
+        self.uint16 = uint16
+        self.rr = rr
+        self.contact = contact
+        self.dropout_prob = dropout_prob
+        self.energy = energy
+
+        self._rng = random.Random(seed if seed is not None else address)
+        self._bpm = float(base_bpm)
+        self._target = float(base_bpm)
+        self._phase = 0.0
+        self._contact_lost_for = 0
+        self._energy_kj = 0.0
+        self.sent = 0
+        self.motion = SimulatedIMU(motion_hz, seed=self._rng.random()) if motion else None
+
+    def _next_bpm(self, dt):
+        # Mean-reverting random walk towards a slowly changing target, plus a
+        # small respiratory oscillation, keeps values in a plausible range.
+        if self._rng.random() < 0.01:
+            self._target = min(190.0, max(45.0, self.base_bpm + self._rng.gauss(0, 35)))
+        self._phase += dt * 2 * math.pi * 0.25
+        self._bpm += (self._target - self._bpm) * min(1.0, 0.5 * dt)
+        self._bpm += self._rng.gauss(0, 0.6) + 0.4 * math.sin(self._phase)
+        self._bpm = min(220.0, max(30.0, self._bpm))
+        return self._bpm
+
+    def next_payload(self):
+        dt = 1.0 / self.rate_hz
+        bpm = self._next_bpm(dt)
+
+        contact = None
+        if self.contact:
+            if self._contact_lost_for:
+                self._contact_lost_for -= 1
+            elif self._rng.random() < self.dropout_prob:
+                self._contact_lost_for = self._rng.randint(1, 5)
+            contact = not self._contact_lost_for
+
+        rr_intervals = ()
+        if self.rr and contact is not False:
+            # Emit the beats that fell inside this notification period
+            beat = 60.0 / bpm
+            n_beats = max(1, int(round(dt / beat)))
+            rr_intervals = tuple(beat + self._rng.gauss(0, 0.02) for _ in range(min(n_beats, 4)))
+
+        energy = None
+        if self.energy:
+            self._energy_kj += dt * bpm / 600.0
+            energy = self._energy_kj
+
+        self.sent += 1
+        return encode_hr_measurement(
+            0 if contact is False else bpm,
+            rr_intervals=rr_intervals,
+            contact=contact,
+            uint16=self.uint16,
+            energy=energy,
+        )
+
+    def interval(self):
+        # Seconds until the next notification (FakeBleakClient pacing)
+        return 1.0 / self.rate_hz
+
+    def payloads(self, count):
+        return [self.next_payload() for _ in range(count)]
+
+    def samples(self, count, start=None, gap_every=0, gap_seconds=120):
+        # (datetime, bpm) pairs as the apps log them, with an optional recording
+        # gap every `gap_every` samples to exercise gap segmentation
+        t = start or datetime.now().replace(hour=7, minute=0, second=0, microsecond=0)
+        step = timedelta(seconds=1.0 / self.rate_hz)
+        for i in range(count):
+            if gap_every and i and i % gap_every == 0:
+                t += timedelta(seconds=gap_seconds)
+            yield t, int(round(self._next_bpm(step.total_seconds())))
+            t += step
+
+
+# Devices that FakeBleakClient can connect to, keyed by address
+_devices = {}
+
+
+def register_device(device):
+    _devices[device.address] = device
+    return device
+
+
+def make_devices(count, rate_hz=1.0, seed=0, **kwargs):
+    rng = random.Random(seed)
+    devices = []
+    for i in range(count):
+        address = f"SIM:00:00:00:{i // 256:02X}:{i % 256:02X}"
+        devices.append(register_device(SimulatedHRDevice(
+            address, rate_hz=rate_hz, base_bpm=rng.randint(55, 95), seed=seed + i, **kwargs
+        )))
+    return devices
+
+
+def write_hr_log(path, device, count, **kwargs):
+    # Writes a day file in the data/hr_log_<date>.csv format
+    with open(path, "w") as f:
+        for t, bpm in device.samples(count, **kwargs):
+            f.write(f"{t.isoformat()},{bpm}\n")
+    return path
+
+
+class FakeBleakClient:
+    # Mirrors the subset of bleak.BleakClient that HRMonitor uses
+
+    def __init__(self, address_or_ble_device, **kwargs):
+        address = getattr(address_or_ble_device, "address", address_or_ble_device)
+        self.address = address
+        self.device = _devices.get(address) or register_device(SimulatedHRDevice(address))
+        self._connected = False
+        self._tasks = {}
+        # perf_counter_ns() just before the latest callback, for latency probes
+        self.sent_at_ns = 0
+
+    @property
+    def is_connected(self):
+        return self._connected
+
+    async def connect(self, **kwargs):
+        await asyncio.sleep(0)
+        self._connected = True
+        return True
+
+    async def disconnect(self):
+        for uuid in list(self._tasks):
+            await self.stop_notify(uuid)
+        self._connected = False
+        return True
+
+    async def start_notify(self, char_specifier, callback, **kwargs):
+        if not self._connected:
+            raise RuntimeError("Not connected")
+        source = self.device
+        if char_specifier == MOTION_UUID:
+            source = getattr(self.device, "motion", None)
+            if source is None:
+                raise ValueError(f"Characteristic {char_specifier} was not found")
+        self._tasks[char_specifier] = asyncio.create_task(self._notify_loop(char_specifier, callback, source))
+
+    async def stop_notify(self, char_specifier):
+        task = self._tasks.pop(char_specifier, None)
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _notify_loop(self, char_specifier, callback, source):
+        next_at = time.perf_counter()
+        while self._connected:
+            payload = source.next_payload()
+            if payload is None:
+                # A recording that has run out (ble/replay.ReplayDevice)
+                return
+            self.sent_at_ns = time.perf_counter_ns()
+            callback(char_specifier, payload)
+            # Schedule against an absolute deadline so callback cost doesn't skew the rate
+            next_at += source.interval()
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+
+def install(count=1, rate_hz=1.0, **kwargs):
+    # Point HRMonitor at simulated devices and preselect the first one
+    from ble.hr_monitor import HRMonitor
+
+    devices = make_devices(count, rate_hz=rate_hz, **kwargs)
+    HRMonitor.client_class = FakeBleakClient
+    HRMonitor.set_device(devices[0].address, devices[0].name)
+    log.info("🧪 %d simulated HR device(s) at %s Hz", count, rate_hz)
+    return devices
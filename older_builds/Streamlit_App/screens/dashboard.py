@@ -1,38 +1,119 @@
 import streamlit as st
 import asyncio
-import os
-from datetime import datetime
+from collections import deque
+import pandas as pd
+import altair as alt
 from ble.hr_monitor import HRMonitor
+from utils.hr_alerts import AlertEngine
+from utils.hr_client import ingest_batch
+from utils.energy import EnergyMeter
+from utils.graph_utils import fit_image, render_sleep_graph
+from utils.motion import MotionTracker
+from utils.shared_cache import get_live_buffer, get_shared
+from utils.stream_pipeline import Pipeline
+from utils.ui_dispatcher import CoalescingDispatcher
 import nest_asyncio
 nest_asyncio.apply()
 
-# Session state defaults
-for key, val in {
+# Session state defaults, set on every viewer's first run (the module is
+# only imported once per server process)
+SESSION_DEFAULTS = {
     "live_bpm": 0,
     "connected": False,
     "connecting": False,
     "monitor": None,
     "status": "not_connected"  # one of: not_connected, connecting, connected, failed
-}.items():
-    if key not in st.session_state:
-        st.session_state[key] = val
-
-# Log HR to CSV
-def log_heart_rate(bpm):
-    st.session_state.live_bpm = bpm
-    timestamp = datetime.now()
-    date_str = timestamp.date().isoformat()
-    os.makedirs("data", exist_ok=True)
-    with open(f"data/hr_log_{date_str}.csv", "a") as f:
-        f.write(f"{timestamp.isoformat()},{bpm}\n")
+}
+
+# Alerts are evaluated per sample on the BLE thread; the newest few are
+# shown on the next rerun
+hr_alerts = AlertEngine()
+recent_alerts = deque(maxlen=3)
+hr_alerts.subscribe(recent_alerts.append)
+
+
+# Accelerometer packets are folded into 5 s epochs on the BLE thread; the
+# metrics below only read the running totals
+motion = MotionTracker(data_dir="data")
+# Calories for this session so far, one sample at a time
+energy = EnergyMeter()
+
+
+def add_energy(batch):
+    activity = motion.activity
+    for t, bpm in batch:
+        energy.add(t, bpm, activity=activity)
+
+
+# BLE callbacks only push into the dispatcher. Its ticker thread fans each
+# batch out through the pipeline, and each rerun reads the newest value
+# from the script thread.
+hr_dispatcher = CoalescingDispatcher(max_updates_per_s=4)
+hr_pipeline = Pipeline("dashboard").attach(hr_dispatcher)
+
+# The last few minutes of samples, kept once for every viewer; the live
+# section below reruns on its own and redraws only when they change
+live_buffer = get_live_buffer()
+hr_pipeline.add("live_buffer", live_buffer.append_batch)
+# Persisted and published to /live subscribers by the HR service
+hr_pipeline.add("store", ingest_batch, executor="thread")
+hr_pipeline.add("energy", add_energy, executor="thread")
+LIVE_REFRESH_S = 1.0
+ASSETS_VERSION = 1  # bump when the sleep data, styling or images change
+
+
+def log_heart_rate(bpm, address=None, contact=None):
+    # Alerts stay per sample: they need the packet's contact flag
+    hr_dispatcher.push(bpm)
+    hr_alerts.process(address or "strap", bpm, contact, active=motion.is_active())
+
+
+def make_monitor():
+    monitor = HRMonitor(on_motion_callback=motion.ingest_packet)
+    # latest_contact is set from the same packet just before the callback
+    monitor.on_hr_callback = lambda bpm: log_heart_rate(bpm, monitor.address, monitor.latest_contact)
+    return monitor
+
+
+def build_live_chart():
+    # A Vega-Lite spec rather than st.line_chart, which rebuilds its chart
+    # on every call
+    ts, bpms = live_buffer.snapshot()
+    if not len(ts):
+        return None
+    df = pd.DataFrame({"time": pd.to_datetime(ts, unit="s"), "bpm": bpms})
+    return alt.Chart(df).mark_line(color="crimson").encode(
+        x=alt.X("time:T", title=None), y=alt.Y("bpm:Q", scale=alt.Scale(zero=False))
+    ).properties(height=160).to_dict()
+
+
+@st.fragment(run_every=LIVE_REFRESH_S)
+def live_section():
+    latest = hr_dispatcher.latest()
+    if latest is not None:
+        st.session_state.live_bpm = latest
+    hr_col, activity_col, steps_col, energy_col = st.columns(4)
+    hr_col.metric("Current HR", f"{st.session_state.live_bpm} BPM")
+    activity_col.metric("Activity", motion.activity or "-")
+    steps_col.metric("Steps Today", f"{motion.steps_today:,}")
+    energy_col.metric("Calories", f"{energy.kcal:.0f} kcal")
+    spec = get_shared().get("live_chart", live_buffer.generation, build_live_chart)
+    if spec is not None:
+        st.vega_lite_chart(spec)
+    for alert in reversed(recent_alerts):
+        st.error(f"🚨 {alert.message}")
+
 
 # Render dashboard
 def render():
+    for key, val in SESSION_DEFAULTS.items():
+        if key not in st.session_state:
+            st.session_state[key] = val
+
     st.title("📊 Daily Dashboard")
 
     # Device info
-    selected = HRMonitor._selected_address
-    name = HRMonitor._selected_name
+    selected, name = HRMonitor.selected_device()
     st.write("🛰️ " + (
         f"Selected Device: {name} ({selected[:4]})" if selected and name else
         f"Selected Device: Unknown ({selected[:4]})" if selected else
@@ -42,13 +123,18 @@ def render():
     # Image + connect logic
     img_col, status_col = st.columns([1, 2])
     with img_col:
-        st.image("assets/wearable.png", width=180)
+        st.image(get_shared().get("wearable_image", ASSETS_VERSION,
+                                  lambda: fit_image("assets/wearable.png", 180)), width=180)
 
     with status_col:
         if st.button("🔗 Connect", key="connect_btn"):
             st.session_state.status = "connecting"
             st.session_state.connecting = True
-            st.session_state.monitor = HRMonitor(on_hr_callback=log_heart_rate)
+            st.session_state.monitor = make_monitor()
+            # Calories count from the start of this session, not of the app
+            energy.reset()
+            hr_dispatcher.start_ticker()
+            hr_alerts.start_ticker()
 
             async def do_connect():
                 try:
@@ -85,12 +171,8 @@ def render():
 
     # Sleep graph
     st.subheader("Sleep History")
-    graph_path = "assets/sleep_graph.png"
-    if os.path.exists(graph_path):
-        st.image(graph_path, width=600)
-    else:
-        st.warning("⚠️ Sleep graph image not found.")
+    st.image(get_shared().get("sleep_graph", ASSETS_VERSION, render_sleep_graph), width=600)
 
     # Live Heart Rate
     st.subheader("Live Heart Rate")
-    st.metric("Current HR", f"{st.session_state.live_bpm} BPM")
+    live_section()
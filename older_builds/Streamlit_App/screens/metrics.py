@@ -1,40 +1,70 @@
 import streamlit as st
 import pandas as pd
-import os
-from datetime import date, datetime
+from datetime import date
 import altair as alt
 
-def render():
-    st.title("📈 Heart Rate Metrics")
-    log_path = f"data/hr_log_{date.today().isoformat()}.csv"
+from utils.hr_analytics import MAX_GAP, HIGH_BPM_THRESHOLD
+from utils.hr_client import get_client
+from utils.mean_max import ALL_TIME, format_pace, headline
+from utils.shared_cache import day_version, days_version, get_shared
 
-    if not os.path.exists(log_path):
-        st.warning("No heart rate log for today.")
-        return
+CHART_MAX_POINTS = 2000
+BESTS_DAYS = 7  # new bests come from recent sessions, so only their logs are watched
 
-    bpm_values = []
-    with open(log_path, "r") as f:
-        for line in f:
-            try:
-                t_str, bpm = line.strip().split(",")
-                bpm_values.append((datetime.fromisoformat(t_str), int(bpm)))
-            except:
-                continue
-
-    if not bpm_values:
-        st.error("No valid HR data.")
-        return
 
-    df = pd.DataFrame(bpm_values, columns=["timestamp", "bpm"])
-    df["seconds"] = (df["timestamp"] - df["timestamp"].iloc[0]).dt.total_seconds()
+def build_day(day):
+    # Parsing and aggregation happen in the HR service; this is the chart
+    # on top, built once per change to the day for every viewer
+    result = get_client().day_metrics(day, MAX_GAP, HIGH_BPM_THRESHOLD, CHART_MAX_POINTS)
+    if result is None:
+        return None
+
+    points = [point for segment in result["segments"] for point in segment]
+    df = pd.DataFrame(points, columns=["seconds", "bpm"])
 
     chart = alt.Chart(df).mark_line(color="crimson").encode(
         x="seconds", y="bpm"
     ).properties(width=700, height=300)
-    st.altair_chart(chart)
+    return result, chart.to_dict()
+
 
-    st.metric("Total readings", len(df))
-    st.metric("Average HR", f"{df['bpm'].mean():.1f} BPM")
-    st.metric("Max HR", f"{df['bpm'].max()} BPM")
-    st.metric("Resting HR", f"{df['bpm'].min()} BPM")
-    st.metric("Training Load (HR > 130)", sum(df["bpm"] > 130))
+def render():
+    st.title("📈 Heart Rate Metrics")
+
+    day = date.today()
+    built = get_shared().get(f"metrics:{day}", day_version(day), lambda: build_day(day))
+    if built is None:
+        st.warning("No heart rate log for today.")
+    else:
+        show_day(*built)
+    best_efforts()
+
+
+def show_day(result, spec):
+    st.vega_lite_chart(spec)
+
+    st.metric("Total readings", result["total"])
+    st.metric("Average HR", f"{result['avg_bpm']:.1f} BPM")
+    st.metric("Max HR", f"{result['max_bpm']} BPM")
+    st.metric("Resting HR", f"{result['resting_bpm']} BPM")
+    st.metric(f"Training Load (HR > {result['high_bpm_threshold']})", result["high_bpm_count"])
+
+
+def best_efforts():
+    # Best sustained heart rate and pace over all history (utils/mean_max.py)
+    st.subheader("Best efforts")
+    envelope = get_shared().get("mean_max", days_version(BESTS_DAYS), lambda: get_client().mean_max(ALL_TIME))
+    if envelope is None:
+        st.info("No sessions yet.")
+        return
+    for column, (minutes, bpm, pace) in zip(st.columns(4), headline(envelope)):
+        column.metric(f"Best {minutes} min", f"{bpm:.0f} bpm" if bpm is not None else "--",
+                      format_pace(pace) if pace is not None else None, delta_color="off")
+    curve = pd.DataFrame({"minutes": [w / 60 for w in envelope["durations"]], "bpm": envelope["bpm"],
+                          "pace": [format_pace(p) for p in envelope["pace_s_km"]]}).dropna(subset=["bpm"])
+    chart = alt.Chart(curve).mark_line(color="crimson", point=True).encode(
+        x=alt.X("minutes", scale=alt.Scale(type="log"), title="Duration (min)"),
+        y=alt.Y("bpm", scale=alt.Scale(zero=False), title="Best mean HR"),
+        tooltip=["minutes", "bpm", "pace"]
+    ).properties(width=700, height=220)
+    st.altair_chart(chart)
@@ -1,7 +1,10 @@
 import streamlit as st
 import asyncio
+import json
+from datetime import datetime
 from ble.hr_monitor import HRMonitor
 from bleak import BleakScanner
+from utils import instrumentation
 
 HR_KEYWORDS = ["hr", "heart", "h10", "whoop", "polar", "garmin", "forerunner"]
 
@@ -80,3 +83,25 @@ def render():
                 key=f"{workout}_color"
             )
             st.session_state.workout_colors[workout] = selected
+
+    # =========================
+    # 🩺 Diagnostics
+    # =========================
+    with st.expander("🩺 Diagnostics"):
+        enabled = st.checkbox("Enable hot-path instrumentation", value=instrumentation.enabled)
+        if enabled != instrumentation.enabled:
+            instrumentation.set_enabled(enabled)
+
+        st.code("\n".join(instrumentation.snapshot_lines()) or "No metrics recorded yet.")
+
+        col_export, col_reset = st.columns(2)
+        with col_export:
+            st.download_button(
+                "💾 Export snapshot",
+                data=json.dumps(instrumentation.snapshot(), indent=2),
+                file_name=f"metrics_snapshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                mime="application/json"
+            )
+        with col_reset:
+            if st.button("♻️ Reset metrics"):
+                instrumentation.reset()
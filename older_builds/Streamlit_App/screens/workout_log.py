@@ -1,14 +1,79 @@
+import pandas as pd
 import streamlit as st
 
+from utils.hr_client import get_client
+from utils.session_compare import describe_match
+from utils.session_export import CONTENT_TYPES, FORMATS, filename
+from utils.sessions import describe
+from utils.shared_cache import days_version, get_shared
+
+RECENT_DAYS = 7
+SIMILAR_SESSIONS = 3
+ALIGN_OPTIONS = {"Time": "time", "Distance": "distance", "Shape": "dtw"}
+
+
+def comparison(session):
+    # This session's heart rate against its most similar earlier sessions,
+    # lined up by time, distance or shape (utils/session_compare.py)
+    start = session["start"]
+    choice = st.radio("Align by", list(ALIGN_OPTIONS), horizontal=True, key=f"align:{start}")
+    align = ALIGN_OPTIONS[choice]
+    try:
+        result = get_shared().get(f"compare:{start}:{align}", days_version(RECENT_DAYS),
+                                  lambda: get_client().compare(start, SIMILAR_SESSIONS, align))
+    except RuntimeError as e:
+        st.info(str(e).split(": ", 1)[-1])
+        return
+    if not result["similar"]:
+        st.info("No earlier sessions like this one yet.")
+        return
+
+    by_distance = result["unit"] == "m"
+    axis = "km" if by_distance else "min"
+    columns = {"This session": result["bpm"]}
+    for entry in result["similar"]:
+        columns[describe_match(entry)[0]] = entry["bpm"]
+    frame = pd.DataFrame(columns, dtype=float)
+    frame.index = pd.Index([x / (1000.0 if by_distance else 60.0) for x in result["x"]], name=axis)
+    st.line_chart(frame, x_label=axis, y_label="HR (bpm)")
+
+    for entry in result["similar"]:
+        when, bpm, pace = describe_match(entry)
+        st.text(f"{when}:  {bpm}" + (f",  {pace}" if pace else ""))
+    # Segment by segment against the closest match
+    segments = pd.DataFrame(result["similar"][0]["segments"])
+    segments[["from", "to"]] = segments[["from", "to"]] / (1000.0 if by_distance else 60.0)
+    st.dataframe(segments.rename(columns={"from": f"from ({axis})", "to": f"to ({axis})"}), hide_index=True)
+
+
 def render():
     st.title("📝 Workout Log")
 
-    def workout_entry(workout, duration, hr, time, expanded=False):
+    def workout_entry(session, expanded=False):
+        workout, duration, hr, time = describe(session)
         with st.expander(f"{workout}  {duration}  {hr}  {time}", expanded=expanded):
-            st.text("Pace: 2:05/500m")
-            st.text("Calories: 350 kcal")
-            st.text("[Graph Placeholder]")
+            st.text(f"Max HR: {session['max_bpm']} bpm")
+            st.text(f"Calories: {session['kcal']:.0f} kcal ({session['active_kcal']:.0f} active)")
+            if session["steps"]:
+                st.text(f"Steps: {session['steps']:,}")
+            # Files are only built when Export is clicked; the bytes are kept
+            # for the download button on later reruns
+            for column, fmt in zip(st.columns(len(FORMATS)), FORMATS):
+                key = f"export:{session['start']}:{fmt}"
+                data = st.session_state.get(key)
+                if data is None and column.button(f"Export {fmt.upper()}", key=f"{key}:build"):
+                    data = st.session_state[key] = get_client().export_session(session["start"], fmt)
+                if data is not None:
+                    column.download_button(fmt.upper(), data, file_name=filename(session, fmt),
+                                           mime=CONTENT_TYPES[fmt], key=f"{key}:download")
+            if st.toggle("Compare with similar sessions", key=f"compare:{session['start']}"):
+                comparison(session)
 
-    workout_entry("Bike", "45 min", "137 bpm", "7:00 AM")
-    workout_entry("Row", "30 min", "145 bpm", "6:45 PM")
-    workout_entry("Lift", "60 min", "120 bpm", "1:00 PM")
+    # Summaries, calories included, are cached by the HR service, and the
+    # answer is shared by every viewer until a log changes
+    sessions = get_shared().get(f"sessions:{RECENT_DAYS}", days_version(RECENT_DAYS),
+                                lambda: get_client().sessions(recent=RECENT_DAYS))
+    if not sessions:
+        st.info("No sessions in the last week.")
+    for session in sessions:
+        workout_entry(session)
@@ -0,0 +1,442 @@
+# utils/cloud_sync.py
+#
+# Offline-first upload of heart-rate samples and session summaries to a
+# remote endpoint (HR_SYNC_URL). The HR store is already the durable copy of
+# everything recorded, so the queue doesn't duplicate samples; it keeps
+# cursors into the store in data/sync_state.json:
+#
+#   per day     samples acknowledged so far (days are append-only, so a
+#               count is a position), the last one's timestamp, and the
+#               closed sessions acknowledged
+#   outbox      batches cut but not yet acknowledged, each with its
+#               Idempotency-Key
+#
+# A batch is written to the outbox before it is sent, and leaves it when the
+# endpoint acknowledges it. After a crash or restart the same batches go out
+# again with the same keys, so the endpoint can drop any it had already
+# applied; nothing acknowledged is ever sent twice.
+#
+#   POST <url>/samples   body: utils/hr_archive encode_samples() ("HRZ1",
+#                        delta-encoded and zlib-compressed, under a byte a
+#                        sample, timestamps to the millisecond); X-HR-Day,
+#                        X-HR-Offset and, when samples were inserted before
+#                        what was already sent (an SD card import),
+#                        X-HR-Replace: 1 with the whole day
+#   POST <url>/sessions  gzipped JSON {"device", "day", "sessions": [...]}:
+#                        the day's closed sessions, replacing earlier ones
+#
+# Both carry Idempotency-Key and X-HR-Device. 2xx and 409 count as
+# acknowledged. Connection errors, 408, 429 and 5xx are retried with
+# exponential backoff (or the server's Retry-After); any other status means
+# the batch will never be accepted, so it is logged and skipped rather than
+# blocking the queue forever.
+#
+# Uploads run on a background thread over pooled keep-alive connections,
+# UPLOAD_WORKERS at a time. notify() is the only call on the live path: a
+# counter bump that wakes the uploader early once BATCH_SAMPLES have arrived,
+# so BLE never waits on the network. The HR service starts a SyncQueue when
+# HR_SYNC_URL is set; `python -m utils.cloud_sync --data-dir data` drains
+# the backlog once and exits.
+
+import argparse
+import gzip
+import hashlib
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from urllib.parse import urlsplit
+
+from utils import instrumentation
+from utils.hr_archive import encode_samples
+from utils.hr_store import HRStore
+from utils.sessions import SessionIndex
+
+log = logging.getLogger("wearable.sync")
+
+SYNC_URL = os.environ.get("HR_SYNC_URL", "")
+STATE_FILE = "sync_state.json"
+BATCH_SAMPLES = int(os.environ.get("HR_SYNC_BATCH", 20000))
+INTERVAL_S = float(os.environ.get("HR_SYNC_INTERVAL_S", 60))
+UPLOAD_WORKERS = 4
+MAX_OUTBOX = 32           # batches cut ahead of acknowledgements
+BACKOFF_S = (1.0, 300.0)  # first and longest wait after a failed round
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+UPLOAD_US = instrumentation.histogram("sync.upload_us")
+UPLOADED = instrumentation.counter("sync.samples_uploaded")
+BACKLOG = instrumentation.gauge("sync.backlog_samples")
+
+
+class RetryLater(Exception):
+    def __init__(self, message, delay=None):
+        super().__init__(message)
+        self.delay = delay
+
+
+class Rejected(Exception):
+    pass
+
+
+class Uploader:
+    # POSTs to the endpoint over a pool of keep-alive connections
+    def __init__(self, url, pool_size=UPLOAD_WORKERS, timeout=30.0):
+        parts = urlsplit(url)
+        self.url = url
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.https else 80)
+        self.path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            return cls(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def post(self, path, body, headers):
+        # Returns on acknowledgement; raises RetryLater or Rejected
+        conn = self._acquire()
+        try:
+            conn.request("POST", self.path + path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            raise RetryLater(f"{type(e).__name__}: {e}")
+        if response.getheader("Connection", "").lower() == "close":
+            conn.close()
+        else:
+            self._release(conn)
+        if 200 <= response.status < 300 or response.status == 409:
+            return
+        if response.status in RETRY_STATUSES:
+            retry_after = response.getheader("Retry-After")
+            raise RetryLater(f"HTTP {response.status}", float(retry_after) if retry_after else None)
+        raise Rejected(f"HTTP {response.status}")
+
+
+def _key(*parts):
+    return hashlib.sha1(":".join(str(p) for p in parts).encode()).hexdigest()
+
+
+class SyncQueue:
+    def __init__(self, store, url=SYNC_URL, sessions=None, path=None, batch_samples=BATCH_SAMPLES,
+                 interval_s=INTERVAL_S, workers=UPLOAD_WORKERS, backoff_s=BACKOFF_S):
+        self.store = store
+        self.sessions = sessions or SessionIndex(store)
+        self.uploader = Uploader(url, pool_size=workers)
+        self.path = path or os.path.join(store.data_dir, STATE_FILE)
+        self.batch_samples = batch_samples
+        self.interval_s = interval_s
+        self.workers = workers
+        self.backoff_s = backoff_s
+        self._state = self._load()
+        self._arrived = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._failures = 0
+        self._retry_in = None
+        self._more = False
+        self._stats = {"batches": 0, "samples": 0, "sessions": 0, "bytes": 0, "retries": 0, "rejected": 0,
+                       "backlog_samples": None, "last_upload": None, "last_error": None}
+
+    # ---------- state ----------
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault("device", os.environ.get("HR_DEVICE_ID") or uuid.uuid4().hex)
+        state.setdefault("days", {})
+        state.setdefault("outbox", [])
+        return state
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._state, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    # ---------- live path ----------
+
+    def notify(self, batch):
+        # Dispatcher batch subscriber (via the service's ingest): never
+        # blocks, only wakes the uploader early once a batch's worth arrived
+        self._arrived += len(batch)
+        if self._arrived >= self.batch_samples:
+            self._wake.set()
+
+    # ---------- planning ----------
+
+    def _plan(self):
+        # Cuts new batches into the outbox, oldest day first, until it is
+        # full; returns the samples not yet acknowledged
+        days = self._state["days"]
+        outbox = self._state["outbox"]
+        backlog = 0
+        present = set()
+        self._more = False
+        for day in self.store.days():
+            key = day.isoformat()
+            present.add(key)
+            version = repr(self.store.day_version(day))
+            cursor = days.setdefault(key, {"version": None, "acked": 0, "planned": 0, "last_t": None,
+                                           "sessions": 0})
+            if cursor["version"] == version:
+                backlog += cursor["planned"] - cursor["acked"]
+                continue
+            if len(outbox) >= MAX_OUTBOX:
+                self._more = True
+                backlog += cursor["planned"] - cursor["acked"]
+                continue
+            ts, _ = self.store.read_day(day)
+            planned = cursor["planned"]
+            if planned and (planned > len(ts) or ts[planned - 1] != cursor["last_t"]
+                            or bisect_right(ts, cursor["last_t"]) != planned):
+                # Samples were inserted before (or removed from) what was
+                # already cut: send the whole day again in its place
+                outbox[:] = [e for e in outbox if not (e["day"] == key and e["kind"] == "samples")]
+                outbox.append({"kind": "samples", "day": key, "offset": 0, "count": len(ts), "replace": True,
+                               "key": _key(self._state["device"], "day", key, version), "acked": False})
+                cursor.update(acked=0, planned=len(ts), last_t=ts[-1] if len(ts) else None)
+            else:
+                while planned < len(ts) and len(outbox) < MAX_OUTBOX:
+                    count = min(self.batch_samples, len(ts) - planned)
+                    outbox.append({"kind": "samples", "day": key, "offset": planned, "count": count,
+                                   "key": _key(self._state["device"], key, planned, count, ts[planned + count - 1]),
+                                   "acked": False})
+                    planned += count
+                self._more = self._more or planned < len(ts)
+                cursor.update(planned=planned, last_t=ts[planned - 1] if planned else None)
+            closed = [s for s in self.sessions.sessions(day) if s["closed"]]
+            if len(closed) > cursor["sessions"] and len(outbox) < MAX_OUTBOX:
+                outbox[:] = [e for e in outbox if not (e["day"] == key and e["kind"] == "sessions")]
+                outbox.append({"kind": "sessions", "day": key, "count": len(closed),
+                               "key": _key(self._state["device"], "sessions", key, *(s["start"] for s in closed)),
+                               "acked": False})
+            if planned == len(ts) and (len(closed) == cursor["sessions"] or any(
+                    e["day"] == key and e["kind"] == "sessions" for e in outbox)):
+                # Everything in this version of the day is cut
+                cursor["version"] = version
+            backlog += len(ts) - cursor["acked"]
+        for key in set(days) - present:
+            if days[key]["planned"] > days[key]["acked"]:
+                log.warning("⚠️ %s was deleted before it was fully synced", key)
+            del days[key]
+            outbox[:] = [e for e in outbox if e["day"] != key]
+        return backlog
+
+    # ---------- uploading ----------
+
+    def _payload(self, entry):
+        headers = {"Idempotency-Key": entry["key"], "X-HR-Device": self._state["device"],
+                   "X-HR-Day": entry["day"]}
+        if entry["kind"] == "sessions":
+            day = date.fromisoformat(entry["day"])
+            closed = [s for s in self.sessions.sessions(day) if s["closed"]][:entry["count"]]
+            body = gzip.compress(json.dumps({"device": self._state["device"], "day": entry["day"],
+                                             "sessions": closed}).encode(), compresslevel=6)
+            headers.update({"Content-Type": "application/json", "Content-Encoding": "gzip"})
+            return "/sessions", body, headers, 0
+        day = date.fromisoformat(entry["day"])
+        ts, bpms = self.store.read_day(day)
+        lo, hi = entry["offset"], entry["offset"] + entry["count"]
+        body = encode_samples(ts[lo:hi], bpms[lo:hi])
+        headers.update({"Content-Type": "application/x-hrz", "X-HR-Offset": str(lo)})
+        if entry.get("replace"):
+            headers["X-HR-Replace"] = "1"
+        return "/samples", body, headers, entry["count"]
+
+    def _send(self, entry):
+        path, body, headers, samples = self._payload(entry)
+        t0 = instrumentation.stopwatch()
+        self.uploader.post(path, body, headers)
+        UPLOAD_US.record_since(t0)
+        return len(body), samples
+
+    def _acknowledge(self, entry, size, samples):
+        days = self._state["days"]
+        cursor = days.get(entry["day"])
+        entry["acked"] = True
+        self._stats["batches"] += 1
+        self._stats["bytes"] += size
+        self._stats["last_upload"] = time.time()
+        if cursor is None:
+            return
+        if entry["kind"] == "sessions":
+            cursor["sessions"] = max(cursor["sessions"], entry["count"])
+            self._stats["sessions"] += entry["count"]
+            return
+        self._stats["samples"] += samples
+        UPLOADED.inc(samples)
+        if entry.get("replace"):
+            cursor["acked"] = entry["count"]
+        # Acknowledgements can arrive out of order; the cursor only moves
+        # over a contiguous run of them
+        moved = True
+        while moved:
+            moved = False
+            for e in self._state["outbox"]:
+                if e["acked"] and e["kind"] == "samples" and e["day"] == entry["day"] \
+                        and e["offset"] == cursor["acked"]:
+                    cursor["acked"] += e["count"]
+                    moved = True
+
+    def run_once(self):
+        # One round: cut batches, send every unacknowledged one; returns
+        # False when there is more to cut straight away
+        backlog = self._plan()
+        self._save()
+        self._stats["backlog_samples"] = backlog
+        BACKLOG.set(backlog)
+        pending = [e for e in self._state["outbox"] if not e["acked"]]
+        if not pending:
+            return True
+        delay = None
+        failed = False
+        sent = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [(entry, pool.submit(self._send, entry)) for entry in pending]
+            for entry, future in futures:
+                try:
+                    size, samples = future.result()
+                except RetryLater as e:
+                    failed = True
+                    self._stats["retries"] += 1
+                    self._stats["last_error"] = str(e)
+                    delay = max(delay or 0, e.delay or 0) or None
+                    continue
+                except Rejected as e:
+                    log.error("❌ Sync endpoint rejected %s batch for %s: %s", entry["kind"], entry["day"], e)
+                    self._stats["rejected"] += 1
+                    self._stats["last_error"] = str(e)
+                    size, samples = 0, 0
+                self._acknowledge(entry, size, samples)
+                sent += entry["count"] if entry["kind"] == "samples" else 0
+        self._stats["backlog_samples"] = max(0, backlog - sent)
+        BACKLOG.set(self._stats["backlog_samples"])
+        # Acknowledged entries leave the outbox once their day's cursor has
+        # moved past them
+        days = self._state["days"]
+        self._state["outbox"] = [e for e in self._state["outbox"] if not e["acked"] or (
+            e["kind"] == "samples" and e["day"] in days and e["offset"] >= days[e["day"]]["acked"])]
+        self._save()
+        if failed:
+            self._failures += 1
+            backoff = min(self.backoff_s[1], self.backoff_s[0] * 2 ** (self._failures - 1))
+            self._retry_in = max(delay or 0, backoff * random.uniform(0.5, 1.0))
+            return True
+        self._failures = 0
+        self._retry_in = None
+        return not self._more
+
+    def drain(self, timeout=None):
+        # Uploads until the backlog is empty (or timeout); for the CLI and
+        # benchmarks. Returns the number of rounds
+        deadline = time.monotonic() + timeout if timeout else None
+        rounds = 0
+        while True:
+            rounds += 1
+            done = self.run_once()
+            if self._failures:
+                if deadline and time.monotonic() + self._retry_in > deadline:
+                    return rounds
+                time.sleep(self._retry_in)
+                continue
+            if done or (deadline and time.monotonic() > deadline):
+                return rounds
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return self
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    drained = self.run_once()
+                except Exception:
+                    log.exception("Sync round failed")
+                    drained, self._failures, self._retry_in = True, self._failures + 1, self.backoff_s[0]
+                if self._failures:
+                    wait = self._retry_in
+                elif drained:
+                    wait = self.interval_s
+                else:
+                    continue
+                self._wake.wait(wait)
+                self._wake.clear()
+                self._arrived = 0
+
+        self._thread = threading.Thread(target=run, name="hr-sync", daemon=True)
+        self._thread.start()
+        log.info("☁️ Syncing to %s", self.uploader.url)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+        self.uploader.close()
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["outbox"] = sum(1 for e in self._state["outbox"] if not e["acked"])
+        stats["failures"] = self._failures
+        return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upload everything not yet synced, then exit")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--url", default=SYNC_URL)
+    parser.add_argument("--timeout", type=float, default=None, help="give up after this many seconds")
+    args = parser.parse_args(argv)
+    if not args.url:
+        parser.error("--url or HR_SYNC_URL is required")
+    instrumentation.configure_logging()
+    sync = SyncQueue(HRStore(args.data_dir), args.url)
+    started = time.perf_counter()
+    rounds = sync.drain(args.timeout)
+    stats = sync.stats()
+    sync.uploader.close()
+    log.info("☁️ %d samples and %d sessions in %d batches (%.1f MiB) over %d rounds in %.1f s; %s left",
+             stats["samples"], stats["sessions"], stats["batches"], stats["bytes"] / 2 ** 20, rounds,
+             time.perf_counter() - started, stats["backlog_samples"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+# utils/geo_index.py
+#
+# Spatial index over workout GPS tracks, for location and route queries.
+#
+# Each imported track is simplified (Douglas-Peucker, SIMPLIFY_M) and
+# covered with geohash cells at CELL_PRECISION (about 0.8 x 0.6 km at
+# mid latitudes). Cells are 30-bit interleaved integers, the same bits as a
+# 6-character geohash string. The index keeps:
+#
+#   postings   cell -> tracks that pass through it
+#   starts     start point of every track, as numpy arrays
+#   geometry   the simplified tracks, a few hundred points each
+#
+# and answers, without touching raw tracks:
+#
+#   passing_through(lat, lon, radius_m)   tracks that came within radius_m
+#   nearest_starts(lat, lon, k)           the k tracks that started closest
+#   similar_routes(track_id, k)           tracks sharing most of its cells,
+#                                         ranked by mean distance between
+#                                         the two routes
+#
+# Tracks are added one at a time (add() or import_arduino_csv()). Each add
+# appends a line to data/tracks/catalog.jsonl, its simplified points to
+# data/tracks/geometry.bin and their times to data/tracks/times.bin, so
+# nothing is rebuilt as the index grows. track_points() gives a track back
+# with its times, for exports (utils/session_export.py).
+#
+#   python -m utils.geo_index import data.csv --start 2025-07-20T09:00:00
+#   python -m utils.geo_index near 47.3769 8.5417 --radius 300
+#   python -m utils.geo_index nearest 47.3769 8.5417
+#   python -m utils.geo_index similar 2025-07-20T09:00:00
+
+import argparse
+import json
+import logging
+import math
+import os
+import threading
+from datetime import datetime
+from itertools import chain
+
+import numpy as np
+
+from utils import instrumentation
+from utils.hr_merge import iter_arduino_rows
+from utils.sessions import MIN_SESSION_S, SESSION_GAP_S
+
+log = logging.getLogger("wearable.geo")
+
+EARTH_RADIUS_M = 6371000.0
+CELL_PRECISION = 6          # geohash characters
+SIMPLIFY_M = 10.0           # Douglas-Peucker tolerance
+DENSIFY_M = 150.0           # spacing of the points used to find a track's cells
+MAX_QUERY_CELLS = 4096      # larger areas prefilter on track bounding boxes instead
+ROUTE_POINTS = 64           # points each route is resampled to for comparison
+MIN_ROUTE_OVERLAP = 0.4     # Jaccard overlap of cells for a route to be a candidate
+TRACK_DIR = "tracks"
+
+QUERY_US = instrumentation.histogram("geo.query_us")
+ADD_US = instrumentation.histogram("geo.add_us")
+
+
+# ---------- geometry ----------
+
+def _cell_bits(precision):
+    bits = 5 * precision
+    return (bits + 1) // 2, bits // 2  # longitude gets the odd bit
+
+
+def _grid(lats, lons, precision):
+    lon_bits, lat_bits = _cell_bits(precision)
+    x = np.clip(((np.asarray(lons) + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+    y = np.clip(((np.asarray(lats) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    return x, y
+
+
+def _interleave(x, y, precision):
+    # Geohash bit order: longitude's top bit first, then latitude's, alternating
+    lon_bits, lat_bits = _cell_bits(precision)
+    code = np.zeros(np.shape(x), dtype=np.int64)
+    for i in range(lon_bits + lat_bits):
+        if i % 2 == 0:
+            bit = (x >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (y >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+    return code
+
+
+def geohash_cells(lats, lons, precision=CELL_PRECISION):
+    # Integer geohash of each point
+    x, y = _grid(lats, lons, precision)
+    return _interleave(x, y, precision)
+
+
+def geohash(lat, lon, precision=CELL_PRECISION):
+    # The usual base32 string, for display
+    code = int(geohash_cells([lat], [lon], precision)[0])
+    alphabet = "0123456789bcdefghjkmnpqrstuvwxyz"
+    return "".join(alphabet[(code >> (5 * (precision - 1 - i))) & 31] for i in range(precision))
+
+
+def _local_xy(lats, lons, lat0, lon0):
+    # Equirectangular metres around (lat0, lon0); fine at workout scales
+    k = math.pi / 180.0 * EARTH_RADIUS_M
+    return (np.asarray(lons) - lon0) * k * math.cos(math.radians(lat0)), (np.asarray(lats) - lat0) * k
+
+
+def haversine_m(lat, lon, lats, lons):
+    p1, p2 = math.radians(lat), np.radians(lats)
+    dp, dl = p2 - p1, np.radians(lons) - math.radians(lon)
+    a = np.sin(dp / 2) ** 2 + math.cos(p1) * np.cos(p2) * np.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def simplify(lats, lons, tolerance_m=SIMPLIFY_M):
+    # Douglas-Peucker; returns the indices kept
+    n = len(lats)
+    if n < 3:
+        return np.arange(n)
+    x, y = _local_xy(lats, lons, lats[0], lons[0])
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        lo, hi = stack.pop()
+        if hi - lo < 2:
+            continue
+        dx, dy = x[hi] - x[lo], y[hi] - y[lo]
+        px, py = x[lo + 1:hi] - x[lo], y[lo + 1:hi] - y[lo]
+        chord = math.hypot(dx, dy)
+        if chord:
+            dist = np.abs(px * dy - py * dx) / chord
+        else:
+            dist = np.hypot(px, py)
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance_m:
+            mid = lo + 1 + i
+            keep[mid] = True
+            stack.append((lo, mid))
+            stack.append((mid, hi))
+    return np.flatnonzero(keep)
+
+
+def _densify(lats, lons, spacing_m):
+    # Points at most spacing_m apart along the polyline
+    if len(lats) < 2:
+        return np.asarray(lats), np.asarray(lons)
+    x, y = _local_xy(lats, lons, lats[0], lons[0])
+    steps = np.maximum(1, np.ceil(np.hypot(np.diff(x), np.diff(y)) / spacing_m)).astype(np.int64)
+    seg = np.repeat(np.arange(len(steps)), steps)
+    frac = np.arange(len(seg)) - np.repeat(np.cumsum(steps) - steps, steps)
+    frac = frac / steps[seg]
+    out_lat = np.append(lats[seg] + (lats[seg + 1] - lats[seg]) * frac, lats[-1])
+    out_lon = np.append(lons[seg] + (lons[seg + 1] - lons[seg]) * frac, lons[-1])
+    return out_lat, out_lon
+
+
+def track_cells(lats, lons, precision=CELL_PRECISION):
+    return np.unique(geohash_cells(*_densify(lats, lons, DENSIFY_M), precision))
+
+
+def _segment_distance_m(lat, lon, lats, lons):
+    # Shortest distance from a point to a polyline
+    x, y = _local_xy(lats, lons, lat, lon)
+    if len(x) == 1:
+        return float(math.hypot(x[0], y[0]))
+    ax, ay, bx, by = x[:-1], y[:-1], x[1:], y[1:]
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = np.clip(-(ax * dx + ay * dy) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0)
+    return float(np.hypot(ax + t * dx, ay + t * dy).min())
+
+
+def _resample(lats, lons, count=ROUTE_POINTS):
+    # count points evenly spaced by distance along the route, in metres
+    # around its first point
+    x, y = _local_xy(lats, lons, lats[0], lons[0])
+    dist = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))))
+    if dist[-1] == 0:
+        return np.full(count, x[0]), np.full(count, y[0])
+    at = np.linspace(0.0, dist[-1], count)
+    return np.interp(at, dist, x), np.interp(at, dist, y)
+
+
+def route_distance_m(a, b):
+    # Mean distance from each route's points to the other's nearest point;
+    # a and b are (lats, lons). Direction doesn't matter.
+    lat0, lon0 = a[0][0], a[1][0]
+    ax, ay = _resample(*a)
+    bx, by = _resample(*b)
+    # Both in metres around a's start
+    ox, oy = _local_xy([b[0][0]], [b[1][0]], lat0, lon0)
+    bx, by = bx + ox[0], by + oy[0]
+    d = np.hypot(ax[:, None] - bx[None, :], ay[:, None] - by[None, :])
+    return float((d.min(axis=1).mean() + d.min(axis=0).mean()) / 2)
+
+
+# ---------- index ----------
+
+class TrackIndex:
+    def __init__(self, directory=os.path.join("data", TRACK_DIR)):
+        self.directory = directory
+        self.catalog_path = os.path.join(directory, "catalog.jsonl")
+        self.geometry_path = os.path.join(directory, "geometry.bin")
+        self.times_path = os.path.join(directory, "times.bin")
+        self._lock = threading.Lock()
+        self.tracks = {}        # id -> metadata
+        self._ids = []          # slot -> id
+        self._slots = {}        # id -> slot
+        self._geometry = []     # slot -> (lats, lons) float32
+        self._times = []        # slot -> seconds since the start, float32, or None
+        self._postings = {}     # cell -> [slot, ...]
+        self._starts = None     # (lats, lons, bboxes) arrays, rebuilt after adds
+        self._load()
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def _load(self):
+        if not os.path.exists(self.catalog_path):
+            return
+        geometry = np.fromfile(self.geometry_path, dtype="<f4") if os.path.exists(self.geometry_path) else None
+        times = np.fromfile(self.times_path, dtype="<f4") if os.path.exists(self.times_path) else np.empty(0)
+        entries = {}
+        with open(self.catalog_path) as f:
+            for line in f:
+                try:
+                    meta = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                entries[meta["id"]] = meta  # a re-import replaces the earlier entry
+        for meta in entries.values():
+            lo, count = meta["offset"], meta["count"]
+            if geometry is None or 2 * (lo + count) > len(geometry):
+                continue
+            points = geometry[2 * lo:2 * (lo + count)].reshape(-1, 2)
+            # Tracks imported before times.bin existed have none
+            at = meta.get("times")
+            offsets = times[at:at + count] if at is not None and at + count <= len(times) else None
+            self._insert(meta, points[:, 0], points[:, 1], offsets)
+        log.info("🗺️ Loaded %d tracks", len(self.tracks))
+
+    def _insert(self, meta, lats, lons, offsets=None):
+        track_id = meta["id"]
+        slot = self._slots.get(track_id)
+        if slot is None:
+            slot = len(self._ids)
+            self._ids.append(track_id)
+            self._geometry.append(None)
+            self._times.append(None)
+            self._slots[track_id] = slot
+        else:
+            for cell in self.tracks[track_id]["cells"]:
+                self._postings[cell].remove(slot)
+        self.tracks[track_id] = meta
+        self._geometry[slot] = (lats, lons)
+        self._times[slot] = offsets
+        for cell in meta["cells"]:
+            self._postings.setdefault(cell, []).append(slot)
+        self._starts = None
+
+    def add(self, track_id, ts, lats, lons):
+        # One track (time-ordered fixes); replaces any earlier track with the
+        # same id. Returns its metadata.
+        t0 = instrumentation.stopwatch()
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        keep = simplify(lats, lons)
+        s_lats, s_lons = lats[keep], lons[keep]
+        x, y = _local_xy(lats, lons, lats[0], lons[0])
+        meta = {
+            "id": track_id,
+            "start": float(ts[0]),
+            "end": float(ts[-1]),
+            "points": len(lats),
+            "length_m": round(float(np.hypot(np.diff(x), np.diff(y)).sum()), 1),
+            "bbox": [float(lats.min()), float(lons.min()), float(lats.max()), float(lons.max())],
+            "cells": track_cells(s_lats, s_lons).tolist(),
+            "count": len(keep),
+        }
+        points = np.column_stack((s_lats, s_lons)).astype("<f4")
+        offsets = (np.asarray(ts, dtype=np.float64)[keep] - float(ts[0])).astype("<f4")
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.geometry_path, "ab") as f:
+                meta["offset"] = f.tell() // 8
+                f.write(points.tobytes())
+            with open(self.times_path, "ab") as f:
+                meta["times"] = f.tell() // 4
+                f.write(offsets.tobytes())
+            with open(self.catalog_path, "a") as f:
+                f.write(json.dumps(meta, separators=(",", ":")) + "\n")
+            self._insert(meta, points[:, 0], points[:, 1], offsets)
+        ADD_US.record_since(t0)
+        return meta
+
+    def _arrays(self):
+        if self._starts is None:
+            metas = [self.tracks[i] for i in self._ids]
+            starts = np.array([(g[0][0], g[1][0]) for g in self._geometry], dtype=np.float64).reshape(-1, 2)
+            bboxes = np.array([m["bbox"] for m in metas], dtype=np.float64).reshape(-1, 4)
+            self._starts = (starts[:, 0], starts[:, 1], bboxes)
+        return self._starts
+
+    def _result(self, slot, **extra):
+        meta = self.tracks[self._ids[slot]]
+        result = {"id": meta["id"], "start": meta["start"], "end": meta["end"], "length_m": meta["length_m"]}
+        result.update(extra)
+        return result
+
+    # ---------- queries ----------
+
+    def between(self, start, end):
+        # Metadata of the tracks overlapping [start, end], oldest first
+        with self._lock:
+            found = [m for m in self.tracks.values() if m["start"] <= end and m["end"] >= start]
+        return sorted(found, key=lambda m: m["start"])
+
+    def track_points(self, track_id):
+        # (ts, lats, lons) float64 arrays of a track's simplified points. A
+        # track stored without times is assumed to have kept a steady pace.
+        with self._lock:
+            slot = self._slots[track_id]
+            meta = self.tracks[track_id]
+            lats, lons = self._geometry[slot]
+            offsets = self._times[slot]
+        lats = lats.astype(np.float64)
+        lons = lons.astype(np.float64)
+        if offsets is None:
+            x, y = _local_xy(lats, lons, lats[0], lons[0])
+            along = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))))
+            offsets = along / along[-1] * (meta["end"] - meta["start"]) if along[-1] else np.zeros(len(lats))
+        return meta["start"] + offsets.astype(np.float64), lats, lons
+
+    def passing_through(self, lat, lon, radius_m):
+        # Tracks that came within radius_m of (lat, lon), newest first
+        t0 = instrumentation.stopwatch()
+        with self._lock:
+            dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+            dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+            x0, y0 = _grid(lat - dlat, lon - dlon, CELL_PRECISION)
+            x1, y1 = _grid(lat + dlat, lon + dlon, CELL_PRECISION)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) <= MAX_QUERY_CELLS:
+                xs, ys = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+                cells = _interleave(xs.ravel(), ys.ravel(), CELL_PRECISION).tolist()
+                candidates = set(chain.from_iterable(self._postings.get(c, ()) for c in cells))
+            else:
+                _, _, bboxes = self._arrays()
+                overlap = ((bboxes[:, 0] <= lat + dlat) & (bboxes[:, 2] >= lat - dlat)
+                           & (bboxes[:, 1] <= lon + dlon) & (bboxes[:, 3] >= lon - dlon))
+                candidates = np.flatnonzero(overlap).tolist()
+            hits = []
+            for slot in candidates:
+                distance = _segment_distance_m(lat, lon, *self._geometry[slot])
+                if distance <= radius_m:
+                    hits.append(self._result(slot, distance_m=round(distance, 1)))
+        hits.sort(key=lambda r: r["start"], reverse=True)
+        QUERY_US.record_since(t0)
+        return hits
+
+    def nearest_starts(self, lat, lon, k=5):
+        # The k tracks whose first fix is closest to (lat, lon)
+        t0 = instrumentation.stopwatch()
+        with self._lock:
+            if not self._ids:
+                return []
+            start_lats, start_lons, _ = self._arrays()
+            distance = haversine_m(lat, lon, start_lats, start_lons)
+            k = min(k, len(distance))
+            nearest = np.argpartition(distance, k - 1)[:k]
+            nearest = nearest[np.argsort(distance[nearest])]
+            results = [self._result(int(s), distance_m=round(float(distance[s]), 1)) for s in nearest]
+        QUERY_US.record_since(t0)
+        return results
+
+    def similar_routes(self, track_id=None, lats=None, lons=None, k=5, min_overlap=MIN_ROUTE_OVERLAP):
+        # Routes like a stored track (or a route given as lats/lons): tracks
+        # sharing at least min_overlap of their cells, closest first
+        t0 = instrumentation.stopwatch()
+        with self._lock:
+            if track_id is not None:
+                query_slot = self._slots[track_id]
+                lats, lons = self._geometry[query_slot]
+                cells = self.tracks[track_id]["cells"]
+            else:
+                query_slot = None
+                keep = simplify(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+                lats, lons = np.asarray(lats)[keep], np.asarray(lons)[keep]
+                cells = track_cells(lats, lons).tolist()
+            slots = np.fromiter(chain.from_iterable(self._postings.get(c, ()) for c in cells), dtype=np.int64)
+            shared = np.bincount(slots, minlength=len(self._ids)) if len(slots) else np.zeros(0, np.int64)
+            results = []
+            for slot in np.flatnonzero(shared).tolist():
+                if slot == query_slot:
+                    continue
+                other = len(self.tracks[self._ids[slot]]["cells"])
+                overlap = shared[slot] / (len(cells) + other - shared[slot])
+                if overlap >= min_overlap:
+                    distance = route_distance_m((lats, lons), self._geometry[slot])
+                    results.append(self._result(slot, distance_m=round(distance, 1),
+                                                overlap=round(float(overlap), 3)))
+        results.sort(key=lambda r: r["distance_m"])
+        QUERY_US.record_since(t0)
+        return results[:k]
+
+
+def split_tracks(rows, gap=SESSION_GAP_S, min_s=MIN_SESSION_S):
+    # (t, lat, lon) fixes -> lists of fixes, one per session, the same way
+    # utils/sessions.py splits heart rate
+    track = []
+    for row in rows:
+        if track and row[0] - track[-1][0] > gap:
+            if track[-1][0] - track[0][0] >= min_s:
+                yield track
+            track = []
+        track.append(row)
+    if track and track[-1][0] - track[0][0] >= min_s:
+        yield track
+
+
+def import_arduino_csv(index, path, start, drift_ppm=0.0):
+    # Adds every session in an Arduino dump with a GPS fix; returns their ids
+    fixes = ((t, lat, lon) for t, _, lat, lon in iter_arduino_rows(path, start, drift_ppm=drift_ppm)
+             if lat is not None and lon is not None and (lat or lon))
+    ids = []
+    for track in split_tracks(fixes):
+        ts, lats, lons = zip(*track)
+        track_id = datetime.fromtimestamp(ts[0]).isoformat(timespec="seconds")
+        index.add(track_id, ts, lats, lons)
+        ids.append(track_id)
+    return ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GPS track index")
+    parser.add_argument("--dir", default=os.path.join("data", TRACK_DIR))
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("import", help="add the tracks in an Arduino data.csv dump")
+    p.add_argument("path")
+    p.add_argument("--start", required=True, help="wall time of the first row (ISO)")
+    p = sub.add_parser("near", help="tracks that passed within --radius metres")
+    p.add_argument("lat", type=float)
+    p.add_argument("lon", type=float)
+    p.add_argument("--radius", type=float, default=250.0)
+    p = sub.add_parser("nearest", help="tracks that started closest")
+    p.add_argument("lat", type=float)
+    p.add_argument("lon", type=float)
+    p.add_argument("-k", type=int, default=5)
+    p = sub.add_parser("similar", help="routes like a stored track")
+    p.add_argument("track_id")
+    p.add_argument("-k", type=int, default=5)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    index = TrackIndex(args.dir)
+    if args.command == "import":
+        ids = import_arduino_csv(index, args.path, datetime.fromisoformat(args.start).timestamp())
+        log.info("🗺️ Added %d track(s): %s", len(ids), ", ".join(ids))
+        return
+    if args.command == "near":
+        results = index.passing_through(args.lat, args.lon, args.radius)
+    elif args.command == "nearest":
+        results = index.nearest_starts(args.lat, args.lon, args.k)
+    else:
+        results = index.similar_routes(args.track_id, k=args.k)
+    for r in results:
+        extra = f"  overlap {r['overlap']:.0%}" if "overlap" in r else ""
+        log.info("%s  %6.1f km  %8.1f m%s", r["id"], r["length_m"] / 1000, r["distance_m"], extra)
+
+
+if __name__ == "__main__":
+    main()
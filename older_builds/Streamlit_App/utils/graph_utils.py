@@ -1,9 +1,23 @@
 # utils/graph_utils.py
 
-from matplotlib import pyplot as plt
+import io
+import os
+
+from PIL import Image
+
+from utils.memo import CACHE_DIR, ResultCache, file_fingerprint
+
+SLEEP_DATA = [6.5, 7.2, 5.8, 8.0, 6.9, 7.5, 7.0]
+
+# Rendered PNGs by their inputs; on disk too, so a restarted server skips
+# matplotlib and PIL for anything it has drawn before
+graph_cache = ResultCache("graphs", os.path.join("data", CACHE_DIR, "graphs"))
+
+
+def _render_sleep_graph(sleep_data):
+    # Imported here: with a cached graph the app never loads matplotlib
+    from matplotlib import pyplot as plt
 
-def save_sleep_graph():
-    sleep_data = [6.5, 7.2, 5.8, 8.0, 6.9, 7.5, 7.0]
     nights = list(range(1, len(sleep_data) + 1))
     plt.figure(figsize=(4, 2))
     plt.plot(nights, sleep_data, color='deepskyblue', marker='o')
@@ -12,5 +26,31 @@ def save_sleep_graph():
     plt.ylabel('Hours')
     plt.grid(True)
     plt.tight_layout()
-    plt.savefig('assets/sleep_graph.png')
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png')
     plt.close()
+    return buf.getvalue()
+
+def render_sleep_graph(cached=True):
+    # PNG bytes of the sleep chart
+    sleep_data = SLEEP_DATA
+    if not cached:
+        return _render_sleep_graph(sleep_data)
+    return graph_cache.get(("sleep_graph", tuple(sleep_data)), lambda: _render_sleep_graph(sleep_data))
+
+def save_sleep_graph(path='assets/sleep_graph.png', cached=True):
+    with open(path, 'wb') as f:
+        f.write(render_sleep_graph(cached))
+
+def _fit_image(path, width):
+    image = Image.open(path)
+    if image.width > width:
+        image = image.resize((width, round(image.height * width / image.width)), Image.BILINEAR)
+    buf = io.BytesIO()
+    image.save(buf, format='PNG')
+    return buf.getvalue()
+
+def fit_image(path, width):
+    # PNG bytes of the image scaled down to `width`, so st.image has
+    # nothing left to resize on each rerun
+    return graph_cache.get(("fit_image", file_fingerprint(path), width), lambda: _fit_image(path, width))
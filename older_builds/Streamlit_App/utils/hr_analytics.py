@@ -0,0 +1,82 @@
+# utils/hr_analytics.py
+#
+# Aggregation for the metrics screens, kept free of any UI toolkit so it can
+# run in a worker thread or process (see utils/analytics_worker.py) or inside
+# the data service (utils/hr_service.py). Works on the (epoch seconds, bpm)
+# arrays returned by utils.hr_store.
+
+import logging
+import os
+
+from utils.hr_store import read_log_file
+
+log = logging.getLogger("wearable.analytics")
+
+MAX_GAP = 30  # seconds between samples before the graph line is broken
+HIGH_BPM_THRESHOLD = 130
+
+
+def split_segments(ts, bpms, max_gap=MAX_GAP):
+    # Split into segments with no large time gaps; x is seconds since the first
+    # sample. Time running backwards (logs from before utils/timebase.py,
+    # naive timestamps across a DST change) also starts a new segment.
+    segments = []
+    current_segment = []
+    last_time = None
+    start = ts[0]
+
+    for t, bpm in zip(ts, bpms):
+        if last_time is not None and not 0 <= t - last_time <= max_gap:
+            if current_segment:
+                segments.append(current_segment)
+                current_segment = []
+        current_segment.append((t - start, bpm))
+        last_time = t
+
+    if current_segment:
+        segments.append(current_segment)
+    return segments
+
+
+def thin_segments(segments, max_points):
+    # Keeps roughly max_points points across all segments by striding, always
+    # keeping each segment's endpoints so gaps stay where they are
+    total = sum(len(s) for s in segments)
+    if not max_points or total <= max_points:
+        return segments
+    stride = -(-total // max_points)
+    thinned = []
+    for segment in segments:
+        kept = segment[::stride]
+        if kept[-1] is not segment[-1]:
+            kept.append(segment[-1])
+        thinned.append(kept)
+    return thinned
+
+
+def compute_metrics(ts, bpms, max_gap=MAX_GAP, high_bpm_threshold=HIGH_BPM_THRESHOLD, max_points=None):
+    segments = thin_segments(split_segments(ts, bpms, max_gap), max_points)
+    return {
+        "start": ts[0],
+        "segments": segments,
+        "total": len(bpms),
+        "avg_bpm": sum(bpms) / len(bpms),
+        "max_bpm": max(bpms),
+        "resting_bpm": min(bpms),
+        "high_bpm_threshold": high_bpm_threshold,
+        "high_bpm_count": sum(1 for b in bpms if b > high_bpm_threshold),
+        "xmax": max(segment[-1][0] for segment in segments if segment),
+    }
+
+
+def analyze_log(path, max_gap=MAX_GAP, high_bpm_threshold=HIGH_BPM_THRESHOLD, max_points=None):
+    # Top-level so it can be pickled into a process pool; returns None when
+    # there is nothing to show
+    if not os.path.exists(path):
+        log.info("No heart rate log found.")
+        return None
+    ts, bpms = read_log_file(path)
+    if not ts:
+        log.info("No valid heart rate data.")
+        return None
+    return compute_metrics(ts, bpms, max_gap, high_bpm_threshold, max_points)
@@ -0,0 +1,150 @@
+# utils/hr_archive.py
+#
+# Archival tier for closed days. A day's CSV (about 30 bytes of ISO
+# timestamp per sample) is compacted into data/archive/hr_<date>.hrz:
+#
+#   header  magic "HRZ1", uint32 count, int64 first timestamp (ms), uint16 first bpm
+#   body    zlib(int32 timestamp deltas in ms, then int16 bpm deltas)
+#
+# Consecutive samples differ by roughly the same interval and a few BPM, so
+# the deltas compress very well, and decoding is a decompress plus a
+# running sum instead of parsing a datetime per line. Timestamps are kept
+# to the millisecond.
+#
+# HRStore reads archived days transparently. ArchiveCompactor moves closed
+# days into the archive from a background thread and, if configured, drops
+# days past the retention window.
+
+import logging
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from datetime import date, timedelta
+from itertools import accumulate
+
+from utils import instrumentation
+
+log = logging.getLogger("wearable.archive")
+
+MAGIC = b"HRZ1"
+HEADER = struct.Struct("<4sIqH")
+ARCHIVE_DIR = "archive"
+
+# Days older than this many days are compacted (1 = everything before today)
+ARCHIVE_AFTER_DAYS = int(os.environ.get("HR_ARCHIVE_AFTER_DAYS", 1))
+# Days older than this are deleted entirely; 0 keeps everything
+RETENTION_DAYS = int(os.environ.get("HR_RETENTION_DAYS", 0))
+
+ENCODE_US = instrumentation.histogram("store.archive_encode_us")
+DECODE_US = instrumentation.histogram("store.archive_decode_us")
+
+_MS_TO_S = (1000.0).__rtruediv__
+
+
+def encode_samples(ts, bpms):
+    # ts: epoch seconds, bpms: ints, same length and non-empty
+    with ENCODE_US.time():
+        ms = [round(t * 1000) for t in ts]
+        dts = array("i", [b - a for a, b in zip(ms, ms[1:])])
+        dbpm = array("h", [b - a for a, b in zip(bpms, bpms[1:])])
+        if sys.byteorder == "big":
+            dts.byteswap()
+            dbpm.byteswap()
+        body = zlib.compress(dts.tobytes() + dbpm.tobytes())
+        return HEADER.pack(MAGIC, len(ms), ms[0], bpms[0]) + body
+
+
+def decode_samples(blob):
+    # Returns (array('d') epoch seconds, array('H') bpm)
+    with DECODE_US.time():
+        magic, count, t0_ms, bpm0 = HEADER.unpack_from(blob)
+        if magic != MAGIC:
+            raise ValueError("Not an HR archive")
+        payload = zlib.decompress(blob[HEADER.size:])
+        split = 4 * (count - 1)
+        dts = array("i")
+        dts.frombytes(payload[:split])
+        dbpm = array("h")
+        dbpm.frombytes(payload[split:])
+        if sys.byteorder == "big":
+            dts.byteswap()
+            dbpm.byteswap()
+        ts = array("d", map(_MS_TO_S, accumulate(dts, initial=t0_ms)))
+        bpms = array("H", accumulate(dbpm, initial=bpm0))
+        return ts, bpms
+
+
+def archive_path(data_dir, day):
+    return os.path.join(data_dir, ARCHIVE_DIR, f"hr_{day.isoformat()}.hrz")
+
+
+def read_archive(path):
+    with open(path, "rb") as f:
+        return decode_samples(f.read())
+
+
+def write_archive(path, ts, bpms):
+    # Written to a temp file and renamed so readers never see half an archive
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(encode_samples(ts, bpms))
+    os.replace(tmp, path)
+
+
+class ArchiveCompactor:
+    def __init__(self, store, archive_after_days=ARCHIVE_AFTER_DAYS, retention_days=RETENTION_DAYS,
+                 interval_s=3600):
+        self.store = store
+        self.archive_after_days = max(1, archive_after_days)
+        self.retention_days = retention_days
+        self.interval_s = interval_s
+        self._thread = None
+        self._stop = threading.Event()
+
+    def run_once(self, today=None):
+        # Returns (days compacted, days deleted)
+        today = today or date.today()
+        compacted = deleted = 0
+        cutoff = today - timedelta(days=self.archive_after_days)
+        for day in self.store.csv_days():
+            if day <= cutoff:
+                try:
+                    self.store.compact_day(day)
+                    compacted += 1
+                except Exception as e:
+                    # One bad day mustn't stop the thread or the days after it
+                    log.error("Could not archive %s: %s", day, e)
+
+        if self.retention_days:
+            oldest = today - timedelta(days=self.retention_days)
+            for day in self.store.days():
+                if day < oldest:
+                    self.store.delete_day(day)
+                    deleted += 1
+        if compacted or deleted:
+            log.info("🗜️ Archived %d day(s), deleted %d past retention", compacted, deleted)
+        return compacted, deleted
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return self
+        self._stop.clear()
+
+        def run():
+            while not self._stop.is_set():
+                self.run_once()
+                self._stop.wait(self.interval_s)
+
+        self._thread = threading.Thread(target=run, name="hr-archive", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
@@ -0,0 +1,274 @@
+# utils/hr_client.py
+#
+# Thin client for utils/hr_service.py. HTTP connections are kept alive and
+# pooled, so repeated queries from screens and workers skip the TCP
+# handshake. get_client() returns the app-wide client. It talks to
+# HR_SERVICE_URL when that is set, and otherwise to a service embedded in
+# this process over the local data/ directory.
+
+import asyncio
+import base64
+import gzip
+import http.client
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+from datetime import date, datetime, time as dtime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+from utils.hr_service import HRService, DEFAULT_HOST, DEFAULT_PORT, unpack_samples, ws_read_frame
+from utils.hr_store import HRStore
+
+log = logging.getLogger("wearable.client")
+
+
+class HRClient:
+    def __init__(self, base_url, pool_size=8, timeout=10.0):
+        parts = urlsplit(base_url)
+        self.base_url = base_url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    # ---------- connection pool ----------
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def request(self, method, path, params=None, body=None):
+        target = path + ("?" + urlencode(params) if params else "")
+        headers = {"Accept-Encoding": "gzip"}
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+
+        # A pooled connection may have been closed by the server; retry once on a fresh one
+        for attempt in (0, 1):
+            conn = self._acquire()
+            try:
+                conn.request(method, target, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionError, BrokenPipeError):
+                conn.close()
+                if attempt:
+                    raise
+                continue
+            except BaseException:
+                # A timeout (or anything else) leaves the connection mid-
+                # response; it can't go back in the pool
+                conn.close()
+                raise
+            if response.getheader("Connection", "").lower() == "close":
+                conn.close()
+            else:
+                self._release(conn)
+            break
+
+        if response.getheader("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        if response.status != 200:
+            try:
+                message = json.loads(data).get("error", data)
+            except ValueError:
+                message = data
+            raise RuntimeError(f"HR service {response.status}: {message}")
+        if response.getheader("Content-Type") != "application/json":
+            return data
+        return json.loads(data)
+
+    # ---------- queries ----------
+
+    def health(self):
+        return self.request("GET", "/health")
+
+    def days(self):
+        return [date.fromisoformat(d) for d in self.request("GET", "/days")["days"]]
+
+    def range(self, start, end, max_points=None, bucket=None, agg="mean", binary=True):
+        # Returns (timestamps, values) for start <= t < end (epoch seconds)
+        params = {"start": start, "end": end, "agg": agg}
+        if max_points:
+            params["max_points"] = max_points
+        if bucket:
+            params["bucket"] = bucket
+        if binary:
+            params["format"] = "bin"
+            return unpack_samples(self.request("GET", "/range", params))
+        result = self.request("GET", "/range", params)
+        return result["t"], result["bpm"]
+
+    def day_range(self, day, **kwargs):
+        start = datetime.combine(day, dtime()).timestamp()
+        end = datetime.combine(day + timedelta(days=1), dtime()).timestamp()
+        return self.range(start, end, **kwargs)
+
+    def day_metrics(self, day=None, max_gap=None, threshold=None, max_points=None):
+        params = {"day": (day or date.today()).isoformat()}
+        if max_gap is not None:
+            params["max_gap"] = max_gap
+        if threshold is not None:
+            params["threshold"] = threshold
+        if max_points is not None:
+            params["max_points"] = max_points
+        return self.request("GET", "/metrics", params)["metrics"]
+
+    def sessions(self, day=None, recent=None):
+        # Session summaries for one day (oldest first) or the last `recent`
+        # days (newest first); see utils/sessions.py
+        params = {"recent": recent} if recent else {"day": (day or date.today()).isoformat()}
+        return self.request("GET", "/sessions", params)["sessions"]
+
+    def export_session(self, start, fmt="gpx"):
+        # One session, by its start time, as GPX, TCX or FIT file contents
+        return self.request("GET", "/sessions/export", {"start": start, "format": fmt})
+
+    def compare(self, start, k=3, align="time"):
+        # One session against its k most similar earlier ones; see
+        # utils/session_compare.compare for the shape of the answer
+        return self.request("GET", "/sessions/compare", {"start": start, "k": k, "align": align})
+
+    def mean_max(self, scope="all"):
+        # Best sustained heart rate and pace per duration over all history
+        # or one year ("2025"); see utils/mean_max.py. None before any session
+        return self.request("GET", "/mean_max", {"scope": scope})["envelope"]
+
+    def session_mean_max(self, start):
+        return self.request("GET", "/mean_max", {"start": start})["curve"]
+
+    def tracks_near(self, lat, lon, radius=250):
+        # GPS tracks that passed within radius metres, newest first
+        return self.request("GET", "/tracks", {"near": f"{lat},{lon}", "radius": radius})["tracks"]
+
+    def nearest_starts(self, lat, lon, k=5):
+        return self.request("GET", "/tracks", {"nearest": f"{lat},{lon}", "k": k})["tracks"]
+
+    def similar_routes(self, track_id, k=5):
+        return self.request("GET", "/tracks", {"similar": track_id, "k": k})["tracks"]
+
+    def ingest(self, batch):
+        return self.request("POST", "/ingest", body={"samples": [list(s) for s in batch]})
+
+
+async def live_feed(host, port, binary=False):
+    # Async generator over live sample batches from GET /live. Yields lists of
+    # (epoch_seconds, bpm) tuples, or (timestamps, values) arrays when binary.
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((f"GET /live{'?format=bin' if binary else ''} HTTP/1.1\r\n"
+                  f"Host: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    await writer.drain()
+    status = await reader.readuntil(b"\r\n\r\n")
+    if b" 101 " not in status.split(b"\r\n", 1)[0]:
+        writer.close()
+        raise RuntimeError("HR service refused the WebSocket upgrade")
+    try:
+        while True:
+            opcode, payload = await ws_read_frame(reader)
+            if opcode == 0x8:
+                return
+            if opcode == 0x2:
+                yield unpack_samples(payload)
+            elif opcode == 0x1:
+                yield [tuple(s) for s in json.loads(payload)["samples"]]
+    finally:
+        # Client frames must be masked; a zero mask keeps the close payload as-is
+        writer.write(bytes([0x88, 0x82, 0, 0, 0, 0]) + struct.pack(">H", 1000))
+        writer.close()
+
+
+_client = None
+_service = None
+_lock = threading.Lock()
+_clients_by_url = {}
+
+
+def get_client(data_dir="data"):
+    global _client, _service
+    with _lock:
+        if _client is not None:
+            return _client
+        url = os.environ.get("HR_SERVICE_URL")
+        if not url:
+            port = int(os.environ.get("HR_SERVICE_PORT", DEFAULT_PORT))
+            try:
+                _service = HRService(HRStore(data_dir), DEFAULT_HOST, port).start_in_thread()
+            except OSError:
+                # Another app already owns the default port; it may serve a
+                # different data/ directory, so run our own on a free port
+                _service = HRService(HRStore(data_dir), DEFAULT_HOST, 0).start_in_thread()
+            url = _service.url
+        _client = HRClient(url)
+        return _client
+
+
+def get_embedded_service():
+    # The in-process service, if get_client() started one (for publishing live batches)
+    return _service
+
+
+def ingest_batch(batch):
+    # Dispatcher batch subscriber for live samples: the embedded service
+    # persists and publishes in-process, an external one gets them over HTTP
+    if _service is not None:
+        _service.ingest(batch)
+        return
+    try:
+        get_client().ingest(batch)
+    except (OSError, RuntimeError) as e:
+        log.error("Could not send HR batch to %s: %s", get_client().base_url, e)
+
+
+def _client_for(base_url):
+    # One pooled client per service URL per process
+    client = _clients_by_url.get(base_url)
+    if client is None:
+        client = _clients_by_url.setdefault(base_url, HRClient(base_url))
+    return client
+
+
+def fetch_day_metrics(base_url, day, max_gap=None, threshold=None, max_points=None):
+    # Top-level so the analytics worker can run it in a thread or a process
+    return _client_for(base_url).day_metrics(day, max_gap=max_gap, threshold=threshold, max_points=max_points)
+
+
+def fetch_sessions(base_url, recent):
+    return _client_for(base_url).sessions(recent=recent)
+
+
+def fetch_compare(base_url, start, k, align):
+    return _client_for(base_url).compare(start, k=k, align=align)
+
+
+def fetch_export(base_url, start, fmt, path):
+    # Saves one session's export file; returns its path
+    data = _client_for(base_url).export_session(start, fmt)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def fetch_mean_max(base_url, scope):
+    return _client_for(base_url).mean_max(scope)
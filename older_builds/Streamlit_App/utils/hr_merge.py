@@ -0,0 +1,264 @@
+# utils/hr_merge.py
+#
+# Merges overlapping HR recordings of the same session: the app logs
+# (data/hr_log_<date>.csv, from either front end) and the Arduino SD dump
+# (data.csv, one "BPM,Latitude,Longitude,Millis" row a second, no time of day).
+#
+#   1. align    each source's clock offset against the highest-priority one
+#               is estimated from the first few minutes of both
+#   2. merge    heapq k-way merge by timestamp over the shifted streams
+#   3. dedup    samples from different sources within `tolerance` seconds
+#               collapse to the one from the highest-priority source
+#
+# resample() puts several devices on one time grid for group views.
+# Everything is a generator over time-ordered input. Memory holds the
+# alignment window and one sample per source, however long the inputs are.
+#
+#   python -m utils.hr_merge --log data/hr_log_2025-07-20.csv \
+#       --arduino dump.csv --arduino-start 2025-07-20T09:00:00 --out merged.csv
+
+import argparse
+import heapq
+import logging
+import math
+from datetime import datetime
+from itertools import chain
+
+from utils.hr_store import iter_log_file
+
+log = logging.getLogger("wearable.merge")
+
+LOG_PRIORITY = 2
+ARDUINO_PRIORITY = 1
+ALIGN_WINDOW_S = 900      # seconds of each source used to estimate its offset
+MAX_OFFSET_S = 300        # largest clock offset searched for
+MIN_OVERLAP_BINS = 30     # fewer overlapping seconds than this and no offset is trusted
+
+
+class Source:
+    # samples: iterable of (epoch_seconds, bpm) in time order. offset is added
+    # to every timestamp; None means "estimate it" when merging.
+    def __init__(self, name, samples, priority=LOG_PRIORITY, offset=None):
+        self.name = name
+        self.samples = samples
+        self.priority = priority
+        self.offset = offset
+
+    def shifted(self):
+        offset = self.offset or 0.0
+        if not offset:
+            return iter(self.samples)
+        return ((t + offset, bpm) for t, bpm in self.samples)
+
+
+def log_source(path, name=None, priority=LOG_PRIORITY, offset=None):
+    # An hr_log CSV written by either app; timestamps are already wall-clock
+    return Source(name or path, iter_log_file(path), priority, offset)
+
+
+def iter_arduino_rows(path, start, interval=1.0, drift_ppm=0.0):
+    # Rows are "BPM,Latitude,Longitude[,Millis]". With the Millis column each
+    # row is stamped start + elapsed millis(), corrected by the board's clock
+    # drift (see utils.timebase.DriftEstimator). Older dumps without it are
+    # assumed to be one row per `interval` seconds. Yields (t, bpm, lat, lon)
+    # with None for "null" fields (no beat detected, no GPS fix).
+    scale = (1.0 + drift_ppm / 1e6) / 1000.0
+    with open(path, "r") as f:
+        i = 0
+        first_ms = None
+        for line in f:
+            fields = line.strip().split(",")
+            if not fields[0] or fields[0] == "BPM":
+                continue
+            if len(fields) >= 4 and fields[3].isdigit():
+                ms = int(fields[3])
+                if first_ms is None:
+                    first_ms = ms
+                t = start + (ms - first_ms) * scale
+            else:
+                t = start + i * interval
+            i += 1
+            yield t, _parse_field(fields, 0, int), _parse_field(fields, 1, float), _parse_field(fields, 2, float)
+
+
+def _parse_field(fields, i, kind):
+    if len(fields) <= i or fields[i] == "null":
+        return None
+    try:
+        value = float(fields[i])
+    except ValueError:
+        return None
+    return int(round(value)) if kind is int else value
+
+
+def iter_arduino_csv(path, start, interval=1.0, drift_ppm=0.0):
+    # (t, bpm) from an Arduino dump; rows without a beat keep their time
+    # slot but are skipped
+    for t, bpm, _, _ in iter_arduino_rows(path, start, interval, drift_ppm):
+        if bpm is not None:
+            yield t, bpm
+
+
+def arduino_source(path, start, interval=1.0, name="arduino", priority=ARDUINO_PRIORITY, offset=None,
+                   drift_ppm=0.0):
+    if isinstance(start, datetime):
+        start = start.timestamp()
+    return Source(name, iter_arduino_csv(path, start, interval, drift_ppm), priority, offset)
+
+
+def _peek_window(samples, window):
+    # Pulls the first `window` seconds of samples; returns them and an
+    # iterator that replays them before the rest
+    samples = iter(samples)
+    head = []
+    for sample in samples:
+        head.append(sample)
+        if sample[0] - head[0][0] >= window:
+            break
+    return head, chain(head, samples)
+
+
+def _bin_means(samples, step):
+    sums = {}
+    for t, bpm in samples:
+        b = math.floor(t / step)
+        acc = sums.setdefault(b, [0, 0])
+        acc[0] += bpm
+        acc[1] += 1
+    return {b: s / n for b, (s, n) in sums.items()}
+
+
+def estimate_offset(reference, other, max_offset=MAX_OFFSET_S, step=1.0):
+    # Seconds to add to `other` so its BPM curve best matches `reference`
+    # (lowest mean absolute difference). Both are lists of (t, bpm). Returns
+    # None when they never overlap by MIN_OVERLAP_BINS.
+    ref = _bin_means(reference, step)
+    oth = _bin_means(other, step)
+    if not ref or not oth:
+        return None
+    # Coarse prior from the start times, then search around it
+    prior = round((reference[0][0] - other[0][0]) / step)
+    span = int(max_offset / step)
+    best = None
+    for shift in range(prior - span, prior + span + 1):
+        total = n = 0
+        for b, v in oth.items():
+            r = ref.get(b + shift)
+            if r is not None:
+                total += abs(r - v)
+                n += 1
+        if n >= MIN_OVERLAP_BINS:
+            score = total / n
+            if best is None or score < best[0]:
+                best = (score, shift)
+    return None if best is None else best[1] * step
+
+
+def align(sources, window=ALIGN_WINDOW_S, max_offset=MAX_OFFSET_S):
+    # Fills in offset for sources that have none, relative to the highest
+    # priority source (whose own offset is left as given, default 0)
+    sources = sorted(sources, key=lambda s: -s.priority)
+    if not sources:
+        return sources
+    reference = sources[0]
+    ref_head, reference.samples = _peek_window(reference.shifted(), window)
+    reference.offset = 0.0
+    for source in sources[1:]:
+        if source.offset is not None:
+            continue
+        head, source.samples = _peek_window(source.samples, window)
+        offset = estimate_offset(ref_head, head, max_offset) if ref_head and head else None
+        source.offset = offset or 0.0
+        if offset is None:
+            log.warning("⚠️ Could not align %s against %s; leaving its clock as is",
+                        source.name, reference.name)
+        else:
+            log.info("⏱️ %s is offset %+.1fs from %s", source.name, offset, reference.name)
+    return sources
+
+
+def merge(sources, tolerance=0.5, estimate=True):
+    # Yields (t, bpm, source_name) in time order, one sample per cluster of
+    # near-coincident samples from different sources
+    if estimate:
+        sources = align(sources)
+    streams = [_tagged(s.shifted(), -s.priority, s.name) for s in sources]
+
+    cluster = []
+    for item in heapq.merge(*streams):
+        if cluster and (item[0] - cluster[0][0] > tolerance
+                        or any(c[2] == item[2] for c in cluster)):
+            yield _pick(cluster)
+            cluster = []
+        cluster.append(item)
+    if cluster:
+        yield _pick(cluster)
+
+
+def _tagged(samples, *tags):
+    # (t, *tags, bpm) tuples so heapq.merge orders ties by the tags
+    for t, bpm in samples:
+        yield (t, *tags, bpm)
+
+
+def _pick(cluster):
+    t, _, name, bpm = min(cluster, key=lambda c: c[1])
+    return t, bpm, name
+
+
+def resample(streams, step=1.0, hold=None):
+    # Group view: streams is {device: iterable of (t, bpm)} in time order.
+    # Yields (grid_t, [bpm or None per device]), each device showing its
+    # latest sample no older than `hold` seconds (default: one step).
+    names = list(streams)
+    hold = step if hold is None else hold
+    merged = heapq.merge(*(_tagged(streams[name], i) for i, name in enumerate(names)))
+
+    latest = [None] * len(names)
+    first = next(merged, None)
+    if first is None:
+        return
+    grid_t = math.ceil(first[0] / step) * step
+    pending = first
+    while pending is not None:
+        # Apply everything at or before this grid point, then emit the row
+        while pending is not None and pending[0] <= grid_t:
+            latest[pending[1]] = (pending[0], pending[2])
+            pending = next(merged, None)
+        yield grid_t, [v[1] if v and grid_t - v[0] <= hold else None for v in latest]
+        grid_t += step
+
+
+def write_merged(samples, path):
+    # Writes merge() output in the hr_log CSV format the apps read
+    count = 0
+    with open(path, "w") as f:
+        for t, bpm, _ in samples:
+            f.write(f"{datetime.fromtimestamp(t).isoformat()},{bpm}\n")
+            count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge overlapping HR recordings")
+    parser.add_argument("--log", action="append", default=[], help="hr_log CSV (repeatable)")
+    parser.add_argument("--arduino", help="Arduino data.csv dump")
+    parser.add_argument("--arduino-start", help="approximate wall time of the first Arduino row (ISO)")
+    parser.add_argument("--arduino-drift-ppm", type=float, default=0.0, help="board clock drift, if known")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="seconds within which samples are duplicates")
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    sources = [log_source(path, priority=LOG_PRIORITY + len(args.log) - i) for i, path in enumerate(args.log)]
+    if args.arduino:
+        if not args.arduino_start:
+            parser.error("--arduino needs --arduino-start")
+        sources.append(arduino_source(args.arduino, datetime.fromisoformat(args.arduino_start),
+                                      drift_ppm=args.arduino_drift_ppm))
+    count = write_merged(merge(sources, args.tolerance), args.out)
+    log.info("💾 Wrote %d samples to %s", count, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,525 @@
+# utils/hr_service.py
+#
+# Small asyncio HTTP/WebSocket data service over the HR store, so the front
+# ends (and any other tool) query one place instead of parsing
+# data/hr_log_*.csv themselves. Standard library only.
+#
+#   GET  /health            liveness, plus the metrics cache's hit/miss stats
+#                           and, when syncing, the upload queue's progress
+#   GET  /days
+#   GET  /range?start=&end=[&max_points=|&bucket=][&agg=mean|min|max|count][&format=json|bin]
+#   GET  /metrics?day=YYYY-MM-DD[&max_gap=&threshold=&max_points=]
+#   GET  /sessions?day=YYYY-MM-DD | ?recent=N   workout session summaries
+#   GET  /sessions/export?start=&format=gpx|tcx|fit
+#                           one session as a file (utils/session_export.py)
+#   GET  /sessions/compare?start=[&k=3][&align=time|distance|dtw]
+#                           one session against its most similar earlier
+#                           ones (utils/session_compare.py)
+#   GET  /mean_max[?scope=all|YYYY] | ?start=
+#                           best sustained heart rate and pace per duration,
+#                           over history or one session (utils/mean_max.py)
+#   GET  /tracks?near=LAT,LON[&radius=] | ?nearest=LAT,LON[&k=] | ?similar=ID[&k=]
+#                           GPS track queries (utils/geo_index.py)
+#   POST /ingest            {"samples": [[epoch_seconds, bpm], ...]}
+#   GET  /live[?format=bin] WebSocket feed of sample batches as they arrive
+#
+# Connections are HTTP/1.1 keep-alive, and bodies over 1 KiB are gzipped for
+# clients that accept it. Requests are answered on a small thread pool, so
+# the event loop only moves bytes and /live never waits behind a slow query.
+# format=bin returns little-endian packed samples: uint32 count,
+# float64 t[count], float32 value[count].
+#
+# Run standalone with `python -m utils.hr_service --data-dir data`, or embed
+# it in an app with start_in_thread() (see utils/hr_client.get_client). While
+# running it also archives closed days in the background (utils/hr_archive.py)
+# and, when HR_SYNC_URL is set, uploads new data there (utils/cloud_sync.py).
+
+import argparse
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+from utils import cloud_sync, instrumentation
+from utils.geo_index import TrackIndex, TRACK_DIR
+from utils.hr_analytics import compute_metrics, MAX_GAP, HIGH_BPM_THRESHOLD
+from utils.hr_archive import ArchiveCompactor
+from utils.hr_store import HRStore, downsample, AGGREGATES
+from utils.mean_max import ALL_TIME, MeanMaxIndex
+from utils.memo import CACHE_DIR, ResultCache
+from utils.session_compare import FeatureIndex, compare
+from utils.session_export import CONTENT_TYPES, write_session
+from utils.sessions import SessionIndex
+
+log = logging.getLogger("wearable.service")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+GZIP_MIN_BYTES = 1024
+SUBSCRIBER_QUEUE = 64  # batches buffered per WebSocket client before dropping the oldest
+REQUEST_WORKERS = 8    # threads routing HTTP requests off the event loop
+
+REQUEST_US = instrumentation.histogram("service.request_us")
+LIVE_SUBSCRIBERS = instrumentation.counter("service.live_connections")
+LIVE_DROPPED = instrumentation.counter("service.live_dropped")
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_time(value):
+    # Epoch seconds or an ISO timestamp/date
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def pack_samples(ts, values):
+    return (struct.pack("<I", len(ts)) + array("d", ts).tobytes()
+            + array("f", values).tobytes())
+
+
+def unpack_samples(payload):
+    (count,) = struct.unpack_from("<I", payload)
+    ts = array("d")
+    ts.frombytes(payload[4:4 + 8 * count])
+    values = array("f")
+    values.frombytes(payload[4 + 8 * count:4 + 12 * count])
+    return ts, values
+
+
+def ws_frame(payload, opcode):
+    # Server-to-client frames are never masked
+    header = bytearray([0x80 | opcode])
+    n = len(payload)
+    if n < 126:
+        header.append(n)
+    elif n < 1 << 16:
+        header.append(126)
+        header += struct.pack(">H", n)
+    else:
+        header.append(127)
+        header += struct.pack(">Q", n)
+    return bytes(header) + payload
+
+
+async def ws_read_frame(reader):
+    # Returns (opcode, payload); unmasks client frames
+    b1, b2 = await reader.readexactly(2)
+    opcode = b1 & 0x0F
+    n = b2 & 0x7F
+    if n == 126:
+        (n,) = struct.unpack(">H", await reader.readexactly(2))
+    elif n == 127:
+        (n,) = struct.unpack(">Q", await reader.readexactly(8))
+    mask = await reader.readexactly(4) if b2 & 0x80 else None
+    payload = await reader.readexactly(n)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+class _Subscriber:
+    def __init__(self, writer, binary):
+        self.writer = writer
+        self.binary = binary
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE)
+        self.dropped = 0
+
+
+class HRService:
+    def __init__(self, store=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.store = store or HRStore()
+        self.host = host
+        self.port = port
+        self.loop = None
+        self._server = None
+        self._subscribers = set()
+        self._ready = threading.Event()
+        self._thread = None
+        self.published = 0
+        self.compactor = ArchiveCompactor(self.store)
+        self.sessions = SessionIndex(self.store)
+        # Requests are routed on these threads, so a slow store read or
+        # export never stalls the event loop (and every /live subscriber)
+        self._requests = ThreadPoolExecutor(max_workers=REQUEST_WORKERS, thread_name_prefix="hr-request")
+        self._lazy_lock = threading.Lock()
+        self._tracks = None
+        self._features = None
+        self._mean_max = None
+        # Day metrics by (day, day_version, parameters): a Refresh with
+        # nothing new, or another screen asking for the same day, is a hit
+        self.metrics_cache = ResultCache("metrics", os.path.join(self.store.data_dir, CACHE_DIR, "metrics"))
+        self.sync = cloud_sync.SyncQueue(self.store, sessions=self.sessions) if cloud_sync.SYNC_URL else None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    # ---------- lifecycle ----------
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  limit=1 << 20)
+        # Port 0 means "pick one"; report the real one
+        self.port = self._server.sockets[0].getsockname()[1]
+        log.info("📡 HR data service listening on %s", self.url)
+        self.compactor.start()
+        if self.sync:
+            self.sync.start()
+        self._ready.set()
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                # stop() closed the server
+                pass
+
+    def start_in_thread(self):
+        # Runs the service on its own event loop in a daemon thread
+        error = []
+
+        def run():
+            try:
+                asyncio.run(self.serve_forever())
+            except Exception as e:
+                error.append(e)
+                self._ready.set()
+
+        self._thread = threading.Thread(target=run, name="hr-service", daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=5)
+        if error:
+            raise error[0]
+        return self
+
+    def stop(self):
+        self.compactor.stop()
+        if self.sync:
+            self.sync.stop()
+        if self.loop and self._server:
+            self.loop.call_soon_threadsafe(self._server.close)
+            for sub in list(self._subscribers):
+                self.loop.call_soon_threadsafe(sub.writer.close)
+        self._requests.shutdown(wait=False)
+
+    # ---------- live feed ----------
+
+    def publish(self, batch):
+        # Thread-safe: hands a [(epoch_seconds, bpm), ...] batch to every
+        # WebSocket subscriber. Intended as a CoalescingDispatcher batch subscriber.
+        if self.loop is None or not batch:
+            return
+        self.loop.call_soon_threadsafe(self._broadcast, list(batch))
+
+    def ingest(self, batch):
+        self.store.append_batch(batch)
+        self.publish(batch)
+        if self.sync:
+            self.sync.notify(batch)
+
+    def _broadcast(self, batch):
+        self.published += len(batch)
+        if not self._subscribers:
+            return
+        # Encode once per format and share the bytes across all subscribers
+        frames = {}
+        for sub in self._subscribers:
+            frame = frames.get(sub.binary)
+            if frame is None:
+                if sub.binary:
+                    frame = ws_frame(pack_samples([t for t, _ in batch], [v for _, v in batch]), 0x2)
+                else:
+                    payload = {"samples": batch, "server_ns": time.perf_counter_ns()}
+                    frame = ws_frame(json.dumps(payload).encode(), 0x1)
+                frames[sub.binary] = frame
+            if sub.queue.full():
+                # Slow consumer: drop its oldest batch rather than stall everyone
+                sub.queue.get_nowait()
+                sub.dropped += 1
+                LIVE_DROPPED.inc()
+            sub.queue.put_nowait(frame)
+
+    async def _serve_websocket(self, reader, writer, headers, query):
+        key = headers["sec-websocket-key"]
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\n"
+                      "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        await writer.drain()
+
+        sub = _Subscriber(writer, binary=query.get("format") == "bin")
+        self._subscribers.add(sub)
+        LIVE_SUBSCRIBERS.inc()
+
+        async def pump():
+            while True:
+                frame = await sub.queue.get()
+                writer.write(frame)
+                await writer.drain()
+
+        pump_task = asyncio.create_task(pump())
+        try:
+            while True:
+                opcode, payload = await ws_read_frame(reader)
+                if opcode == 0x8:  # close
+                    writer.write(ws_frame(payload[:2], 0x8))
+                    break
+                if opcode == 0x9:  # ping
+                    writer.write(ws_frame(payload, 0xA))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            pump_task.cancel()
+            self._subscribers.discard(sub)
+
+    # ---------- HTTP ----------
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, 413, {"error": "Headers too large"}, {})
+                    break
+
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "Bad request line"}, {})
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                body = b""
+                length = int(headers.get("content-length", 0) or 0)
+                if length:
+                    body = await reader.readexactly(length)
+
+                url = urlsplit(target)
+                query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+                if headers.get("upgrade", "").lower() == "websocket" and url.path == "/live":
+                    if "sec-websocket-key" not in headers:
+                        await self._respond(writer, 400, {"error": "Missing Sec-WebSocket-Key"}, {})
+                    else:
+                        await self._serve_websocket(reader, writer, headers, query)
+                    break
+
+                keep_alive = (version == "HTTP/1.1" and headers.get("connection", "").lower() != "close")
+                t0 = instrumentation.stopwatch()
+                try:
+                    status, payload, content_type = await self.loop.run_in_executor(
+                        self._requests, self._route, method, url.path, query, body)
+                except HTTPError as e:
+                    status, payload, content_type = e.status, {"error": str(e)}, None
+                except (ValueError, KeyError) as e:
+                    status, payload, content_type = 400, {"error": str(e)}, None
+                except Exception as e:
+                    log.exception("Request failed: %s %s", method, target)
+                    status, payload, content_type = 500, {"error": str(e)}, None
+                await self._respond(writer, status, payload, headers, content_type, keep_alive)
+                REQUEST_US.record_since(t0)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, request_headers, content_type=None, keep_alive=False):
+        if isinstance(payload, (bytes, bytearray)):
+            body = bytes(payload)
+        else:
+            body = json.dumps(payload).encode()
+            content_type = "application/json"
+        extra = ""
+        if len(body) >= GZIP_MIN_BYTES and "gzip" in request_headers.get("accept-encoding", ""):
+            body = gzip.compress(body, compresslevel=5)
+            extra = "Content-Encoding: gzip\r\n"
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n{extra}"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    def _route(self, method, path, query, body):
+        if path == "/ingest":
+            if method != "POST":
+                raise HTTPError(405, "POST only")
+            samples = json.loads(body or b"{}").get("samples", [])
+            self.ingest([(float(t), int(bpm)) for t, bpm in samples])
+            return 200, {"accepted": len(samples)}, None
+        if method != "GET":
+            raise HTTPError(405, "GET only")
+
+        if path == "/health":
+            return 200, {"ok": True, "subscribers": len(self._subscribers), "published": self.published,
+                         "metrics_cache": self.metrics_cache.stats(),
+                         "sync": self.sync.stats() if self.sync else None}, None
+        if path == "/days":
+            days = self.store.days()
+            return 200, {"days": [d.isoformat() for d in days]}, None
+        if path == "/range":
+            return self._range(query)
+        if path == "/metrics":
+            return self._metrics(query)
+        if path == "/sessions":
+            if "recent" in query:
+                return 200, {"sessions": self.sessions.recent(int(query["recent"]))}, None
+            day = date.fromisoformat(query["day"]) if "day" in query else date.today()
+            return 200, {"day": day.isoformat(), "sessions": self.sessions.sessions(day)}, None
+        if path == "/sessions/export":
+            return self._export_session(query)
+        if path == "/sessions/compare":
+            return 200, compare(self.features, parse_time(query["start"]), int(query.get("k", 3)),
+                                query.get("align", "time")), None
+        if path == "/mean_max":
+            return self._mean_max_query(query)
+        if path == "/tracks":
+            return self._track_query(query)
+        raise HTTPError(404, f"No route for {path}")
+
+    def _range(self, query):
+        start = parse_time(query["start"])
+        end = parse_time(query["end"])
+        agg = query.get("agg", "mean")
+        if agg not in AGGREGATES:
+            raise HTTPError(400, f"agg must be one of {', '.join(AGGREGATES)}")
+        max_points = int(query["max_points"]) if "max_points" in query else None
+        bucket_s = float(query["bucket"]) if "bucket" in query else None
+
+        ts, bpms = self.store.read_range(start, end)
+        if max_points or bucket_s:
+            ts, values = downsample(ts, bpms, max_points=max_points, bucket_s=bucket_s, agg=agg)
+        else:
+            values = bpms
+
+        if query.get("format") == "bin":
+            return 200, pack_samples(ts, values), "application/octet-stream"
+        return 200, {"start": start, "end": end, "agg": agg, "count": len(ts),
+                     "t": list(ts), "bpm": list(values)}, None
+
+    def _export_session(self, query):
+        start = parse_time(query["start"])
+        fmt = query.get("format", "gpx")
+        if fmt not in CONTENT_TYPES:
+            raise HTTPError(400, f"format must be one of {', '.join(CONTENT_TYPES)}")
+        for session in self.sessions.sessions(datetime.fromtimestamp(start).date()):
+            if abs(session["start"] - start) < 1.0:
+                f = BytesIO()
+                write_session(self.store, self.tracks, session, fmt, f)
+                return 200, f.getvalue(), CONTENT_TYPES[fmt]
+        raise HTTPError(404, f"No session starting at {start}")
+
+    @property
+    def tracks(self):
+        # Opened on first use; most sessions never query by location
+        with self._lazy_lock:
+            if self._tracks is None:
+                self._tracks = TrackIndex(os.path.join(self.store.data_dir, TRACK_DIR))
+        return self._tracks
+
+    @property
+    def features(self):
+        # Session feature vectors for similarity search, also opened on first use
+        tracks = self.tracks
+        with self._lazy_lock:
+            if self._features is None:
+                self._features = FeatureIndex(self.sessions, tracks)
+        return self._features
+
+    @property
+    def mean_max(self):
+        tracks = self.tracks
+        with self._lazy_lock:
+            if self._mean_max is None:
+                self._mean_max = MeanMaxIndex(self.sessions, tracks)
+        return self._mean_max
+
+    def _mean_max_query(self, query):
+        self.mean_max.refresh()
+        if "start" in query:
+            return 200, {"curve": self.mean_max.curve(parse_time(query["start"]))}, None
+        scope = query.get("scope", ALL_TIME)
+        return 200, {"scope": scope, "envelope": self.mean_max.envelope(scope),
+                     "seasons": self.mean_max.seasons()}, None
+
+    def _track_query(self, query):
+        k = int(query.get("k", 5))
+        if "near" in query:
+            lat, lon = (float(v) for v in query["near"].split(","))
+            return 200, {"tracks": self.tracks.passing_through(lat, lon, float(query.get("radius", 250)))}, None
+        if "nearest" in query:
+            lat, lon = (float(v) for v in query["nearest"].split(","))
+            return 200, {"tracks": self.tracks.nearest_starts(lat, lon, k)}, None
+        if "similar" in query:
+            if query["similar"] not in self.tracks.tracks:
+                raise HTTPError(404, f"No track {query['similar']}")
+            return 200, {"tracks": self.tracks.similar_routes(query["similar"], k=k)}, None
+        raise HTTPError(400, "tracks needs near=, nearest= or similar=")
+
+    def _metrics(self, query):
+        day = date.fromisoformat(query["day"]) if "day" in query else date.today()
+        version = self.store.day_version(day)
+        if version is None:
+            return 200, {"day": day.isoformat(), "metrics": None}, None
+        max_gap = float(query.get("max_gap", MAX_GAP))
+        threshold = int(query.get("threshold", HIGH_BPM_THRESHOLD))
+        max_points = int(query["max_points"]) if "max_points" in query else None
+
+        def build():
+            ts, bpms = self.store.read_day(day)
+            if not ts:
+                return None
+            return compute_metrics(ts, bpms, max_gap=max_gap, high_bpm_threshold=threshold, max_points=max_points)
+
+        metrics = self.metrics_cache.get(("metrics", day, version, max_gap, threshold, max_points), build)
+        return 200, {"day": day.isoformat(), "metrics": metrics}, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HR data service")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args(argv)
+    instrumentation.configure_logging()
+    service = HRService(HRStore(args.data_dir), args.host, args.port)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+# utils/hr_store.py
+#
+# Read/append access to the per-day HR logs (data/hr_log_<date>.csv), and to
+# closed days compacted into data/archive/ (see utils/hr_archive.py). Samples
+# come back as parallel compact arrays (epoch seconds as float64, BPM as
+# uint16) rather than lists of (datetime, int) tuples.
+#
+# A BPM outside 0..MAX_BPM is a corrupt reading, not a heart rate: it is
+# dropped on append, and skipped when a log written before that is read,
+# so it never reaches the archive's int16 deltas or an upload.
+
+import logging
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from utils import instrumentation
+from utils.hr_archive import ARCHIVE_DIR, archive_path, read_archive, write_archive
+
+DAY_FILE_RE = re.compile(r"^hr_log_(\d{4}-\d{2}-\d{2})\.csv$")
+ARCHIVE_FILE_RE = re.compile(r"^hr_(\d{4}-\d{2}-\d{2})\.hrz$")
+CACHE_DAYS = 14  # parsed days kept in memory
+MAX_BPM = 300
+
+log = logging.getLogger("wearable.store")
+
+INVALID_BPM = instrumentation.counter("store.invalid_bpm")
+
+
+def _parse_lines(f, ts, bpms):
+    # Appends every complete line from f to the arrays; returns the bytes
+    # consumed so a partly written last line is picked up on the next read
+    consumed = 0
+    fromiso = datetime.fromisoformat
+    for line in f:
+        if not line.endswith(b"\n"):
+            break
+        consumed += len(line)
+        try:
+            t_str, bpm_str = line.decode().rstrip("\n").split(",")
+            bpm = int(bpm_str)
+            t = fromiso(t_str).timestamp()
+        except ValueError:
+            continue
+        if not 0 <= bpm <= MAX_BPM:
+            continue
+        ts.append(t)
+        bpms.append(bpm)
+    return consumed
+
+
+def read_log_file(path):
+    # Parses one hr_log CSV into (epoch seconds, bpm) arrays, skipping bad lines
+    ts = array("d")
+    bpms = array("H")
+    if not os.path.exists(path):
+        return ts, bpms
+    with open(path, "rb") as f:
+        _parse_lines(f, ts, bpms)
+    return ts, bpms
+
+
+def iter_log_file(path):
+    # Streams (epoch seconds, bpm) from an hr_log CSV without loading it
+    fromiso = datetime.fromisoformat
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                t_str, bpm_str = line.rstrip("\n").split(",")
+                t, bpm = fromiso(t_str).timestamp(), int(bpm_str)
+            except ValueError:
+                continue
+            if 0 <= bpm <= MAX_BPM:
+                yield t, bpm
+
+
+def _sorted_by_time(ts, bpms):
+    # Late samples appended to an archived day can land out of order
+    if all(a <= b for a, b in zip(ts, ts[1:])):
+        return ts, bpms
+    pairs = sorted(zip(ts, bpms))
+    return array("d", (t for t, _ in pairs)), array("H", (b for _, b in pairs))
+
+
+def _list_days(directory, pattern):
+    if not os.path.isdir(directory):
+        return set()
+    found = set()
+    for name in os.listdir(directory):
+        m = pattern.match(name)
+        if m:
+            found.add(date.fromisoformat(m.group(1)))
+    return found
+
+
+def _version(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class HRStore:
+    def __init__(self, data_dir="data"):
+        self.data_dir = data_dir
+        self._write_lock = threading.Lock()
+        # Held while reading day files and while compacting, so a reader never
+        # sees a day both archived and still in its CSV
+        self._read_lock = threading.Lock()
+        # day -> (archive version, CSV bytes parsed, ts, bpms). Day files are
+        # append-only, so a grown CSV only needs its new tail parsed.
+        self._cache = OrderedDict()
+
+    def day_path(self, day):
+        return os.path.join(self.data_dir, f"hr_log_{day.isoformat()}.csv")
+
+    def archive_path(self, day):
+        return archive_path(self.data_dir, day)
+
+    def csv_days(self):
+        return sorted(_list_days(self.data_dir, DAY_FILE_RE))
+
+    def archived_days(self):
+        return sorted(_list_days(os.path.join(self.data_dir, ARCHIVE_DIR), ARCHIVE_FILE_RE))
+
+    def days(self):
+        return sorted(_list_days(self.data_dir, DAY_FILE_RE)
+                      | _list_days(os.path.join(self.data_dir, ARCHIVE_DIR), ARCHIVE_FILE_RE))
+
+    def day_version(self, day):
+        # Changes whenever the day's data does
+        archived = _version(self.archive_path(day))
+        csv = _version(self.day_path(day))
+        if archived is None and csv is None:
+            return None
+        return archived, csv
+
+    def append_batch(self, batch):
+        # batch: iterable of (epoch_seconds, bpm); split across day files by local date
+        t0 = instrumentation.stopwatch()
+        lines_by_day = {}
+        invalid = 0
+        for t, bpm in batch:
+            if not 0 <= bpm <= MAX_BPM:
+                invalid += 1
+                continue
+            # With the UTC offset, so the hour repeated when DST ends still sorts
+            timestamp = datetime.fromtimestamp(t).astimezone()
+            lines_by_day.setdefault(timestamp.date(), []).append(f"{timestamp.isoformat()},{bpm}\n")
+
+        with self._write_lock:
+            os.makedirs(self.data_dir, exist_ok=True)
+            for day, lines in lines_by_day.items():
+                with open(self.day_path(day), "a") as f:
+                    f.writelines(lines)
+        if invalid:
+            INVALID_BPM.inc(invalid)
+            log.warning("Dropped %d sample(s) with BPM outside 0..%d", invalid, MAX_BPM)
+        instrumentation.LOG_FLUSH_US.record_since(t0)
+
+    def read_day(self, day):
+        # The returned arrays are shared with the cache; don't modify them
+        path = self.day_path(day)
+        with self._read_lock:
+            archived = _version(self.archive_path(day))
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                size = 0
+            if archived is None and not size:
+                self._cache.pop(day, None)
+                return array("d"), array("H")
+
+            cached = self._cache.get(day)
+            if cached and cached[0] == archived and cached[1] <= size:
+                self._cache.move_to_end(day)
+                if cached[1] == size:
+                    return cached[2], cached[3]
+                offset, ts, bpms = cached[1], array("d", cached[2]), array("H", cached[3])
+            elif archived is not None:
+                offset = 0
+                ts, bpms = read_archive(self.archive_path(day))
+            else:
+                offset, ts, bpms = 0, array("d"), array("H")
+
+            if size > offset:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    offset += _parse_lines(f, ts, bpms)
+                ts, bpms = _sorted_by_time(ts, bpms)
+
+            self._cache[day] = (archived, offset, ts, bpms)
+            self._cache.move_to_end(day)
+            while len(self._cache) > CACHE_DAYS:
+                self._cache.popitem(last=False)
+            return ts, bpms
+
+    def read_range(self, start, end):
+        # Samples with start <= t < end (epoch seconds), across day files.
+        # Each day is kept in time order, so it is a bisected slice.
+        ts = array("d")
+        bpms = array("H")
+        if end <= start:
+            return ts, bpms
+        day = datetime.fromtimestamp(start).date()
+        last_day = datetime.fromtimestamp(end).date()
+        while day <= last_day:
+            day_ts, day_bpms = self.read_day(day)
+            lo = bisect_left(day_ts, start)
+            hi = bisect_left(day_ts, end)
+            ts.extend(day_ts[lo:hi])
+            bpms.extend(day_bpms[lo:hi])
+            day += timedelta(days=1)
+        return ts, bpms
+
+    # ---------- archive ----------
+
+    def compact_day(self, day):
+        # Folds the day's CSV (and any earlier archive of it) into one archive
+        # file, then removes the CSV. Appends wait for the few ms this takes.
+        path = self.day_path(day)
+        with self._write_lock, self._read_lock:
+            if not os.path.exists(path):
+                return False
+            ts, bpms = read_log_file(path)
+            if os.path.exists(self.archive_path(day)):
+                old_ts, old_bpms = read_archive(self.archive_path(day))
+                ts, bpms = _sorted_by_time(old_ts + ts, old_bpms + bpms)
+            if ts:
+                write_archive(self.archive_path(day), ts, bpms)
+            os.remove(path)
+            self._cache.pop(day, None)
+            return True
+
+    def delete_day(self, day):
+        with self._write_lock, self._read_lock:
+            for path in (self.day_path(day), self.archive_path(day)):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._cache.pop(day, None)
+
+
+AGGREGATES = ("mean", "min", "max", "count")
+
+
+def downsample(ts, bpms, max_points=None, bucket_s=None, agg="mean"):
+    # Buckets samples into fixed-width time windows and aggregates each one.
+    # Either bucket_s is given, or it is chosen so at most max_points come back.
+    if agg not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate: {agg}")
+    if not ts:
+        return array("d"), array("d")
+    last_bucket = None
+    if bucket_s is None:
+        if not max_points or len(ts) <= max_points:
+            return array("d", ts), array("d", bpms)
+        bucket_s = max((ts[-1] - ts[0]) / max_points, 1e-6)
+        # The last sample sits exactly on the end of the span; keep it in
+        # the last bucket rather than opening one more
+        last_bucket = max_points - 1
+
+    out_t = array("d")
+    out_v = array("d")
+    origin = ts[0]
+    current = None
+    acc = count = 0
+    lo = hi = 0
+    for t, v in zip(ts, bpms):
+        bucket = int((t - origin) // bucket_s)
+        if last_bucket is not None and bucket > last_bucket:
+            bucket = last_bucket
+        if bucket != current:
+            if current is not None:
+                out_t.append(origin + current * bucket_s)
+                out_v.append(_finish(agg, acc, count, lo, hi))
+            current = bucket
+            acc = count = 0
+            lo = hi = v
+        acc += v
+        count += 1
+        if v < lo:
+            lo = v
+        if v > hi:
+            hi = v
+    out_t.append(origin + current * bucket_s)
+    out_v.append(_finish(agg, acc, count, lo, hi))
+    return out_t, out_v
+
+
+def _finish(agg, acc, count, lo, hi):
+    if agg == "mean":
+        return acc / count
+    if agg == "min":
+        return lo
+    if agg == "max":
+        return hi
+    return count
@@ -0,0 +1,252 @@
+# utils/instrumentation.py
+#
+# Lightweight counters, histograms, gauges and timers for the ingestion hot path.
+# Everything is off unless HR_METRICS=1 is set or set_enabled(True) is called
+# (the Settings diagnostics panel does this); while disabled, stopwatch()
+# returns 0 and every record call returns straight away.
+#
+#   t0 = instrumentation.stopwatch()
+#   ...work...
+#   DECODE_US.record_since(t0)
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+enabled = os.environ.get("HR_METRICS", "") not in ("", "0")
+
+_started = time.monotonic()
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+
+
+def set_enabled(value):
+    global enabled
+    enabled = bool(value)
+
+
+def stopwatch():
+    return time.perf_counter_ns() if enabled else 0
+
+
+class Counter:
+    RATE_WINDOW = 10  # seconds
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        # Per-second buckets for a rolling rate over the last RATE_WINDOW seconds
+        self._buckets = [0] * self.RATE_WINDOW
+        self._bucket_second = 0
+
+    def inc(self, n=1):
+        if not enabled:
+            return
+        self.count += n
+        second = int(time.monotonic())
+        if second != self._bucket_second:
+            self._roll(second)
+        self._buckets[second % self.RATE_WINDOW] += n
+
+    def _roll(self, second):
+        stale = min(second - self._bucket_second, self.RATE_WINDOW)
+        for s in range(second - stale + 1, second + 1):
+            self._buckets[s % self.RATE_WINDOW] = 0
+        self._bucket_second = second
+
+    def rate(self):
+        self._roll(int(time.monotonic()))
+        return sum(self._buckets) / self.RATE_WINDOW
+
+    def reset(self):
+        self.count = 0
+        self._buckets = [0] * self.RATE_WINDOW
+
+    def snapshot(self):
+        return {"count": self.count, "rate_per_s": round(self.rate(), 2)}
+
+
+class Histogram:
+    # Exact count/sum/min/max plus a ring of the most recent values for
+    # percentiles, so recording is O(1) and memory is fixed
+    RESERVOIR = 1024
+
+    def __init__(self, name, unit="us"):
+        self.name = name
+        self.unit = unit
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._recent = [0.0] * self.RESERVOIR
+        self._next = 0
+
+    def record(self, value):
+        if not enabled:
+            return
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self._recent[self._next] = value
+        self._next = (self._next + 1) % self.RESERVOIR
+
+    def record_since(self, start_ns):
+        # Records the elapsed time in microseconds since a stopwatch() start
+        if start_ns:
+            self.record((time.perf_counter_ns() - start_ns) / 1000.0)
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self):
+        recent = sorted(self._recent[:min(self.count, self.RESERVOIR)])
+
+        def pct(p):
+            return round(recent[min(len(recent) - 1, int(len(recent) * p / 100))], 2) if recent else None
+
+        return {
+            "unit": self.unit,
+            "count": self.count,
+            "mean": round(self.total / self.count, 2) if self.count else None,
+            "min": round(self.min, 2) if self.min is not None else None,
+            "max": round(self.max, 2) if self.max is not None else None,
+            "p50": pct(50),
+            "p99": pct(99),
+        }
+
+
+class Gauge:
+    # The current level of something (bytes held, queue depth), as last set
+    def __init__(self, name, unit=""):
+        self.name = name
+        self.unit = unit
+        self.value = None
+
+    def set(self, value):
+        if not enabled:
+            return
+        self.value = value
+
+    def reset(self):
+        self.value = None
+
+    def snapshot(self):
+        return {"unit": self.unit, "value": self.value}
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0
+
+    def __enter__(self):
+        self.start = stopwatch()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record_since(self.start)
+
+
+def counter(name):
+    with _lock:
+        if name not in _counters:
+            _counters[name] = Counter(name)
+        return _counters[name]
+
+
+def histogram(name, unit="us"):
+    with _lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(name, unit)
+        return _histograms[name]
+
+
+def gauge(name, unit=""):
+    with _lock:
+        if name not in _gauges:
+            _gauges[name] = Gauge(name, unit)
+        return _gauges[name]
+
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        histograms = dict(_histograms)
+        gauges = dict(_gauges)
+    return {
+        "enabled": enabled,
+        "taken": datetime.now().isoformat(timespec="seconds"),
+        "uptime_s": round(time.monotonic() - _started, 1),
+        "counters": {name: c.snapshot() for name, c in sorted(counters.items())},
+        "histograms": {name: h.snapshot() for name, h in sorted(histograms.items())},
+        "gauges": {name: g.snapshot() for name, g in sorted(gauges.items())},
+    }
+
+
+def snapshot_lines():
+    # Compact one-line-per-metric rendering for the Settings debug panels
+    snap = snapshot()
+    lines = []
+    for name, c in snap["counters"].items():
+        lines.append(f"{name}: {c['count']} ({c['rate_per_s']}/s)")
+    for name, h in snap["histograms"].items():
+        if h["count"]:
+            lines.append(f"{name}: n={h['count']} p50={h['p50']}{h['unit']} "
+                         f"p99={h['p99']}{h['unit']} max={h['max']}{h['unit']}")
+        else:
+            lines.append(f"{name}: n=0")
+    for name, g in snap["gauges"].items():
+        lines.append(f"{name}: {g['value']}{g['unit']}")
+    return lines
+
+
+def export_snapshot(path=None):
+    if path is None:
+        os.makedirs("data", exist_ok=True)
+        path = f"data/metrics_snapshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(path, "w") as f:
+        json.dump(snapshot(), f, indent=2)
+    return path
+
+
+def reset():
+    with _lock:
+        for c in _counters.values():
+            c.reset()
+        for h in _histograms.values():
+            h.reset()
+        for g in _gauges.values():
+            g.reset()
+
+
+def configure_logging(level=None):
+    # Per-packet diagnostics are logged at DEBUG; HR_LOG_LEVEL=DEBUG shows them
+    level = level or os.environ.get("HR_LOG_LEVEL", "INFO")
+    root = logging.getLogger("wearable")
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        root.addHandler(handler)
+        root.propagate = False
+    return root
+
+
+# Hot-path metrics shared by the BLE handler, loggers and screens
+NOTIFICATIONS = counter("ble.notifications")
+DECODE_ERRORS = counter("ble.decode_errors")
+DECODE_US = histogram("ble.decode_us")
+CALLBACK_US = histogram("ble.callback_us")
+LOG_FLUSH_US = histogram("log.flush_us")
+UI_UPDATE_US = histogram("ui.update_us")
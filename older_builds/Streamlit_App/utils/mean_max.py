@@ -0,0 +1,247 @@
+# utils/mean_max.py
+#
+# Mean-maximal curves: for each duration in DURATIONS_S, the highest heart
+# rate held on average for that long, and the most distance covered in that
+# long (the best pace), within one session and over all of history.
+#
+# A session's curve comes from its 1 Hz series (utils/session_compare.py's
+# session_series with step=1). For each duration w the best window is found
+# with prefix sums: the mean of every w-second window is (c[i + w] - c[i]) / w,
+# one vectorised pass, O(n) per duration. Distance works the same way on the
+# cumulative distance along the session's GPS track, so pace needs GPS and
+# windows without a fix never win.
+#
+# MeanMaxIndex keeps every session's curve in data/mean_max.json, updated
+# per day like utils/sessions.py's summaries, and the envelopes over them:
+# all-time and one per calendar year ("season"), each with the session that
+# holds each record. A new session only raises an envelope where it beats
+# it, so history is never rescanned. Only when a session holding a record
+# changes or disappears is that envelope rebuilt, from the stored curves
+# rather than from samples.
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from utils import instrumentation
+from utils.session_compare import session_series
+
+log = logging.getLogger("wearable.meanmax")
+
+DURATIONS_S = (5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 5400, 7200, 10800)
+HEADLINE_S = (60, 300, 1200, 3600)   # the 1/5/20/60-minute bests the screens show
+MIN_DISTANCE_M = 1.0                 # less than this in a window means no GPS
+INDEX_FILE = "mean_max.json"
+ALL_TIME = "all"
+
+CURVE_US = instrumentation.histogram("meanmax.curve_us")
+
+
+def best_means(values, durations=DURATIONS_S):
+    # [(best mean, start index) or None, ...]: the highest mean of any
+    # window of each duration on a 1 Hz series
+    values = np.asarray(values, dtype=np.float64)
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    best = []
+    for w in durations:
+        if w > len(values):
+            best.append(None)
+            continue
+        means = (sums[w:] - sums[:-w]) / w
+        i = int(np.argmax(means))
+        best.append((float(means[i]), i))
+    return best
+
+
+def best_distances(distance, durations=DURATIONS_S):
+    # [metres or None, ...]: the most distance covered in any window of each
+    # duration, from cumulative distance at 1 Hz
+    best = []
+    for w in durations:
+        if w >= len(distance):
+            best.append(None)
+            continue
+        metres = float(np.max(distance[w:] - distance[:-w]))
+        best.append(metres if metres >= MIN_DISTANCE_M else None)
+    return best
+
+
+def session_curve(store, tracks, session, durations=DURATIONS_S):
+    # {"bpm": [...], "distance": [...]}, None where the session is shorter
+    # than the duration (or had no GPS for distance)
+    t0 = instrumentation.stopwatch()
+    series = session_series(store, tracks, session, step=1)
+    bpm = [None if b is None else round(b[0], 1) for b in best_means(series["bpm"], durations)]
+    if series["distance"] is None:
+        distance = [None] * len(durations)
+    else:
+        distance = [None if d is None else round(d, 1) for d in best_distances(series["distance"], durations)]
+    CURVE_US.record_since(t0)
+    return {"bpm": bpm, "distance": distance}
+
+
+def pace_s_km(metres, seconds):
+    return round(seconds / metres * 1000, 1) if metres else None
+
+
+def season(start):
+    return str(datetime.fromtimestamp(start).year)
+
+
+def _empty_envelope(n):
+    return {"bpm": [None] * n, "bpm_start": [None] * n, "distance": [None] * n, "distance_start": [None] * n}
+
+
+def _raise(envelope, start, curve):
+    # Lifts the envelope to this session's curve wherever it's higher
+    for metric in ("bpm", "distance"):
+        held, holder = envelope[metric], envelope[f"{metric}_start"]
+        for i, value in enumerate(curve[metric]):
+            if value is not None and (held[i] is None or value > held[i]):
+                held[i] = value
+                holder[i] = start
+
+
+class MeanMaxIndex:
+    def __init__(self, sessions, tracks=None, path=None, durations=DURATIONS_S):
+        self.sessions = sessions     # a utils.sessions.SessionIndex
+        self.store = sessions.store
+        self.tracks = tracks
+        self.durations = tuple(durations)
+        self.path = path or os.path.join(self.store.data_dir, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._index = self._load()
+
+    def _fresh(self):
+        return {"durations": list(self.durations), "tracks": [], "days": {}, "envelopes": {}}
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return self._fresh()
+        if index.get("durations") != list(self.durations):
+            log.info("Durations changed; recomputing mean-maximal curves")
+            return self._fresh()
+        return index
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def _track_days(self):
+        # Days whose sessions a newly added (or re-imported) track may cover
+        known = set(self._index["tracks"])
+        current = {f"{m['id']}@{m['offset']}": m for m in self.tracks.tracks.values()} if self.tracks else {}
+        added = [current[k] for k in current.keys() - known]
+        self._index["tracks"] = sorted(current)
+        return {datetime.fromtimestamp(t).date().isoformat() for m in added for t in (m["start"], m["end"])}
+
+    def refresh(self):
+        # Brings curves and envelopes up to date; cheap when nothing changed
+        with self._lock:
+            dirty = self._track_days()
+            days = {day.isoformat(): day for day in self.store.days()}
+            envelopes = self._index["envelopes"]
+            stale = set()    # envelopes that lost a record holder
+            changed = bool(dirty)
+            for key in self._index["days"].keys() - days.keys():
+                stale |= self._dropped(self._index["days"].pop(key)["rows"])
+                changed = True
+            for key, day in days.items():
+                version = self.sessions._version(day)
+                cached = self._index["days"].get(key)
+                if cached and cached["version"] == version and key not in dirty:
+                    continue
+                if cached:
+                    stale |= self._dropped(cached["rows"])
+                rows = [[s["start"], s["workout"], session_curve(self.store, self.tracks, s, self.durations)]
+                        for s in self.sessions.sessions(day)]
+                self._index["days"][key] = {"version": version, "rows": rows}
+                for start, _, curve in rows:
+                    for scope in (ALL_TIME, season(start)):
+                        _raise(envelopes.setdefault(scope, _empty_envelope(len(self.durations))), start, curve)
+                changed = True
+            for scope in stale:
+                self._rebuild(scope)
+            if changed:
+                self._save()
+
+    def _dropped(self, rows):
+        # Envelopes that one of these (outgoing) sessions holds a record in
+        starts = {row[0] for row in rows}
+        stale = set()
+        for scope, envelope in self._index["envelopes"].items():
+            if starts & set(envelope["bpm_start"] + envelope["distance_start"]):
+                stale.add(scope)
+        return stale
+
+    def _rebuild(self, scope):
+        envelope = _empty_envelope(len(self.durations))
+        for day in self._index["days"].values():
+            for start, _, curve in day["rows"]:
+                if scope == ALL_TIME or season(start) == scope:
+                    _raise(envelope, start, curve)
+        if any(v is not None for v in envelope["bpm"] + envelope["distance"]):
+            self._index["envelopes"][scope] = envelope
+        else:
+            self._index["envelopes"].pop(scope, None)
+
+    def _answer(self, curve, holders=None):
+        answer = {"durations": list(self.durations), "bpm": curve["bpm"],
+                  "pace_s_km": [pace_s_km(m, w) for m, w in zip(curve["distance"], self.durations)]}
+        if holders:
+            answer["bpm_start"], answer["pace_start"] = holders
+        return answer
+
+    def envelope(self, scope=ALL_TIME):
+        # Best heart rate and pace per duration over `scope` ("all" or a
+        # year), with the start of the session holding each; as stored, so
+        # call refresh() first for anything recorded since
+        with self._lock:
+            envelope = self._index["envelopes"].get(scope)
+            if envelope is None:
+                return None
+            return self._answer(envelope, (envelope["bpm_start"], envelope["distance_start"]))
+
+    def seasons(self):
+        with self._lock:
+            return sorted(scope for scope in self._index["envelopes"] if scope != ALL_TIME)
+
+    def curve(self, start):
+        # One session's curve, by its start time
+        with self._lock:
+            day = self._index["days"].get(datetime.fromtimestamp(start).date().isoformat())
+            for row_start, _, curve in day["rows"] if day else ():
+                if abs(row_start - start) < 0.5:
+                    return self._answer(curve)
+        raise KeyError(f"No session starting at {start}")
+
+
+def format_pace(s_km):
+    if s_km is None:
+        return "--"
+    minutes, seconds = divmod(int(round(s_km)), 60)
+    return f"{minutes}:{seconds:02d} /km"
+
+
+def headline(answer, durations=HEADLINE_S):
+    # [(minutes, bpm or None, pace s/km or None), ...] at the headline
+    # durations, for the metrics screens
+    at = {w: i for i, w in enumerate(answer["durations"])} if answer else {}
+    return [(w // 60, answer["bpm"][at[w]] if w in at else None, answer["pace_s_km"][at[w]] if w in at else None)
+            for w in durations]
+
+
+def describe_best(minutes, bpm, pace):
+    # "Best 5 min: 171 bpm, 4:35 /km"
+    text = f"Best {minutes} min: " + (f"{bpm:.0f} bpm" if bpm is not None else "--")
+    return text + (f", {format_pace(pace)}" if pace is not None else "")
@@ -0,0 +1,324 @@
+# utils/motion.py
+#
+# Accelerometer stream from the wearable's LSM6DS3, alongside heart rate.
+#
+# Wire format, little-endian: BLE notifications on MOTION_UUID, and the same
+# packets back to back in IMnnnn.BIN (one per boot) on the SD card:
+#
+#   header  uint8 version (1), uint8 rate (Hz), uint16 count, uint32 millis() of the first sample
+#   body    count x int16 (x, y, z) in milli-g
+#
+# 25 samples at 50 Hz is a 158-byte notification twice a second, and
+# decode_packet() is a numpy view over the body rather than a per-sample
+# parse.
+#
+# MotionTracker gathers samples into EPOCH_S windows and computes, over each
+# window at once:
+#
+#   enmo      mean of max(|a| - 1 g, 0): acceleration beyond gravity
+#   counts    rectified, gravity-removed magnitude summed over the window
+#             (g*s), an activity-count style intensity
+#   steps     peaks of the smoothed magnitude above STEP_THRESHOLD_G, at
+#             least STEP_MIN_INTERVAL_S apart, carried across windows
+#
+# and classifies it as still / light / walk / run / active (moving without
+# steps: cycling, rowing, lifting). Only the current window's raw samples
+# are held; each finished window becomes one row of a preallocated per-day
+# array (about 330 KB at 5 s epochs), so memory doesn't grow with the day.
+# With a data_dir, rows are also appended to data/activity_log_<date>.csv
+# and reloaded after a restart.
+#
+#   python -m utils.motion IM0001.BIN --start 2025-07-20T09:00:00
+
+import argparse
+import logging
+import os
+import struct
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from utils import instrumentation
+from utils.timebase import DriftEstimator, now_ns, timebase
+
+log = logging.getLogger("wearable.motion")
+
+MOTION_UUID = "7e1a0002-5f3c-4b8e-9d6a-2c1f0e9b7a51"  # vendor characteristic on the wearable
+VERSION = 1
+HEADER = struct.Struct("<BBHI")
+SAMPLE_BYTES = 6
+RATE_HZ = 50
+PACKET_SAMPLES = 25
+
+EPOCH_S = 5
+SMOOTH_S = 0.1
+STEP_THRESHOLD_G = 0.12
+STEP_MIN_INTERVAL_S = 0.25
+STILL_ENMO_G = 0.008
+ACTIVE_ENMO_G = 0.025
+WALK_CADENCE = 60     # steps per minute
+RUN_CADENCE = 140
+
+ACTIVITIES = ("still", "light", "walk", "run", "active")
+MOVING = (ACTIVITIES.index("walk"), ACTIVITIES.index("run"), ACTIVITIES.index("active"))
+EPOCH_DTYPE = np.dtype([("t", "<f8"), ("enmo_mg", "<f4"), ("counts", "<f4"),
+                        ("steps", "<u2"), ("activity", "u1")])
+
+EPOCH_US = instrumentation.histogram("motion.epoch_us")
+PACKETS = instrumentation.counter("motion.packets")
+DECODE_ERRORS = instrumentation.counter("motion.decode_errors")
+
+
+def encode_packet(t0_ms, samples_mg, rate_hz=RATE_HZ):
+    # samples_mg: (n, 3) integers in milli-g
+    body = np.asarray(samples_mg, dtype="<i2")
+    return HEADER.pack(VERSION, rate_hz, len(body), int(t0_ms) & 0xFFFFFFFF) + body.tobytes()
+
+
+def decode_packet(payload):
+    # Returns (t0_ms, rate_hz, (n, 3) int16 milli-g view of payload)
+    version, rate_hz, count, t0_ms = HEADER.unpack_from(payload)
+    if version != VERSION or len(payload) < HEADER.size + count * SAMPLE_BYTES or not rate_hz:
+        raise ValueError("Not a motion packet")
+    samples = np.frombuffer(payload, dtype="<i2", count=count * 3, offset=HEADER.size)
+    return t0_ms, rate_hz, samples.reshape(count, 3)
+
+
+def iter_packets(blob):
+    # Packets stored back to back (IMnnnn.BIN); stops at a truncated tail
+    offset = 0
+    while offset + HEADER.size <= len(blob):
+        count = HEADER.unpack_from(blob, offset)[2]
+        end = offset + HEADER.size + count * SAMPLE_BYTES
+        if end > len(blob):
+            break
+        yield decode_packet(memoryview(blob)[offset:end])
+        offset = end
+
+
+def classify(enmo_g, cadence):
+    if enmo_g < STILL_ENMO_G:
+        return ACTIVITIES.index("still")
+    if cadence >= RUN_CADENCE:
+        return ACTIVITIES.index("run")
+    if cadence >= WALK_CADENCE:
+        return ACTIVITIES.index("walk")
+    if enmo_g >= ACTIVE_ENMO_G:
+        return ACTIVITIES.index("active")
+    return ACTIVITIES.index("light")
+
+
+def activity_log_path(data_dir, day):
+    return os.path.join(data_dir, f"activity_log_{day.isoformat()}.csv")
+
+
+def read_activity_log(path):
+    # (t, enmo_mg, counts, steps, activity index) rows of an activity log,
+    # skipping any line that doesn't parse
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    with open(path) as f:
+        for line in f:
+            try:
+                ts, steps, enmo, counts, activity = line.rstrip("\n").split(",")
+                rows.append((datetime.fromisoformat(ts).timestamp(), float(enmo), float(counts),
+                             int(steps), ACTIVITIES.index(activity)))
+            except ValueError:
+                continue
+    return rows
+
+
+class MotionTracker:
+    def __init__(self, rate_hz=RATE_HZ, epoch_s=EPOCH_S, data_dir=None, clock=timebase):
+        self.epoch_s = epoch_s
+        self.data_dir = data_dir
+        self.clock = clock
+        self.drift = DriftEstimator("imu")
+        self.epochs = np.zeros(86400 // epoch_s + 1, dtype=EPOCH_DTYPE)
+        self.count = 0
+        self.day = None
+        self.steps_today = 0
+        self.activity = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._set_rate(rate_hz)
+
+    def _set_rate(self, rate_hz):
+        self.rate_hz = rate_hz
+        self._window = np.empty((rate_hz * self.epoch_s, 3), dtype=np.float32)
+        self._fill = 0
+        width = max(1, round(SMOOTH_S * rate_hz))
+        self._smooth = np.full(width, 1.0 / width, dtype=np.float32)
+        self._tail = np.zeros(len(self._smooth) + 1, dtype=np.float32)
+        self._sample_index = 0
+        self._last_step = -(1 << 62)
+
+    def subscribe(self, cb):
+        # cb(epoch dict) for every finished window
+        if cb not in self._subscribers:
+            self._subscribers.append(cb)
+
+    def ingest_packet(self, payload):
+        # BLE notification handler (HRMonitor.on_motion_callback)
+        PACKETS.inc()
+        try:
+            t0_ms, rate_hz, samples = decode_packet(payload)
+        except (ValueError, struct.error):
+            DECODE_ERRORS.inc()
+            log.warning("Malformed motion packet: %s", bytes(payload[:16]).hex())
+            return
+        self.ingest(t0_ms, samples, rate_hz)
+
+    def ingest(self, t0_ms, samples_mg, rate_hz=None, t=None):
+        # samples_mg: (n, 3) milli-g; t: epoch seconds of the last sample
+        # (default: now, as the packet has just arrived)
+        n = len(samples_mg)
+        if not n:
+            return
+        if rate_hz and rate_hz != self.rate_hz:
+            self._set_rate(rate_hz)
+        last_ms = t0_ms + (n - 1) * 1000 / self.rate_hz
+        if t is None:
+            mono = now_ns()
+            self.drift.add(mono, last_ms / 1000.0)
+            t = self.clock.to_wall(mono)
+        finished = []
+        with self._lock:
+            done = 0
+            size = len(self._window)
+            while done < n:
+                take = min(n - done, size - self._fill)
+                self._window[self._fill:self._fill + take] = samples_mg[done:done + take]
+                self._fill += take
+                done += take
+                if self._fill == size:
+                    finished.append(self._close_epoch(t - (n - done) / self.rate_hz))
+                    self._fill = 0
+        for epoch in finished:
+            for cb in self._subscribers:
+                cb(epoch)
+
+    def _close_epoch(self, t):
+        t0 = instrumentation.stopwatch()
+        acc = self._window
+        acc *= 0.001  # milli-g -> g, in place
+        mag = np.sqrt(np.einsum("ij,ij->i", acc, acc))
+        enmo = float(np.maximum(mag - 1.0, 0.0).mean())
+        counts = float(np.abs(mag - mag.mean()).sum() / self.rate_hz)
+        steps = self._count_steps(mag)
+        cadence = steps * 60.0 / self.epoch_s
+        activity = classify(enmo, cadence)
+
+        day = datetime.fromtimestamp(t).date()
+        if day != self.day:
+            self._start_day(day)
+        if self.count < len(self.epochs):
+            self.epochs[self.count] = (t, enmo * 1000, counts, steps, activity)
+            self.count += 1
+        self.steps_today += steps
+        self.activity = ACTIVITIES[activity]
+        epoch = {"t": t, "enmo_mg": round(enmo * 1000, 1), "counts": round(counts, 3),
+                 "steps": steps, "activity": self.activity}
+        if self.data_dir:
+            self._append_log(epoch)
+        EPOCH_US.record_since(t0)
+        return epoch
+
+    def _count_steps(self, mag):
+        # Peaks of the smoothed dynamic magnitude. The previous window's last
+        # len(kernel) + 1 samples go in front, so the smoothing is exact at
+        # the boundary and each sample is judged as a peak exactly once: the
+        # previous window's last one needed this window's first to decide.
+        k = len(self._tail)
+        signal = np.concatenate((self._tail, mag - 1.0))
+        self._tail = signal[-k:].copy()
+        smooth = np.convolve(signal, self._smooth, mode="valid")
+        mid = smooth[1:-1]
+        peaks = np.flatnonzero((mid > smooth[:-2]) & (mid >= smooth[2:]) & (mid > STEP_THRESHOLD_G)) + 1
+        # Sample index of each peak since the tracker started
+        peaks = peaks + (self._sample_index - k + len(self._smooth) // 2)
+        self._sample_index += len(mag)
+
+        min_gap = STEP_MIN_INTERVAL_S * self.rate_hz
+        steps = 0
+        last = self._last_step
+        for p in peaks.tolist():
+            if p - last >= min_gap:
+                steps += 1
+                last = p
+        self._last_step = last
+        return steps
+
+    def _start_day(self, day):
+        self.day = day
+        self.count = 0
+        self.steps_today = 0
+        if self.data_dir:
+            self._load_log(day)
+
+    def _log_path(self, day):
+        return activity_log_path(self.data_dir, day)
+
+    def _append_log(self, epoch):
+        os.makedirs(self.data_dir, exist_ok=True)
+        with open(self._log_path(self.day), "a") as f:
+            f.write(f"{datetime.fromtimestamp(epoch['t']).isoformat()},{epoch['steps']},"
+                    f"{epoch['enmo_mg']},{epoch['counts']},{epoch['activity']}\n")
+
+    def _load_log(self, day):
+        # Picks today back up after a restart
+        for row in read_activity_log(self._log_path(day)):
+            if self.count < len(self.epochs):
+                self.epochs[self.count] = row
+                self.count += 1
+            self.steps_today += row[3]
+
+    def is_active(self, within_s=60):
+        # Whether any epoch in the last `within_s` seconds was walking,
+        # running or otherwise moving (hr_alerts uses this for "at rest")
+        with self._lock:
+            recent = self.epochs[max(0, self.count - max(1, within_s // self.epoch_s)):self.count]
+            recent = recent[recent["t"] >= self.clock.wall_now() - within_s]
+            return bool(np.isin(recent["activity"], MOVING).any())
+
+    def summary(self):
+        # Steps and minutes per activity for the current day
+        with self._lock:
+            epochs = self.epochs[:self.count]
+            minutes = np.bincount(epochs["activity"], minlength=len(ACTIVITIES)) * self.epoch_s / 60
+            return {
+                "day": self.day.isoformat() if self.day else None,
+                "steps": self.steps_today,
+                "activity": self.activity,
+                "minutes": {name: round(float(m), 1) for name, m in zip(ACTIVITIES, minutes)},
+                "counts": round(float(epochs["counts"].sum()), 1),
+            }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise a motion log (IMnnnn.BIN) from the wearable's SD card")
+    parser.add_argument("path")
+    parser.add_argument("--start", required=True, help="wall time of the first sample (ISO)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    start = datetime.fromisoformat(args.start).timestamp()
+    with open(args.path, "rb") as f:
+        blob = f.read()
+    tracker = MotionTracker()
+    first_ms = None
+    for t0_ms, rate_hz, samples in iter_packets(blob):
+        if first_ms is None:
+            first_ms = t0_ms
+        last = start + (t0_ms - first_ms + (len(samples) - 1) * 1000 / rate_hz) / 1000
+        tracker.ingest(t0_ms, samples, rate_hz, t=last)
+    summary = tracker.summary()
+    log.info("👟 %d steps", summary["steps"])
+    for name, minutes in summary["minutes"].items():
+        log.info("  %-7s %6.1f min", name, minutes)
+
+
+if __name__ == "__main__":
+    main()
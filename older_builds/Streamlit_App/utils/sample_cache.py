@@ -0,0 +1,160 @@
+# utils/sample_cache.py
+#
+# Raw heart-rate samples of workout sessions, for the graphs the workout
+# log draws when an entry is expanded. A year of sessions doesn't fit in
+# memory as (datetime, int) tuples (100+ bytes a sample), and loading one
+# only when it's expanded makes every expand wait on the store. So:
+#
+#   - a session is held as two arrays: float32 seconds since its start and
+#     uint16 bpm, 6 bytes a sample (an hour at 1 Hz is about 21 KiB)
+#   - sessions are kept least-recently-used first, and dropped once the
+#     total passes budget_bytes (HR_SAMPLE_CACHE_MB, default 32)
+#   - prefetch(sessions) loads the given sessions on a background thread,
+#     nearest first; the workout log calls it with the entries around the
+#     visible scroll position. A newer prefetch() replaces the queue of an
+#     older one, so flinging through the list never builds a backlog.
+#
+#   cache = SampleCache(lambda start, end: client.range(start, end))
+#   series = cache.peek(session)      # None unless already loaded
+#   series = cache.get(session)       # loads on a miss
+#   series.minutes(), series.bpm
+#
+# stats() reports entries, bytes held against the budget, hits, misses,
+# prefetched loads and evictions; sample_cache.bytes is the same figure as
+# an instrumentation gauge.
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils import instrumentation
+
+log = logging.getLogger("wearable.samples")
+
+BUDGET_BYTES = int(float(os.environ.get("HR_SAMPLE_CACHE_MB", 32)) * (1 << 20))
+ENTRY_OVERHEAD = 256  # the SessionSamples object and two array headers
+PREFETCH_WORKERS = 1
+
+CACHE_BYTES = instrumentation.gauge("sample_cache.bytes", "B")
+LOAD_US = instrumentation.histogram("sample_cache.load_us")
+
+
+class SessionSamples:
+    __slots__ = ("start", "offsets", "bpm")
+
+    def __init__(self, start, ts, bpms):
+        self.start = start
+        self.offsets = (np.asarray(ts, dtype=np.float64) - start).astype(np.float32)
+        self.bpm = np.asarray(bpms).astype(np.uint16)
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.bpm.nbytes + ENTRY_OVERHEAD
+
+    def __len__(self):
+        return len(self.bpm)
+
+    def minutes(self):
+        return self.offsets / np.float32(60)
+
+
+def _key(session):
+    return session["start"], session["end"]
+
+
+class SampleCache:
+    def __init__(self, fetch, budget_bytes=BUDGET_BYTES):
+        self.fetch = fetch            # fetch(start, end) -> (timestamps, bpms)
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()  # (start, end) -> SessionSamples
+        self._bytes = 0
+        self._loading = {}            # (start, end) -> lock held while loading it
+        self._lock = threading.Lock()
+        self._prefetcher = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="sample-prefetch")
+        self._generation = 0
+        self._stats = {"hits": 0, "misses": 0, "prefetched": 0, "evicted": 0}
+
+    def peek(self, session):
+        # The session's samples if they're already held; never loads
+        with self._lock:
+            series = self._entries.get(_key(session))
+            if series is not None:
+                self._entries.move_to_end(_key(session))
+                self._stats["hits"] += 1
+            return series
+
+    def get(self, session):
+        series = self.peek(session)
+        if series is not None:
+            return series
+        return self._load(session, prefetch=False)
+
+    def _load(self, session, prefetch):
+        key = _key(session)
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            # A prefetch may have loaded it while we waited
+            with self._lock:
+                series = self._entries.get(key)
+                if series is not None:
+                    if not prefetch:
+                        self._entries.move_to_end(key)
+                        self._stats["hits"] += 1
+                    return series
+            t0 = instrumentation.stopwatch()
+            ts, bpms = self.fetch(session["start"], session["end"] + 1)
+            series = SessionSamples(session["start"], ts, bpms)
+            LOAD_US.record_since(t0)
+            self._add(key, series, prefetch)
+        with self._lock:
+            self._loading.pop(key, None)
+        return series
+
+    def _add(self, key, series, prefetch):
+        with self._lock:
+            self._stats["prefetched" if prefetch else "misses"] += 1
+            if series.nbytes > self.budget_bytes:
+                return
+            self._entries[key] = series
+            self._bytes += series.nbytes
+            while self._bytes > self.budget_bytes:
+                _, dropped = self._entries.popitem(last=False)
+                self._bytes -= dropped.nbytes
+                self._stats["evicted"] += 1
+            CACHE_BYTES.set(self._bytes)
+
+    def prefetch(self, sessions):
+        # Loads these sessions in the background, in the order given; a
+        # later call replaces whatever of this one hasn't started yet
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            wanted = [s for s in sessions if _key(s) not in self._entries]
+        for session in wanted:
+            self._prefetcher.submit(self._prefetch_one, session, generation)
+
+    def _prefetch_one(self, session, generation):
+        if generation != self._generation:
+            return
+        try:
+            self._load(session, prefetch=True)
+        except Exception as e:
+            log.warning("⚠️ Couldn't prefetch session at %s: %s", session["start"], e)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            CACHE_BYTES.set(0)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(entries=len(self._entries), bytes=self._bytes, budget_bytes=self.budget_bytes,
+                         samples=sum(len(s) for s in self._entries.values()))
+        return stats
@@ -0,0 +1,660 @@
+# utils/sd_transfer.py
+#
+# Pulls the wearable's SD logs over its USB serial port with a framed,
+# checksummed binary protocol, instead of the old CSV printed as text and
+# deleted whether or not anyone was listening.
+#
+# Frame, little-endian:
+#
+#   A5 5A | uint8 type | uint16 seq | uint16 length | payload | uint32 CRC-32
+#
+# The CRC (zlib's) covers type through payload. The reader resyncs on A5 5A,
+# so debug text the firmware prints between frames is skipped.
+#
+#   host -> device                        device -> host
+#   HELLO                                 INFO  version, boot, millis, files
+#   READ   name, offset, length           DATA  offset, bytes
+#   DELETE name, size, CRC of the file    ACK, or NAK code
+#
+# The device deletes a file only when size and CRC match what it has, so
+# nothing is lost to a dropped link or a file still being written.
+#
+# Files (one of each per boot, see arduino_code/SummerWearable.ino):
+#
+#   HRnnnn.BIN   14-byte samples: uint8 1, uint32 millis, uint8 bpm (0 none),
+#                int32 lat, int32 lon (1e-7 degrees, INT32_MIN without a fix);
+#                9-byte anchors: uint8 2, uint32 millis, uint32 GPS UTC time
+#   IMnnnn.BIN   motion packets (utils/motion.py)
+#
+# Chunks are requested WINDOW at a time and written to
+# data/transfer/<name>.part as they arrive, so an interrupted pull resumes
+# from the bytes already on disk. HR samples go into the HR store as they
+# decode, less those BLE already recorded live: each batch is merged against
+# the store's samples for its span (utils/hr_merge.py), the live log taking
+# priority, so a workout that was also streamed is stored once. Once a file
+# is complete its GPS fixes go into the track index and its motion into the
+# activity log. Millis become wall time through the host's clock for the
+# current boot's files, and through the GPS anchors for older ones.
+#
+#   python -m utils.sd_transfer /dev/tty.usbmodem1101
+
+import argparse
+import json
+import logging
+import os
+import select
+import struct
+import termios
+import threading
+import time
+import tty
+import zlib
+from datetime import datetime
+
+from utils import instrumentation
+from utils.geo_index import TRACK_DIR, TrackIndex, split_tracks
+from utils.hr_merge import ARDUINO_PRIORITY, LOG_PRIORITY, Source, merge
+from utils.hr_store import HRStore
+from utils.motion import MotionTracker, iter_packets
+
+log = logging.getLogger("wearable.transfer")
+
+SYNC = b"\xa5\x5a"
+HEADER = struct.Struct("<2sBHH")
+CRC = struct.Struct("<I")
+MAX_PAYLOAD = 1024
+
+HELLO, READ, DELETE = 0x01, 0x02, 0x03
+INFO, DATA, ACK, NAK = 0x81, 0x82, 0x83, 0x84
+NAK_REASONS = {1: "no such file", 2: "size changed", 3: "checksum mismatch", 4: "bad request"}
+
+NAME = struct.Struct("<12s")
+INFO_HEAD = struct.Struct("<BHIB")      # version, boot, millis, file count
+INFO_FILE = struct.Struct("<12sI")      # name, size
+READ_REQ = struct.Struct("<12sIH")      # name, offset, length
+DELETE_REQ = struct.Struct("<12sII")    # name, size, crc32
+DATA_HEAD = struct.Struct("<I")         # offset
+
+SAMPLE = struct.Struct("<BIBii")
+ANCHOR = struct.Struct("<BII")
+REC_SAMPLE, REC_ANCHOR = 1, 2
+NO_FIX = -(1 << 31)
+
+PROTOCOL_VERSION = 1
+CHUNK = 512
+WINDOW = 8
+TIMEOUT_S = 1.0
+RETRIES = 5
+TRANSFER_DIR = "transfer"
+
+CHUNK_US = instrumentation.histogram("transfer.chunk_us")
+RETRANSMITS = instrumentation.counter("transfer.retransmits")
+BAD_FRAMES = instrumentation.counter("transfer.bad_frames")
+DUPLICATES = instrumentation.counter("transfer.duplicate_samples")
+
+
+class TransferError(Exception):
+    pass
+
+
+# ---------- framing ----------
+
+def encode_frame(kind, seq, payload=b""):
+    body = HEADER.pack(SYNC, kind, seq & 0xFFFF, len(payload))[2:] + payload
+    return SYNC + body + CRC.pack(zlib.crc32(body))
+
+
+class FrameReader:
+    # Feed it bytes as they arrive; yields (type, seq, payload) for every
+    # frame with a good CRC and skips everything else
+    def __init__(self):
+        self._buf = bytearray()
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        frames = []
+        while True:
+            start = buf.find(SYNC)
+            if start < 0:
+                # Keep a trailing A5 in case the 5A is in the next read
+                del buf[:max(0, len(buf) - 1)]
+                return frames
+            if start:
+                del buf[:start]
+            if len(buf) < HEADER.size:
+                return frames
+            _, kind, seq, length = HEADER.unpack_from(buf)
+            if length > MAX_PAYLOAD:
+                BAD_FRAMES.inc()
+                del buf[:2]
+                continue
+            end = HEADER.size + length + CRC.size
+            if len(buf) < end:
+                return frames
+            body = bytes(buf[2:HEADER.size + length])
+            if CRC.unpack_from(buf, HEADER.size + length)[0] != zlib.crc32(body):
+                BAD_FRAMES.inc()
+                del buf[:2]
+                continue
+            frames.append((kind, seq, body[HEADER.size - 2:]))
+            del buf[:end]
+
+
+# ---------- records ----------
+
+def encode_sample(millis, bpm, lat=None, lon=None):
+    lat_e7 = NO_FIX if lat is None else int(round(lat * 1e7))
+    lon_e7 = NO_FIX if lon is None else int(round(lon * 1e7))
+    return SAMPLE.pack(REC_SAMPLE, millis & 0xFFFFFFFF, max(0, min(255, int(bpm or 0))), lat_e7, lon_e7)
+
+
+def encode_anchor(millis, unix_s):
+    return ANCHOR.pack(REC_ANCHOR, millis & 0xFFFFFFFF, int(unix_s))
+
+
+class RecordDecoder:
+    # Incremental HRnnnn.BIN decoder: feed() returns complete records as
+    # ("sample", millis, bpm, lat, lon) / ("anchor", millis, unix_s) and
+    # keeps any partial one for the next chunk
+    def __init__(self):
+        self._tail = b""
+        self.consumed = 0
+
+    def feed(self, data):
+        buf = self._tail + bytes(data)
+        records = []
+        i = 0
+        n = len(buf)
+        while i < n:
+            kind = buf[i]
+            if kind == REC_SAMPLE:
+                if i + SAMPLE.size > n:
+                    break
+                _, millis, bpm, lat, lon = SAMPLE.unpack_from(buf, i)
+                records.append(("sample", millis, bpm,
+                                None if lat == NO_FIX else lat / 1e7, None if lon == NO_FIX else lon / 1e7))
+                i += SAMPLE.size
+            elif kind == REC_ANCHOR:
+                if i + ANCHOR.size > n:
+                    break
+                _, millis, unix_s = ANCHOR.unpack_from(buf, i)
+                records.append(("anchor", millis, unix_s))
+                i += ANCHOR.size
+            else:
+                # A torn write (power loss mid-record); resync on the next byte
+                i += 1
+        self._tail = buf[i:]
+        self.consumed += i
+        return records
+
+
+def boot_of(name):
+    try:
+        return int(name[2:6])
+    except ValueError:
+        return None
+
+
+# ---------- serial port ----------
+
+class SerialPort:
+    # Raw POSIX serial port (termios), so no pyserial is needed
+    def __init__(self, path, baud=115200):
+        self.fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        tty.setraw(self.fd)
+        attrs = termios.tcgetattr(self.fd)
+        speed = getattr(termios, f"B{baud}", termios.B115200)
+        attrs[4] = attrs[5] = speed
+        termios.tcsetattr(self.fd, termios.TCSANOW, attrs)
+        termios.tcflush(self.fd, termios.TCIOFLUSH)
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            select.select([], [self.fd], [], TIMEOUT_S)
+            try:
+                view = view[os.write(self.fd, view):]
+            except BlockingIOError:
+                continue
+
+    def read(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return b""
+        try:
+            return os.read(self.fd, 4096)
+        except BlockingIOError:
+            return b""
+
+    def close(self):
+        os.close(self.fd)
+
+
+
+# ---------- receiver ----------
+
+FLUSH_SAMPLES = 256
+MERGE_TOLERANCE_S = 0.5   # an SD sample this close to a stored one is the same beat
+
+
+class Receiver:
+    def __init__(self, port, store=None, data_dir="data", chunk=CHUNK, window=WINDOW):
+        self.port = port
+        self.data_dir = data_dir
+        self.store = store or HRStore(data_dir)
+        self.dir = os.path.join(data_dir, TRANSFER_DIR)
+        self.chunk = chunk
+        self.window = window
+        self._reader = FrameReader()
+        self._frames = []
+        self._seq = 0
+        self._tracks = None
+        self.info = None
+        self.clock_offset = None  # wall seconds minus device seconds, this boot
+        self.offsets = {}         # boot -> the same, from anchors, for older boots
+
+    @property
+    def tracks(self):
+        if self._tracks is None:
+            self._tracks = TrackIndex(os.path.join(self.data_dir, TRACK_DIR))
+        return self._tracks
+
+    def _send(self, kind, payload=b""):
+        self._seq = (self._seq + 1) & 0xFFFF
+        self.port.write(encode_frame(kind, self._seq, payload))
+        return self._seq
+
+    def _receive(self, timeout):
+        # Next good frame, or None after timeout seconds of silence
+        deadline = time.monotonic() + timeout
+        while not self._frames:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            data = self.port.read(remaining)
+            if data:
+                self._frames.extend(self._reader.feed(data))
+        return self._frames.pop(0)
+
+    def _request(self, kind, payload, expect):
+        for _ in range(RETRIES):
+            seq = self._send(kind, payload)
+            deadline = time.monotonic() + TIMEOUT_S
+            while True:
+                frame = self._receive(deadline - time.monotonic())
+                if frame is None:
+                    RETRANSMITS.inc()
+                    break
+                if frame[1] == seq and frame[0] in expect:
+                    return frame
+        raise TransferError("Wearable is not answering")
+
+    def hello(self):
+        sent_at = time.time()
+        _, _, payload = self._request(HELLO, b"", (INFO,))
+        version, boot, millis, count = INFO_HEAD.unpack_from(payload)
+        if version != PROTOCOL_VERSION:
+            raise TransferError(f"Unsupported protocol version {version}")
+        files = {}
+        for i in range(count):
+            name, size = INFO_FILE.unpack_from(payload, INFO_HEAD.size + i * INFO_FILE.size)
+            files[name.rstrip(b"\0").decode()] = size
+        # The reply left somewhere within the round trip; take the middle
+        self.clock_offset = (sent_at + time.time()) / 2 - millis / 1000.0
+        self.offsets[boot] = self.clock_offset
+        self.info = {"boot": boot, "millis": millis, "files": files}
+        log.info("⌚ Wearable boot %d, %d file(s) on SD", boot, len(files))
+        return self.info
+
+    # ---------- resumable state ----------
+
+    def _part_path(self, name):
+        return os.path.join(self.dir, name + ".part")
+
+    def _state_path(self, name):
+        return os.path.join(self.dir, name + ".json")
+
+    def _load_state(self, name):
+        try:
+            with open(self._state_path(name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"decoded": 0, "offset": None}
+
+    def _save_state(self, name, state):
+        tmp = self._state_path(name) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self._state_path(name))
+
+    # ---------- pulling ----------
+
+    def fetch(self, name, size, on_chunk=None):
+        # Brings data/transfer/<name>.part up to `size` bytes, resuming from
+        # whatever is already there; on_chunk(bytes) sees each new chunk in
+        # order. Returns the number of bytes read from the wearable.
+        os.makedirs(self.dir, exist_ok=True)
+        part = self._part_path(name)
+        have = os.path.getsize(part) if os.path.exists(part) else 0
+        if have > size:
+            raise TransferError(f"{name} is shorter on the wearable than already received")
+        if have:
+            log.info("⏯️ Resuming %s at %d of %d bytes", name, have, size)
+        start = have
+        key = name.encode()
+        pending = {}   # offset -> (length, sent at)
+        early = {}     # offset -> chunk that arrived ahead of a lost one
+        next_offset = have
+        stalls = 0
+        with open(part, "ab") as f:
+            while have < size:
+                while len(pending) + len(early) < self.window and next_offset < size:
+                    length = min(self.chunk, size - next_offset)
+                    self._send(READ, READ_REQ.pack(key, next_offset, length))
+                    pending[next_offset] = (length, time.perf_counter_ns())
+                    next_offset += length
+                frame = self._receive(TIMEOUT_S)
+                if frame is None:
+                    # Requests or replies lost: ask again for everything outstanding
+                    stalls += 1
+                    if stalls > RETRIES:
+                        raise TransferError(f"Link lost while reading {name} at {have} of {size} bytes")
+                    for offset, (length, _) in sorted(pending.items()):
+                        RETRANSMITS.inc()
+                        self._send(READ, READ_REQ.pack(key, offset, length))
+                        pending[offset] = (length, time.perf_counter_ns())
+                    continue
+                kind, _, payload = frame
+                if kind == NAK:
+                    raise TransferError(f"Wearable refused to read {name}: {NAK_REASONS.get(payload[0], payload[0])}")
+                if kind != DATA:
+                    continue
+                offset = DATA_HEAD.unpack_from(payload)[0]
+                request = pending.get(offset)
+                data = payload[DATA_HEAD.size:]
+                if request is None or len(data) != request[0]:
+                    continue  # a duplicate of a chunk already written
+                del pending[offset]
+                stalls = 0
+                # Replies come back in request order, so anything asked for
+                # before this chunk and still missing was lost; ask again now
+                # rather than waiting out the timeout
+                for lost, (length, sent) in sorted(pending.items()):
+                    if sent < request[1]:
+                        RETRANSMITS.inc()
+                        self._send(READ, READ_REQ.pack(key, lost, length))
+                        pending[lost] = (length, time.perf_counter_ns())
+                CHUNK_US.record((time.perf_counter_ns() - request[1]) / 1000)
+                early[offset] = data
+                while have in early:
+                    data = early.pop(have)
+                    f.write(data)
+                    have += len(data)
+                    if on_chunk:
+                        on_chunk(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return have - start
+
+    def _pull_hr(self, name, size):
+        # Streams samples into the HR store as chunks decode; returns how
+        # many were stored
+        state = self._load_state(name)
+        boot = boot_of(name)
+        if state["offset"] is None and boot in self.offsets:
+            state["offset"] = self.offsets[boot]
+        decoder = RecordDecoder()
+        decoder.consumed = state["decoded"]
+        pending = []
+        stored = [0]
+
+        def handle(data, final=False):
+            for record in decoder.feed(data):
+                if record[0] == "anchor":
+                    if state["offset"] is None:
+                        state["offset"] = record[2] - record[1] / 1000.0
+                elif record[2]:
+                    pending.append((record[1], record[2]))
+            if state["offset"] is None or not pending or (len(pending) < FLUSH_SAMPLES and not final):
+                return
+            offset = state["offset"]
+            stored[0] += self._store_new([(millis / 1000.0 + offset, bpm) for millis, bpm in pending])
+            pending.clear()
+            state["decoded"] = decoder.consumed
+            self._save_state(name, state)
+
+        # Bytes received before an interruption but not yet stored go first
+        part = self._part_path(name)
+        if os.path.exists(part):
+            with open(part, "rb") as f:
+                f.seek(state["decoded"])
+                handle(f.read())
+        self.fetch(name, size, handle)
+        handle(b"", final=True)
+        if pending:
+            log.warning("%s: %d samples with no time anchor; kept in %s", name, len(pending), part)
+        if state["offset"] is not None:
+            self.offsets[boot] = state["offset"]
+            self._import_tracks(part, state["offset"])
+        return stored[0]
+
+    def _store_new(self, batch):
+        # Stores the samples of batch that the store doesn't already have;
+        # returns how many
+        batch.sort()
+        ts, bpms = self.store.read_range(batch[0][0] - MERGE_TOLERANCE_S,
+                                         batch[-1][0] + MERGE_TOLERANCE_S + 1e-6)
+        if not len(ts):
+            self.store.append_batch(batch)
+            return len(batch)
+        sources = [Source("live", zip(ts, bpms), LOG_PRIORITY, offset=0.0),
+                   Source("sd", batch, ARDUINO_PRIORITY, offset=0.0)]
+        new = [(t, bpm) for t, bpm, name in merge(sources, MERGE_TOLERANCE_S, estimate=False) if name == "sd"]
+        if len(new) < len(batch):
+            DUPLICATES.inc(len(batch) - len(new))
+        if new:
+            self.store.append_batch(new)
+        return len(new)
+
+    def _import_tracks(self, part, offset):
+        with open(part, "rb") as f:
+            records = RecordDecoder().feed(f.read())
+        fixes = [(r[1] / 1000.0 + offset, r[3], r[4]) for r in records
+                 if r[0] == "sample" and r[3] is not None and r[4] is not None]
+        for track in split_tracks(fixes):
+            ts, lats, lons = zip(*track)
+            track_id = datetime.fromtimestamp(ts[0]).isoformat(timespec="seconds")
+            self.tracks.add(track_id, ts, lats, lons)
+            log.info("🗺️ Added track %s", track_id)
+
+    def _import_motion(self, part, offset):
+        with open(part, "rb") as f:
+            blob = f.read()
+        tracker = MotionTracker(data_dir=self.data_dir)
+        for t0_ms, rate_hz, samples in iter_packets(blob):
+            last = (t0_ms + (len(samples) - 1) * 1000 / rate_hz) / 1000.0 + offset
+            tracker.ingest(t0_ms, samples, rate_hz, t=last)
+        log.info("👟 %s: %d steps", os.path.basename(part), tracker.summary()["steps"])
+
+    def _delete(self, name, size):
+        crc = 0
+        with open(self._part_path(name), "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                crc = zlib.crc32(block, crc)
+        kind, _, payload = self._request(DELETE, DELETE_REQ.pack(name.encode(), size, crc), (ACK, NAK))
+        # "No such file" means an earlier ACK went missing after the delete
+        if kind == NAK and payload[0] != 1:
+            log.info("📁 Wearable kept %s: %s", name, NAK_REASONS.get(payload[0], payload[0]))
+            return False
+        return True
+
+    def _finish(self, name):
+        done = os.path.join(self.dir, "done")
+        os.makedirs(done, exist_ok=True)
+        os.replace(self._part_path(name), os.path.join(done, name))
+        try:
+            os.remove(self._state_path(name))
+        except FileNotFoundError:
+            pass
+
+    def pull(self, delete=True):
+        # Every log on the wearable: HR files first, so older boots' motion
+        # files have a time anchor. Returns {name: samples or bytes}.
+        info = self.info or self.hello()
+        pulled = {}
+        names = sorted(info["files"], key=lambda n: (not n.startswith("HR"), n))
+        for name in names:
+            size = info["files"][name]
+            t0 = time.perf_counter()
+            if name.startswith("HR"):
+                pulled[name] = self._pull_hr(name, size)
+                log.info("📥 %s: %d bytes, %d samples in %.1f s", name, size, pulled[name],
+                         time.perf_counter() - t0)
+            elif name.startswith("IM"):
+                pulled[name] = self.fetch(name, size)
+                log.info("📥 %s: %d bytes in %.1f s", name, size, time.perf_counter() - t0)
+            else:
+                continue
+            if not delete or not self._delete(name, size):
+                continue
+            offset = self.offsets.get(boot_of(name))
+            if name.startswith("IM"):
+                if offset is None:
+                    log.warning("%s has no time anchor; import it with python -m utils.motion", name)
+                else:
+                    self._import_motion(self._part_path(name), offset)
+            self._finish(name)
+        return pulled
+
+
+# ---------- stand-in device ----------
+
+class EmulatedWearable:
+    # The firmware's side of the protocol over a pseudo-terminal, for the
+    # benchmark and for trying the receiver without hardware. files:
+    # {name: bytes}. baud throttles replies to what a real UART would
+    # manage (None: as fast as the pty goes); drop / corrupt are the chances
+    # of a reply frame going missing or arriving damaged.
+    def __init__(self, files, boot=1, baud=None, drop=0.0, corrupt=0.0, seed=0, chatter=True):
+        import random
+        self.files = dict(files)
+        self.boot = boot
+        self.baud = baud
+        self.drop = drop
+        self.corrupt = corrupt
+        self.chatter = chatter
+        self.sent = 0
+        self.cut_after = None   # close the link after this many bytes sent
+        self._rng = random.Random(seed)
+        self._started = time.monotonic()
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.path = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="wearable-emulator", daemon=True)
+        self._thread.start()
+
+    def millis(self):
+        return int((time.monotonic() - self._started) * 1000) & 0xFFFFFFFF
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _write(self, data):
+        if self.cut_after is not None and self.sent + len(data) > self.cut_after:
+            self._stop.set()
+            return
+        if self.baud:
+            time.sleep(len(data) * 10 / self.baud)
+        view = memoryview(data)
+        while view:
+            select.select([], [self._master], [], TIMEOUT_S)
+            view = view[os.write(self._master, view):]
+        self.sent += len(data)
+
+    def _reply(self, kind, seq, payload=b""):
+        frame = encode_frame(kind, seq, payload)
+        if self._rng.random() < self.drop:
+            return
+        if self._rng.random() < self.corrupt:
+            frame = bytearray(frame)
+            frame[self._rng.randrange(2, len(frame))] ^= 0xFF
+        self._write(bytes(frame))
+
+    def _handle(self, kind, seq, payload):
+        if kind == HELLO:
+            names = sorted(self.files)
+            body = INFO_HEAD.pack(PROTOCOL_VERSION, self.boot, self.millis(), len(names))
+            body += b"".join(INFO_FILE.pack(n.encode(), len(self.files[n])) for n in names)
+            self._reply(INFO, seq, body)
+        elif kind == READ:
+            name, offset, length = READ_REQ.unpack(payload)
+            blob = self.files.get(name.rstrip(b"\0").decode())
+            if blob is None:
+                self._reply(NAK, seq, bytes([1]))
+            elif offset + length > len(blob) or length > MAX_PAYLOAD - DATA_HEAD.size:
+                self._reply(NAK, seq, bytes([4]))
+            else:
+                self._reply(DATA, seq, DATA_HEAD.pack(offset) + blob[offset:offset + length])
+        elif kind == DELETE:
+            name, size, crc = DELETE_REQ.unpack(payload)
+            name = name.rstrip(b"\0").decode()
+            blob = self.files.get(name)
+            if blob is None:
+                self._reply(NAK, seq, bytes([1]))
+            elif len(blob) != size:
+                self._reply(NAK, seq, bytes([2]))
+            elif zlib.crc32(blob) != crc:
+                self._reply(NAK, seq, bytes([3]))
+            else:
+                del self.files[name]
+                self._reply(ACK, seq)
+                if self.chatter:
+                    self._write(f"🗑️ Deleted {name}\n".encode())
+
+    def _run(self):
+        reader = FrameReader()
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            for frame in reader.feed(data):
+                self._handle(*frame)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pull logs off the wearable's SD card over USB serial")
+    parser.add_argument("port", help="e.g. /dev/tty.usbmodem1101")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--keep", action="store_true", help="leave the files on the SD card")
+    parser.add_argument("--list", action="store_true", help="only list the files")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    port = SerialPort(args.port, args.baud)
+    try:
+        receiver = Receiver(port, data_dir=args.data_dir)
+        info = receiver.hello()
+        if args.list:
+            for name, size in sorted(info["files"].items()):
+                log.info("  %-12s %10d bytes", name, size)
+            return
+        receiver.pull(delete=not args.keep)
+    finally:
+        port.close()
+
+
+if __name__ == "__main__":
+    main()
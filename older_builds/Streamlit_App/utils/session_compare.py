@@ -0,0 +1,361 @@
+# utils/session_compare.py
+#
+# "This session against your previous similar ones", for the workout log.
+#
+# Every session is reduced to a series on a STEP_S grid: mean heart rate
+# per step and, where a GPS track covers it, distance so far. Two or more
+# series are then lined up one of three ways:
+#
+#   time       by elapsed time since each session's start
+#   distance   by distance covered (needs GPS), with the time each took,
+#              so segments also compare pace
+#   dtw        by shape: banded dynamic time warping (Sakoe-Chiba band of
+#              DTW_BAND of the length) on DTW_STEP_S means, which lines up
+#              an interval session with the same intervals run a bit later
+#
+# and compared per segment (SEGMENT_S of the reference, or SEGMENT_M).
+#
+# Finding the similar ones never touches samples: FeatureIndex keeps a
+# feature vector per session (duration, heart rate, distance, time in each
+# personal zone, the shape of the heart-rate curve) in
+# data/session_features.json, updated per day like utils/sessions.py's
+# summaries. A query standardizes the vectors once and takes the k nearest
+# earlier sessions of the same workout type, a few hundred microseconds for
+# thousands of sessions.
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from utils import instrumentation
+from utils.hr_alerts import PersonalZones
+from utils.session_export import Positions
+
+log = logging.getLogger("wearable.compare")
+
+STEP_S = 5
+DTW_STEP_S = 15
+DTW_BAND = 0.1
+DISTANCE_STEP_M = 50
+SEGMENT_S = 300
+SEGMENT_M = 1000
+SHAPE_BINS = 6
+ALIGNMENTS = ("time", "distance", "dtw")
+FEATURES_FILE = "session_features.json"
+# duration, avg, max, distance, 7 zone shares, SHAPE_BINS shape means
+WEIGHTS = np.array([1.0, 1.5, 0.5, 1.0] + [0.5] * 7 + [0.5] * SHAPE_BINS)
+
+SIMILAR_US = instrumentation.histogram("compare.similar_us")
+COMPARE_US = instrumentation.histogram("compare.compare_us")
+
+
+# ---------- series ----------
+
+def _fill(values):
+    # NaN steps (dropouts) interpolated from their neighbours
+    missing = np.isnan(values)
+    if missing.all() or not missing.any():
+        return values
+    steps = np.arange(len(values))
+    values[missing] = np.interp(steps[missing], steps[~missing], values[~missing])
+    return values
+
+
+def session_series(store, tracks, session, step=STEP_S):
+    # {"elapsed", "bpm", "distance" (None without GPS)} arrays on a step grid
+    ts, bpms = store.read_range(session["start"], session["end"] + 1)
+    ts = np.frombuffer(ts, dtype=np.float64) if len(ts) else np.empty(0)
+    bpms = np.frombuffer(bpms, dtype=np.uint16).astype(np.float64) if len(bpms) else np.empty(0)
+    count = int((session["end"] - session["start"]) // step) + 1
+    bucket = np.minimum(((ts - session["start"]) // step).astype(np.intp), count - 1)
+    sums = np.bincount(bucket, bpms, minlength=count)
+    counts = np.bincount(bucket, minlength=count)
+    bpm = _fill(np.where(counts > 0, sums / np.maximum(counts, 1), np.nan))
+
+    elapsed = np.arange(count) * float(step)
+    lats, _, along = Positions(tracks, session["start"], session["end"]).at(session["start"] + elapsed)
+    distance = None
+    if not np.isnan(lats).all():
+        # Distance so far, carried flat through stretches without a fix
+        distance = np.maximum.accumulate(np.where(np.isnan(lats), 0.0, along))
+    return {"elapsed": elapsed, "bpm": bpm, "distance": distance}
+
+
+# ---------- alignment ----------
+
+def align_time(ref, others):
+    x = ref["elapsed"]
+    return {"x": x, "unit": "s", "ref": ref["bpm"],
+            "others": [np.interp(x, o["elapsed"], o["bpm"], right=np.nan) for o in others]}
+
+
+def _on_distance(series, x):
+    # (bpm, elapsed) at each distance in x; NaN past the series' end
+    if series["distance"] is None:
+        return np.full(len(x), np.nan), np.full(len(x), np.nan)
+    distance = series["distance"]
+    # First step at each distance, so stops don't fold the axis back
+    first = np.concatenate(([True], np.diff(distance) > 0))
+    d, bpm, elapsed = distance[first], series["bpm"][first], series["elapsed"][first]
+    return np.interp(x, d, bpm, right=np.nan), np.interp(x, d, elapsed, right=np.nan)
+
+
+def align_distance(ref, others, step=DISTANCE_STEP_M):
+    if ref["distance"] is None or ref["distance"][-1] < step:
+        raise ValueError("the session has no GPS track to align by distance")
+    x = np.arange(0.0, ref["distance"][-1], step)
+    ref_bpm, ref_elapsed = _on_distance(ref, x)
+    aligned = [_on_distance(o, x) for o in others]
+    return {"x": x, "unit": "m", "ref": ref_bpm, "ref_elapsed": ref_elapsed,
+            "others": [bpm for bpm, _ in aligned], "others_elapsed": [elapsed for _, elapsed in aligned]}
+
+
+def _coarse(values, factor):
+    usable = len(values) // factor * factor
+    if not usable:
+        return values[:1].copy()
+    return values[:usable].reshape(-1, factor).mean(axis=1)
+
+
+def dtw_path(a, b, band=DTW_BAND):
+    # Banded DTW on absolute differences: (path [(i, j), ...], mean cost
+    # along it). Each row only visits the band around the diagonal, and a
+    # row's left-to-right dependency is resolved with a running minimum
+    # instead of a Python loop.
+    n, m = len(a), len(b)
+    width = max(int(band * max(n, m)), int(np.ceil(m / n)) + 1)
+    cost = np.full((n + 1, m + 1), np.inf)
+    cost[0, 0] = 0.0
+    slope = (m - 1) / max(n - 1, 1)
+    for i in range(1, n + 1):
+        centre = int(round((i - 1) * slope)) + 1
+        lo, hi = max(1, centre - width), min(m, centre + width)
+        step = np.abs(a[i - 1] - b[lo - 1:hi])
+        through = step + np.minimum(cost[i - 1, lo - 1:hi], cost[i - 1, lo:hi + 1])
+        # cost[i, j] = min(through[j], step[j] + cost[i, j - 1])
+        run = np.cumsum(step)
+        cost[i, lo:hi + 1] = run + np.minimum.accumulate(through - run)
+    path = []
+    i, j = n, m
+    while i > 0 and j > 0:
+        path.append((i - 1, j - 1))
+        moves = (cost[i - 1, j - 1], cost[i - 1, j], cost[i, j - 1])
+        best = moves.index(min(moves))
+        i, j = (i - 1, j - 1) if best == 0 else (i - 1, j) if best == 1 else (i, j - 1)
+    path.reverse()
+    return path, float(cost[n, m] / len(path))
+
+
+def align_dtw(ref, others, band=DTW_BAND, step=DTW_STEP_S):
+    factor = max(1, int(round(step / (ref["elapsed"][1] - ref["elapsed"][0]))) if len(ref["elapsed"]) > 1 else 1)
+    a = _coarse(ref["bpm"], factor)
+    x = np.arange(len(a)) * float(step)
+    warped = []
+    costs = []
+    for other in others:
+        b = _coarse(other["bpm"], factor)
+        path, mean_cost = dtw_path(a, b, band)
+        # Each reference step gets the mean of the steps matched to it
+        i, j = np.array(path).T
+        sums = np.bincount(i, b[j], minlength=len(a))
+        warped.append(sums / np.bincount(i, minlength=len(a)))
+        costs.append(round(mean_cost, 2))
+    return {"x": x, "unit": "s", "ref": a, "others": warped, "costs": costs}
+
+
+ALIGN = {"time": align_time, "distance": align_distance, "dtw": align_dtw}
+
+
+def segment_deltas(aligned, index):
+    # Per-segment means of the reference and of others[index], and the
+    # difference (other - reference); pace per km when aligned by distance
+    x = aligned["x"]
+    size = SEGMENT_M if aligned["unit"] == "m" else SEGMENT_S
+    other = aligned["others"][index]
+    segments = []
+    for lo in np.arange(0.0, x[-1] + 1e-9 if len(x) else 0.0, size):
+        inside = (x >= lo) & (x < lo + size)
+        if not inside.any() or np.isnan(other[inside]).all():
+            continue
+        ref_bpm = float(np.nanmean(aligned["ref"][inside]))
+        bpm = float(np.nanmean(other[inside]))
+        segment = {"from": float(lo), "to": float(min(lo + size, x[-1])), "ref_bpm": round(ref_bpm, 1),
+                   "bpm": round(bpm, 1), "delta_bpm": round(bpm - ref_bpm, 1)}
+        if aligned["unit"] == "m":
+            span = x[inside]
+            ref_s = np.interp(span[[0, -1]], x, aligned["ref_elapsed"])
+            other_s = np.interp(span[[0, -1]], x, aligned["others_elapsed"][index])
+            metres = max(span[-1] - span[0], 1.0)
+            if not np.isnan(other_s).any():
+                segment["ref_pace_s_km"] = round(float(np.diff(ref_s)[0]) / metres * 1000, 1)
+                segment["pace_s_km"] = round(float(np.diff(other_s)[0]) / metres * 1000, 1)
+                segment["delta_pace_s_km"] = round(segment["pace_s_km"] - segment["ref_pace_s_km"], 1)
+        segments.append(segment)
+    return segments
+
+
+# ---------- features ----------
+
+def features(session, series, zones):
+    bpm = series["bpm"]
+    zone = np.searchsorted(zones.limits, bpm, side="right")
+    shares = np.bincount(zone, minlength=len(zones.limits) + 1)[:len(zones.limits) + 1] / max(len(bpm), 1)
+    shape = [float(np.mean(part)) - session["avg_bpm"] if len(part) else 0.0
+             for part in np.array_split(bpm, SHAPE_BINS)]
+    distance_km = series["distance"][-1] / 1000 if series["distance"] is not None else 0.0
+    return [session["duration_s"] / 60, session["avg_bpm"], session["max_bpm"], distance_km,
+            *shares.tolist(), *shape]
+
+
+class FeatureIndex:
+    def __init__(self, sessions, tracks=None, path=None, zones=None):
+        self.sessions = sessions     # a utils.sessions.SessionIndex
+        self.store = sessions.store
+        self.tracks = tracks
+        self.zones = zones or PersonalZones.from_env()
+        self.path = path or os.path.join(self.store.data_dir, FEATURES_FILE)
+        self._lock = threading.Lock()
+        self._index = self._load()
+        self._arrays = None
+
+    def _key(self):
+        return f"{self.zones.max_hr}/{self.zones.resting_hr}/{STEP_S}/{SHAPE_BINS}"
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {"key": self._key(), "tracks": [], "days": {}}
+        if index.get("key") != self._key():
+            log.info("Zones changed; recomputing session features")
+            return {"key": self._key(), "tracks": [], "days": {}}
+        return index
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def _track_days(self):
+        # Days whose sessions a newly added (or re-imported) track may cover
+        known = set(self._index["tracks"])
+        current = {f"{m['id']}@{m['offset']}": m for m in self.tracks.tracks.values()} if self.tracks else {}
+        added = [current[k] for k in current.keys() - known]
+        self._index["tracks"] = sorted(current)
+        return {datetime.fromtimestamp(t).date().isoformat() for m in added for t in (m["start"], m["end"])}
+
+    def refresh(self):
+        # Brings every day's vectors up to date; cheap when nothing changed
+        with self._lock:
+            dirty = self._track_days()
+            days = {day.isoformat(): day for day in self.store.days()}
+            changed = bool(dirty) or bool(self._index["days"].keys() - days.keys())
+            for key in self._index["days"].keys() - days.keys():
+                del self._index["days"][key]
+            for key, day in days.items():
+                version = self.sessions._version(day)
+                cached = self._index["days"].get(key)
+                if cached and cached["version"] == version and key not in dirty:
+                    continue
+                rows = []
+                for session in self.sessions.sessions(day):
+                    series = session_series(self.store, self.tracks, session)
+                    rows.append([session["start"], session["workout"],
+                                 [round(v, 4) for v in features(session, series, self.zones)]])
+                self._index["days"][key] = {"version": version, "rows": rows}
+                changed = True
+            if changed:
+                self._save()
+                self._arrays = None
+
+    def _matrix(self):
+        # (starts, workouts, standardized and weighted vectors), oldest first
+        if self._arrays is None:
+            rows = sorted(row for day in self._index["days"].values() for row in day["rows"])
+            starts = np.array([r[0] for r in rows], dtype=np.float64)
+            workouts = np.array([r[1] for r in rows], dtype=object)
+            vectors = np.array([r[2] for r in rows], dtype=np.float64).reshape(len(rows), len(WEIGHTS))
+            mean = vectors.mean(axis=0) if len(rows) else np.zeros(len(WEIGHTS))
+            scale = vectors.std(axis=0) if len(rows) else np.ones(len(WEIGHTS))
+            scale[scale == 0] = 1.0
+            self._arrays = (starts, workouts, (vectors - mean) / scale * WEIGHTS)
+        return self._arrays
+
+    def similar(self, session, k=5, same_workout=True):
+        # [(start, distance), ...] of the k earlier sessions nearest to this
+        # one, nearest first
+        self.refresh()
+        return self.nearest(session["start"], k, same_workout)
+
+    def nearest(self, start, k=5, same_workout=True):
+        # similar() on the vectors as they are, without refreshing them
+        t0 = instrumentation.stopwatch()
+        with self._lock:
+            starts, workouts, matrix = self._matrix()
+        i = int(np.searchsorted(starts, start - 0.5))
+        if i >= len(starts) or abs(starts[i] - start) > 0.5:
+            raise KeyError(f"No session starting at {start}")
+        candidates = np.flatnonzero(starts[:i] < start)
+        if same_workout:
+            candidates = candidates[workouts[candidates] == workouts[i]]
+        if not len(candidates):
+            return []
+        distance = np.sqrt(((matrix[candidates] - matrix[i]) ** 2).sum(axis=1))
+        k = min(k, len(candidates))
+        nearest = np.argpartition(distance, k - 1)[:k]
+        nearest = nearest[np.argsort(distance[nearest])]
+        SIMILAR_US.record_since(t0)
+        return [(float(starts[candidates[n]]), round(float(distance[n]), 3)) for n in nearest]
+
+    def summary(self, start):
+        for session in self.sessions.sessions(datetime.fromtimestamp(start).date()):
+            if abs(session["start"] - start) < 0.5:
+                return session
+        raise KeyError(f"No session starting at {start}")
+
+
+def _listed(values, digits=1):
+    # JSON has no NaN
+    return [None if v != v else round(v, digits) for v in np.asarray(values, dtype=np.float64).tolist()]
+
+
+def compare(index, start, k=3, align="time"):
+    # The session starting at `start` against its k most similar
+    # predecessors, aligned by `align`; what /sessions/compare returns
+    if align not in ALIGN:
+        raise ValueError(f"align must be one of {', '.join(ALIGNMENTS)}")
+    t0 = instrumentation.stopwatch()
+    session = index.summary(start)
+    matches = index.similar(session, k)
+    ref = session_series(index.store, index.tracks, session)
+    others = [(index.summary(s), score) for s, score in matches]
+    series = [session_series(index.store, index.tracks, s) for s, _ in others]
+    aligned = ALIGN[align](ref, series)
+    similar = []
+    for n, (summary, score) in enumerate(others):
+        entry = {"session": summary, "score": score, "bpm": _listed(aligned["others"][n]),
+                 "segments": segment_deltas(aligned, n)}
+        if "costs" in aligned:
+            entry["dtw_cost"] = aligned["costs"][n]
+        similar.append(entry)
+    COMPARE_US.record_since(t0)
+    return {"session": session, "align": align, "unit": aligned["unit"], "x": _listed(aligned["x"]),
+            "bpm": _listed(aligned["ref"]), "similar": similar}
+
+
+def describe_match(entry):
+    # ("Jun 14, 7:00 AM", "+3.5 bpm", "-4 s/km" or None) for one of the
+    # similar sessions in a compare() answer: how it differed on average
+    when = datetime.fromtimestamp(entry["session"]["start"]).strftime("%b %d, %I:%M %p").replace(" 0", " ")
+    segments = entry["segments"]
+    bpm = np.mean([s["delta_bpm"] for s in segments]) if segments else 0.0
+    paces = [s["delta_pace_s_km"] for s in segments if "delta_pace_s_km" in s]
+    pace = f"{round(float(np.mean(paces))):+d} s/km" if paces else None
+    return when, f"{bpm:+.1f} bpm", pace
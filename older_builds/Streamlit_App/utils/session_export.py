@@ -0,0 +1,397 @@
+# utils/session_export.py
+#
+# Workout sessions as files other platforms import: GPX 1.1 (with Garmin's
+# heart-rate extension), TCX and FIT activity files.
+#
+# A session's heart rate is streamed from its day file in CHUNK_SAMPLES
+# pieces, each given a position by interpolating the GPS tracks recorded
+# during it (utils/geo_index.py) and handed straight to the writer, so an
+# export never holds more than a chunk of samples plus the simplified tracks.
+# Samples outside any track have no position: TCX and FIT keep them as
+# heart rate only, GPX (whose points must have one) leaves them out.
+#
+#   write_session(store, tracks, session, fmt, f)   one session to a file object
+#   export_range(data_dir, out_dir, first, last)    every session in a date
+#                                                   range, across processes
+#
+# The service serves single sessions at /sessions/export (the workout log's
+# export buttons use it); bulk exports read data/ directly:
+#
+#   python -m utils.session_export --from 2025-07-01 --to 2025-07-31 --format gpx fit
+
+import argparse
+import heapq
+import logging
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from utils import instrumentation
+from utils.geo_index import TRACK_DIR, TrackIndex, _local_xy
+from utils.hr_archive import read_archive
+from utils.hr_store import HRStore, iter_log_file
+from utils.sessions import SessionIndex
+
+log = logging.getLogger("wearable.session_export")
+
+FORMATS = ("gpx", "tcx", "fit")
+CONTENT_TYPES = {"gpx": "application/gpx+xml", "tcx": "application/vnd.garmin.tcx+xml",
+                 "fit": "application/vnd.ant.fit"}
+CHUNK_SAMPLES = 4096
+CREATOR = "SummerWearable"
+SPORTS = {"Run": ("running", "Running", 1), "Walk": ("walking", "Other", 11)}  # GPX, TCX, FIT
+OTHER_SPORT = ("workout", "Other", 0)
+
+EXPORT_US = instrumentation.histogram("session_export.session_us")
+
+
+def _iso(t):
+    # UTC xsd:dateTime, with milliseconds only when there are any
+    ms = int(round(t * 1000)) % 1000
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(int(t)))
+    return f"{stamp}.{ms:03d}Z" if ms else stamp + "Z"
+
+
+def filename(session, fmt):
+    start = datetime.fromtimestamp(session["start"]).strftime("%Y-%m-%d_%H%M%S")
+    return f"{start}_{session['workout']}.{fmt}"
+
+
+# ---------- sources ----------
+
+def _chunked(pairs, chunk):
+    ts, bpms = [], []
+    for t, bpm in pairs:
+        ts.append(t)
+        bpms.append(bpm)
+        if len(ts) == chunk:
+            yield np.array(ts), np.array(bpms, dtype=np.uint16)
+            ts, bpms = [], []
+    if ts:
+        yield np.array(ts), np.array(bpms, dtype=np.uint16)
+
+
+def iter_hr(store, start, end, chunk=CHUNK_SAMPLES):
+    # (ts, bpms) arrays of the samples with start <= t <= end, a chunk at a
+    # time, from the day's archive and then its CSV, as HRStore.read_day
+    # sees them. Late samples in the CSV of an archived day are few and can
+    # be out of order; they are sorted and merged into the archive's samples.
+    day = datetime.fromtimestamp(start).date()
+    last_day = datetime.fromtimestamp(end).date()
+    while day <= last_day:
+        path = store.day_path(day)
+        in_range = ()
+        if os.path.exists(path):
+            in_range = ((t, bpm) for t, bpm in iter_log_file(path) if start <= t <= end)
+        if os.path.exists(store.archive_path(day)):
+            ts, bpms = read_archive(store.archive_path(day))
+            ts = np.asarray(ts, dtype=np.float64)
+            lo, hi = np.searchsorted(ts, start, side="left"), np.searchsorted(ts, end, side="right")
+            late = sorted(in_range, key=lambda s: s[0])
+            if late:
+                archived = zip(ts[lo:hi].tolist(), bpms[lo:hi])
+                yield from _chunked(heapq.merge(archived, late, key=lambda s: s[0]), chunk)
+            else:
+                for i in range(lo, hi, chunk):
+                    yield ts[i:min(i + chunk, hi)], np.asarray(bpms[i:min(i + chunk, hi)], dtype=np.uint16)
+        else:
+            yield from _chunked(in_range, chunk)
+        day += timedelta(days=1)
+
+
+class Positions:
+    # Where the wearer was during a session, from the GPS tracks that
+    # overlap it; at() interpolates between the simplified points
+    def __init__(self, tracks, start, end):
+        ts, lats, lons, along = [], [], [], []
+        self.spans = []
+        distance = 0.0
+        for meta in tracks.between(start, end) if tracks is not None else ():
+            t, lat, lon = tracks.track_points(meta["id"])
+            x, y = _local_xy(lat, lon, lat[0], lon[0])
+            steps = np.hypot(np.diff(x), np.diff(y))
+            ts.append(t)
+            lats.append(lat)
+            lons.append(lon)
+            along.append(distance + np.concatenate(([0.0], np.cumsum(steps))))
+            distance = along[-1][-1]
+            self.spans.append((t[0], t[-1]))
+        self.distance_m = distance
+        if ts:
+            self.ts, self.lats, self.lons, self.along = (np.concatenate(a) for a in (ts, lats, lons, along))
+        self.span_starts = np.array([s for s, _ in self.spans])
+        self.span_ends = np.array([e for _, e in self.spans])
+
+    def at(self, ts):
+        # (lats, lons, metres so far) for each t; NaN positions outside tracks
+        n = len(ts)
+        if not self.spans:
+            return np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan)
+        span = np.searchsorted(self.span_starts, ts, side="right") - 1
+        inside = (span >= 0) & (ts <= self.span_ends[np.maximum(span, 0)])
+        lats = np.where(inside, np.interp(ts, self.ts, self.lats), np.nan)
+        lons = np.where(inside, np.interp(ts, self.ts, self.lons), np.nan)
+        # Distance carries on through gaps between tracks
+        return lats, lons, np.interp(ts, self.ts, self.along)
+
+
+# ---------- writers ----------
+#
+# Each takes the session summary up front, then add() per chunk of samples
+# and close() at the end. Summary values (duration, calories, heart rate)
+# come from utils/sessions.py; the distance from the tracks.
+
+def _sport(session):
+    return SPORTS.get(session["workout"], OTHER_SPORT)
+
+
+class GPXWriter:
+    def __init__(self, f, session, distance_m=0.0):
+        self.f = f
+        f.write(('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 f'<gpx version="1.1" creator="{CREATOR}" xmlns="http://www.topografix.com/GPX/1/1" '
+                 'xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1">\n'
+                 f' <metadata><time>{_iso(session["start"])}</time></metadata>\n'
+                 f' <trk><name>{escape(session["workout"])}</name><type>{_sport(session)[0]}</type><trkseg>\n')
+                .encode())
+
+    def add(self, ts, bpms, lats, lons, along):
+        keep = ~np.isnan(lats)
+        self.f.write("".join(
+            f'  <trkpt lat="{lat:.7f}" lon="{lon:.7f}"><time>{_iso(t)}</time><extensions>'
+            f'<gpxtpx:TrackPointExtension><gpxtpx:hr>{bpm}</gpxtpx:hr></gpxtpx:TrackPointExtension>'
+            f'</extensions></trkpt>\n'
+            for t, bpm, lat, lon in zip(ts[keep].tolist(), bpms[keep].tolist(), lats[keep].tolist(),
+                                        lons[keep].tolist())).encode())
+
+    def close(self):
+        self.f.write(b" </trkseg></trk>\n</gpx>\n")
+
+
+class TCXWriter:
+    def __init__(self, f, session, distance_m=0.0):
+        self.f = f
+        start = _iso(session["start"])
+        f.write(('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<TrainingCenterDatabase xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2">\n'
+                 f' <Activities><Activity Sport="{_sport(session)[1]}"><Id>{start}</Id>\n'
+                 f'  <Lap StartTime="{start}"><TotalTimeSeconds>{session["duration_s"]:.1f}</TotalTimeSeconds>'
+                 f'<DistanceMeters>{distance_m:.1f}</DistanceMeters><Calories>{round(session["kcal"])}</Calories>'
+                 f'<AverageHeartRateBpm><Value>{round(session["avg_bpm"])}</Value></AverageHeartRateBpm>'
+                 f'<MaximumHeartRateBpm><Value>{session["max_bpm"]}</Value></MaximumHeartRateBpm>'
+                 '<Intensity>Active</Intensity><TriggerMethod>Manual</TriggerMethod><Track>\n').encode())
+
+    def add(self, ts, bpms, lats, lons, along):
+        rows = []
+        for t, bpm, lat, lon, metres in zip(ts.tolist(), bpms.tolist(), lats.tolist(), lons.tolist(),
+                                            along.tolist()):
+            where = "" if lat != lat else (f"<Position><LatitudeDegrees>{lat:.7f}</LatitudeDegrees>"
+                                           f"<LongitudeDegrees>{lon:.7f}</LongitudeDegrees></Position>"
+                                           f"<DistanceMeters>{metres:.1f}</DistanceMeters>")
+            rows.append(f"   <Trackpoint><Time>{_iso(t)}</Time>{where}"
+                        f"<HeartRateBpm><Value>{bpm}</Value></HeartRateBpm></Trackpoint>\n")
+        self.f.write("".join(rows).encode())
+
+    def close(self):
+        self.f.write(b"  </Track></Lap></Activity></Activities>\n</TrainingCenterDatabase>\n")
+
+
+# FIT: a 14-byte header, definition and data messages, and a CRC-16 of it
+# all. Field numbers and base types follow the FIT SDK profile.
+FIT_EPOCH = 631065600  # 1989-12-31T00:00:00Z
+FIT_PROFILE_VERSION = 2132
+SEMICIRCLES = 2 ** 31 / 180.0
+ENUM, UINT8, UINT16, SINT32, UINT32, UINT32Z = 0x00, 0x02, 0x84, 0x85, 0x86, 0x8C
+SIZES = {ENUM: 1, UINT8: 1, UINT16: 2, SINT32: 4, UINT32: 4, UINT32Z: 4}
+FORMAT_CHARS = {ENUM: "B", UINT8: "B", UINT16: "H", SINT32: "i", UINT32: "I", UINT32Z: "I"}
+# local type: (global message, [(field, base type), ...])
+FIT_MESSAGES = {
+    0: (0, [(0, ENUM), (1, UINT16), (2, UINT16), (3, UINT32Z), (4, UINT32)]),              # file_id
+    1: (21, [(253, UINT32), (0, ENUM), (1, ENUM)]),                                        # event
+    2: (20, [(253, UINT32), (0, SINT32), (1, SINT32), (3, UINT8), (5, UINT32)]),           # record
+    3: (19, [(253, UINT32), (2, UINT32), (7, UINT32), (8, UINT32), (9, UINT32), (11, UINT16),
+             (15, UINT8), (16, UINT8), (0, ENUM), (1, ENUM), (25, ENUM)]),                 # lap
+    4: (18, [(253, UINT32), (2, UINT32), (7, UINT32), (8, UINT32), (9, UINT32), (11, UINT16),
+             (16, UINT8), (17, UINT8), (0, ENUM), (1, ENUM), (5, ENUM), (6, ENUM), (25, UINT16),
+             (26, UINT16)]),                                                               # session
+    5: (34, [(253, UINT32), (0, UINT32), (1, UINT16), (2, ENUM), (3, ENUM), (4, ENUM), (5, UINT32)]),  # activity
+}
+RECORD = np.dtype([("header", "u1"), ("timestamp", "<u4"), ("lat", "<i4"), ("lon", "<i4"),
+                   ("heart_rate", "u1"), ("distance", "<u4")])
+EVENT_TIMER, EVENT_LAP, EVENT_SESSION, EVENT_ACTIVITY = 0, 9, 8, 26
+START, STOP, STOP_ALL = 0, 1, 4
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC_TABLE = _crc_table()
+
+
+def fit_crc(data, crc=0):
+    # CRC-16 (poly 0xA001, as the FIT SDK computes it nibble by nibble)
+    table = CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+class FITWriter:
+    # The header's data size is only known at the end, and the CRC after it
+    # covers the header, so f must be seekable and readable ("w+b")
+    def __init__(self, f, session, distance_m=0.0):
+        self.f = f
+        self.session = session
+        self.distance_m = distance_m
+        self.size = 0
+        self.origin = f.tell()
+        f.write(bytes(14))  # the header, filled in by close()
+        for local, (number, fields) in FIT_MESSAGES.items():
+            self._emit(struct.pack("<BBBHB", 0x40 | local, 0, 0, number, len(fields))
+                       + b"".join(struct.pack("<BBB", field, SIZES[base], base) for field, base in fields))
+        start = self._time(session["start"])
+        self._message(0, 4, 255, 0, 1, start)  # activity file, development manufacturer
+        self._message(1, start, EVENT_TIMER, START)
+
+    def _emit(self, data):
+        self.f.write(data)
+        self.size += len(data)
+
+    def _message(self, local, *values):
+        fields = FIT_MESSAGES[local][1]
+        self._emit(struct.pack("<B" + "".join(FORMAT_CHARS[base] for _, base in fields), local, *values))
+
+    @staticmethod
+    def _time(t):
+        return int(t) - FIT_EPOCH
+
+    def add(self, ts, bpms, lats, lons, along):
+        records = np.zeros(len(ts), dtype=RECORD)
+        records["header"] = 2
+        records["timestamp"] = ts.astype(np.int64) - FIT_EPOCH
+        fixed = ~np.isnan(lats)
+        records["lat"] = np.where(fixed, np.round(np.nan_to_num(lats) * SEMICIRCLES), 0x7FFFFFFF)
+        records["lon"] = np.where(fixed, np.round(np.nan_to_num(lons) * SEMICIRCLES), 0x7FFFFFFF)
+        records["heart_rate"] = np.minimum(bpms, 254)
+        records["distance"] = np.where(fixed, np.round(np.nan_to_num(along) * 100), 0xFFFFFFFF)
+        self._emit(records.tobytes())
+
+    def close(self):
+        s = self.session
+        start, end = self._time(s["start"]), self._time(s["end"])
+        elapsed = round(s["duration_s"] * 1000)
+        distance = round(self.distance_m * 100)
+        kcal = round(s["kcal"])
+        avg, peak = round(s["avg_bpm"]), min(s["max_bpm"], 254)
+        sport = _sport(s)[2]
+        self._message(1, end, EVENT_TIMER, STOP_ALL)
+        self._message(3, end, start, elapsed, elapsed, distance, kcal, avg, peak, EVENT_LAP, STOP, sport)
+        self._message(4, end, start, elapsed, elapsed, distance, kcal, avg, peak, EVENT_SESSION, STOP, sport,
+                      0, 0, 1)
+        local_end = end + round(datetime.fromtimestamp(s["end"]).astimezone().utcoffset().total_seconds())
+        self._message(5, end, elapsed, 1, 0, EVENT_ACTIVITY, STOP, local_end)
+        header = struct.pack("<BBHI4s", 14, 0x10, FIT_PROFILE_VERSION, self.size, b".FIT")
+        header += struct.pack("<H", fit_crc(header))
+        self.f.seek(self.origin)
+        self.f.write(header)
+        crc = fit_crc(header)
+        remaining = self.size
+        while remaining:
+            block = self.f.read(min(remaining, 1 << 16))
+            crc = fit_crc(block, crc)
+            remaining -= len(block)
+        self.f.write(struct.pack("<H", crc))
+
+
+WRITERS = {"gpx": GPXWriter, "tcx": TCXWriter, "fit": FITWriter}
+
+
+def write_session(store, tracks, session, fmt, f):
+    # Streams one session (a summary from utils/sessions.py) to f as fmt;
+    # returns the number of samples written
+    t0 = instrumentation.stopwatch()
+    positions = Positions(tracks, session["start"], session["end"])
+    writer = WRITERS[fmt](f, session, positions.distance_m)
+    count = 0
+    for ts, bpms in iter_hr(store, session["start"], session["end"]):
+        writer.add(ts, bpms, *positions.at(ts))
+        count += len(ts)
+    writer.close()
+    EXPORT_US.record_since(t0)
+    return count
+
+
+# ---------- bulk export ----------
+
+_sources = {}  # data_dir -> (store, tracks), one of each per worker process
+
+
+def _open(data_dir):
+    if data_dir not in _sources:
+        _sources[data_dir] = (HRStore(data_dir), TrackIndex(os.path.join(data_dir, TRACK_DIR)))
+    return _sources[data_dir]
+
+
+def export_session(data_dir, out_dir, session, formats=FORMATS):
+    # Writes one session in each format; returns the bytes written
+    store, tracks = _open(data_dir)
+    written = 0
+    for fmt in formats:
+        path = os.path.join(out_dir, filename(session, fmt))
+        tmp = path + ".tmp"
+        with open(tmp, "w+b") as f:
+            write_session(store, tracks, session, fmt, f)
+            written += f.tell()
+        os.replace(tmp, path)
+    return written
+
+
+def export_range(data_dir, out_dir, first, last, formats=FORMATS, workers=None):
+    # Every session from day `first` to `last` inclusive, one task per
+    # session across a process pool. Returns counts and sessions per second.
+    start = time.perf_counter()
+    index = SessionIndex(HRStore(data_dir))
+    sessions = [s for day in index.store.days() if first <= day <= last for s in index.sessions(day)]
+    os.makedirs(out_dir, exist_ok=True)
+    written = 0
+    if sessions:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(export_session, data_dir, out_dir, s, formats) for s in sessions]
+            written = sum(f.result() for f in futures)
+    elapsed = time.perf_counter() - start
+    result = {"sessions": len(sessions), "files": len(sessions) * len(formats), "bytes": written,
+              "seconds": round(elapsed, 3), "sessions_per_s": round(len(sessions) / elapsed, 1)}
+    log.info("📤 Exported %d sessions (%d files, %.1f MiB) in %.1f s: %.1f sessions/s", result["sessions"],
+             result["files"], written / 2 ** 20, elapsed, result["sessions_per_s"])
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export workout sessions as GPX, TCX or FIT files")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--out", default=os.path.join("data", "exports"))
+    parser.add_argument("--from", dest="first", required=True, help="first day (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="last", help="last day (default: the first)")
+    parser.add_argument("--format", nargs="+", default=list(FORMATS), choices=FORMATS)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    first = date.fromisoformat(args.first)
+    last = date.fromisoformat(args.last) if args.last else first
+    export_range(args.data_dir, args.out, first, last, args.format, args.workers)
+
+
+if __name__ == "__main__":
+    main()
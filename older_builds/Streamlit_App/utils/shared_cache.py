@@ -0,0 +1,147 @@
+# utils/shared_cache.py
+#
+# Work shared by every Streamlit session in the server process. Each viewer
+# reruns app.py top to bottom on every interaction, so a coach with the
+# dashboard open on ten tablets used to pay for ten copies of each parse,
+# chart and matplotlib render. Now each expensive product is built once per
+# version of its inputs and handed to every session.
+#
+#   SharedCache.get(key, version, build)
+#       returns the value built for `version`; when the version moves on,
+#       the first session to ask rebuilds it while any others asking for the
+#       same key wait for that build instead of starting their own
+#   LiveBuffer
+#       the last LIVE_SECONDS of live samples, fed once by the dashboard's
+#       dispatcher; its generation is the version of anything drawn from it
+#
+# Versions are how changes reach the sessions: the HR store's day_version()
+# (file sizes and mtimes) with the embedded service, the live buffer's
+# generation, or a REMOTE_TTL_S time bucket against an external service
+# whose files we can't see. A session rerunning after a change gets the new
+# product; one rerunning without a change costs a dictionary lookup.
+#
+# get_shared() / get_live_buffer() hand out one of each per process through
+# st.cache_resource. HR_SHARED_CACHE=0 builds everything per rerun again,
+# which is what benchmarks/bench_shared.py compares against.
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import date, timedelta
+
+import numpy as np
+import streamlit as st
+
+from utils import instrumentation
+from utils.hr_client import get_embedded_service
+from utils.motion import activity_log_path
+
+ENABLED = os.environ.get("HR_SHARED_CACHE", "1") != "0"
+REMOTE_TTL_S = 5.0
+LIVE_SECONDS = 300
+LIVE_MAX_SAMPLES = 4096
+
+HITS = instrumentation.counter("shared.hits")
+BUILDS = instrumentation.counter("shared.builds")
+BUILD_US = instrumentation.histogram("shared.build_us")
+
+
+class SharedCache:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._entries = {}   # key -> (version, value)
+        self._locks = {}     # key -> lock held while building it
+        self._lock = threading.Lock()
+
+    def get(self, key, version, build):
+        if not self.enabled:
+            return build()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            HITS.inc()
+            return entry[1]
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another session may have built it while we waited
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                HITS.inc()
+                return entry[1]
+            t0 = instrumentation.stopwatch()
+            value = build()
+            self._entries[key] = (version, value)
+            BUILDS.inc()
+            BUILD_US.record_since(t0)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LiveBuffer:
+    def __init__(self, seconds=LIVE_SECONDS, max_samples=LIVE_MAX_SAMPLES):
+        self.seconds = seconds
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def append_batch(self, batch):
+        # Dispatcher batch subscriber: [(epoch seconds, bpm), ...]
+        if not batch:
+            return
+        with self._lock:
+            self._samples.extend(batch)
+            self.generation += 1
+
+    def snapshot(self):
+        # (ts, bpms) arrays of the last `seconds` of samples
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            return np.empty(0), np.empty(0, dtype=np.uint16)
+        table = np.array(samples, dtype=np.float64)
+        keep = table[:, 0] >= table[-1, 0] - self.seconds
+        return table[keep, 0], table[keep, 1].astype(np.uint16)
+
+
+@st.cache_resource
+def get_shared():
+    return SharedCache(enabled=ENABLED)
+
+
+@st.cache_resource
+def get_live_buffer():
+    return LiveBuffer()
+
+
+def _file_version(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _remote_version():
+    return int(time.monotonic() // REMOTE_TTL_S)
+
+
+def day_version(day):
+    service = get_embedded_service()
+    if service is None:
+        return _remote_version()
+    return service.store.day_version(day)
+
+
+def days_version(days, today=None):
+    # Heart rate and activity logs of the last `days` days, as sessions use them
+    service = get_embedded_service()
+    if service is None:
+        return _remote_version()
+    today = today or date.today()
+    store = service.store
+    window = [today - timedelta(days=i) for i in range(days)]
+    return tuple((store.day_version(d), _file_version(activity_log_path(store.data_dir, d))) for d in window)
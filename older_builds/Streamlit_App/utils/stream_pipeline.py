@@ -0,0 +1,299 @@
+# utils/stream_pipeline.py
+#
+# Composable processing of live sample batches between the BLE side and
+# whatever consumes them. HRMonitor's callback pushes samples into a
+# CoalescingDispatcher as before; a Pipeline attached to it receives each
+# flushed batch and passes it through registered stages:
+#
+#   pipeline = Pipeline("live")
+#   pipeline.add("graph", graph.add_points)                          # sink
+#   smooth = pipeline.add("smooth", median_filter, executor="process")
+#   pipeline.add("store", ingest_batch, executor="thread", after=smooth)
+#   pipeline.attach(dispatcher)
+#
+# A stage is fn(batch). If it returns a batch (a SampleBatch or (t, bpm)
+# pairs), that batch goes on to the stages registered after it; if it
+# returns None it is a sink. Stages added without `after` take batches
+# straight from the pipeline, so any number of sinks fan out from one push.
+#
+# Each stage picks where it runs:
+#
+#   inline   on the thread that delivered the batch (the Kivy frame clock
+#            for a graph, which must stay on the UI thread)
+#   thread   on its own worker thread(s) behind a queue of queue_size
+#            batches (storage, sync, anything that waits on I/O)
+#   process  in a process pool, queue_size batches in flight (CPU-heavy
+#            filters and analytics; fn must be a module-level function)
+#
+# When a stage's queue is full, on_full="block" makes the delivering thread
+# wait, which backs up into the dispatcher's bounded pending buffer and
+# stretches its flush interval; on_full="drop" discards the incoming batch
+# and counts it, for stages that can afford to miss some.
+#
+# A SampleBatch holds float64 epoch seconds and uint16 bpm as read-only
+# memoryviews. Every stage downstream of a push gets the same object, so
+# fan-out never copies sample buffers; np.frombuffer(batch.ts) is a view too.
+# Only the process executor copies, since the batch has to be pickled.
+# Iterating a batch still yields (t, bpm) pairs for subscribers written
+# against the dispatcher's lists.
+#
+# stats() gives each stage's batches, samples, drops, errors, queue depth,
+# samples/s, and mean latency from the pipeline push to the stage's end
+# (queue wait included). With instrumentation on, the same latencies go to
+# the pipeline.<stage>_us histograms, and stats() adds their p99.
+
+import logging
+import queue
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import instrumentation
+
+log = logging.getLogger("wearable.pipeline")
+
+EXECUTORS = ("inline", "thread", "process")
+QUEUE_SIZE = 64
+
+
+class SampleBatch:
+    __slots__ = ("ts", "bpm", "device", "pushed_ns")
+
+    def __init__(self, ts, bpm, device=None, pushed_ns=None):
+        self.ts = memoryview(ts if isinstance(ts, (array, memoryview)) else array("d", ts)).toreadonly()
+        self.bpm = memoryview(bpm if isinstance(bpm, (array, memoryview)) else array("H", bpm)).toreadonly()
+        self.device = device
+        self.pushed_ns = pushed_ns
+
+    @classmethod
+    def from_pairs(cls, pairs, device=None):
+        return cls(array("d", [t for t, _ in pairs]), array("H", [b for _, b in pairs]), device)
+
+    def select(self, keep):
+        # A new batch of the samples where keep(t, bpm) is true
+        pairs = [(t, b) for t, b in zip(self.ts, self.bpm) if keep(t, b)]
+        batch = SampleBatch.from_pairs(pairs, self.device)
+        batch.pushed_ns = self.pushed_ns
+        return batch
+
+    def __len__(self):
+        return len(self.ts)
+
+    def __iter__(self):
+        return zip(self.ts, self.bpm)
+
+    def __reduce__(self):
+        # memoryviews don't pickle; the process executor gets bytes
+        return _unpickle_batch, (self.ts.tobytes(), self.bpm.tobytes(), self.device, self.pushed_ns)
+
+
+def _unpickle_batch(ts, bpm, device, pushed_ns):
+    ts_array = array("d")
+    ts_array.frombytes(ts)
+    bpm_array = array("H")
+    bpm_array.frombytes(bpm)
+    return SampleBatch(ts_array, bpm_array, device, pushed_ns)
+
+
+def as_batch(batch, pushed_ns=None):
+    if not isinstance(batch, SampleBatch):
+        batch = SampleBatch.from_pairs(batch)
+    if batch.pushed_ns is None:
+        batch.pushed_ns = pushed_ns or time.perf_counter_ns()
+    return batch
+
+
+class Stage:
+    def __init__(self, name, fn, executor="inline", queue_size=QUEUE_SIZE, on_full="block", workers=1):
+        if executor not in EXECUTORS:
+            raise ValueError(f"executor must be one of {EXECUTORS}, not {executor!r}")
+        if on_full not in ("block", "drop"):
+            raise ValueError(f"on_full must be 'block' or 'drop', not {on_full!r}")
+        self.name = name
+        self.fn = fn
+        self.executor = executor
+        self.queue_size = queue_size
+        self.on_full = on_full
+        self.workers = workers
+        self.children = []
+        self.latency = instrumentation.histogram(f"pipeline.{name}_us")
+        self._queue = None
+        self._threads = []
+        self._pool = None
+        self._in_flight = None
+        self._lock = threading.Lock()
+        self._started_at = None
+        self._stats = {"batches": 0, "samples": 0, "dropped": 0, "errors": 0}
+        self._latency_ns = 0
+        if executor == "thread":
+            self._queue = queue.Queue(maxsize=queue_size)
+            for i in range(workers):
+                thread = threading.Thread(target=self._work, name=f"pipeline-{name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        elif executor == "process":
+            self._in_flight = threading.BoundedSemaphore(queue_size)
+
+    # ---------- delivery ----------
+
+    def deliver(self, batch):
+        if self._started_at is None:
+            self._started_at = time.perf_counter()
+        if self.executor == "inline":
+            self._run(batch)
+        elif self.executor == "thread":
+            if self.on_full == "drop":
+                try:
+                    self._queue.put_nowait(batch)
+                except queue.Full:
+                    self._drop(batch)
+            else:
+                self._queue.put(batch)
+        else:
+            if not self._in_flight.acquire(blocking=self.on_full == "block"):
+                self._drop(batch)
+                return
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            future = self._pool.submit(self.fn, batch)
+            future.add_done_callback(lambda f: self._finish_remote(f, batch))
+
+    def _drop(self, batch):
+        with self._lock:
+            self._stats["dropped"] += len(batch)
+
+    def _work(self):
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is None:
+                    return
+                self._run(batch)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, batch):
+        try:
+            out = self.fn(batch)
+        except Exception:
+            log.exception("Pipeline stage %s failed", self.name)
+            with self._lock:
+                self._stats["errors"] += 1
+            return
+        self._done(batch, out)
+
+    def _finish_remote(self, future, batch):
+        try:
+            out = future.result()
+        except Exception as e:
+            log.error("❌ Pipeline stage %s failed: %s", self.name, e)
+            with self._lock:
+                self._stats["errors"] += 1
+            self._in_flight.release()
+            return
+        try:
+            self._done(batch, out)
+        finally:
+            # Released once children have it, so join() covers them too
+            self._in_flight.release()
+
+    def _done(self, batch, out):
+        latency_ns = time.perf_counter_ns() - batch.pushed_ns
+        self.latency.record(latency_ns / 1000)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["samples"] += len(batch)
+            self._latency_ns += latency_ns
+        if out is None or not self.children:
+            return
+        out = as_batch(out, batch.pushed_ns)
+        if len(out):
+            for child in self.children:
+                child.deliver(out)
+
+    # ---------- lifecycle ----------
+
+    def join(self):
+        # Waits until everything delivered so far has been processed
+        if self._queue is not None:
+            self._queue.join()
+        elif self._in_flight is not None:
+            for _ in range(self.queue_size):
+                self._in_flight.acquire()
+            for _ in range(self.queue_size):
+                self._in_flight.release()
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        self._threads = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            latency_ns = self._latency_ns
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        stats.update(executor=self.executor, queued=self._queue.qsize() if self._queue else 0,
+                     samples_per_s=round(stats["samples"] / elapsed, 1) if elapsed else 0.0,
+                     mean_us=round(latency_ns / stats["batches"] / 1000, 1) if stats["batches"] else None,
+                     p99_us=self.latency.snapshot()["p99"])
+        return stats
+
+
+class Pipeline:
+    def __init__(self, name="live"):
+        self.name = name
+        self.stages = {}
+        self.roots = []
+        self.pushed = 0
+
+    def add(self, name, fn, executor="inline", after=None, queue_size=QUEUE_SIZE, on_full="block", workers=1):
+        # Registers a stage; returns it so later stages can chain `after` it
+        if name in self.stages:
+            raise ValueError(f"Pipeline {self.name} already has a stage {name!r}")
+        stage = Stage(name, fn, executor, queue_size, on_full, workers)
+        if after is None:
+            self.roots.append(stage)
+        else:
+            parent = after if isinstance(after, Stage) else self.stages[after]
+            parent.children.append(stage)
+        self.stages[name] = stage
+        return stage
+
+    def push(self, batch):
+        # A dispatcher batch subscriber: hands the same batch to every root
+        # stage in registration order. An inline stage runs before push moves
+        # on, so register UI sinks ahead of blocking thread stages.
+        if not len(batch):
+            return
+        batch = as_batch(batch)
+        batch.pushed_ns = time.perf_counter_ns()
+        self.pushed += len(batch)
+        for stage in self.roots:
+            stage.deliver(batch)
+
+    def attach(self, dispatcher):
+        dispatcher.subscribe_batch(self.push)
+        return self
+
+    def join(self):
+        # Waits for every queued batch to pass through (benchmarks, shutdown)
+        pending = list(self.roots)
+        while pending:
+            stage = pending.pop(0)
+            stage.join()
+            pending += stage.children
+
+    def stop(self):
+        self.join()
+        for stage in self.stages.values():
+            stage.stop()
+
+    def stats(self):
+        return {name: stage.stats() for name, stage in self.stages.items()}
@@ -0,0 +1,159 @@
+# utils/timebase.py
+#
+# Sample timestamps on the hot path are time.monotonic_ns(): one integer
+# read, unaffected by NTP steps or DST. They become wall-clock epoch
+# seconds in bulk when a batch is read (CoalescingDispatcher.flush), using
+# an anchor (wall - monotonic offset) refreshed at most once a minute.
+#
+# When the wall clock steps backwards the anchor doesn't follow it at once;
+# it slews towards the new offset at SLEW seconds per second, so converted
+# times never run backwards and break gap segmentation. Forward steps, and
+# backwards steps larger than MAX_HOLD_S (the clock was simply wrong), are
+# adopted immediately.
+#
+# DriftEstimator fits a device's own clock (cumulative RR intervals from a
+# strap, Arduino millis()) against host monotonic time, so device-side
+# durations can be corrected to host seconds.
+
+import logging
+import time
+from array import array
+
+log = logging.getLogger("wearable.timebase")
+
+now_ns = time.monotonic_ns
+
+REFRESH_S = 60
+STEP_S = 0.5        # offset changes bigger than this are logged as clock steps
+MAX_HOLD_S = 600    # backwards steps bigger than this are adopted, not slewed
+SLEW = 0.05         # seconds of backwards correction per second while slewing
+
+
+class Timebase:
+    now_ns = staticmethod(now_ns)
+
+    def __init__(self, refresh_s=REFRESH_S):
+        self.refresh_ns = int(refresh_s * 1e9)
+        self.steps = 0
+        self.offset_ns = time.time_ns() - now_ns()
+        self._anchored_at = now_ns()
+        self._slew_start = None
+        self._target_ns = self.offset_ns
+
+    def _offset_at(self, mono_ns):
+        if self._slew_start is None:
+            return self.offset_ns
+        slewed = self.offset_ns - int(SLEW * max(0, mono_ns - self._slew_start))
+        return max(slewed, self._target_ns)
+
+    def refresh(self, force=False):
+        mono = now_ns()
+        if not force and mono - self._anchored_at < self.refresh_ns:
+            return
+        self._anchored_at = mono
+        offset = time.time_ns() - mono
+        current = self._offset_at(mono)
+        step = offset - current
+        if abs(step) > STEP_S * 1e9:
+            self.steps += 1
+            log.warning("🕰️ Wall clock stepped %+.1fs", step / 1e9)
+        if step >= 0 or step < -MAX_HOLD_S * 1e9:
+            self.offset_ns = offset
+            self._slew_start = None
+        else:
+            self.offset_ns = current
+            self._slew_start = mono
+        self._target_ns = offset
+
+    def to_wall(self, mono_ns):
+        self.refresh()
+        return (mono_ns + self._offset_at(mono_ns)) / 1e9
+
+    def to_wall_many(self, mono_ns_values):
+        # One anchor lookup for the whole batch; returns epoch seconds
+        self.refresh()
+        if self._slew_start is None:
+            offset = self.offset_ns
+            return array("d", [(m + offset) / 1e9 for m in mono_ns_values])
+        return array("d", [(m + self._offset_at(m)) / 1e9 for m in mono_ns_values])
+
+    def wall_now(self):
+        return self.to_wall(now_ns())
+
+
+timebase = Timebase()
+
+
+class VirtualClock:
+    # Stands in for the Timebase when replaying recordings (ble/replay.py):
+    # time only moves when set() is called, and converts exactly back to the
+    # recorded epoch seconds, so replays don't depend on the host clock
+    def __init__(self, epoch_s):
+        self.origin = epoch_s
+        self._mono = 0
+
+    def set(self, epoch_s):
+        self._mono = round((epoch_s - self.origin) * 1e9)
+
+    def now_ns(self):
+        return self._mono
+
+    def to_wall(self, mono_ns):
+        return self.origin + mono_ns / 1e9
+
+    def to_wall_many(self, mono_ns_values):
+        origin = self.origin
+        return array("d", [origin + m / 1e9 for m in mono_ns_values])
+
+    def wall_now(self):
+        return self.to_wall(self._mono)
+
+
+class DriftEstimator:
+    # Least-squares fit of host seconds against device seconds since an
+    # origin, in O(1) memory. A jump between the two clocks (reconnect, lost
+    # packets with RR intervals in them) restarts the fit.
+    MIN_SPAN_S = 60
+    MAX_JUMP_S = 2.0
+
+    def __init__(self, name):
+        self.name = name
+        self.ppm = None  # host seconds per device second, minus one, in ppm
+        self._reset(None, None)
+
+    def _reset(self, host_ns, device_s):
+        self._origin = (host_ns, device_s)
+        self._last = (host_ns, device_s)
+        self._n = 0
+        self._sx = self._sy = self._sxx = self._sxy = 0.0
+
+    def add(self, host_ns, device_s):
+        # device_s: the device's cumulative clock, e.g. the running sum of RR
+        # intervals or millis() / 1000
+        if self._origin[0] is None:
+            self._reset(host_ns, device_s)
+            return
+        last_host, last_device = self._last
+        if abs((host_ns - last_host) / 1e9 - (device_s - last_device)) > self.MAX_JUMP_S:
+            self._reset(host_ns, device_s)
+            return
+        self._last = (host_ns, device_s)
+
+        x = device_s - self._origin[1]
+        y = (host_ns - self._origin[0]) / 1e9
+        self._n += 1
+        self._sx += x
+        self._sy += y
+        self._sxx += x * x
+        self._sxy += x * y
+        if x >= self.MIN_SPAN_S:
+            denom = self._n * self._sxx - self._sx * self._sx
+            if denom > 0:
+                slope = (self._n * self._sxy - self._sx * self._sy) / denom
+                self.ppm = (slope - 1.0) * 1e6
+
+    def to_host_seconds(self, device_seconds):
+        # Corrects a device-measured duration to host seconds
+        if self.ppm is None:
+            return device_seconds
+        return device_seconds * (1.0 + self.ppm / 1e6)